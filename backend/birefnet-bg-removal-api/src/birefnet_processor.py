@@ -19,6 +19,8 @@ from PIL import Image, ImageFilter
 import psutil
 import cv2
 
+from metrics import model_load_seconds, observe_stage, size_label
+
 logger = logging.getLogger(__name__)
 
 
@@ -86,6 +88,189 @@ def enhance_mask(
     return Image.fromarray(enhanced_uint8, mode='L')
 
 
+def guided_filter(
+    guide: np.ndarray,
+    src: np.ndarray,
+    radius: int = 4,
+    eps: float = 1e-3
+) -> np.ndarray:
+    """
+    Edge-preserving color guided filter (He et al.) built from O(1) box filters.
+
+    Pulls the soft edges of the model mask onto the edges of the RGB guide,
+    which keeps individual fur strands that the network only half-resolves.
+
+    Args:
+        guide: float32 RGB guide image (H, W, 3) in [0, 1]
+        src: float32 mask to filter (H, W)
+        radius: Box filter radius in pixels
+        eps: Regularization - larger values smooth more, smaller follow the guide harder
+
+    Returns:
+        Filtered float32 mask (H, W)
+    """
+    ksize = (2 * radius + 1, 2 * radius + 1)
+
+    def box(x: np.ndarray) -> np.ndarray:
+        return cv2.boxFilter(x, -1, ksize, borderType=cv2.BORDER_REFLECT)
+
+    mean_i = box(guide)
+    mean_p = box(src)
+    cov_ip = box(guide * src[..., None]) - mean_i * mean_p[..., None]
+
+    r, g, b = guide[..., 0], guide[..., 1], guide[..., 2]
+    mr, mg, mb = mean_i[..., 0], mean_i[..., 1], mean_i[..., 2]
+
+    # Per-pixel 3x3 covariance of the guide (symmetric - six unique entries)
+    products = box(np.dstack([r * r, r * g, r * b, g * g, g * b, b * b]))
+    var_rr = products[..., 0] - mr * mr + eps
+    var_rg = products[..., 1] - mr * mg
+    var_rb = products[..., 2] - mr * mb
+    var_gg = products[..., 3] - mg * mg + eps
+    var_gb = products[..., 4] - mg * mb
+    var_bb = products[..., 5] - mb * mb + eps
+
+    # Closed-form inverse via the adjugate, vectorized over all pixels
+    inv_rr = var_gg * var_bb - var_gb * var_gb
+    inv_rg = var_gb * var_rb - var_rg * var_bb
+    inv_rb = var_rg * var_gb - var_gg * var_rb
+    inv_gg = var_rr * var_bb - var_rb * var_rb
+    inv_gb = var_rb * var_rg - var_rr * var_gb
+    inv_bb = var_rr * var_gg - var_rg * var_rg
+    det = inv_rr * var_rr + inv_rg * var_rg + inv_rb * var_rb
+
+    cr, cg, cb = cov_ip[..., 0], cov_ip[..., 1], cov_ip[..., 2]
+    coeffs = np.empty((*src.shape, 4), dtype=np.float32)
+    coeffs[..., 0] = (inv_rr * cr + inv_rg * cg + inv_rb * cb) / det
+    coeffs[..., 1] = (inv_rg * cr + inv_gg * cg + inv_gb * cb) / det
+    coeffs[..., 2] = (inv_rb * cr + inv_gb * cg + inv_bb * cb) / det
+    coeffs[..., 3] = mean_p - coeffs[..., 0] * mr - coeffs[..., 1] * mg - coeffs[..., 2] * mb
+
+    mean_coeffs = box(coeffs)
+    return (
+        mean_coeffs[..., 0] * r + mean_coeffs[..., 1] * g
+        + mean_coeffs[..., 2] * b + mean_coeffs[..., 3]
+    )
+
+
+def refine_mask(
+    pred: np.ndarray,
+    guide: Image.Image,
+    output_size: Tuple[int, int],
+    threshold: float = 0.5,
+    contrast_boost: float = 1.5,
+    hard_floor: float = 0.0,
+    hard_ceiling: float = 1.0,
+    guided_radius: int = 4,
+    guided_eps: float = 1e-3,
+    cleanup_kernel_size: int = 0
+) -> np.ndarray:
+    """
+    Refine the raw model mask at model resolution and upsample it once.
+
+    Replaces resize-then-enhance_mask: the guided filter, contrast curve and
+    floor/ceiling all run on the model-sized prediction, in place, and the
+    only full-resolution pass is the final uint8 resize.
+
+    Args:
+        pred: float32 probability mask (0-1) at model resolution
+        guide: RGB image the model saw (resized to the prediction size if needed)
+        output_size: (width, height) of the returned mask
+        threshold: Center point for contrast curve (0-1)
+        contrast_boost: How aggressively to push values to extremes (1.0-5.0)
+        hard_floor: Values below this become 0
+        hard_ceiling: Values above this become 1
+        guided_radius: Guided filter radius at model resolution (0 to disable)
+        guided_eps: Guided filter regularization
+        cleanup_kernel_size: Optional morphological cleanup at model resolution (0 to disable)
+
+    Returns:
+        uint8 mask (height, width) at output_size
+    """
+    height, width = pred.shape[:2]
+    mask = np.ascontiguousarray(pred, dtype=np.float32)
+
+    if guided_radius > 0:
+        if guide.size != (width, height):
+            guide = guide.resize((width, height), Image.Resampling.BILINEAR)
+        guide_array = np.asarray(guide, dtype=np.float32)
+        guide_array *= 1.0 / 255.0
+        mask = guided_filter(guide_array, mask, guided_radius, guided_eps)
+    elif mask is pred:
+        mask = mask.copy()
+
+    # Sigmoid contrast curve in place: 1 / (1 + exp(-contrast_boost * (x - threshold) * 10))
+    mask -= threshold
+    mask *= -10.0 * contrast_boost
+    with np.errstate(over='ignore'):
+        np.exp(mask, out=mask)
+    mask += 1.0
+    np.reciprocal(mask, out=mask)
+
+    if hard_floor > 0:
+        mask[mask < hard_floor] = 0.0
+    if hard_ceiling < 1.0:
+        mask[mask > hard_ceiling] = 1.0
+
+    # Saturating float -> uint8 conversion without an intermediate float copy
+    mask_uint8 = cv2.convertScaleAbs(mask, alpha=255.0)
+
+    if cleanup_kernel_size > 0:
+        kernel = cv2.getStructuringElement(
+            cv2.MORPH_ELLIPSE,
+            (cleanup_kernel_size, cleanup_kernel_size)
+        )
+        mask_uint8 = cv2.morphologyEx(mask_uint8, cv2.MORPH_CLOSE, kernel)
+        mask_uint8 = cv2.morphologyEx(mask_uint8, cv2.MORPH_OPEN, kernel)
+
+    if (width, height) != tuple(output_size):
+        mask_uint8 = cv2.resize(mask_uint8, tuple(output_size), interpolation=cv2.INTER_LINEAR)
+
+    return mask_uint8
+
+
+# Same box logic as find_subject_bbox in inspirenet-api/src/inspirenet_model.py, taking a
+# float probability mask instead of a uint8 PIL mask. Each service image copies only its own
+# src/, so there is no shared module to import it from - change both copies together.
+def find_subject_bbox(
+    mask: np.ndarray,
+    image_size: Tuple[int, int],
+    threshold: float = 0.15,
+    padding: float = 0.1
+) -> Optional[Tuple[int, int, int, int]]:
+    """
+    Padded subject bounding box from a low-resolution probability mask.
+
+    Args:
+        mask: float32 probability mask (0-1), any resolution
+        image_size: (width, height) the mask maps onto
+        threshold: Mask values above this count as subject
+        padding: Padding added on each side, as a fraction of the box size
+
+    Returns:
+        (left, top, right, bottom) in image_size pixels, or None if no subject found
+    """
+    rows = np.flatnonzero((mask > threshold).any(axis=1))
+    if rows.size == 0:
+        return None
+    cols = np.flatnonzero((mask[rows[0]:rows[-1] + 1] > threshold).any(axis=0))
+
+    scale_x = image_size[0] / mask.shape[1]
+    scale_y = image_size[1] / mask.shape[0]
+    left, right = cols[0] * scale_x, (cols[-1] + 1) * scale_x
+    top, bottom = rows[0] * scale_y, (rows[-1] + 1) * scale_y
+
+    # Pad generously - the coarse pass tends to clip thin fur, ears and tails
+    pad_x = max(16.0, (right - left) * padding)
+    pad_y = max(16.0, (bottom - top) * padding)
+    return (
+        max(0, int(left - pad_x)),
+        max(0, int(top - pad_y)),
+        min(image_size[0], int(np.ceil(right + pad_x))),
+        min(image_size[1], int(np.ceil(bottom + pad_y)))
+    )
+
+
 def log_gpu_diagnostics() -> dict:
     """
     Log comprehensive GPU/CUDA diagnostics at startup.
@@ -136,6 +321,7 @@ class ProcessingResult:
     input_size: Tuple[int, int]
     output_size: Tuple[int, int]
     model_variant: str
+    roi: Optional[Tuple[int, int, int, int]] = None
 
 
 class BiRefNetProcessor:
@@ -174,11 +360,24 @@ class BiRefNetProcessor:
         self.max_dimension = max_dimension
         self.enable_preprocessing = enable_preprocessing
 
+        # Mask refinement: "guided" (model-resolution guided filter) or "legacy" (enhance_mask)
+        self.mask_refinement = os.getenv("BIREFNET_MASK_REFINEMENT", "guided").lower()
+        self.guided_radius = int(os.getenv("BIREFNET_GUIDED_RADIUS", "4"))
+        self.guided_eps = float(os.getenv("BIREFNET_GUIDED_EPS", "1e-3"))
+
+        # Two-stage ROI mode: a reduced-size pass finds the subject, the full
+        # inference_size pass runs on the padded crop only
+        self.roi_crop = os.getenv("BIREFNET_ROI_CROP", "false").lower() == "true"
+        self.roi_coarse_size = int(os.getenv("BIREFNET_ROI_COARSE_SIZE", "512"))
+        self.roi_padding = float(os.getenv("BIREFNET_ROI_PADDING", "0.1"))
+        self.roi_max_area = float(os.getenv("BIREFNET_ROI_MAX_AREA", "0.6"))
+
         # Inference resolution - BiRefNet-general is trained at 1024x1024
         self.inference_size = (1024, 1024)
 
         self.model = None
         self.transform = None
+        self.coarse_transform = None
         self.device = None
         self.model_loaded = False
         self.loading_lock = threading.Lock()
@@ -232,6 +431,14 @@ class BiRefNetProcessor:
                         std=[0.229, 0.224, 0.225]
                     ),
                 ])
+                self.coarse_transform = transforms.Compose([
+                    transforms.Resize((self.roi_coarse_size, self.roi_coarse_size)),
+                    transforms.ToTensor(),
+                    transforms.Normalize(
+                        mean=[0.485, 0.456, 0.406],
+                        std=[0.229, 0.224, 0.225]
+                    ),
+                ])
                 stage3_time = time.time() - stage3_start
                 logger.info(f"[LOAD-TIMING] Stage 3 - Transform setup: {stage3_time:.2f}s")
 
@@ -244,6 +451,7 @@ class BiRefNetProcessor:
                            f"model={stage2_time:.2f}s, transform={stage3_time:.2f}s")
                 logger.info(f"[GPU-DIAG] Model running on: {self.device}")
                 logger.info(f"BiRefNet model loaded successfully in {load_time:.2f}s")
+                model_load_seconds.labels(model="birefnet").set(load_time)
 
             except ImportError as e:
                 logger.error(f"Failed to import required packages: {e}")
@@ -293,6 +501,38 @@ class BiRefNetProcessor:
 
         return resized, scale
 
+    def _find_roi(self, image: Image.Image) -> Optional[Tuple[int, int, int, int]]:
+        """
+        Cheap reduced-size inference to locate the subject.
+
+        Returns:
+            Padded crop box in image pixels, or None when cropping would not help
+        """
+        import torch
+
+        try:
+            coarse_tensor = self.coarse_transform(image).unsqueeze(0).to(self.device)
+            with torch.no_grad():
+                coarse = self.model(coarse_tensor)[-1].sigmoid().cpu()[0].squeeze().numpy()
+
+            roi = find_subject_bbox(coarse, image.size, padding=self.roi_padding)
+            if roi is None:
+                logger.info("ROI crop: no subject in coarse mask, processing full frame")
+                return None
+
+            roi_area = (roi[2] - roi[0]) * (roi[3] - roi[1])
+            area_ratio = roi_area / float(image.size[0] * image.size[1])
+            if area_ratio > self.roi_max_area:
+                logger.info(f"ROI crop: subject covers {area_ratio:.0%} of frame, processing full frame")
+                return None
+
+            logger.info(f"ROI crop: {roi} ({area_ratio:.0%} of frame)")
+            return roi
+
+        except Exception as e:
+            logger.warning(f"ROI detection failed, processing full frame: {e}")
+            return None
+
     def remove_background(
         self,
         image: Image.Image,
@@ -332,6 +572,21 @@ class BiRefNetProcessor:
         # Preprocess (resize if too large for preprocessing, but we'll still process at inference_size)
         processed_image, scale = self.preprocess_image(image)
 
+        # Two-stage mode: locate the subject, then spend the full inference size on the crop
+        roi = None
+        target_image = image
+        if self.roi_crop:
+            roi_start = time.time()
+            roi_processed = self._find_roi(processed_image)
+            if roi_processed is not None:
+                roi = tuple(
+                    min(limit, int(round(v / scale)))
+                    for v, limit in zip(roi_processed, (*input_size, *input_size))
+                )
+                target_image = image.crop(roi)
+                processed_image, _ = self.preprocess_image(target_image)
+            logger.info(f"ROI pass took {(time.time() - roi_start) * 1000:.0f}ms")
+
         logger.info(f"Processing image {input_size} with BiRefNet transformers "
                    f"(variant: {self.model_variant}, device: {self.device})")
 
@@ -345,31 +600,57 @@ class BiRefNetProcessor:
             with torch.no_grad():
                 preds = self.model(input_tensor)[-1].sigmoid().cpu()
 
-            # Post-process: resize mask back to original resolution
             pred = preds[0].squeeze()
-            pred_pil = transforms.ToPILImage()(pred)
-
-            # Resize mask to original input size (high-res output)
-            mask = pred_pil.resize(input_size, Image.Resampling.BILINEAR)
-
-            # Enhance mask to reduce gray artifacts and improve edge clarity
-            # This pushes uncertain (gray) areas toward fully transparent or opaque
-            # Parameters tuned for pet photos with complex backgrounds (sofas, furniture)
-            enhanced_mask = enhance_mask(
-                mask,
-                threshold=0.60,       # Higher threshold - more areas become transparent
-                contrast_boost=4.0,   # Very aggressive - steep sigmoid curve
-                cleanup_kernel_size=5,  # Larger kernel for smoother edges
-                hard_floor=0.25       # Kill all grays below 25% - eliminates shadow artifacts
-            )
 
-            logger.info(f"Mask enhanced: threshold=0.60, contrast=4.0, cleanup=5, floor=0.25")
+            if self.mask_refinement == "guided":
+                # Refine at model resolution with the RGB input as guide, then upsample once
+                # Same curve as legacy; the guided filter replaces the full-res morphology
+                mask_array = refine_mask(
+                    pred.numpy(),
+                    processed_image,
+                    target_image.size,
+                    threshold=0.60,
+                    contrast_boost=4.0,
+                    hard_floor=0.25,
+                    guided_radius=self.guided_radius,
+                    guided_eps=self.guided_eps
+                )
+                enhanced_mask = Image.fromarray(mask_array, mode='L')
+
+                logger.info(f"Mask refined: guided r={self.guided_radius} eps={self.guided_eps}, "
+                           f"threshold=0.60, contrast=4.0, floor=0.25")
+            else:
+                # Post-process: resize mask back to original resolution
+                pred_pil = transforms.ToPILImage()(pred)
+
+                # Resize mask to original input size (high-res output)
+                mask = pred_pil.resize(target_image.size, Image.Resampling.BILINEAR)
+
+                # Enhance mask to reduce gray artifacts and improve edge clarity
+                # This pushes uncertain (gray) areas toward fully transparent or opaque
+                # Parameters tuned for pet photos with complex backgrounds (sofas, furniture)
+                enhanced_mask = enhance_mask(
+                    mask,
+                    threshold=0.60,       # Higher threshold - more areas become transparent
+                    contrast_boost=4.0,   # Very aggressive - steep sigmoid curve
+                    cleanup_kernel_size=5,  # Larger kernel for smoother edges
+                    hard_floor=0.25       # Kill all grays below 25% - eliminates shadow artifacts
+                )
+
+                logger.info(f"Mask enhanced: threshold=0.60, contrast=4.0, cleanup=5, floor=0.25")
+
+            if roi is not None:
+                # Paste the crop mask back; everything outside the crop is background
+                full_mask = Image.new('L', input_size, 0)
+                full_mask.paste(enhanced_mask, roi[:2])
+                enhanced_mask = full_mask
 
             # Apply enhanced mask to original image for full resolution output
             result = image.copy()
             result.putalpha(enhanced_mask)
 
             inference_time = (time.time() - start_time) * 1000
+            observe_stage("inference", inference_time / 1000, size=size_label(*input_size))
 
             logger.info(f"BiRefNet processing completed in {inference_time:.0f}ms on {self.device}")
 
@@ -378,7 +659,8 @@ class BiRefNetProcessor:
                 inference_time_ms=inference_time,
                 input_size=input_size,
                 output_size=result.size,
-                model_variant=self.model_variant
+                model_variant=self.model_variant,
+                roi=roi
             )
 
         except Exception as e:
@@ -467,6 +749,8 @@ class BiRefNetProcessor:
             "inference_size": self.inference_size,
             "max_dimension": self.max_dimension,
             "preprocessing_enabled": self.enable_preprocessing,
+            "mask_refinement": self.mask_refinement,
+            "roi_crop": self.roi_crop,
             "status": "loaded" if self.model_loaded else "not_loaded",
             "ready": self.model_loaded and self.model is not None,
             "device": self.device if self.device else "not_initialized",
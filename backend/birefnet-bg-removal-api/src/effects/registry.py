@@ -0,0 +1,131 @@
+"""
+Effect Registry for BiRefNet Background Removal API
+Single source of truth for effect names, aliases and parameters
+
+Specs and lookups come from the shared effect_specs module (same file as the InSPyReNet service).
+
+Effect implementations are loaded on first use, and a per-request EffectPlan
+computes shared intermediates (the capped-resolution effect input) once for
+all requested effects, and only when a requested effect needs them.
+"""
+import logging
+from PIL import Image
+from typing import Callable, Iterable, Optional, Tuple
+
+from .effect_specs import EffectSpec, EffectRegistry as SharedEffectRegistry
+
+logger = logging.getLogger(__name__)
+
+# Intermediates an effect can declare as inputs
+INPUT_ORIGINAL = "original"            # bg-removed image at full resolution
+INPUT_EFFECT_RESOLUTION = "effect_resolution"  # bg-removed image capped to the effect resolution
+
+
+class EffectRegistry(SharedEffectRegistry):
+    """Shared effect registry with plans over PIL images"""
+
+    def plan(
+        self,
+        image: Image.Image,
+        effect_names: Iterable[str],
+        resize_fn: Callable[[Image.Image], Tuple[Image.Image, bool, Tuple[int, int]]]
+    ) -> "EffectPlan":
+        """Build the per-request plan for the requested effects"""
+        return EffectPlan(self, image, effect_names, resize_fn)
+
+
+class EffectPlan:
+    """
+    Per-request effect plan over one bg-removed image
+
+    Intermediates declared by the requested effects are computed once on first use;
+    a request for only 'color' never pays for the effect-resolution resize.
+    """
+
+    def __init__(
+        self,
+        registry: EffectRegistry,
+        image: Image.Image,
+        effect_names: Iterable[str],
+        resize_fn: Callable[[Image.Image], Tuple[Image.Image, bool, Tuple[int, int]]]
+    ):
+        self.registry = registry
+        self.image = image
+        self.effect_names = [registry.resolve(name) for name in effect_names]
+        self._resize_fn = resize_fn
+        self._effect_input: Optional[Tuple[Image.Image, bool, Tuple[int, int]]] = None
+
+        self.inputs = set(registry.declared_inputs(self.effect_names))
+
+    @property
+    def needs_resize(self) -> bool:
+        """Whether any requested effect runs at the capped effect resolution"""
+        return INPUT_EFFECT_RESOLUTION in self.inputs
+
+    def effect_input(self) -> Tuple[Image.Image, bool, Tuple[int, int]]:
+        """(image, was_resized, original_size) at effect resolution, resized once per request"""
+        if self._effect_input is None:
+            self._effect_input = self._resize_fn(self.image)
+            if self._effect_input[1]:
+                logger.info(f"Effects will process at {self._effect_input[0].size} instead of {self._effect_input[2]}")
+        return self._effect_input
+
+    def apply(self, effect_name: str, **params) -> Image.Image:
+        """
+        Apply one effect and return it at the original resolution
+
+        Args:
+            effect_name: Effect name or alias
+            **params: Effect parameters
+
+        Returns:
+            Processed PIL Image
+        """
+        spec = self.registry.get_spec(effect_name)
+        apply_fn = self.registry.get_instance(spec.name)
+        if apply_fn is None:
+            # Identity effect - bg-removed image at original resolution
+            return self.image.copy()
+
+        if INPUT_EFFECT_RESOLUTION not in spec.inputs:
+            return apply_fn(self.image, **params)
+
+        source, was_resized, original_size = self.effect_input()
+        result = apply_fn(source, **params)
+
+        # Upscale back to original resolution if we downscaled
+        if was_resized:
+            result = result.resize(original_size, Image.Resampling.LANCZOS)
+        return result
+
+
+def _load_blackwhite(gpu_enabled: bool) -> Callable[..., Image.Image]:
+    # The GPU pipeline falls back to CPU on its own
+    from . import apply_blackwhite_effect
+    return apply_blackwhite_effect
+
+
+_BLACKWHITE_PARAMETERS = {
+    "contrast": {"type": "float", "default": 1.12, "min": 0.8, "max": 1.5},
+    "edge_strength": {"type": "float", "default": 0.9, "min": 0.0, "max": 1.5},
+    "halation": {"type": "float", "default": 0.5, "min": 0.0, "max": 1.0},
+    "grain": {"type": "float", "default": 0.08, "min": 0.0, "max": 0.2}
+}
+
+EFFECT_REGISTRY = EffectRegistry()
+
+EFFECT_REGISTRY.register(EffectSpec(
+    name="color",
+    display_name="Original Color",
+    description="Original color image with background removed (no additional processing)"
+))
+EFFECT_REGISTRY.register(EffectSpec(
+    name="blackwhite",
+    display_name="Enhanced Black & White",
+    description="Tri-X film simulation with adaptive sharpening and halation",
+    parameters=_BLACKWHITE_PARAMETERS,
+    factory=_load_blackwhite,
+    inputs=(INPUT_EFFECT_RESOLUTION,),
+    # Alias for frontend compatibility (InSPyReNet uses 'enhancedblackwhite')
+    aliases=("enhancedblackwhite",)
+))
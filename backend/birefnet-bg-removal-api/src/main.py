@@ -8,6 +8,7 @@ Endpoints:
 - POST /remove-background: Remove background from image
 - POST /remove-background-batch: Batch background removal
 - POST /apply-effect: Apply effect to image (color, blackwhite, etc.)
+- POST /preview-effect: Low-resolution effect preview for live parameter sliders
 - POST /process: Combined bg removal + single effect in one call
 - POST /process-with-effects: Combined bg removal + multiple effects (returns JSON with base64)
 - POST /api/v2/process-with-effects: InSPyReNet-compatible endpoint
@@ -15,6 +16,7 @@ Endpoints:
 - GET /health: Health check
 - GET /model-info: Model information
 - GET /effects: List available effects
+- GET /metrics: Prometheus metrics (OpenMetrics text)
 
 Supported Effects:
 - color: Original color image with background removed (no processing)
@@ -37,8 +39,10 @@ from fastapi.middleware.gzip import GZipMiddleware
 from PIL import Image
 
 from birefnet_processor import get_processor, BiRefNetProcessor, log_gpu_diagnostics
-from effects import TriXPipeline, apply_blackwhite_effect
+from effects.registry import EFFECT_REGISTRY
 from cleanup import get_cleanup
+from metrics import install_metrics, observe_stage, size_label, time_stage
+from preview_proxy import get_proxy_cache, downscale, preview_size, PREVIEW_PROXY_MAX_SIZE
 
 # Configure logging
 logging.basicConfig(
@@ -139,13 +143,16 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "OPTIONS"],
     allow_headers=["*"],
-    expose_headers=["X-Processing-Time-Ms", "X-Model-Variant"]
+    expose_headers=["X-Processing-Time-Ms", "X-Model-Variant", "X-Proxy-Id", "X-Preview-Size"]
 )
 
 # GZip compression middleware for large base64 responses
 # Compresses responses > 1KB, saving 60-75% bandwidth on base64 payloads
 app.add_middleware(GZipMiddleware, minimum_size=1024)
 
+# Request counters/latency and GET /metrics (OpenMetrics)
+install_metrics(app)
+
 
 @app.get("/health")
 async def health_check():
@@ -177,6 +184,14 @@ async def warmup():
     return JSONResponse(content=result, status_code=status_code)
 
 
+def decode_upload(content: bytes) -> Image.Image:
+    """Open and fully decode an upload so decoding is its own stage (PIL decodes lazily)"""
+    with time_stage("decode"):
+        image = Image.open(io.BytesIO(content))
+        image.load()
+    return image
+
+
 @app.post("/remove-background")
 async def remove_background(
     file: UploadFile = File(...),
@@ -216,7 +231,7 @@ async def remove_background(
 
     try:
         # Load image
-        image = Image.open(io.BytesIO(content))
+        image = decode_upload(content)
 
         # Get processor and process
         processor = get_processor()
@@ -226,6 +241,7 @@ async def remove_background(
         )
 
         # Convert to output format
+        encode_start = time.time()
         output_buffer = io.BytesIO()
 
         if output_format == "webp":
@@ -237,6 +253,7 @@ async def remove_background(
 
         output_buffer.seek(0)
         output_bytes = output_buffer.read()
+        observe_stage("encode", time.time() - encode_start, size=size_label(*result.image.size))
 
         total_time_ms = (time.time() - start_time) * 1000
 
@@ -280,7 +297,7 @@ async def remove_background_batch(
     for file in files:
         try:
             content = await file.read()
-            image = Image.open(io.BytesIO(content))
+            image = decode_upload(content)
 
             result = processor.remove_background(image, alpha_matting=alpha_matting)
 
@@ -316,45 +333,13 @@ async def remove_background_batch(
 # EFFECTS ENDPOINTS
 # =============================================================================
 
-# Available effects registry
-AVAILABLE_EFFECTS = {
-    "color": {
-        "name": "Original Color",
-        "description": "Original color image with background removed (no additional processing)",
-        "parameters": {}
-    },
-    "blackwhite": {
-        "name": "Enhanced Black & White",
-        "description": "Tri-X film simulation with adaptive sharpening and halation",
-        "parameters": {
-            "contrast": {"type": "float", "default": 1.12, "min": 0.8, "max": 1.5},
-            "edge_strength": {"type": "float", "default": 0.9, "min": 0.0, "max": 1.5},
-            "halation": {"type": "float", "default": 0.5, "min": 0.0, "max": 1.0},
-            "grain": {"type": "float", "default": 0.08, "min": 0.0, "max": 0.2}
-        }
-    },
-    # Alias for frontend compatibility (InSPyReNet uses 'enhancedblackwhite')
-    "enhancedblackwhite": {
-        "name": "Enhanced Black & White",
-        "description": "Alias for 'blackwhite' - Tri-X film simulation",
-        "parameters": {
-            "contrast": {"type": "float", "default": 1.12, "min": 0.8, "max": 1.5},
-            "edge_strength": {"type": "float", "default": 0.9, "min": 0.0, "max": 1.5},
-            "halation": {"type": "float", "default": 0.5, "min": 0.0, "max": 1.0},
-            "grain": {"type": "float", "default": 0.08, "min": 0.0, "max": 0.2}
-        },
-        "alias_of": "blackwhite"
-    }
-}
+# Available effects - derived from the effect registry (aliases listed with "alias_of")
+AVAILABLE_EFFECTS = EFFECT_REGISTRY.catalog()
 
-# Effect name normalization (aliases)
-EFFECT_ALIASES = {
-    "enhancedblackwhite": "blackwhite"
-}
 
 def normalize_effect_name(effect_name: str) -> str:
-    """Normalize effect name, resolving aliases"""
-    return EFFECT_ALIASES.get(effect_name, effect_name)
+    """Normalize effect name, resolving aliases (case-insensitive)"""
+    return EFFECT_REGISTRY.resolve(effect_name)
 
 
 @app.get("/effects")
@@ -399,7 +384,7 @@ async def apply_effect(
     start_time = time.time()
 
     # Validate effect
-    if effect not in AVAILABLE_EFFECTS:
+    if not EFFECT_REGISTRY.is_known(effect):
         raise HTTPException(
             status_code=400,
             detail=f"Unknown effect: {effect}. Available: {list(AVAILABLE_EFFECTS.keys())}"
@@ -422,28 +407,28 @@ async def apply_effect(
 
     try:
         # Load image
-        image = Image.open(io.BytesIO(content))
+        image = decode_upload(content)
         original_mode = image.mode
 
         # Normalize effect name (handle aliases)
         normalized_effect = normalize_effect_name(effect)
 
-        # Apply effect
-        if normalized_effect == "color":
+        # Apply effect (implementation loaded on first use)
+        apply_fn = EFFECT_REGISTRY.get_instance(normalized_effect)
+        if apply_fn is None:
             # Color effect - return original (no processing)
             result_image = image.copy()
-        elif normalized_effect == "blackwhite":
-            result_image = apply_blackwhite_effect(
+        else:
+            result_image = apply_fn(
                 image,
                 contrast=contrast,
                 edge_strength=edge_strength,
                 halation=halation,
                 grain=grain
             )
-        else:
-            raise HTTPException(status_code=400, detail=f"Effect '{effect}' not implemented")
 
         # Convert to output format
+        encode_start = time.time()
         output_buffer = io.BytesIO()
 
         if output_format == "webp":
@@ -467,6 +452,7 @@ async def apply_effect(
 
         output_buffer.seek(0)
         output_bytes = output_buffer.read()
+        observe_stage("encode", time.time() - encode_start, size=size_label(*result_image.size))
 
         total_time_ms = (time.time() - start_time) * 1000
 
@@ -489,6 +475,91 @@ async def apply_effect(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/preview-effect")
+async def preview_effect(
+    file: Optional[UploadFile] = File(None, description="Background-removed image - first call only"),
+    proxy_id: Optional[str] = Query(None, description="X-Proxy-Id from an earlier preview of the same image"),
+    effect: str = Query("blackwhite", description="Effect to preview"),
+    contrast: float = Query(1.12, ge=0.8, le=1.5, description="Contrast boost"),
+    edge_strength: float = Query(0.9, ge=0.0, le=1.5, description="Edge sharpening"),
+    halation: float = Query(0.5, ge=0.0, le=1.0, description="Glow/halation"),
+    grain: float = Query(0.08, ge=0.0, le=0.2, description="Film grain"),
+    max_size: Optional[int] = Query(None, ge=64, le=PREVIEW_PROXY_MAX_SIZE, description="Preview long side"),
+    quality: int = Query(75, ge=1, le=100, description="WebP quality")
+):
+    """
+    Preview an effect with live parameters on a low-resolution proxy of the cutout.
+
+    The first call uploads the background-removed image and gets an X-Proxy-Id header;
+    slider updates then send only proxy_id and the parameters. Returns a fast-encoded
+    WebP that is never cached - confirm with /apply-effect for the full-resolution render.
+    """
+    start_time = time.time()
+
+    if not EFFECT_REGISTRY.is_known(effect):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown effect: {effect}. Available: {list(AVAILABLE_EFFECTS.keys())}"
+        )
+
+    proxy_cache = get_proxy_cache()
+    if file is not None:
+        if not file.content_type or not file.content_type.startswith("image/"):
+            raise HTTPException(status_code=400, detail="File must be an image")
+        content = await file.read()
+        if len(content) / (1024 * 1024) > MAX_IMAGE_SIZE_MB:
+            raise HTTPException(
+                status_code=413,
+                detail=f"File too large. Maximum size: {MAX_IMAGE_SIZE_MB}MB"
+            )
+        proxy_id = proxy_cache.put(content, decode_upload(content))
+    elif not proxy_id:
+        raise HTTPException(status_code=400, detail="Send the image or a proxy_id")
+
+    proxy = proxy_cache.get(proxy_id)
+    if proxy is None:
+        raise HTTPException(status_code=404, detail="Preview proxy expired - upload the image again")
+
+    try:
+        size = preview_size(max_size)
+        source = downscale(proxy, size) if max(proxy.size) > size else proxy
+
+        effect_start = time.time()
+        apply_fn = EFFECT_REGISTRY.get_instance(normalize_effect_name(effect))
+        if apply_fn is None:
+            result_image = source
+        else:
+            result_image = apply_fn(
+                source,
+                contrast=contrast,
+                edge_strength=edge_strength,
+                halation=halation,
+                grain=grain
+            )
+        observe_stage("effect", time.time() - effect_start, effect=effect, size=size_label(*source.size))
+
+        output_buffer = io.BytesIO()
+        with time_stage("encode", effect=effect, size=size_label(*source.size)):
+            # method=0 is libwebp's fastest encoder setting
+            result_image.save(output_buffer, format="WEBP", quality=quality, method=0)
+
+    except Exception as e:
+        logger.error(f"Effect preview failed: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return Response(
+        content=output_buffer.getvalue(),
+        media_type="image/webp",
+        headers={
+            "X-Processing-Time-Ms": str(int((time.time() - start_time) * 1000)),
+            "X-Proxy-Id": proxy_id,
+            "X-Preview-Size": f"{result_image.size[0]}x{result_image.size[1]}",
+            "X-Effect": effect,
+            "Cache-Control": "no-store"
+        }
+    )
+
+
 @app.post("/process")
 async def process_with_effect(
     file: UploadFile = File(...),
@@ -524,7 +595,7 @@ async def process_with_effect(
     start_time = time.time()
 
     # Validate effect
-    if effect not in AVAILABLE_EFFECTS:
+    if not EFFECT_REGISTRY.is_known(effect):
         raise HTTPException(
             status_code=400,
             detail=f"Unknown effect: {effect}. Available: {list(AVAILABLE_EFFECTS.keys())}"
@@ -547,7 +618,7 @@ async def process_with_effect(
 
     try:
         # Load image
-        image = Image.open(io.BytesIO(content))
+        image = decode_upload(content)
 
         # Step 1: Remove background
         processor = get_processor()
@@ -562,30 +633,22 @@ async def process_with_effect(
         # Normalize effect name (handle aliases)
         normalized_effect = normalize_effect_name(effect)
 
-        if normalized_effect == "color":
-            # Color effect - return bg-removed image (no additional processing)
-            result_image = bg_removed.copy()
-        elif normalized_effect == "blackwhite":
-            # Resize for optimized effect processing
-            bg_for_effect, was_resized, original_size = resize_for_effect_processing(bg_removed)
-
-            result_image = apply_blackwhite_effect(
-                bg_for_effect,
-                contrast=contrast,
-                edge_strength=edge_strength,
-                halation=halation,
-                grain=grain
-            )
-
-            # Upscale back to original resolution if we downscaled
-            if was_resized:
-                result_image = result_image.resize(original_size, Image.Resampling.LANCZOS)
-        else:
-            raise HTTPException(status_code=400, detail=f"Effect '{effect}' not implemented")
+        # The plan resizes for optimized effect processing only if the effect needs it
+        # (color returns the bg-removed image at full resolution) and upscales the result back
+        plan = EFFECT_REGISTRY.plan(bg_removed, [normalized_effect], resize_for_effect_processing)
+        result_image = plan.apply(
+            normalized_effect,
+            contrast=contrast,
+            edge_strength=edge_strength,
+            halation=halation,
+            grain=grain
+        )
 
         effect_time_ms = (time.time() - effect_start) * 1000
+        observe_stage("effect", effect_time_ms / 1000, effect=normalized_effect, size=size_label(*bg_removed.size))
 
         # Convert to output format
+        encode_start = time.time()
         output_buffer = io.BytesIO()
 
         if output_format == "webp":
@@ -607,6 +670,7 @@ async def process_with_effect(
 
         output_buffer.seek(0)
         output_bytes = output_buffer.read()
+        observe_stage("encode", time.time() - encode_start, size=size_label(*result_image.size))
 
         total_time_ms = (time.time() - start_time) * 1000
 
@@ -681,7 +745,7 @@ async def process_with_multiple_effects(
         raise HTTPException(status_code=400, detail="No effects specified")
 
     # Validate all effects
-    invalid_effects = [e for e in effects_list if e not in AVAILABLE_EFFECTS]
+    invalid_effects = [e for e in effects_list if not EFFECT_REGISTRY.is_known(e)]
     if invalid_effects:
         raise HTTPException(
             status_code=400,
@@ -705,7 +769,7 @@ async def process_with_multiple_effects(
 
     try:
         # Load image
-        image = Image.open(io.BytesIO(content))
+        image = decode_upload(content)
 
         # ESRGAN preprocessing DISABLED - was causing quality regression
         # Root cause: ESRGAN artifacts + BiRefNet downsampling to 1024px made segmentation worse
@@ -719,13 +783,11 @@ async def process_with_multiple_effects(
 
         bg_time_ms = bg_result.inference_time_ms
 
-        # Step 2: Resize for effect processing (optimization)
+        # Step 2: Plan effects - the resize for effect processing (optimization) runs once,
+        # and only if a requested effect needs it
         # Processing effects on 12MP images takes 30+ seconds
         # Processing at 4MP takes ~8 seconds with minimal quality loss
-        bg_for_effects, was_resized, original_size = resize_for_effect_processing(bg_removed)
-
-        if was_resized:
-            logger.info(f"Effects will process at {bg_for_effects.size} instead of {original_size}")
+        plan = EFFECT_REGISTRY.plan(bg_removed, effects_list, resize_for_effect_processing)
 
         # Step 3: Apply each effect at optimized resolution
         effect_results = {}
@@ -734,43 +796,31 @@ async def process_with_multiple_effects(
         for effect_name in effects_list:
             effect_start = time.time()
 
-            # Normalize effect name (handle aliases like enhancedblackwhite -> blackwhite)
-            normalized_name = normalize_effect_name(effect_name)
-
-            if normalized_name == "color":
-                # Color effect - return bg-removed image (no additional processing)
-                # Use original resolution since there's no heavy processing
-                result_image = bg_removed.copy()
-            elif normalized_name == "blackwhite":
-                # Apply effect at optimized resolution
-                result_image = apply_blackwhite_effect(
-                    bg_for_effects,
-                    contrast=contrast,
-                    edge_strength=edge_strength,
-                    halation=halation,
-                    grain=grain
-                )
-                # Upscale back to original resolution if we downscaled
-                if was_resized:
-                    upscale_start = time.time()
-                    result_image = result_image.resize(original_size, Image.Resampling.LANCZOS)
-                    upscale_time = (time.time() - upscale_start) * 1000
-                    logger.debug(f"Upscaled {effect_name} to {original_size} in {upscale_time:.0f}ms")
-            else:
-                continue  # Skip unknown effects (shouldn't happen after validation)
+            # Aliases like enhancedblackwhite -> blackwhite are resolved by the registry;
+            # color returns the bg-removed image at original resolution
+            result_image = plan.apply(
+                effect_name,
+                contrast=contrast,
+                edge_strength=edge_strength,
+                halation=halation,
+                grain=grain
+            )
 
             # Use original effect_name as key so frontend gets expected names
             effect_timings[effect_name] = (time.time() - effect_start) * 1000
+            size = size_label(*bg_removed.size)
+            observe_stage("effect", effect_timings[effect_name] / 1000, effect=effect_name, size=size)
 
             # Encode to base64
             output_buffer = io.BytesIO()
-            if output_format == "webp":
-                result_image.save(output_buffer, format="WEBP", quality=95)
-                mime_type = "image/webp"
-            else:
-                # optimize=False for faster encoding (5s -> 1-2s), transparency preserved
-                result_image.save(output_buffer, format="PNG", optimize=False)
-                mime_type = "image/png"
+            with time_stage("encode", effect=effect_name, size=size):
+                if output_format == "webp":
+                    result_image.save(output_buffer, format="WEBP", quality=95)
+                    mime_type = "image/webp"
+                else:
+                    # optimize=False for faster encoding (5s -> 1-2s), transparency preserved
+                    result_image.save(output_buffer, format="PNG", optimize=False)
+                    mime_type = "image/png"
 
             output_buffer.seek(0)
             b64_data = base64.b64encode(output_buffer.read()).decode()
@@ -0,0 +1,382 @@
+"""
+Service Metrics
+Prometheus /metrics in OpenMetrics text format, per-request stage traces (Server-Timing) and opt-in sampling profiles
+"""
+
+# The same file ships in every service (inspirenet-api, birefnet-bg-removal-api,
+# gemini-artistic-api) - each image copies only its own src/, so it has no imports from
+# either service. Change all copies together.
+
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import logging
+import threading
+from collections import Counter as StackCounter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Any, Callable, Iterator, List, Optional, Tuple
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, ProcessCollector
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from prometheus_client.openmetrics.exposition import CONTENT_TYPE_LATEST, generate_latest
+
+try:
+    import psutil
+except ImportError:  # Not in every service's requirements - /proc is read instead
+    psutil = None
+
+logger = logging.getLogger(__name__)
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+OPENMETRICS_CONTENT_TYPE = CONTENT_TYPE_LATEST
+
+# Seconds - from cache lookups and encodes up to cold model loads and generation calls
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Long-edge bounds in pixels for the size label (same as inspirenet's latency_stats buckets)
+SIZE_BUCKETS = (512, 1024, 1536, 2048)
+
+# Stage spans of each request as a Server-Timing header (visible in browser devtools)
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", "true").lower() == "true"
+# Cross-origin pages only see Server-Timing through the Resource Timing API with this set
+TIMING_ALLOW_ORIGIN = os.getenv("TIMING_ALLOW_ORIGIN", "")
+# Optional JSONL trace log - one line per request at or above TRACE_LOG_MIN_MS
+TRACE_LOG_PATH = os.getenv("TRACE_LOG_PATH", "")
+TRACE_LOG_MIN_MS = float(os.getenv("TRACE_LOG_MIN_MS", "0"))
+# Bounds the header size for requests with many effects
+MAX_TRACE_SPANS = 64
+
+# Opt-in sampling profiler - a request is profiled when it sends X-Profile: <token> (or
+# ?profile=<token>), or at random with PROFILE_SAMPLE_RATE. Both unset costs nothing per request.
+PROFILE_ADMIN_TOKEN = os.getenv("PROFILE_ADMIN_TOKEN", "")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "/tmp/profiles")
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "50"))
+# Leaf frames of threads parked waiting for work (event loop select, idle pool workers)
+IDLE_FRAMES = {("selectors.py", "select"), ("threading.py", "wait"), ("thread.py", "_worker"), ("queue.py", "get")}
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+# Tiers counted here (record_cache_lookup) and tiers whose counts live in their own stats
+_cache_counts: Dict[str, List[int]] = {}
+_cache_sources: Dict[str, Callable[[], Tuple[int, int]]] = {}
+_cache_lock = threading.Lock()
+
+
+class CacheTierCollector:
+    """Cache lookups and hit ratio per tier, read at scrape time (no per-lookup metric updates)"""
+
+    def collect(self):
+        with _cache_lock:
+            tiers = {tier: tuple(counts) for tier, counts in _cache_counts.items()}
+        for tier, source in _cache_sources.items():
+            try:
+                tiers[tier] = source()
+            except Exception as e:
+                logger.warning(f"Cache source '{tier}' failed: {e}")
+
+        lookups = CounterMetricFamily("cache_lookups", "Cache lookups by tier and result", labels=("tier", "result"))
+        ratio = GaugeMetricFamily("cache_hit_ratio", "Hits over lookups since start, per cache tier", labels=("tier",))
+        for tier, (hits, misses) in sorted(tiers.items()):
+            lookups.add_metric((tier, "hit"), hits)
+            lookups.add_metric((tier, "miss"), misses)
+            ratio.add_metric((tier,), hits / (hits + misses) if hits + misses else 0)
+        yield lookups
+        yield ratio
+
+
+# Process-wide registry and the families every service exposes
+registry = CollectorRegistry()
+
+http_requests = Counter(
+    "http_requests", "HTTP requests by method, route template and status", ("method", "route", "status"),
+    registry=registry
+)
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template", ("method", "route"),
+    buckets=DEFAULT_BUCKETS, registry=registry
+)
+http_requests_in_flight = Gauge(
+    "http_requests_in_flight", "Requests being handled by this instance (queue depth at the container)",
+    registry=registry
+)
+stage_duration = Histogram(
+    "stage_duration_seconds", "Pipeline stage latency by stage, effect and image size bucket", ("stage", "effect", "size"),
+    buckets=DEFAULT_BUCKETS, registry=registry
+)
+model_load_seconds = Gauge(
+    "model_load_seconds", "Duration of the last successful model load", ("model",), registry=registry
+)
+# process_resident_memory_bytes, CPU seconds, open fds (reads /proc - Linux only)
+ProcessCollector(registry=registry)
+registry.register(CacheTierCollector())
+
+
+def render_metrics() -> bytes:
+    """The registry in OpenMetrics text format (ends with # EOF)"""
+    return generate_latest(registry)
+
+
+def size_label(width: int, height: int) -> str:
+    long_edge = max(width, height)
+    for bound in SIZE_BUCKETS:
+        if long_edge <= bound:
+            return f"<={bound}px"
+    return f">{SIZE_BUCKETS[-1]}px"
+
+
+class RequestTrace:
+    """Stage spans of one request - (stage, effect, size, start offset, duration) in seconds"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.spans: List[Tuple[str, Optional[str], Optional[str], float, float]] = []
+
+    def add(self, stage: str, seconds: float, effect: Optional[str] = None, size: Optional[str] = None):
+        if len(self.spans) < MAX_TRACE_SPANS:
+            offset = time.perf_counter() - self.start - seconds
+            self.spans.append((stage, effect, size, max(offset, 0.0), seconds))
+
+    def server_timing(self, total_seconds: float) -> str:
+        """Server-Timing header value - one entry per span, effect/size as desc, plus total"""
+        entries = []
+        for stage, effect, size, _, seconds in self.spans:
+            entry = stage
+            description = " ".join(part for part in (effect, size) if part)
+            if description:
+                entry += f';desc="{_escape(description)}"'
+            entries.append(f"{entry};dur={seconds * 1000:.1f}")
+        entries.append(f"total;dur={total_seconds * 1000:.1f}")
+        return ", ".join(entries)
+
+    def to_record(self, method: str, route: str, status: int, total_seconds: float) -> Dict[str, Any]:
+        return {
+            'ts': round(time.time(), 3),
+            'method': method,
+            'route': route,
+            'status': status,
+            'total_ms': round(total_seconds * 1000, 1),
+            'spans': [
+                {'stage': stage, 'effect': effect, 'size': size,
+                 'start_ms': round(offset * 1000, 1), 'dur_ms': round(seconds * 1000, 1)}
+                for stage, effect, size, offset, seconds in self.spans
+            ]
+        }
+
+
+# Trace of the request being handled - set by the middleware, copied into tasks with the context
+_current_trace: ContextVar[Optional[RequestTrace]] = ContextVar("request_trace", default=None)
+_trace_log_lock = threading.Lock()
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current_trace.get()
+
+
+def write_trace(record: Dict[str, Any]):
+    try:
+        line = json.dumps(record)
+        with _trace_log_lock, open(TRACE_LOG_PATH, "a") as f:
+            f.write(line + "\n")
+    except Exception as e:
+        logger.warning(f"Trace log write failed: {e}")
+
+
+def observe_stage(stage: str, seconds: float, effect: Optional[str] = None, size: Optional[str] = None):
+    """Stage histogram sample, and a span on the current request's trace (if any)"""
+    stage_duration.labels(stage=stage, effect=effect or "", size=size or "").observe(seconds)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(stage, seconds, effect, size)
+
+
+@contextmanager
+def time_stage(stage: str, effect: Optional[str] = None, size: Optional[str] = None) -> Iterator[None]:
+    """Observe the duration of the with-block (also when it raises)"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start, effect, size)
+
+
+def record_cache_lookup(tier: str, hit: bool):
+    with _cache_lock:
+        counts = _cache_counts.setdefault(tier, [0, 0])
+        counts[0 if hit else 1] += 1
+
+
+def register_cache_source(tier: str, source: Callable[[], Tuple[int, int]]):
+    """Expose a tier that already counts its lookups - source returns (hits, misses)"""
+    _cache_sources[tier] = source
+
+
+def resident_memory_bytes() -> int:
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+class StackSampler:
+    """
+    Collapsed-stack sampler - a daemon thread snapshots every other thread's stack each interval
+
+    Samples are process-wide (executor threads are where decode, inference and effects run),
+    so overlapping requests show up too; only one sampler runs at a time.
+    """
+
+    def __init__(self, interval: float = PROFILE_INTERVAL_MS / 1000):
+        self.interval = interval
+        self.stacks: StackCounter = StackCounter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self) -> "StackSampler":
+        self._thread.start()
+        return self
+
+    def stop(self) -> StackCounter:
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+    def _run(self):
+        own = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            self.samples += 1
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                code = frame.f_code
+                if (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+                    continue
+                if thread_id not in names:
+                    names = {thread.ident: thread.name for thread in threading.enumerate()}
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def collapsed(self) -> str:
+        """Brendan Gregg folded format - "root;...;leaf count" per line, for flamegraph.pl / speedscope"""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+_profile_lock = threading.Lock()
+
+
+def _profile_requested(request) -> bool:
+    if PROFILE_ADMIN_TOKEN and PROFILE_ADMIN_TOKEN in (
+        request.headers.get("x-profile"), request.query_params.get("profile")
+    ):
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def profile_path(profile_id: str) -> str:
+    return os.path.join(PROFILE_DIR, f"{profile_id}.folded")
+
+
+def save_profile(sampler: StackSampler, method: str, route: str) -> Optional[str]:
+    """Write the folded stacks under PROFILE_DIR (keeping the newest PROFILE_MAX_FILES); returns the id"""
+    profile_id = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        with open(profile_path(profile_id), "w") as f:
+            f.write(f"# {method} {route} samples={sampler.samples} interval_ms={sampler.interval * 1000:g}\n")
+            f.write(sampler.collapsed())
+        profiles = sorted(name for name in os.listdir(PROFILE_DIR) if name.endswith(".folded"))
+        for name in profiles[:-PROFILE_MAX_FILES]:
+            os.remove(os.path.join(PROFILE_DIR, name))
+    except OSError as e:
+        logger.warning(f"Profile write failed: {e}")
+        return None
+    return profile_id
+
+
+def _finish_request(request, response, start: float, trace: Optional[RequestTrace]):
+    elapsed = time.perf_counter() - start
+    status = response.status_code if response is not None else 500
+    # Route template, not the raw path - keeps label cardinality bounded
+    route = getattr(request.scope.get("route"), "path", None) or "unmatched"
+    if METRICS_ENABLED:
+        http_requests_in_flight.dec()
+        http_requests.labels(method=request.method, route=route, status=status).inc()
+        http_request_duration.labels(method=request.method, route=route).observe(elapsed)
+    if trace is None:
+        return
+    if SERVER_TIMING_ENABLED and response is not None:
+        response.headers["Server-Timing"] = trace.server_timing(elapsed)
+        if TIMING_ALLOW_ORIGIN:
+            response.headers["Timing-Allow-Origin"] = TIMING_ALLOW_ORIGIN
+    if TRACE_LOG_PATH and elapsed * 1000 >= TRACE_LOG_MIN_MS:
+        write_trace(trace.to_record(request.method, route, status, elapsed))
+
+
+def install_metrics(app, path: str = "/metrics", profiles_path: str = "/debug/profiles"):
+    """Count, time, trace and (opt-in) profile every HTTP request and serve the registry at path (call with the other middleware)"""
+    tracing = SERVER_TIMING_ENABLED or bool(TRACE_LOG_PATH)
+    profiling = bool(PROFILE_ADMIN_TOKEN) or PROFILE_SAMPLE_RATE > 0
+    if not METRICS_ENABLED and not tracing and not profiling:
+        return
+
+    from fastapi import Request, HTTPException
+    from fastapi.responses import Response, PlainTextResponse
+
+    @app.middleware("http")
+    async def metrics_middleware(request: Request, call_next):
+        start = time.perf_counter()
+        trace = RequestTrace() if tracing else None
+        token = _current_trace.set(trace)
+        if METRICS_ENABLED:
+            http_requests_in_flight.inc()
+        sampler = None
+        if (profiling and not request.url.path.startswith(profiles_path)
+                and _profile_requested(request) and _profile_lock.acquire(blocking=False)):
+            sampler = StackSampler().start()
+        response = None
+        try:
+            response = await call_next(request)
+            return response
+        finally:
+            _current_trace.reset(token)
+            if sampler is not None:
+                sampler.stop()
+                _profile_lock.release()
+                route = getattr(request.scope.get("route"), "path", None) or "unmatched"
+                profile_id = save_profile(sampler, request.method, route)
+                if profile_id and response is not None:
+                    response.headers["X-Profile-Id"] = profile_id
+                    if PROFILE_ADMIN_TOKEN:
+                        response.headers["X-Profile-URL"] = f"{profiles_path}/{profile_id}"
+            _finish_request(request, response, start, trace)
+
+    if PROFILE_ADMIN_TOKEN:
+        async def profile_endpoint(profile_id: str, request: Request):
+            if PROFILE_ADMIN_TOKEN not in (request.headers.get("x-profile"), request.query_params.get("profile")):
+                raise HTTPException(status_code=403, detail="Profile token required")
+            if os.path.basename(profile_id) != profile_id or not os.path.exists(profile_path(profile_id)):
+                raise HTTPException(status_code=404, detail="Profile not found")
+            with open(profile_path(profile_id)) as f:
+                return PlainTextResponse(f.read())
+
+        app.add_api_route(f"{profiles_path}/{{profile_id}}", profile_endpoint, methods=["GET"], include_in_schema=False)
+
+    if METRICS_ENABLED:
+        async def metrics_endpoint():
+            return Response(content=render_metrics(), media_type=OPENMETRICS_CONTENT_TYPE)
+
+        app.add_api_route(path, metrics_endpoint, methods=["GET"], include_in_schema=False)
@@ -0,0 +1,110 @@
+"""
+Preview Proxies for BiRefNet Background Removal API
+
+Live effect-parameter sliders render on a downscaled copy of the cutout instead of
+the full-resolution image. The first preview call uploads the cutout once; the proxy
+is kept in a small in-memory LRU and later calls refer to it by proxy_id.
+"""
+import os
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Long side of the stored proxy - previews never render larger
+PREVIEW_PROXY_MAX_SIZE = int(os.getenv("PREVIEW_PROXY_MAX_SIZE", "512"))
+# Proxies are ~0.8MB each at 512px RGBA
+PREVIEW_PROXY_CACHE_MB = int(os.getenv("PREVIEW_PROXY_CACHE_MB", "128"))
+PREVIEW_PROXY_TTL_SECONDS = int(os.getenv("PREVIEW_PROXY_TTL_SECONDS", "1800"))
+# Requested preview sizes round up to one of these
+PREVIEW_SIZES = tuple(size for size in (128, 256) if size < PREVIEW_PROXY_MAX_SIZE) + (PREVIEW_PROXY_MAX_SIZE,)
+
+
+def preview_size(max_size: Optional[int] = None) -> int:
+    """Smallest fixed preview size covering max_size (PREVIEW_PROXY_MAX_SIZE when not given)"""
+    max_size = max_size or PREVIEW_PROXY_MAX_SIZE
+    return next((size for size in PREVIEW_SIZES if size >= max_size), PREVIEW_PROXY_MAX_SIZE)
+
+
+def downscale(image: Image.Image, max_size: int) -> Image.Image:
+    """Copy with long side <= max_size (PIL resamples RGBA premultiplied, so edges don't bleed)"""
+    scale = max_size / max(image.size)
+    if scale >= 1:
+        return image.copy()
+    size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    return image.resize(size, Image.Resampling.BILINEAR, reducing_gap=2.0)
+
+
+class PreviewProxyCache:
+    """LRU (by bytes, with TTL) of downscaled RGBA cutouts keyed by a content hash"""
+
+    def __init__(
+        self,
+        max_bytes: int = PREVIEW_PROXY_CACHE_MB * 1024 * 1024,
+        ttl: int = PREVIEW_PROXY_TTL_SECONDS,
+        max_size: int = PREVIEW_PROXY_MAX_SIZE
+    ):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: 'OrderedDict[str, Tuple[Image.Image, float]]' = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'stored': 0}
+
+    @staticmethod
+    def proxy_id(content: bytes) -> str:
+        return hashlib.sha256(content).hexdigest()[:32]
+
+    @staticmethod
+    def _nbytes(image: Image.Image) -> int:
+        return image.width * image.height * len(image.getbands())
+
+    def put(self, content: bytes, image: Image.Image) -> str:
+        """Store the proxy of a decoded cutout and return its proxy_id"""
+        key = self.proxy_id(content)
+        proxy = downscale(image.convert('RGBA'), self.max_size)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= self._nbytes(previous[0])
+            self._entries[key] = (proxy, time.time())
+            self._bytes += self._nbytes(proxy)
+            self.stats['stored'] += 1
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                _, (old, _) = self._entries.popitem(last=False)
+                self._bytes -= self._nbytes(old)
+        return key
+
+    def get(self, key: str) -> Optional[Image.Image]:
+        """Proxy for a proxy_id, or None when unknown or expired"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or now - entry[1] > self.ttl:
+                if entry is not None:
+                    del self._entries[key]
+                    self._bytes -= self._nbytes(entry[0])
+                self.stats['misses'] += 1
+                return None
+            self._entries[key] = (entry[0], now)
+            self._entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return entry[0]
+
+
+_proxy_cache: Optional[PreviewProxyCache] = None
+
+
+def get_proxy_cache() -> PreviewProxyCache:
+    """Process-wide proxy cache (created on first use)"""
+    global _proxy_cache
+    if _proxy_cache is None:
+        _proxy_cache = PreviewProxyCache()
+    return _proxy_cache
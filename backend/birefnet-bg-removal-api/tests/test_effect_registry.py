@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Tests for the effect registry and per-request effect plans (no model needed)
+
+Usage:
+    pytest tests/test_effect_registry.py
+"""
+import sys
+from pathlib import Path
+
+from PIL import Image
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from effects.registry import EffectRegistry, EffectSpec, EFFECT_REGISTRY, INPUT_EFFECT_RESOLUTION
+
+
+def halve(image):
+    """resize_fn stand-in: always downscale by 2"""
+    return image.resize((image.width // 2, image.height // 2)), True, image.size
+
+
+def test_names_resolve_case_insensitively():
+    """Aliases and mixed-case names resolve the same way as in the InSPyReNet service"""
+    assert EFFECT_REGISTRY.resolve(" EnhancedBlackWhite ") == "blackwhite"
+    assert EFFECT_REGISTRY.is_known("BLACKWHITE")
+    assert not EFFECT_REGISTRY.is_known("watercolor")
+    assert EFFECT_REGISTRY.catalog()["enhancedblackwhite"]["alias_of"] == "blackwhite"
+
+
+def test_plan_resizes_once_and_only_when_needed():
+    """Color alone never resizes; effects declaring the capped input share one resize"""
+    calls = []
+    registry = EffectRegistry()
+    registry.register(EffectSpec("color", "Original"))
+    registry.register(EffectSpec(
+        "invert", "Invert", factory=lambda gpu: lambda image: image.point(lambda v: 255 - v),
+        inputs=(INPUT_EFFECT_RESOLUTION,), aliases=("negative",)
+    ))
+    image = Image.new("RGB", (64, 48), (10, 20, 30))
+
+    def resize(image):
+        calls.append(image.size)
+        return halve(image)
+
+    plan = registry.plan(image, ["color"], resize)
+    assert not plan.needs_resize
+    assert plan.apply("color").getpixel((0, 0)) == (10, 20, 30)
+
+    plan = registry.plan(image, ["color", "Invert", "negative"], resize)
+    assert plan.needs_resize
+    result = plan.apply("invert")
+    plan.apply("negative")
+    assert result.size == (64, 48) and result.getpixel((0, 0)) == (245, 235, 225)
+    assert calls == [(64, 48)]
+    assert registry.initialized_effects() == ["invert"]
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"[OK] {name}")
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Numeric tests for the mask helpers in birefnet_processor (no model needed)
+
+Usage:
+    pytest tests/test_mask_utils.py
+"""
+import sys
+from pathlib import Path
+
+import cv2
+import numpy as np
+from PIL import Image
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from birefnet_processor import guided_filter, refine_mask, find_subject_bbox
+
+
+def step_mask(height=40, width=50, edge=25):
+    """Hard vertical edge: background left of `edge`, subject from it on"""
+    mask = np.zeros((height, width), dtype=np.float32)
+    mask[:, edge:] = 1.0
+    return mask
+
+
+def test_guided_filter_constant_guide():
+    """A flat guide has no edges to follow - the filter degrades to a mean filter"""
+    guide = np.full((40, 50, 3), 0.4, dtype=np.float32)
+    constant = np.full((40, 50), 0.7, dtype=np.float32)
+    assert np.allclose(guided_filter(guide, constant), constant)
+
+    src = np.random.default_rng(0).random((40, 50), dtype=np.float32)
+
+    def box(x):
+        return cv2.boxFilter(x, -1, (9, 9), borderType=cv2.BORDER_REFLECT)
+
+    assert np.allclose(guided_filter(guide, src, radius=4), box(box(src)), atol=1e-5)
+
+
+def test_guided_filter_keeps_edge_the_guide_shares():
+    """A mask edge that matches an edge in the guide comes back sharp and in range"""
+    mask = step_mask()
+    out = guided_filter(np.dstack([mask] * 3), mask)
+    assert out.dtype == np.float32
+    assert np.abs(out - mask).max() < 0.01
+
+
+def test_refine_mask_range_and_hard_edge():
+    """Refined mask is uint8 at output size, saturated away from the edge, with a narrow transition"""
+    mask = step_mask()
+    guide = Image.fromarray((np.dstack([mask] * 3) * 255).astype(np.uint8))
+    # Soft model output around the same edge
+    pred = mask * 0.9 + 0.05
+
+    refined = refine_mask(pred, guide, (100, 80))
+    assert refined.dtype == np.uint8 and refined.shape == (80, 100)
+    assert refined[:, :46].max() == 0
+    assert refined[:, 54:].min() == 255
+    # Bilinear 2x upscale of a hard edge - at most a few partial pixels per row
+    assert ((refined > 0) & (refined < 255)).sum(axis=1).max() <= 4
+
+
+def test_refine_mask_without_guided_filter_leaves_pred_untouched():
+    """guided_radius=0 refines a copy, not the caller's array"""
+    pred = step_mask() * 0.8 + 0.1
+    before = pred.copy()
+    refined = refine_mask(pred, Image.new('RGB', (50, 40)), (50, 40), guided_radius=0)
+    assert np.array_equal(pred, before)
+    assert refined.min() < 10 and refined.max() > 245
+
+
+def test_find_subject_bbox_scales_and_pads():
+    """Box from a low-res probability mask, mapped to image pixels with padding clamped to the frame"""
+    mask = np.zeros((50, 40), dtype=np.float32)
+    mask[10:30, 8:20] = 0.9
+    mask[5, 30] = 0.1  # below threshold
+
+    # 10x scale: subject spans x 80-200, y 100-300; padding 10% -> max(16, 12) and max(16, 20)
+    assert find_subject_bbox(mask, (400, 500)) == (64, 80, 216, 320)
+    # Padding never leaves the frame
+    assert find_subject_bbox(mask, (400, 500), padding=1.0) == (0, 0, 320, 500)
+    assert find_subject_bbox(np.zeros((50, 40), dtype=np.float32), (400, 500)) is None
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"[OK] {name}")
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Tests for the preview proxy cache behind /preview-effect (no model needed)
+
+Usage:
+    pytest tests/test_preview_proxy.py
+"""
+import sys
+from pathlib import Path
+
+from PIL import Image
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from preview_proxy import PreviewProxyCache, preview_size
+
+
+def test_proxy_is_downscaled_and_found_by_id():
+    """One upload stores a <=512px RGBA proxy; later calls find it by content hash"""
+    cache = PreviewProxyCache()
+    image = Image.new('RGB', (1600, 1200), (10, 20, 30))
+    proxy_id = cache.put(b"cutout-bytes", image)
+
+    assert proxy_id == PreviewProxyCache.proxy_id(b"cutout-bytes")
+    proxy = cache.get(proxy_id)
+    assert proxy.mode == 'RGBA' and proxy.size == (512, 384)
+    assert cache.get("unknown") is None
+
+
+def test_lru_by_bytes_and_ttl():
+    """Oldest proxies go first once over budget; expired proxies are gone"""
+    one = 512 * 384 * 4
+    cache = PreviewProxyCache(max_bytes=2 * one)
+    for i in range(3):
+        cache.put(f"image-{i}".encode(), Image.new('RGBA', (1024, 768)))
+    assert cache.get(PreviewProxyCache.proxy_id(b"image-0")) is None
+    assert cache.get(PreviewProxyCache.proxy_id(b"image-2")) is not None
+
+    expired = PreviewProxyCache(ttl=-1)
+    proxy_id = expired.put(b"old", Image.new('RGBA', (64, 64)))
+    assert expired.get(proxy_id) is None
+
+
+def test_preview_size_rounds_to_fixed_sizes():
+    assert preview_size() == 512
+    assert preview_size(100) == 128
+    assert preview_size(300) == 512
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"[OK] {name}")
@@ -1,6 +1,6 @@
 """Application configuration using Pydantic settings"""
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import List, Dict
 
 
 class Settings(BaseSettings):
@@ -31,6 +31,9 @@ class Settings(BaseSettings):
     # Storage Configuration
     storage_bucket: str = "perkieprints-processing-cache"
     cache_ttl_seconds: int = 604800  # 7 days
+    # Cache versions - bump to stop serving generations made by older prompts/models
+    generation_cache_version: int = 1
+    style_cache_versions: Dict[str, int] = {}  # Per-style overrides, e.g. {"ink_wash": 2}
 
     # Signed URL Configuration
     signed_url_expiry_hours: int = 24  # URL expiry time for email downloads
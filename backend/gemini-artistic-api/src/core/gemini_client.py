@@ -11,6 +11,7 @@ from io import BytesIO
 from PIL import Image
 from src.config import settings
 from src.models.schemas import ArtisticStyle
+from src.core.metrics import observe_stage
 
 logger = logging.getLogger(__name__)
 
@@ -215,6 +216,7 @@ class GeminiClient:
             generated_base64 = base64.b64encode(generated_image_data).decode('utf-8')
 
             processing_time = time.time() - start_time
+            observe_stage("generation", processing_time, effect=style.value)
             logger.info(f"Generated {style.value} in {processing_time:.2f}s")
 
             return generated_base64, processing_time
@@ -332,6 +334,7 @@ class GeminiClient:
             generated_base64 = base64.b64encode(generated_image_data).decode('utf-8')
 
             processing_time = time.time() - start_time
+            observe_stage("generation", processing_time, effect="custom")
             logger.info(f"Generated custom prompt result in {processing_time:.2f}s")
 
             return generated_base64, processing_time
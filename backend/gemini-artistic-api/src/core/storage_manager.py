@@ -6,6 +6,7 @@ import logging
 from typing import Optional, Tuple
 from datetime import datetime
 from src.config import settings
+from src.core.metrics import record_cache_lookup, time_stage
 
 logger = logging.getLogger(__name__)
 
@@ -13,8 +14,9 @@ logger = logging.getLogger(__name__)
 class StorageManager:
     """Manage Cloud Storage with deduplication and caching"""
 
-    def __init__(self):
-        self.client = storage.Client(project=settings.project_id)
+    def __init__(self, client=None):
+        # Any google.cloud.storage-compatible client (e.g. a local stand-in for offline load tests)
+        self.client = client or storage.Client(project=settings.project_id)
         self.bucket = self.client.bucket(settings.storage_bucket)
         logger.info(f"Initialized storage: {settings.storage_bucket}")
 
@@ -57,16 +59,23 @@ class StorageManager:
             'session_id': session_id or 'none',
             'upload_date': datetime.utcnow().isoformat(),
         }
-        blob.upload_from_string(image_bytes, content_type='image/jpeg')
+        with time_stage("upload", effect="original"):
+            blob.upload_from_string(image_bytes, content_type='image/jpeg')
         logger.info(f"Stored original: {blob_path}")
 
         return blob.public_url, image_hash
 
+    def _cache_namespace(self, style: str, custom: bool = False) -> str:
+        """Model and style version the generation was produced with"""
+        model = settings.gemini_custom_model if custom else settings.gemini_model
+        version = settings.style_cache_versions.get(style, settings.generation_cache_version)
+        return f"{model}-v{version}"
+
     def _cache_key(self, image_hash: str, style: str, prompt_hash: Optional[str] = None) -> str:
-        """Build cache key component from style or prompt hash"""
+        """Build cache key component from style or prompt hash, versioned by model and style"""
         if prompt_hash:
-            return f"{image_hash}_custom_{prompt_hash[:16]}"
-        return f"{image_hash}_{style}"
+            return f"{image_hash}_custom_{prompt_hash[:16]}_{self._cache_namespace('custom', custom=True)}"
+        return f"{image_hash}_{style}_{self._cache_namespace(style)}"
 
     async def get_cached_generation(
         self,
@@ -79,7 +88,8 @@ class StorageManager:
         """
         Check if we've already generated this image+style (or image+prompt)
 
-        Cache key: {image_hash}_{style}.jpg or {image_hash}_custom_{prompt_hash[:16]}.jpg
+        Cache key: {image_hash}_{style}_{model}-v{n}.jpg or
+        {image_hash}_custom_{prompt_hash[:16]}_{model}-v{n}.jpg
         """
         cache_key = self._cache_key(image_hash, style, prompt_hash)
 
@@ -93,7 +103,10 @@ class StorageManager:
 
         blob = self.bucket.blob(blob_path)
 
-        if blob.exists():
+        with time_stage("cache_lookup", effect=style):
+            hit = blob.exists()
+        record_cache_lookup("generation", hit)
+        if hit:
             logger.info(f"Cache hit: {blob_path}")
             return blob.public_url
 
@@ -145,7 +158,8 @@ class StorageManager:
             metadata['prompt'] = prompt_text[:200]  # Truncate for metadata limits
 
         blob.metadata = metadata
-        blob.upload_from_string(image_bytes, content_type='image/jpeg')
+        with time_stage("upload", effect=style):
+            blob.upload_from_string(image_bytes, content_type='image/jpeg')
         logger.info(f"Stored generated: {blob_path}")
 
         return blob.public_url
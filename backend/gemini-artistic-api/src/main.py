@@ -23,6 +23,7 @@ from src.models.schemas import (
 from src.core.gemini_client import gemini_client
 from src.core.rate_limiter import rate_limiter
 from src.core.storage_manager import storage_manager
+from src.core.metrics import install_metrics
 # from src.core.email_client import email_client  # TODO: Enable when email client is ready
 
 # Configure logging
@@ -69,6 +70,9 @@ app.add_middleware(
     expose_headers=["*"],
 )
 
+# Request counters/latency and GET /metrics (OpenMetrics)
+install_metrics(app)
+
 
 @app.get("/health")
 async def health_check():
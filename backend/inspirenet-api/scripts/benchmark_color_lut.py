@@ -0,0 +1,93 @@
+"""
+Color LUT Benchmark
+Accuracy (max delta-E) and speed of compiled color LUTs against direct evaluation
+
+Usage:
+    python scripts/benchmark_color_lut.py [--size 1280x960] [--lut-sizes 33,65]
+
+For each pointwise stage the table is compiled at every LUT size and compared with
+direct evaluation on random colors (CIE76 delta-E). Timings are per frame on a smooth
+synthetic image, after one warm-up run. "popart (whole)" compiles the full pop art
+function including posterization to show why it is not tabled trilinearly - only its
+color mapping stage is, over the posterized levels where the lookup is exact.
+"""
+
+import os
+import sys
+import time
+import argparse
+import logging
+from typing import Callable
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../src'))
+
+import numpy as np
+import cv2
+
+from effects.color_lut import accuracy_report, compile_color_lut, lut_grid, INTERP_NEAREST
+from effects.enhanced_blackwhite_effect import EnhancedBlackWhiteEffect
+from effects.optimized_popart_effect import OptimizedPopArtEffect
+
+logging.basicConfig(level=logging.WARNING)
+
+
+def make_image(width: int, height: int) -> np.ndarray:
+    """Smooth RGB gradients (no noise, so tone curves see realistic neighbourhoods)"""
+    yy, xx = np.mgrid[0:height, 0:width]
+    image = np.dstack([xx * 255 // width, yy * 255 // height, (xx + yy) % 256]).astype(np.uint8)
+    return cv2.GaussianBlur(image, (0, 0), 3)
+
+
+def time_ms(func: Callable[[], object]) -> float:
+    func()
+    start = time.perf_counter()
+    func()
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare compiled color LUTs with direct evaluation")
+    parser.add_argument("--size", default="1280x960", help="Frame size WxH")
+    parser.add_argument("--lut-sizes", default="33,65", help="Grid points per axis to compile")
+    args = parser.parse_args()
+
+    width, height = (int(v) for v in args.size.split("x"))
+    lut_sizes = [int(v) for v in args.lut_sizes.split(",")]
+    image = make_image(width, height)
+
+    bw = EnhancedBlackWhiteEffect(gpu_enabled=False)
+    params = dict(bw.IMPROVED_DEFAULTS)
+    popart = OptimizedPopArtEffect(gpu_enabled=False)
+
+    film_tone = lambda rgb: bw.film_tone(rgb, params)[..., np.newaxis]
+    whole_popart = lambda rgb: popart.create_pop_art_effect_vectorized(rgb).astype(np.float32)
+
+    print(f"Frame {width}x{height}")
+    print("-" * 72)
+    for name, function, output_max in (
+        ("enhancedblackwhite film_tone", film_tone, 1.0),
+        ("popart (whole)", whole_popart, 255.0)
+    ):
+        direct_ms = time_ms(lambda: function(image))
+        for size in lut_sizes:
+            compile_start = time.perf_counter()
+            lut = compile_color_lut(function, size)
+            compile_ms = (time.perf_counter() - compile_start) * 1000
+            report = accuracy_report(function, lut, output_max=output_max)
+            lut_ms = time_ms(lambda: lut.apply(image))
+            print(f"{name:<30} {size}^3 compile={compile_ms:.0f}ms direct={direct_ms:.0f}ms lut={lut_ms:.0f}ms "
+                  f"max dE={report['max_delta_e']} p99={report['p99_delta_e']} mean={report['mean_delta_e']}")
+
+    # Pop art color mapping over the posterized levels
+    data = image.astype(np.float32)
+    posterized = popart.apply_posterization_vectorized(popart.apply_contrast_saturation_boost_vectorized(data))
+    mapping = lambda rgb: popart.apply_pop_art_color_mapping_vectorized(rgb).astype(np.float32)
+    lut = compile_color_lut(mapping, popart.COLOR_LEVELS, INTERP_NEAREST)
+    report = accuracy_report(mapping, lut, samples=lut_grid(popart.COLOR_LEVELS))
+    exact = np.array_equal(lut.apply(posterized).astype(np.uint8), mapping(posterized).astype(np.uint8))
+    print(f"{'popart color_mapping':<30} {lut.size}^3 nearest direct={time_ms(lambda: mapping(posterized)):.0f}ms "
+          f"lut={time_ms(lambda: lut.apply(posterized)):.0f}ms max dE={report['max_delta_e']} frame exact={exact}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,377 @@
+"""
+End-to-End Benchmark
+Throughput, latency percentiles, peak RSS and per-stage time of a service app with a fake segmentation model
+
+Usage:
+    python scripts/benchmark_e2e.py [--service inspirenet] [--model-ms 300] [--concurrency 4] [--output e2e.json]
+    python scripts/benchmark_e2e.py --service birefnet --compare baseline.json
+
+The service's FastAPI app is imported in-process and driven through httpx's ASGI
+transport over the tests/Images corpus, so middleware, upload decode, hashing, cache,
+effects and encode are the real code paths. Only the network is replaced: a
+deterministic stand-in (loaded through the processor's own load_model) returns a
+soft-edged elliptical subject mask after --model-ms, sleeping like a GPU call that
+releases the GIL. Storage is the in-memory backend with injected latency. Stage times
+come from each response's Server-Timing header. No network access or model weights.
+
+Workloads: "miss" sends a distinct image per request (one pixel block differs),
+"hit" replays the warmed corpus, "mobile" sends distinct images with a phone
+User-Agent (1280px processing and the memory-efficient processor). BiRefNet has no
+result cache, so only "miss" applies there.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import logging
+import mimetypes
+import platform
+import threading
+from io import BytesIO
+from typing import Any, Dict, List, Tuple
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+import numpy as np
+from PIL import Image
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+MOBILE_USER_AGENT = "Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15 Mobile/15E148"
+BUCKET_NAME = "benchmark-cache"
+
+SERVICES = {
+    'inspirenet': {
+        'src': os.path.join(SCRIPT_DIR, '../src'),
+        'endpoint': '/api/v2/process-with-effects',
+        'effects': 'enhancedblackwhite,color',
+        'workloads': ('miss', 'hit', 'mobile')
+    },
+    'birefnet': {
+        'src': os.path.join(SCRIPT_DIR, '../../birefnet-bg-removal-api/src'),
+        'endpoint': '/process-with-effects',
+        'effects': 'color,blackwhite',
+        'workloads': ('miss',)
+    }
+}
+
+# (metric, higher is better) checked by --compare
+COMPARED_METRICS = (('throughput_rps', True), ('p50_ms', False), ('p99_ms', False), ('peak_rss_mb', False))
+
+
+class FakeSegmentationModel:
+    """
+    Deterministic stand-in for the segmentation network
+
+    Serves both interfaces the processors call: transparent_background's
+    Remover.process (InSPyReNet) and a transformers segmentation module returning
+    logits (BiRefNet). Jitter comes from a seeded generator, so runs repeat.
+    """
+
+    def __init__(self, latency_ms: float, jitter_ms: float = 0.0, seed: int = 0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.calls = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _infer(self):
+        with self._lock:
+            self.calls += 1
+            delay_ms = self.latency_ms + self._rng.uniform(0, self.jitter_ms)
+        time.sleep(delay_ms / 1000)
+
+    @staticmethod
+    def mask(width: int, height: int) -> np.ndarray:
+        """Soft-edged ellipse around the lower centre, float32 in [0, 1]"""
+        yy, xx = np.ogrid[:height, :width]
+        distance = ((xx - width / 2) / (0.35 * width)) ** 2 + ((yy - height * 0.55) / (0.42 * height)) ** 2
+        return np.clip((1.15 - distance) / 0.3, 0, 1).astype(np.float32)
+
+    # transparent_background.Remover
+    def process(self, image: Image.Image, type: str = 'rgba') -> Image.Image:
+        self._infer()
+        result = image.convert('RGBA')
+        result.putalpha(Image.fromarray((self.mask(*image.size) * 255).astype(np.uint8)))
+        return result
+
+    # transformers AutoModelForImageSegmentation
+    def to(self, device) -> "FakeSegmentationModel":
+        return self
+
+    def eval(self) -> "FakeSegmentationModel":
+        return self
+
+    def __call__(self, input_tensor):
+        import torch
+        self._infer()
+        height, width = input_tensor.shape[-2:]
+        probabilities = torch.from_numpy(self.mask(width, height)).clamp(1e-4, 1 - 1e-4)
+        return [torch.logit(probabilities)[None, None]]
+
+
+def setup_inspirenet(model: FakeSegmentationModel, args: argparse.Namespace):
+    """Import the app with the fake Remover and initialise what the startup event would (minus GCS)"""
+    import inspirenet_model
+    inspirenet_model.Remover = lambda **_: model
+
+    import main
+    import api_v2_endpoints
+    from storage import CloudStorageManager
+    from storage_backend import create_client, reset_memory_backend
+
+    reset_memory_backend()
+    client = create_client(backend='memory', latency_ms=args.storage_latency_ms, ms_per_mb=args.storage_ms_per_mb)
+    main.storage_manager = CloudStorageManager(BUCKET_NAME, client=client)
+    api_v2_endpoints.initialize_v2_api(main.storage_manager)
+    api_v2_endpoints.integrated_processor.inspirenet_processor.load_model()
+    return main.app
+
+
+def setup_birefnet(model: FakeSegmentationModel, args: argparse.Namespace):
+    """Import the app with from_pretrained returning the fake module"""
+    from transformers import AutoModelForImageSegmentation
+    AutoModelForImageSegmentation.from_pretrained = lambda *_, **__: model
+
+    import main
+    from birefnet_processor import get_processor
+    get_processor().load_model()
+    return main.app
+
+
+class PeakRSS:
+    """Samples resident memory on a background thread while the with-block runs"""
+
+    def __init__(self, interval: float = 0.05):
+        from metrics import resident_memory_bytes
+        self._read = resident_memory_bytes
+        self.interval = interval
+        self.start = self.peak = self._read()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, self._read())
+
+    def __enter__(self) -> "PeakRSS":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self._read())
+
+
+def load_corpus(directory: str) -> List[Tuple[str, bytes]]:
+    names = sorted(name for name in os.listdir(directory) if name.lower().endswith(IMAGE_EXTENSIONS))
+    corpus = []
+    for name in names:
+        with open(os.path.join(directory, name), 'rb') as f:
+            corpus.append((name, f.read()))
+    return corpus
+
+
+def make_variants(corpus: List[Tuple[str, bytes]], count: int, offset: int) -> List[Tuple[str, bytes]]:
+    """count uploads cycling the corpus, each with a distinct 8x8 block so no two share a cache key"""
+    decoded = [Image.open(BytesIO(data)) for _, data in corpus]
+    variants = []
+    for i in range(count):
+        index = i % len(corpus)
+        image = decoded[index]
+        variant = image.convert('RGB')
+        n = offset + i
+        variant.paste((n % 256, (n // 256) % 256, 255 - n % 256), (0, 0, 8, 8))
+        buffer = BytesIO()
+        variant.save(buffer, format='JPEG', quality=95, exif=image.info.get('exif', b''))
+        name = os.path.splitext(corpus[index][0])[0] + '.jpg'
+        variants.append((name, buffer.getvalue()))
+    return variants
+
+
+def parse_server_timing(header: str) -> Dict[str, float]:
+    """Milliseconds per stage of one response - repeated stages (one span per effect) are summed"""
+    stages: Dict[str, float] = {}
+    for entry in header.split(','):
+        name, *params = entry.strip().split(';')
+        for param in params:
+            if param.startswith('dur='):
+                stages[name] = stages.get(name, 0.0) + float(param[4:])
+    return stages
+
+
+def percentiles(values_ms: List[float]) -> Dict[str, float]:
+    values = np.array(values_ms) if values_ms else np.zeros(1)
+    return {
+        'mean_ms': round(float(values.mean()), 1),
+        'p50_ms': round(float(np.percentile(values, 50)), 1),
+        'p90_ms': round(float(np.percentile(values, 90)), 1),
+        'p99_ms': round(float(np.percentile(values, 99)), 1)
+    }
+
+
+async def run_workload(client, endpoint: str, params: Dict[str, str], headers: Dict[str, str],
+                       payloads: List[Tuple[str, bytes]], concurrency: int) -> Dict[str, Any]:
+    """Send every payload at the configured concurrency; latency, RSS and Server-Timing stage totals"""
+    queue: asyncio.Queue = asyncio.Queue()
+    for payload in payloads:
+        queue.put_nowait(payload)
+    latencies: List[float] = []
+    stages: Dict[str, List[float]] = {}
+    errors = 0
+
+    async def worker():
+        nonlocal errors
+        while not queue.empty():
+            name, data = queue.get_nowait()
+            content_type = mimetypes.guess_type(name)[0] or 'image/jpeg'
+            start = time.perf_counter()
+            response = await client.post(endpoint, params=params, headers=headers,
+                                         files={'file': (name, data, content_type)})
+            latencies.append((time.perf_counter() - start) * 1000)
+            if response.status_code != 200:
+                errors += 1
+                logger.warning(f"{name}: HTTP {response.status_code} {response.text[:200]}")
+                continue
+            for stage, ms in parse_server_timing(response.headers.get('server-timing', '')).items():
+                stages.setdefault(stage, []).append(ms)
+
+    with PeakRSS() as rss:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    server_total = sum(stages.get('total', [])) or 1.0
+    result = {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput_rps': round(len(latencies) / elapsed, 2),
+        **percentiles(latencies),
+        'rss_start_mb': round(rss.start / 1024 / 1024, 1),
+        'peak_rss_mb': round(rss.peak / 1024 / 1024, 1),
+        'stages': {
+            stage: {**percentiles(values), 'share': round(sum(values) / server_total, 3)}
+            for stage, values in sorted(stages.items(), key=lambda item: -sum(item[1]))
+            if stage != 'total'
+        }
+    }
+    return result
+
+
+def print_result(name: str, result: Dict[str, Any]):
+    print(f"{name:<8}{result['throughput_rps']:>8.2f}{result['p50_ms']:>10.1f}{result['p90_ms']:>10.1f}"
+          f"{result['p99_ms']:>10.1f}{result['peak_rss_mb']:>10.0f}{result['errors']:>8}")
+    for stage, summary in result['stages'].items():
+        print(f"    {stage:<14}{summary['mean_ms']:>10.1f} ms mean{summary['p99_ms']:>10.1f} ms p99"
+              f"{summary['share'] * 100:>8.1f}%")
+
+
+def compare(results: Dict[str, Any], baseline_path: str, tolerance: float) -> bool:
+    """Print changes against a saved run; False when a metric regressed by more than tolerance"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    ok = True
+    print(f"\nCompared with {baseline_path} (tolerance {tolerance:.0%})")
+    for name, result in results['workloads'].items():
+        base = baseline.get('workloads', {}).get(name)
+        if base is None:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS:
+            if not base.get(metric):
+                continue
+            change = (result[metric] - base[metric]) / base[metric]
+            regressed = -change > tolerance if higher_is_better else change > tolerance
+            ok = ok and not regressed
+            print(f"  {name:<8}{metric:<16}{base[metric]:>10.1f} -> {result[metric]:>10.1f} "
+                  f"({change:+.1%}){'  REGRESSION' if regressed else ''}")
+    return ok
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    service = SERVICES[args.service]
+    sys.path.insert(0, os.path.abspath(service['src']))
+    os.environ.update({
+        'STORAGE_BACKEND': 'memory',
+        'SERVER_TIMING_ENABLED': 'true',
+        'TRACE_LOG_PATH': '',
+        'ENABLE_WARMUP_ON_STARTUP': 'false'
+    })
+    import httpx
+
+    model = FakeSegmentationModel(args.model_ms, args.jitter_ms, seed=args.seed)
+    app = (setup_inspirenet if args.service == 'inspirenet' else setup_birefnet)(model, args)
+    effects = args.effects or service['effects']
+    params = {'effects': effects, 'return_all_effects': 'true'}
+    workloads = [w for w in (args.workloads or service['workloads']) if w in service['workloads']]
+
+    corpus = load_corpus(args.images)
+    payloads = {
+        'miss': make_variants(corpus, args.requests, offset=0),
+        'hit': [corpus[i % len(corpus)] for i in range(args.requests)],
+        'mobile': make_variants(corpus, args.requests, offset=args.requests)
+    }
+
+    print(f"Service={args.service} model={args.model_ms}ms (+{args.jitter_ms}ms jitter) "
+          f"concurrency={args.concurrency} effects={effects}")
+    print(f"Corpus: {len(corpus)} images from {args.images}, {args.requests} requests per workload")
+    print("-" * 64)
+    print(f"{'workload':<8}{'req/s':>8}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'peak MB':>10}{'errors':>8}")
+
+    results = {
+        'service': args.service,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+        'environment': {'python': platform.python_version(), 'cpus': os.cpu_count(), 'machine': platform.machine()},
+        'workloads': {}
+    }
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+        # Untimed pass over the corpus - first-call costs, and the cache entries "hit" replays
+        await run_workload(client, service['endpoint'], params, {}, corpus, 1)
+        for name in workloads:
+            headers = {'User-Agent': MOBILE_USER_AGENT} if name == 'mobile' else {}
+            result = await run_workload(client, service['endpoint'], params, headers, payloads[name], args.concurrency)
+            results['workloads'][name] = result
+            print_result(name, result)
+
+    results['model_calls'] = model.calls
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark a service end to end in-process with a fake segmentation model")
+    parser.add_argument('--service', choices=sorted(SERVICES), default='inspirenet')
+    parser.add_argument('--images', default=os.path.join(SCRIPT_DIR, '../tests/Images'), help='Image corpus directory')
+    parser.add_argument('--requests', type=int, default=40, help='Requests per workload')
+    parser.add_argument('--concurrency', type=int, default=4, help='Concurrent in-flight requests')
+    parser.add_argument('--workloads', default=None, help='Comma-separated subset of miss,hit,mobile')
+    parser.add_argument('--effects', default=None, help='Comma-separated effects (service default if unset)')
+    parser.add_argument('--model-ms', type=float, default=300.0, help='Fake inference latency per call')
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help='Seeded uniform extra inference latency')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--storage-latency-ms', type=float, default=20.0, help='Injected round trip per storage call')
+    parser.add_argument('--storage-ms-per-mb', type=float, default=10.0, help='Injected transfer time per MB')
+    parser.add_argument('--output', default=None, help='Write results as JSON')
+    parser.add_argument('--compare', default=None, help='Baseline JSON from an earlier --output')
+    parser.add_argument('--tolerance', type=float, default=0.10, help='Allowed relative regression for --compare')
+    args = parser.parse_args()
+    if args.workloads:
+        args.workloads = [w.strip() for w in args.workloads.split(',') if w.strip()]
+
+    results = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+    if args.compare and not compare(results, args.compare, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
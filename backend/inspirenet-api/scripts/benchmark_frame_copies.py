@@ -0,0 +1,196 @@
+"""
+Frame Copy Benchmark
+Counts full-frame buffer copies per request for the legacy BGR path vs the canonical RGBA path
+
+Usage:
+    python scripts/benchmark_frame_copies.py [--size 3000x4000] [--effects color,popart,retro8bit]
+
+A "full-frame copy" is any call to a conversion/layout function (cv2.cvtColor, np.array,
+np.asarray, np.ascontiguousarray, np.dstack, Image.fromarray, Image.tobytes) that returns a
+new buffer at least as large as the frame's color planes. Arithmetic inside the effects
+is not counted - only the color-space and layout round trips between decode and encode.
+"""
+
+import os
+import sys
+import time
+import argparse
+import logging
+from io import BytesIO
+from typing import Dict, List, Tuple, Any
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../src'))
+
+import numpy as np
+import cv2
+from PIL import Image
+
+from effects.effects_processor import EffectsProcessor
+from effects.effect_frame import CHANNEL_ORDER_RGB, pil_to_array, array_to_pil
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+
+class FrameCopyCounter:
+    """Context manager that wraps conversion functions and counts full-frame results"""
+
+    TARGETS = [
+        (cv2, 'cvtColor'),
+        (np, 'array'),
+        (np, 'asarray'),
+        (np, 'ascontiguousarray'),
+        (np, 'dstack'),
+        (Image, 'fromarray'),
+    ]
+
+    def __init__(self, frame_bytes: int):
+        self.frame_bytes = frame_bytes
+        self.counts: Dict[str, int] = {}
+        self._originals: List[Tuple[Any, str, Any]] = []
+
+    def _record(self, name: str) -> None:
+        self.counts[name] = self.counts.get(name, 0) + 1
+
+    def _wrap(self, module: Any, attr: str):
+        original = getattr(module, attr)
+        label = f"{getattr(module, '__name__', module)}.{attr}"
+        counter = self
+
+        def wrapper(*args, **kwargs):
+            result = original(*args, **kwargs)
+            source = args[0] if args else None
+            if isinstance(result, np.ndarray) and result.nbytes >= counter.frame_bytes:
+                sources = source if isinstance(source, (list, tuple)) else [source]
+                shared = any(
+                    isinstance(s, np.ndarray) and np.shares_memory(result, s) for s in sources
+                )
+                # np.asarray(PIL image) wraps the exported tobytes() buffer (counted there)
+                shared = shared or isinstance(result.base, bytes)
+                if not shared:
+                    counter._record(label)
+            elif isinstance(result, Image.Image) and result.width * result.height * 3 >= counter.frame_bytes:
+                # fromarray shares contiguous RGBA/L buffers; everything else is copied
+                if not (isinstance(source, np.ndarray) and result.mode == 'RGBA'
+                        and source.flags.c_contiguous):
+                    counter._record(label)
+            return result
+
+        return original, wrapper
+
+    def __enter__(self):
+        for module, attr in self.TARGETS:
+            original, wrapper = self._wrap(module, attr)
+            self._originals.append((module, attr, original))
+            setattr(module, attr, wrapper)
+
+        # Image.tobytes is a method - PIL's array export goes through it
+        original_tobytes = Image.Image.tobytes
+        counter = self
+
+        def tobytes(image, *args, **kwargs):
+            data = original_tobytes(image, *args, **kwargs)
+            if len(data) >= counter.frame_bytes:
+                counter._record('PIL.Image.tobytes')
+            return data
+
+        self._originals.append((Image.Image, 'tobytes', original_tobytes))
+        Image.Image.tobytes = tobytes
+        return self
+
+    def __exit__(self, *exc):
+        for module, attr, original in reversed(self._originals):
+            setattr(module, attr, original)
+        self._originals.clear()
+        return False
+
+    @property
+    def total(self) -> int:
+        return sum(self.counts.values())
+
+
+def legacy_request(processor: EffectsProcessor, image: Image.Image, effects: List[str]) -> Dict[str, bytes]:
+    """Pre-canonical pipeline: PIL RGBA -> BGRA -> effects (BGR) -> RGBA -> PNG"""
+    bg_removed_array = np.array(image)
+    bgr_image = cv2.cvtColor(bg_removed_array[:, :, :3], cv2.COLOR_RGB2BGR)
+    alpha_channel = bg_removed_array[:, :, 3]
+    bg_removed_cv = np.dstack([bgr_image, alpha_channel])
+
+    plan = processor.plan_effects(bg_removed_cv, effects)
+    results = {}
+    for effect_name in effects:
+        effect_result = processor.process_planned_effect(plan, effect_name)
+        result_rgba = cv2.cvtColor(effect_result, cv2.COLOR_BGRA2RGBA)
+        buffer = BytesIO()
+        Image.fromarray(result_rgba, mode='RGBA').save(buffer, format='PNG', compress_level=1)
+        results[effect_name] = buffer.getvalue()
+    return results
+
+
+def canonical_request(processor: EffectsProcessor, image: Image.Image, effects: List[str]) -> Dict[str, bytes]:
+    """Canonical pipeline: PIL RGBA -> contiguous RGBA array -> effects (RGB order) -> PNG"""
+    bg_removed_rgba = pil_to_array(image)
+
+    plan = processor.plan_effects(bg_removed_rgba, effects, channel_order=CHANNEL_ORDER_RGB)
+    results = {}
+    for effect_name in effects:
+        effect_result = processor.process_planned_effect(plan, effect_name)
+        buffer = BytesIO()
+        array_to_pil(effect_result).save(buffer, format='PNG', compress_level=1)
+        results[effect_name] = buffer.getvalue()
+    return results
+
+
+def make_test_image(width: int, height: int) -> Image.Image:
+    """Synthetic bg-removed image: textured subject ellipse on a transparent background"""
+    rng = np.random.default_rng(7)
+    rgba = np.zeros((height, width, 4), dtype=np.uint8)
+    rgba[:, :, :3] = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    yy, xx = np.mgrid[0:height, 0:width]
+    subject = ((yy - height / 2) / (height * 0.35)) ** 2 + ((xx - width / 2) / (width * 0.3)) ** 2 <= 1.0
+    rgba[:, :, 3] = np.where(subject, 255, 0).astype(np.uint8)
+    return Image.fromarray(rgba, mode='RGBA')
+
+
+def run(size: Tuple[int, int], effects: List[str], crop_to_subject: bool) -> None:
+    width, height = size
+    image = make_test_image(width, height)
+    processor = EffectsProcessor(gpu_enabled=False)
+    processor.crop_to_subject = crop_to_subject
+
+    # Warm up lazy effect construction outside the measured runs
+    canonical_request(processor, make_test_image(64, 64), effects)
+
+    # Threshold: the color planes of the processed frame (the subject crop when cropping)
+    plan = processor.plan_effects(pil_to_array(image), [])
+    frame_bytes = plan.image.shape[0] * plan.image.shape[1] * 3
+
+    print(f"Frame {width}x{height}, effects={effects}, crop_to_subject={crop_to_subject}")
+    print(f"Counting copies >= {frame_bytes / 1_000_000:.1f}MB")
+    print("-" * 60)
+
+    for label, request in (("legacy BGR", legacy_request), ("canonical RGBA", canonical_request)):
+        with FrameCopyCounter(frame_bytes) as counter:
+            start = time.perf_counter()
+            request(processor, image, effects)
+            elapsed = time.perf_counter() - start
+
+        print(f"{label:<16} copies={counter.total:<3} time={elapsed * 1000:.0f}ms")
+        for name, count in sorted(counter.counts.items()):
+            print(f"    {name:<28} {count}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Count full-frame copies per request")
+    parser.add_argument('--size', default='3000x4000', help='Frame size WIDTHxHEIGHT')
+    parser.add_argument('--effects', default='color,popart,retro8bit', help='Comma-separated effects')
+    parser.add_argument('--no-crop', action='store_true', help='Disable subject cropping')
+    args = parser.parse_args()
+
+    width, height = (int(v) for v in args.size.lower().split('x'))
+    effects = [e.strip() for e in args.effects.split(',') if e.strip()]
+    run((width, height), effects, crop_to_subject=not args.no_crop)
+
+
+if __name__ == "__main__":
+    main()
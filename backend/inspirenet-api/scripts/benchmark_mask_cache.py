@@ -0,0 +1,100 @@
+"""
+Background Cache Format Benchmark
+Bytes stored and reconstruct time of mask records vs full RGBA PNGs
+
+Usage:
+    python scripts/benchmark_mask_cache.py [--images tests/Images] [--max-size 1536]
+
+Each photo is decoded the way /process-with-effects does (draft decode, EXIF, resize) and
+given a soft-edged elliptical subject mask in place of the model output. "png" is the old
+cache entry (RGBA PNG) and its decode; "mask" is the record plus the original upload bytes,
+and the reconstruct that re-decodes the original and composites the mask. "stored" is the
+format store_background picks (large originals stay PNG). "color" is the first 'color'
+request on a mask-record hit: rebuild plus the PNG encode written back over the record -
+later color hits return those PNG bytes as-is. Storage round trips are excluded.
+"""
+
+import os
+import sys
+import time
+import argparse
+import logging
+from io import BytesIO
+from typing import Callable, List
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../src'))
+
+import numpy as np
+import cv2
+from PIL import Image
+
+from mask_cache import OriginalSource, composite, encode_mask_record, encode_png, reconstruct_rgba, prefers_mask_record
+from effects.effect_frame import pil_to_array, array_to_pil
+
+logging.basicConfig(level=logging.WARNING)
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+
+
+def time_ms(func: Callable[[], object], runs: int = 3) -> float:
+    func()
+    start = time.perf_counter()
+    for _ in range(runs):
+        func()
+    return (time.perf_counter() - start) / runs * 1000
+
+
+def subject_mask(height: int, width: int) -> np.ndarray:
+    mask = np.zeros((height, width), dtype=np.uint8)
+    cv2.ellipse(mask, (width // 2, height // 2), (width // 3, int(height / 2.5)), 0, 0, 360, 255, -1)
+    return cv2.GaussianBlur(mask, (0, 0), 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare mask-record and PNG background cache entries")
+    parser.add_argument("--images", default=os.path.join(os.path.dirname(__file__), '../tests/Images'))
+    parser.add_argument("--max-size", type=int, default=1536, help="Processing size (1280 for mobile)")
+    args = parser.parse_args()
+
+    paths: List[str] = sorted(
+        os.path.join(args.images, name) for name in os.listdir(args.images)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    print(f"Processing size {args.max_size}")
+    print(f"{'image':<12} {'size':>10} {'png KB':>8} {'mask KB':>8} {'orig KB':>8} {'saved':>6} "
+          f"{'png dec':>8} {'rebuild':>8} {'color':>8} {'stored':>7}")
+    print("-" * 95)
+
+    total_png = total_mask = 0
+    for path in paths:
+        with open(path, 'rb') as f:
+            source = OriginalSource(f.read(), max_size=args.max_size)
+        rgb = source.decode_rgb()
+        rgba = composite(rgb, subject_mask(*rgb.shape[:2]))
+
+        buffer = BytesIO()
+        Image.fromarray(rgba, mode='RGBA').save(buffer, format='PNG')
+        png_bytes = buffer.getvalue()
+        record = encode_mask_record(rgba, source)
+        assert np.array_equal(reconstruct_rgba(record, source.data), rgba)
+
+        png_ms = time_ms(lambda: pil_to_array(Image.open(BytesIO(png_bytes))))
+        rebuild_ms = time_ms(lambda: reconstruct_rgba(record, source.data))
+        color_ms = time_ms(lambda: encode_png(array_to_pil(reconstruct_rgba(record, source.data))))
+        mask_total = len(record) + len(source.data)
+        stored = "mask" if prefers_mask_record(rgba, source) else "png"
+        total_png += len(png_bytes)
+        total_mask += mask_total if stored == "mask" else len(png_bytes)
+
+        print(f"{os.path.basename(path):<12} {rgb.shape[1]:>5}x{rgb.shape[0]:<4} {len(png_bytes) // 1024:>8} "
+              f"{len(record) // 1024:>8} {len(source.data) // 1024:>8} {1 - mask_total / len(png_bytes):>6.0%} "
+              f"{png_ms:>6.0f}ms {rebuild_ms:>6.0f}ms {color_ms:>6.0f}ms {stored:>7}")
+
+    if total_png:
+        print("-" * 95)
+        print(f"Total: all png {total_png // 1024}KB, as stored {total_mask // 1024}KB "
+              f"({1 - total_mask / total_png:.0%} less)")
+
+
+if __name__ == "__main__":
+    main()
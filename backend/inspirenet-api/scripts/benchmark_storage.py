@@ -0,0 +1,159 @@
+"""
+Storage Benchmark
+Request throughput and p50/p99 latency of the cache path against a local storage backend
+
+Usage:
+    python scripts/benchmark_storage.py [--backend memory] [--latency-ms 20] [--concurrency 16]
+
+Each simulated request follows the storage sequence of the integrated processor:
+background-removal lookup (and write on a miss), then a lookup (and write on a miss)
+per requested effect in its versioned namespace. The "hit" workload replays a warm
+key set; the "miss" workload uses a fresh image per request. No network access -
+latency comes from the backend's injected round-trip and per-MB transfer delays.
+"""
+
+import os
+import sys
+import time
+import uuid
+import random
+import asyncio
+import argparse
+import logging
+import tempfile
+from typing import Dict, List, Any
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../src'))
+
+import numpy as np
+
+from storage import CloudStorageManager
+from storage_backend import create_client, reset_memory_backend
+from effects import EFFECT_REGISTRY
+
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+BUCKET_NAME = "benchmark-cache"
+
+
+def make_key() -> str:
+    return uuid.uuid4().hex + uuid.uuid4().hex[:8]
+
+
+async def simulated_request(storage: CloudStorageManager, image_key: str, effects: List[str],
+                            bg_bytes: bytes, effect_bytes: bytes) -> bool:
+    """Storage calls of one /api/v2/process request; returns True when fully served from cache"""
+    hit = True
+    if await storage.get_cached_result(image_key) is None:
+        hit = False
+        await storage.cache_result(image_key, bg_bytes)
+
+    for effect_name in effects:
+        namespace = EFFECT_REGISTRY.cache_namespace(effect_name)
+        effect_key = EFFECT_REGISTRY.cache_key(image_key, effect_name, {})
+        if await storage.get_cached_result(effect_key, namespace=namespace) is None:
+            hit = False
+            await storage.cache_result(effect_key, effect_bytes, namespace=namespace)
+    return hit
+
+
+async def run_workload(storage: CloudStorageManager, keys: List[str], args: argparse.Namespace,
+                       bg_bytes: bytes, effect_bytes: bytes) -> Dict[str, Any]:
+    """Drive len(keys) requests at the configured concurrency and collect per-request latency"""
+    queue: asyncio.Queue = asyncio.Queue()
+    for key in keys:
+        queue.put_nowait(key)
+    latencies: List[float] = []
+    hits = 0
+
+    async def worker():
+        nonlocal hits
+        while not queue.empty():
+            key = queue.get_nowait()
+            start = time.perf_counter()
+            if await simulated_request(storage, key, args.effects, bg_bytes, effect_bytes):
+                hits += 1
+            latencies.append(time.perf_counter() - start)
+
+    calls_before = getattr(storage.client, 'calls', 0)
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        'requests': len(latencies),
+        'hit_rate': hits / max(1, len(latencies)),
+        'throughput_rps': len(latencies) / elapsed,
+        'p50_ms': float(np.percentile(latencies_ms, 50)),
+        'p99_ms': float(np.percentile(latencies_ms, 99)),
+        'mean_ms': float(latencies_ms.mean()),
+        'calls_per_request': (getattr(storage.client, 'calls', 0) - calls_before) / max(1, len(latencies))
+    }
+
+
+async def run(args: argparse.Namespace) -> None:
+    client_kwargs = {
+        'latency_ms': args.latency_ms,
+        'jitter_ms': args.jitter_ms,
+        'ms_per_mb': args.ms_per_mb
+    }
+    root = None
+    if args.backend == 'filesystem':
+        root = tempfile.mkdtemp(prefix='storage-benchmark-')
+        client_kwargs['root'] = root
+    else:
+        reset_memory_backend()
+
+    client = create_client(backend=args.backend, **client_kwargs)
+    storage = CloudStorageManager(BUCKET_NAME, client=client)
+    rng = random.Random(7)
+    bg_bytes = rng.randbytes(args.bg_kb * 1024)
+    effect_bytes = rng.randbytes(args.effect_kb * 1024)
+
+    # Warm key set for the hit workload (written without the timer)
+    warm_keys = [make_key() for _ in range(args.warm_keys)]
+    for key in warm_keys:
+        await simulated_request(storage, key, args.effects, bg_bytes, effect_bytes)
+
+    workloads = {
+        'hit': [rng.choice(warm_keys) for _ in range(args.requests)],
+        'miss': [make_key() for _ in range(args.requests)]
+    }
+
+    print(f"Backend={args.backend} latency={args.latency_ms}ms (+{args.jitter_ms}ms jitter, "
+          f"{args.ms_per_mb}ms/MB) concurrency={args.concurrency} effects={args.effects}")
+    print(f"Payloads: bg={args.bg_kb}KB effect={args.effect_kb}KB, {args.requests} requests per workload")
+    print("-" * 78)
+    print(f"{'workload':<10}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'mean ms':>10}"
+          f"{'hit rate':>10}{'calls/req':>12}")
+    for name, keys in workloads.items():
+        result = await run_workload(storage, keys, args, bg_bytes, effect_bytes)
+        print(f"{name:<10}{result['throughput_rps']:>10.1f}{result['p50_ms']:>10.1f}{result['p99_ms']:>10.1f}"
+              f"{result['mean_ms']:>10.1f}{result['hit_rate']:>10.2f}{result['calls_per_request']:>12.1f}")
+
+    if root:
+        import shutil
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark cache-hit and cache-miss storage workloads offline")
+    parser.add_argument('--backend', choices=['memory', 'filesystem'], default='memory')
+    parser.add_argument('--latency-ms', type=float, default=20.0, help='Injected round trip per storage call')
+    parser.add_argument('--jitter-ms', type=float, default=5.0, help='Uniform random extra latency')
+    parser.add_argument('--ms-per-mb', type=float, default=10.0, help='Injected transfer time per MB')
+    parser.add_argument('--concurrency', type=int, default=16, help='Concurrent in-flight requests')
+    parser.add_argument('--requests', type=int, default=200, help='Requests per workload')
+    parser.add_argument('--warm-keys', type=int, default=20, help='Distinct images in the hit workload')
+    parser.add_argument('--effects', default='enhancedblackwhite,color', help='Comma-separated effects')
+    parser.add_argument('--bg-kb', type=int, default=900, help='Background-removed PNG size')
+    parser.add_argument('--effect-kb', type=int, default=700, help='Effect PNG size')
+    args = parser.parse_args()
+    args.effects = [e.strip() for e in args.effects.split(',') if e.strip()]
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
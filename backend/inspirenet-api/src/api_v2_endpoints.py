@@ -10,18 +10,23 @@ import logging
 import gc
 import torch
 from typing import List, Optional, Dict, Any
-from io import BytesIO
-from PIL import Image
 
 from fastapi import APIRouter, File, UploadFile, HTTPException, BackgroundTasks, WebSocket, WebSocketDisconnect, Query, Request, Form
 from fastapi.responses import Response
 from pydantic import BaseModel
 
-from integrated_processor import IntegratedProcessor
+from integrated_processor import IntegratedProcessor, SESSION_OUTPUT_FORMATS
 from memory_efficient_integrated_processor import MemoryEfficientIntegratedProcessor
 from enhanced_progress_manager import EnhancedProgressManager, create_progress_callback
 from storage import CloudStorageManager
 from memory_optimized_processor import MemoryOptimizedProcessor
+import cache_namespaces
+from upload_reader import read_image_upload, UploadRejected
+from session_working_set import session_working_set, preview_size
+from effects.color_lut import color_lut_cache
+from effects.effect_registry import EFFECT_REGISTRY
+from effects.latency_histogram import latency_stats
+from mask_cache import OriginalSource, compact_cache_enabled
 
 logger = logging.getLogger(__name__)
 
@@ -49,6 +54,14 @@ class EffectSwitchRequest(BaseModel):
     output_format: str = "png"
     quality: int = 95
 
+class EffectPreviewRequest(BaseModel):
+    """Request model for a low-resolution effect preview (live parameter sliders)"""
+    effect: str
+    effect_params: Optional[Dict[str, Any]] = None
+    # None uses the effect's preview size (smaller for slow effects)
+    max_size: Optional[int] = None
+    quality: int = 75
+
 def initialize_v2_api(storage_manager: CloudStorageManager):
     """Initialize v2 API components"""
     global integrated_processor, enhanced_progress_manager
@@ -58,6 +71,7 @@ def initialize_v2_api(storage_manager: CloudStorageManager):
         storage_manager=storage_manager,
         gpu_enabled=True
     )
+    session_working_set.attach_storage(storage_manager)
     
     logger.info("API v2 initialized with integrated processor")
 
@@ -74,7 +88,8 @@ async def v2_root():
             "Integrated processing pipeline",
             "Advanced caching strategy",
             "Real-time progress tracking",
-            "Effect switching capabilities"
+            "Effect switching capabilities",
+            "Low-resolution live effect previews"
         ],
         "available_effects": integrated_processor.get_available_effects() if integrated_processor else []
     }
@@ -187,7 +202,8 @@ async def process_with_effects(
     effects: Optional[str] = Query(default=None, description="Multiple effects as comma-separated string"),
     return_all_effects: bool = Query(default=False, description="Return JSON with all effects instead of PNG blob"),
     load_single_effect: bool = Query(default=False, description="Process only the first/primary effect for progressive loading"),
-    session_id: Optional[str] = Query(default=None, description="Session ID for progress tracking")
+    session_id: Optional[str] = Query(default=None, description="Session ID for progress tracking"),
+    progressive: Optional[bool] = Query(default=None, description="Send a coarse mask over the progress WebSocket before the full pass (defaults to on for mobile)")
 ):
     """
     Process image with background removal and multiple effects
@@ -213,51 +229,30 @@ async def process_with_effects(
                 )
             raise HTTPException(status_code=400, detail="File must be an image")
         
-        # Read image data
-        image_data = await file.read()
-        
-        if len(image_data) > 50 * 1024 * 1024:  # 50MB limit
+        # Check the already-spooled upload in place: byte cap and header dimensions, no copy
+        # (the body cap while it arrives is UploadLimitMiddleware in main.py)
+        try:
+            upload = await read_image_upload(file)
+        except UploadRejected as e:
             if enhanced_progress_manager:
-                await enhanced_progress_manager.send_error(
-                    session_id, "validation", "File too large. Maximum size is 50MB."
-                )
-            raise HTTPException(status_code=413, detail="File too large (max 50MB)")
+                await enhanced_progress_manager.send_error(session_id, "validation", e.message)
+            raise HTTPException(status_code=e.status_code, detail=e.detail)
         
         # Detect mobile request and optimize large images
         user_agent = request.headers.get("User-Agent", "")
         is_mobile = "Mobile" in user_agent or "iPhone" in user_agent or "Android" in user_agent
-        original_size_mb = len(image_data) / 1024 / 1024
-        
-        # Check image dimensions before processing
-        try:
-            img_check = Image.open(BytesIO(image_data))
-            width, height = img_check.size
-            total_pixels = width * height
-            max_pixels = 4096 * 4096  # Maximum 16 megapixels
-            
-            if total_pixels > max_pixels:
-                logger.warning(f"Image too large: {width}x{height} = {total_pixels/1e6:.1f} megapixels")
-                if enhanced_progress_manager:
-                    await enhanced_progress_manager.send_error(
-                        session_id, "validation", 
-                        f"Image dimensions too large ({width}x{height}). Maximum supported is 4096x4096."
-                    )
-                raise HTTPException(status_code=413, detail="Image dimensions too large. Maximum 4096x4096.")
-            
-            img_check.close()
-            del img_check
-        except HTTPException:
-            raise
-        except Exception as e:
-            logger.warning(f"Failed to check image dimensions: {e}")
+        original_size_mb = upload.size / 1024 / 1024
         
         # More aggressive optimization for mobile and large images
         max_image_size_mb = float(os.getenv("MAX_IMAGE_SIZE_MB", "30"))
         mobile_max_size = int(os.getenv("MOBILE_MAX_SIZE", "1280"))
         
         # Optimize if mobile, large image, or PNG format
-        is_png = image_data[:8] == b'\x89PNG\r\n\x1a\n'
+        is_png = upload.format == 'PNG'
         should_optimize = is_mobile or original_size_mb > 0.5 or is_png
+        image_data = None
+        # Upload bytes + decode recipe, so the cutout can be cached as a mask referencing them
+        original = None
         
         if should_optimize:
             logger.info(f"Image optimization triggered (mobile={is_mobile}, size={original_size_mb:.1f}MB, png={is_png})")
@@ -267,55 +262,40 @@ async def process_with_effects(
                 if torch.cuda.is_available():
                     torch.cuda.empty_cache()
                 
-                # Open and optimize image
-                img = Image.open(BytesIO(image_data))
+                # Decode straight from the spool to processing size (draft-mode for JPEG)
+                decode_start_time = time.time()
+                img = upload.open_image()
+                upload_dimensions = img.size
                 logger.info(f"Original dimensions: {img.size}, format: {img.format}")
                 
                 # More aggressive size limit for mobile
                 max_size = mobile_max_size if is_mobile else 1536
                 
-                # Optimize using memory-efficient processor
-                img_optimized = MemoryOptimizedProcessor.optimize_image_for_processing(img, max_size=max_size)
-                
-                # Save optimized image with more compression
-                buffer = BytesIO()
-                
-                # For mobile or large images, prefer JPEG to save memory
-                if is_mobile and img_optimized.mode == 'RGBA':
-                    # Convert RGBA to RGB for JPEG (mobile doesn't need transparency for processing)
-                    rgb_image = Image.new('RGB', img_optimized.size, (255, 255, 255))
-                    rgb_image.paste(img_optimized, mask=img_optimized.split()[3] if img_optimized.mode == 'RGBA' else None)
-                    rgb_image.save(buffer, format='JPEG', quality=80, optimize=True)
-                    rgb_image.close()
-                elif img_optimized.mode == 'RGBA':
-                    # Keep PNG for non-mobile RGBA images
-                    img_optimized.save(buffer, format='PNG', compress_level=9, optimize=True)
-                else:
-                    # Convert to RGB if needed
-                    if img_optimized.mode != 'RGB':
-                        img_optimized = img_optimized.convert('RGB')
-                    img_optimized.save(buffer, format='JPEG', quality=85, optimize=True)
-                
-                image_data = buffer.getvalue()
-                optimized_size_mb = len(image_data) / 1024 / 1024
-                logger.info(f"Image optimized: {original_size_mb:.1f}MB -> {optimized_size_mb:.1f}MB")
-                
-                # Clean up immediately
-                img.close()
-                img_optimized.close()
-                del img, img_optimized
-                buffer.close()
+                # The decoded image goes to the processor as-is - no re-encode/decode round trip
+                image_data = MemoryOptimizedProcessor.decode_for_processing(
+                    img, max_size=max_size, flatten_alpha=is_mobile
+                )
+                latency_stats.record("decode", time.time() - decode_start_time, shape=upload_dimensions)
+                if use_cache and compact_cache_enabled():
+                    original = OriginalSource(upload.read_bytes(), max_size=max_size, flatten_alpha=is_mobile)
+                logger.info(f"Image decoded for processing: {upload.size // 1024}KB -> "
+                            f"{image_data.size[0]}x{image_data.size[1]} {image_data.mode}")
                 gc.collect()
                 
                 if enhanced_progress_manager:
                     await enhanced_progress_manager.send_progress(
                         session_id, "optimization", 10, 
-                        f"Image optimized for processing ({optimized_size_mb:.1f}MB)"
+                        f"Image optimized for processing ({image_data.size[0]}x{image_data.size[1]})"
                     )
             except Exception as e:
                 logger.warning(f"Image optimization failed: {e}, proceeding with original")
+                original = None
                 gc.collect()
         
+        if image_data is None:
+            image_data = upload.read_bytes()
+        upload.close()
+        
         # Use form_effects if provided and URL param effects is not set
         if form_effects and not effects:
             effects = form_effects
@@ -373,6 +353,11 @@ async def process_with_effects(
         # Create progress callback
         progress_callback = create_progress_callback(enhanced_progress_manager, session_id)
         
+        # Coarse mask preview only helps when a client is listening on the progress WebSocket
+        if progressive is None:
+            progressive = is_mobile
+        progressive = progressive and session_id in enhanced_progress_manager.active_connections
+        
         # Choose processor based on conditions
         use_memory_efficient = os.getenv("USE_MEMORY_EFFICIENT_PROCESSOR", "true").lower() == "true"
         
@@ -387,7 +372,9 @@ async def process_with_effects(
             result = await memory_processor.process_image_with_effects(
                 image_data, effects_list, parsed_effect_params,
                 use_cache=use_cache, session_id=session_id,
-                progress_callback=progress_callback
+                progress_callback=progress_callback,
+                progressive=progressive,
+                original=original
             )
         else:
             # Use standard integrated processor
@@ -396,7 +383,10 @@ async def process_with_effects(
                 effects=effects_list,
                 effect_params=parsed_effect_params,
                 use_cache=use_cache,
-                progress_callback=progress_callback
+                progress_callback=progress_callback,
+                progressive=progressive,
+                session_id=session_id,
+                original=original
             )
         
         # Check if processing actually succeeded
@@ -559,7 +549,67 @@ async def process(
         effect=effect,
         effects=None,  # Single effect mode
         return_all_effects=False,  # Return PNG blob for backward compatibility
-        session_id=session_id
+        session_id=session_id,
+        progressive=None
+    )
+
+async def render_session_effect(
+    session_id: str,
+    effect: str,
+    effect_params: Optional[Dict[str, Any]] = None,
+    use_cache: bool = True,
+    output_format: str = "png",
+    quality: int = 95
+) -> Response:
+    """Effect for a session from its working-set cutout - no upload, decode or inference"""
+    if not integrated_processor:
+        raise HTTPException(status_code=503, detail="Integrated processor not initialized")
+    
+    effect_name = EFFECT_REGISTRY.resolve(effect)
+    if effect_name not in integrated_processor.get_available_effects():
+        raise HTTPException(status_code=400, detail=f"Unsupported effect: {effect}")
+    
+    output_format = output_format.lower()
+    if output_format not in SESSION_OUTPUT_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported output format: {output_format}. Supported: {list(SESSION_OUTPUT_FORMATS)}"
+        )
+    quality = min(max(quality, 1), 100)
+    
+    start_time = time.time()
+    session_image = await session_working_set.get(session_id)
+    if session_image is None:
+        raise HTTPException(
+            status_code=404,
+            detail="Session not found or expired - process the image with process-with-effects first"
+        )
+    
+    try:
+        result_bytes, cache_hit = await integrated_processor.render_session_effect(
+            session_image, effect_name, effect_params, use_cache=use_cache,
+            output_format=output_format, quality=quality
+        )
+    except Exception as e:
+        logger.error(f"Effect switch failed for session {session_id}: {e}")
+        raise HTTPException(status_code=500, detail=f"Effect processing failed: {str(e)}")
+    
+    if not result_bytes:
+        raise HTTPException(status_code=500, detail=f"Effect '{effect_name}' failed")
+    
+    processing_time = time.time() - start_time
+    logger.info(f"Effect switch to '{effect_name}' for session {session_id} in {processing_time * 1000:.0f}ms "
+                f"(cache_hit={cache_hit})")
+    
+    return Response(
+        content=result_bytes,
+        media_type=f"image/{output_format}",
+        headers={
+            "X-Processing-Time": str(processing_time),
+            "X-Cache-Hits": "1" if cache_hit else "0",
+            "X-Session-ID": session_id,
+            "X-Effect": effect_name
+        }
     )
 
 @router.get("/download-effect/{session_id}/{effect_name}")
@@ -568,8 +618,10 @@ async def download_effect(session_id: str, effect_name: str, output_format: str
     Download specific effect result from a previous processing session
     Enables effect switching without reprocessing
     """
-    # This would require session result caching - simplified for now
-    raise HTTPException(status_code=501, detail="Effect download endpoint not yet implemented - use process-with-effects")
+    response = await render_session_effect(session_id, effect_name, output_format=output_format)
+    filename = f"{EFFECT_REGISTRY.resolve(effect_name)}.{output_format.lower()}"
+    response.headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
 
 @router.post("/switch-effect")
 async def switch_effect(
@@ -578,10 +630,65 @@ async def switch_effect(
 ):
     """
     Switch to a different effect on an already processed image
-    Requires the background-removed image to be cached
+    Renders from the session's background-removed image held in the working set
     """
-    # This would enable instant effect switching - simplified for now
-    raise HTTPException(status_code=501, detail="Effect switching endpoint not yet implemented")
+    return await render_session_effect(
+        session_id, request.effect, request.effect_params,
+        output_format=request.output_format, quality=request.quality
+    )
+
+@router.post("/preview-effect")
+async def preview_effect(
+    session_id: str,
+    request: EffectPreviewRequest
+):
+    """
+    Preview an effect with live parameters on a low-resolution proxy of the session image
+    Returns a fast-encoded WebP; confirm with switch-effect for the full-resolution render
+    """
+    if not integrated_processor:
+        raise HTTPException(status_code=503, detail="Integrated processor not initialized")
+    
+    effect_name = EFFECT_REGISTRY.resolve(request.effect)
+    if effect_name not in integrated_processor.get_available_effects():
+        raise HTTPException(status_code=400, detail=f"Unsupported effect: {request.effect}")
+    
+    start_time = time.time()
+    session_image = await session_working_set.get(session_id)
+    if session_image is None:
+        raise HTTPException(
+            status_code=404,
+            detail="Session not found or expired - process the image with process-with-effects first"
+        )
+    
+    # Fixed proxy size, capped for effects too slow to preview at full proxy size
+    max_size = preview_size(effect_name, request.max_size)
+    quality = min(max(request.quality, 1), 100)
+    try:
+        result_bytes = await integrated_processor.render_session_preview(
+            session_image, effect_name, request.effect_params, max_size=max_size, quality=quality
+        )
+    except Exception as e:
+        logger.error(f"Effect preview failed for session {session_id}: {e}")
+        raise HTTPException(status_code=500, detail=f"Effect processing failed: {str(e)}")
+    
+    if not result_bytes:
+        raise HTTPException(status_code=500, detail=f"Effect '{request.effect}' failed")
+    
+    processing_time = time.time() - start_time
+    logger.debug(f"Effect preview '{request.effect}' for session {session_id} in {processing_time * 1000:.0f}ms")
+    
+    return Response(
+        content=result_bytes,
+        media_type="image/webp",
+        headers={
+            "X-Processing-Time": str(processing_time),
+            "X-Session-ID": session_id,
+            "X-Effect": request.effect,
+            "X-Preview-Max-Size": str(max_size),
+            "Cache-Control": "no-store"
+        }
+    )
 
 @router.get("/stats")
 async def get_processing_stats():
@@ -596,6 +703,23 @@ async def get_processing_stats():
         progress_stats = enhanced_progress_manager.get_connection_stats()
         stats["progress_tracking"] = progress_stats
     
+    # Cache usage from maintained counters (no bucket listing)
+    if integrated_processor.storage_manager:
+        stats["cache_storage"] = await integrated_processor.storage_manager.get_cache_stats()
+    
+    # Superseded cache namespace sweeps (bytes reclaimed)
+    if cache_namespaces.cache_sweeper:
+        stats["cache_sweeper"] = cache_namespaces.cache_sweeper.get_stats()
+    
+    # Session cutouts held for effect switching
+    stats["session_working_set"] = session_working_set.get_stats()
+    
+    # Compiled color LUTs with their accuracy against direct evaluation
+    stats["color_luts"] = {**color_lut_cache.get_stats(), "tables": color_lut_cache.reports()}
+    
+    # Stage/effect latency percentiles by image size (fixed-memory histograms)
+    stats["latency"] = latency_stats.get_stats()
+    
     return stats
 
 @router.get("/health/detailed")
@@ -0,0 +1,133 @@
+"""
+Cache Namespaces
+Versioned cache namespaces for the segmentation model and each effect, plus a sweeper for superseded ones
+"""
+
+import os
+import time
+import asyncio
+import logging
+from typing import Dict, Any, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# Bump when the segmentation model, its weights or mask post-processing change output -
+# every cached background removal (and coarse mask) moves to a fresh namespace
+BG_MODEL_NAME = "inspyrenet"
+BG_MODEL_CACHE_VERSION = int(os.getenv("BG_MODEL_CACHE_VERSION", "1"))
+
+# Sweeper schedule (0 disables the background sweep)
+CACHE_SWEEP_INTERVAL_SECONDS = int(os.getenv("CACHE_SWEEP_INTERVAL_SECONDS", "21600"))
+CACHE_SWEEP_INITIAL_DELAY_SECONDS = int(os.getenv("CACHE_SWEEP_INITIAL_DELAY_SECONDS", "600"))
+
+
+def model_namespace(model: str = BG_MODEL_NAME, version: int = BG_MODEL_CACHE_VERSION) -> str:
+    """Namespace for background-removal results of a model version"""
+    return f"models/{model}/v{version}"
+
+
+def live_namespaces(registry: Any) -> Set[str]:
+    """Namespaces the running code reads and writes - everything else is superseded"""
+    namespaces = {model_namespace()}
+    for effect_name in registry.supported_effects():
+        namespaces.add(registry.cache_namespace(effect_name))
+    return namespaces
+
+
+class CacheNamespaceSweeper:
+    """Deletes cache namespaces that no longer match a live model or effect version"""
+
+    def __init__(self, storage_manager: Any, registry: Any):
+        self.storage_manager = storage_manager
+        self.registry = registry
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+        self.stats = {
+            'sweeps': 0,
+            'namespaces_deleted': 0,
+            'blobs_deleted': 0,
+            'bytes_reclaimed': 0,
+            'last_sweep': None
+        }
+
+    async def superseded_namespaces(self) -> List[str]:
+        """Namespaces present in the bucket that no live version maps to"""
+        present = await self.storage_manager.list_cache_namespaces()
+        live = live_namespaces(self.registry)
+        return sorted(namespace for namespace in present if namespace not in live)
+
+    async def sweep(self) -> Dict[str, Any]:
+        """Delete every superseded namespace (parallel batch deletes via the storage maintenance engine)"""
+        if not getattr(self.storage_manager, 'enabled', False):
+            return {'namespaces': [], 'blobs_deleted': 0, 'bytes_reclaimed': 0}
+
+        async with self._lock:
+            start_time = time.time()
+            namespaces = await self.superseded_namespaces()
+            blobs_deleted = 0
+            bytes_reclaimed = 0
+
+            for namespace in namespaces:
+                deleted = await self.storage_manager.delete_cache_namespace(namespace)
+                blobs_deleted += deleted['blobs']
+                bytes_reclaimed += deleted['bytes']
+                logger.info(f"Swept cache namespace '{namespace}': {deleted['blobs']} blobs, "
+                            f"{deleted['bytes'] / (1024 * 1024):.1f}MB")
+
+            result = {
+                'namespaces': namespaces,
+                'blobs_deleted': blobs_deleted,
+                'bytes_reclaimed': bytes_reclaimed,
+                'duration_s': round(time.time() - start_time, 3)
+            }
+
+            self.stats['sweeps'] += 1
+            self.stats['namespaces_deleted'] += len(namespaces)
+            self.stats['blobs_deleted'] += blobs_deleted
+            self.stats['bytes_reclaimed'] += bytes_reclaimed
+            self.stats['last_sweep'] = {**result, 'finished_at': int(time.time())}
+            return result
+
+    async def run_forever(
+        self,
+        interval: int = CACHE_SWEEP_INTERVAL_SECONDS,
+        initial_delay: int = CACHE_SWEEP_INITIAL_DELAY_SECONDS
+    ):
+        """Background loop - first sweep after startup traffic settles, then every interval"""
+        await asyncio.sleep(initial_delay)
+        while True:
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.error(f"Cache namespace sweep failed: {e}")
+            await asyncio.sleep(interval)
+
+    def start(self) -> None:
+        """Schedule the background sweep on the running event loop"""
+        if self._task is None and CACHE_SWEEP_INTERVAL_SECONDS > 0:
+            self._task = asyncio.create_task(self.run_forever())
+            logger.info(f"Cache namespace sweeper scheduled every {CACHE_SWEEP_INTERVAL_SECONDS}s")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Cumulative sweep statistics with the namespaces currently in use"""
+        return {
+            **self.stats,
+            'bytes_reclaimed_mb': self.stats['bytes_reclaimed'] / (1024 * 1024),
+            'live_namespaces': sorted(live_namespaces(self.registry)),
+            'scheduled': self._task is not None
+        }
+
+
+# Set by start_cache_sweeper at startup
+cache_sweeper: Optional[CacheNamespaceSweeper] = None
+
+
+def start_cache_sweeper(storage_manager: Any, registry: Any) -> Optional[CacheNamespaceSweeper]:
+    """Create the shared sweeper and schedule it (no-op without a working bucket)"""
+    global cache_sweeper
+    if not storage_manager or not getattr(storage_manager, 'enabled', False):
+        return None
+    cache_sweeper = CacheNamespaceSweeper(storage_manager, registry)
+    cache_sweeper.start()
+    return cache_sweeper
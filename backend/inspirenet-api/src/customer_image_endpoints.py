@@ -27,6 +27,9 @@ def initialize_customer_storage(bucket_name: str = "perkieprints-customer-images
     global customer_storage
     
     customer_storage = CustomerStorageManager(bucket_name=bucket_name)
+    if customer_storage.maintenance:
+        # Initial + periodic counter reconcile so /storage/stats never lists the bucket
+        customer_storage.maintenance.start()
     logger.info(f"Customer storage initialized with bucket: {bucket_name}")
 
 
@@ -13,14 +13,8 @@ from datetime import datetime, timedelta
 from io import BytesIO
 import os
 
-try:
-    from google.cloud import storage
-    from google.api_core import exceptions as gcs_exceptions
-    GOOGLE_CLOUD_AVAILABLE = True
-except ImportError:
-    GOOGLE_CLOUD_AVAILABLE = False
-    storage = None
-    gcs_exceptions = None
+from storage_maintenance import StorageMaintenanceEngine
+from storage_backend import create_client, backend_available
 
 logger = logging.getLogger(__name__)
 
@@ -48,17 +42,19 @@ class CustomerStorageManager:
         }
     }
     
-    def __init__(self, bucket_name: str):
+    def __init__(self, bucket_name: str, client: Optional[Any] = None):
         """
         Initialize customer storage manager
         
         Args:
             bucket_name: GCS bucket name for customer images
+            client: Storage client (default: STORAGE_BACKEND via storage_backend.create_client)
         """
         self.bucket_name = bucket_name
-        self.client = None
+        self.client = client
         self.bucket = None
-        self.enabled = GOOGLE_CLOUD_AVAILABLE
+        self.maintenance: Optional[StorageMaintenanceEngine] = None
+        self.enabled = client is not None or backend_available()
         
         if not self.enabled:
             logger.warning("Google Cloud Storage not available. Customer storage disabled.")
@@ -72,12 +68,10 @@ class CustomerStorageManager:
             self.enabled = False
     
     def _initialize_client(self):
-        """Initialize Google Cloud Storage client"""
-        if not GOOGLE_CLOUD_AVAILABLE:
-            return
-            
+        """Initialize the storage client (GCS, or a local backend for offline runs)"""
         try:
-            self.client = storage.Client()
+            if self.client is None:
+                self.client = create_client()
             self.bucket = self.client.bucket(self.bucket_name)
             
             # Create bucket if it doesn't exist
@@ -90,6 +84,12 @@ class CustomerStorageManager:
                 logger.info(f"Created bucket {self.bucket_name}")
             else:
                 logger.info(f"Connected to existing bucket: {self.bucket_name}")
+            
+            # Per-tier usage counters, kept current on every store/move/delete
+            self.maintenance = StorageMaintenanceEngine(
+                self.client, self.bucket,
+                [f"customer-images/{tier}/" for tier in self.STORAGE_TIERS]
+            )
                 
         except Exception as e:
             logger.error(f"Failed to initialize GCS client: {e}")
@@ -249,7 +249,7 @@ class CustomerStorageManager:
             logger.info(f"Stored {image_type} for session {session_id} in {tier} tier: {public_url}")
             
             # Track storage metrics
-            await self._track_storage_metric(tier, len(image_data))
+            await self._track_storage_metric(blob_path, len(image_data))
             
             return public_url
             
@@ -408,6 +408,8 @@ class CustomerStorageManager:
                 
                 # Delete source blob
                 source_blob.delete()
+                self.maintenance.record_delete(source_blob.name, source_blob.size or 0)
+                self.maintenance.record_write(new_path, source_blob.size or 0)
                 
             logger.info(f"Moved {len(blobs)} images from {from_tier} to {to_tier} for session {session_id}")
             return True
@@ -508,11 +510,12 @@ class CustomerStorageManager:
             logger.error(f"Error getting session images: {e}")
             return []
     
-    async def _track_storage_metric(self, tier: str, size_bytes: int):
+    async def _track_storage_metric(self, blob_path: str, size_bytes: int):
         """Track storage metrics for monitoring"""
         try:
-            # This could be extended to send metrics to monitoring service
-            logger.debug(f"Storage metric - Tier: {tier}, Size: {size_bytes} bytes")
+            # Feeds the per-tier counters behind get_storage_stats
+            self.maintenance.record_write(blob_path, size_bytes)
+            logger.debug(f"Storage metric - Blob: {blob_path}, Size: {size_bytes} bytes")
         except Exception as e:
             logger.error(f"Error tracking storage metric: {e}")
     
@@ -520,6 +523,9 @@ class CustomerStorageManager:
         """
         Get storage statistics by tier
         
+        Served from incrementally maintained counters (reconciled in the background),
+        so the cost does not grow with the bucket.
+        
         Returns:
             Dictionary with storage statistics
         """
@@ -527,18 +533,18 @@ class CustomerStorageManager:
             return {"enabled": False}
             
         try:
+            counters = self.maintenance.counters.snapshot()
             stats = {
                 "enabled": True,
                 "bucket": self.bucket_name,
-                "tiers": {}
+                "tiers": {},
+                "counters_reconciled_at": self.maintenance.counters.reconciled_at
             }
             
             for tier, config in self.STORAGE_TIERS.items():
-                prefix = f"customer-images/{tier}/"
-                blobs = list(self.client.list_blobs(self.bucket_name, prefix=prefix, max_results=1000))
-                
-                total_size = sum(blob.size or 0 for blob in blobs)
-                total_count = len(blobs)
+                tier_counts = counters[f"customer-images/{tier}/"]
+                total_size = tier_counts['bytes']
+                total_count = tier_counts['count']
                 
                 stats["tiers"][tier] = {
                     "description": config['description'],
@@ -574,30 +580,28 @@ class CustomerStorageManager:
             
         try:
             cleanup_stats = {}
-            current_time = datetime.utcnow()
+            current_time = time.time()
             
-            for tier, config in self.STORAGE_TIERS.items():
-                prefix = f"customer-images/{tier}/"
-                blobs = list(self.client.list_blobs(self.bucket_name, prefix=prefix))
-                
-                expired_count = 0
-                expired_size = 0
-                
-                for blob in blobs:
-                    if blob.time_created:
-                        age_days = (current_time - blob.time_created).days
-                        
-                        if age_days > config['days']:
-                            expired_count += 1
-                            expired_size += blob.size or 0
-                            
-                            if not dry_run:
-                                blob.delete()
-                                logger.info(f"Deleted expired image: {blob.name}")
+            def expired_after(days: int):
+                return lambda blob: bool(blob.time_created) and \
+                    (current_time - blob.time_created.timestamp()) / 86400 > days
+            
+            # Tiers are paged concurrently; expired blobs go out in parallel batch deletes
+            tiers = list(self.STORAGE_TIERS.items())
+            results = await asyncio.gather(*(
+                self.maintenance.delete_where(
+                    f"customer-images/{tier}/", expired_after(config['days']), dry_run=dry_run
+                )
+                for tier, config in tiers
+            ))
+            
+            for (tier, config), result in zip(tiers, results):
+                if result['blobs'] and not dry_run:
+                    logger.info(f"Deleted {result['blobs']} expired images from {tier}")
                 
                 cleanup_stats[tier] = {
-                    "expired_count": expired_count,
-                    "expired_size_mb": round(expired_size / (1024 * 1024), 2),
+                    "expired_count": result['blobs'],
+                    "expired_size_mb": round(result['bytes'] / (1024 * 1024), 2),
                     "retention_days": config['days']
                 }
             
@@ -5,6 +5,11 @@ Advanced image effects for background-removed pet images
 
 from .effects_processor import EffectsProcessor
 from .base_effect import BaseEffect
+from .effect_frame import EffectFrame, EffectPlan, CHANNEL_ORDER_BGR, CHANNEL_ORDER_RGB, pil_to_array, array_to_pil, rgba_digest
+from .effect_registry import EffectRegistry, EffectSpec, EFFECT_REGISTRY
+from .tile_engine import TileEngine, TileSpec, tile_engine
+from .color_lut import ColorLUT, ColorLUTCache, compile_color_lut, accuracy_report, color_lut_cache
+from .latency_histogram import LatencyHistogram, LatencyStats, size_bucket, latency_stats
 from .enhanced_blackwhite_effect import EnhancedBlackWhiteEffect
 from .optimized_popart_effect import OptimizedPopArtEffect
 from .dithering_effect import DitheringEffect
@@ -13,6 +18,28 @@ from .pet_optimized_eightbit_effect import PetOptimizedEightBitEffect
 __all__ = [
     "EffectsProcessor",
     "BaseEffect",
+    "EffectFrame",
+    "EffectPlan",
+    "CHANNEL_ORDER_BGR",
+    "CHANNEL_ORDER_RGB",
+    "pil_to_array",
+    "array_to_pil",
+    "rgba_digest",
+    "EffectRegistry",
+    "EffectSpec",
+    "EFFECT_REGISTRY",
+    "TileEngine",
+    "TileSpec",
+    "tile_engine",
+    "ColorLUT",
+    "ColorLUTCache",
+    "compile_color_lut",
+    "accuracy_report",
+    "color_lut_cache",
+    "LatencyHistogram",
+    "LatencyStats",
+    "size_bucket",
+    "latency_stats",
     "EnhancedBlackWhiteEffect",
     "OptimizedPopArtEffect", 
     "DitheringEffect",
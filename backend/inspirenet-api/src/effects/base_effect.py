@@ -5,16 +5,29 @@ Provides consistent interface for all visual effects
 
 import numpy as np
 from PIL import Image
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 import torch
 import cv2
 import logging
+from .effect_frame import EffectFrame, INPUT_RGB, INPUT_ALPHA, CHANNEL_ORDER_BGR
+
+from .tile_engine import TileSpec
 
 logger = logging.getLogger(__name__)
 
 class BaseEffect:
     """Base class for all effects - ensures consistent interface"""
     
+    # Shared intermediates (see effect_frame) the effect reads in apply_frame; the
+    # per-request planner computes the union of these once for all requested effects
+    INPUTS = (INPUT_RGB, INPUT_ALPHA)
+    
+    # Tiling (see tile_engine) - context in pixels each output pixel depends on;
+    # None means the effect needs the whole image (global palettes, block grids)
+    TILE_HALO: Optional[int] = None
+    # Hot path runs in GIL-releasing cv2/numpy code: tiles go to threads, otherwise processes
+    RELEASES_GIL = True
+    
     def __init__(self, gpu_enabled: bool = True):
         """Initialize effect with GPU capability"""
         self.gpu_enabled = gpu_enabled and torch.cuda.is_available()
@@ -35,6 +48,32 @@ class BaseEffect:
         """
         raise NotImplementedError(f"Effect {self.__class__.__name__} must implement apply() method")
     
+    def apply_frame(self, frame: EffectFrame, **kwargs) -> np.ndarray:
+        """
+        Apply effect to a planned frame, reusing its shared intermediates
+        
+        Effects that read frame.rgb / frame.alpha / frame.edge override this; the
+        default simply runs apply() on the frame image.
+        """
+        return self.apply(frame.image, **kwargs)
+    
+    def tile_spec(self, **kwargs) -> Optional[TileSpec]:
+        """How this effect may be tiled for the given parameters (None = run whole)"""
+        if self.TILE_HALO is None:
+            return None
+        return TileSpec(halo=self.TILE_HALO, releases_gil=self.RELEASES_GIL)
+    
+    def finish_frame(self, frame: EffectFrame, result_rgb: np.ndarray, alpha: Optional[np.ndarray]) -> np.ndarray:
+        """
+        Return an RGB effect result in the frame's channel order with alpha restored
+        
+        RGB-ordered frames (the pipeline's canonical RGBA) need no color conversion;
+        legacy BGR frames convert back once.
+        """
+        if frame.channel_order == CHANNEL_ORDER_BGR and len(result_rgb.shape) == 3:
+            result_rgb = cv2.cvtColor(result_rgb, cv2.COLOR_RGB2BGR)
+        return self.postprocess_image(result_rgb, alpha)
+    
     def get_quality_settings(self, quality: str = 'standard') -> Dict[str, Any]:
         """Get quality-specific settings for the effect"""
         settings = {
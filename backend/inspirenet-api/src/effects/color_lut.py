@@ -0,0 +1,240 @@
+"""
+Color LUT Compiler
+Samples pointwise RGB effects into 3D lookup tables applied with a single lookup per pixel
+"""
+
+import os
+import json
+import threading
+import logging
+import numpy as np
+import torch
+import torch.nn.functional as F
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Any, Tuple, Callable
+
+from .effect_registry import EFFECT_REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Grid points per axis - 33 for smooth curves, 65 where highlights/shadows roll off steeply
+COLOR_LUT_SIZE = int(os.getenv("COLOR_LUT_SIZE", "33"))
+# Compiled tables whose sampled error exceeds this (CIE76 delta-E) are rejected - callers evaluate directly
+COLOR_LUT_MAX_DELTA_E = float(os.getenv("COLOR_LUT_MAX_DELTA_E", "2.0"))
+COLOR_LUT_CACHE_SIZE = int(os.getenv("COLOR_LUT_CACHE_SIZE", "32"))
+# Random colors evaluated both ways for the accuracy report
+COLOR_LUT_REPORT_SAMPLES = 65536
+
+# Continuous effects interpolate between grid points; quantized effects (posterized
+# input that always lands on a grid point) look up the nearest one, which is exact
+INTERP_TRILINEAR = 'trilinear'
+INTERP_NEAREST = 'nearest'
+
+# A pointwise effect: (..., 3) float32 RGB in 0-255 to (..., C) values in 0-output_max
+PointwiseFunction = Callable[[np.ndarray], np.ndarray]
+
+
+def lut_grid(size: int) -> np.ndarray:
+    """(size, size, size, 3) float32 RGB sample points in 0-255, indexed [r, g, b]"""
+    axis = np.linspace(0, 255, size, dtype=np.float32)
+    return np.stack(np.meshgrid(axis, axis, axis, indexing='ij'), axis=-1)
+
+
+@dataclass
+class ColorLUT:
+    """3D lookup table over RGB 0-255"""
+    table: np.ndarray  # (S, S, S, C) float32, indexed [r, g, b]
+    interpolation: str = INTERP_TRILINEAR
+
+    def __post_init__(self):
+        self.table = np.ascontiguousarray(self.table, dtype=np.float32)
+        # grid_sample layout (1, C, D=b, H=g, W=r) so pixel (r, g, b) is its (x, y, z) as-is
+        self._volume = torch.from_numpy(np.ascontiguousarray(self.table.transpose(3, 2, 1, 0)))[None]
+        self._flat = self.table.reshape(-1, self.channels)
+
+    @property
+    def size(self) -> int:
+        return self.table.shape[0]
+
+    @property
+    def channels(self) -> int:
+        return self.table.shape[3]
+
+    def apply(self, rgb: np.ndarray) -> np.ndarray:
+        """(H, W, 3) RGB uint8 or float 0-255 to (H, W, C) float32"""
+        if self.interpolation == INTERP_NEAREST:
+            return self._apply_nearest(rgb)
+        return self._apply_trilinear(rgb)
+
+    def _apply_nearest(self, rgb: np.ndarray) -> np.ndarray:
+        size = self.size
+        index = np.rint(rgb * np.float32((size - 1) / 255.0)).astype(np.intp)
+        flat_index = (index[..., 0] * size + index[..., 1]) * size + index[..., 2]
+        return self._flat[flat_index]
+
+    def _apply_trilinear(self, rgb: np.ndarray) -> np.ndarray:
+        height, width = rgb.shape[:2]
+        # grid_sample coordinates are -1..1
+        coords = torch.from_numpy(np.array(rgb, dtype=np.float32, order='C'))
+        coords = coords.mul_(2.0 / 255.0).sub_(1.0).view(1, 1, height, width, 3)
+        with torch.no_grad():
+            result = F.grid_sample(
+                self._volume, coords, mode='bilinear', padding_mode='border', align_corners=True
+            )
+        # (1, C, 1, H, W) -> (H, W, C)
+        return result[0, :, 0].permute(1, 2, 0).contiguous().numpy()
+
+
+def compile_color_lut(
+    function: PointwiseFunction,
+    size: int = COLOR_LUT_SIZE,
+    interpolation: str = INTERP_TRILINEAR
+) -> ColorLUT:
+    """Evaluate a pointwise effect on every grid point"""
+    values = np.asarray(function(lut_grid(size).reshape(1, -1, 3)), dtype=np.float32)
+    return ColorLUT(values.reshape(size, size, size, -1), interpolation)
+
+
+# sRGB (D65) to XYZ, rows pre-divided by the D65 white point
+_RGB_TO_XYZ_WHITE = (np.array([
+    [0.4124564, 0.3575761, 0.1804375],
+    [0.2126729, 0.7151522, 0.0721750],
+    [0.0193339, 0.1191920, 0.9503041]
+]) / np.array([[0.95047], [1.0], [1.08883]])).T
+
+
+def _to_lab(values: np.ndarray, output_max: float) -> np.ndarray:
+    """(N, C) effect output (C = 1 gray or 3 RGB) to (N, 3) CIELAB"""
+    rgb = np.clip(values.reshape(-1, values.shape[-1]).astype(np.float64) / output_max, 0, 1)
+    if rgb.shape[1] == 1:
+        rgb = np.repeat(rgb, 3, axis=1)
+    linear = np.where(rgb <= 0.04045, rgb / 12.92, ((rgb + 0.055) / 1.055) ** 2.4)
+    xyz = linear @ _RGB_TO_XYZ_WHITE
+    f = np.where(xyz > (6 / 29) ** 3, np.cbrt(xyz), xyz / (3 * (6 / 29) ** 2) + 4 / 29)
+    return np.stack([116 * f[:, 1] - 16, 500 * (f[:, 0] - f[:, 1]), 200 * (f[:, 1] - f[:, 2])], axis=1)
+
+
+def accuracy_report(
+    function: PointwiseFunction,
+    lut: ColorLUT,
+    samples: Optional[np.ndarray] = None,
+    output_max: float = 255.0
+) -> Dict[str, Any]:
+    """
+    CIE76 delta-E of the LUT against direct evaluation
+
+    Args:
+        function: The pointwise effect the LUT was compiled from
+        lut: Compiled table
+        samples: (N, 3) RGB inputs; defaults to random colors plus the cube corners
+        output_max: Value of full intensity in the function's output
+    """
+    if samples is None:
+        rng = np.random.default_rng(0)
+        samples = np.concatenate([
+            rng.integers(0, 256, (COLOR_LUT_REPORT_SAMPLES, 3)),
+            lut_grid(2).reshape(-1, 3)
+        ]).astype(np.uint8)
+    samples = samples.reshape(1, -1, 3).astype(np.float32)
+
+    direct = np.asarray(function(samples), dtype=np.float32).reshape(samples.shape[1], -1)
+    looked_up = lut.apply(samples).reshape(samples.shape[1], -1)
+    delta_e = np.linalg.norm(_to_lab(direct, output_max) - _to_lab(looked_up, output_max), axis=1)
+    worst = int(np.argmax(delta_e))
+    return {
+        'size': lut.size,
+        'interpolation': lut.interpolation,
+        'samples': int(delta_e.size),
+        'max_delta_e': round(float(delta_e[worst]), 3),
+        'p99_delta_e': round(float(np.percentile(delta_e, 99)), 3),
+        'mean_delta_e': round(float(delta_e.mean()), 4),
+        'worst_input': samples[0, worst].tolist()
+    }
+
+
+class ColorLUTCache:
+    """Compiled LUTs keyed by effect version and params, with their accuracy reports"""
+
+    def __init__(self, max_entries: int = COLOR_LUT_CACHE_SIZE, max_delta_e: float = COLOR_LUT_MAX_DELTA_E):
+        self.max_entries = max_entries
+        self.max_delta_e = max_delta_e
+        # None marks a table that failed the accuracy check, so it isn't recompiled per request
+        self._entries: 'OrderedDict[Tuple, Optional[ColorLUT]]' = OrderedDict()
+        self._reports: 'OrderedDict[Tuple, Dict[str, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'compiles': 0, 'rejected': 0}
+
+    def _key(self, effect_name: str, stage: str, params: Optional[Dict[str, Any]], size: int, interpolation: str) -> Tuple:
+        version = EFFECT_REGISTRY.get_spec(effect_name).version
+        params_str = json.dumps(params or {}, sort_keys=True, default=str)
+        return (EFFECT_REGISTRY.resolve(effect_name), version, stage, params_str, size, interpolation)
+
+    def get(
+        self,
+        effect_name: str,
+        stage: str,
+        function: PointwiseFunction,
+        params: Optional[Dict[str, Any]] = None,
+        size: int = COLOR_LUT_SIZE,
+        interpolation: str = INTERP_TRILINEAR,
+        samples: Optional[np.ndarray] = None,
+        output_max: float = 255.0
+    ) -> Optional[ColorLUT]:
+        """
+        LUT for one pointwise stage of an effect, compiled and checked on first use
+
+        Args:
+            effect_name: Registered effect - its version is part of the key
+            stage: Name of the pointwise stage within the effect
+            function: Direct evaluation of the stage
+            params: Every parameter the stage depends on
+            samples: Inputs for the accuracy check (see accuracy_report)
+
+        Returns:
+            The LUT, or None when it exceeds max_delta_e (evaluate the stage directly)
+        """
+        key = self._key(effect_name, stage, params, size, interpolation)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.stats['hits'] += 1
+                return self._entries[key]
+
+        # Compiled outside the lock - a concurrent duplicate compile is harmless
+        lut = compile_color_lut(function, size, interpolation)
+        report = accuracy_report(function, lut, samples, output_max)
+        accepted = report['max_delta_e'] <= self.max_delta_e
+        if not accepted:
+            logger.warning(f"LUT for {effect_name}/{stage} rejected: max delta-E {report['max_delta_e']} "
+                          f"> {self.max_delta_e} at {report['worst_input']}")
+        else:
+            logger.info(f"Compiled {size}^3 LUT for {effect_name}/{stage} "
+                       f"(max delta-E {report['max_delta_e']}, mean {report['mean_delta_e']})")
+
+        with self._lock:
+            self.stats['compiles'] += 1
+            if not accepted:
+                self.stats['rejected'] += 1
+            self._entries[key] = lut if accepted else None
+            self._reports[key] = report
+            while len(self._entries) > self.max_entries:
+                old_key, _ = self._entries.popitem(last=False)
+                self._reports.pop(old_key, None)
+        return lut if accepted else None
+
+    def reports(self) -> List[Dict[str, Any]]:
+        """Accuracy reports of the cached tables"""
+        with self._lock:
+            return [
+                {'effect': key[0], 'version': key[1], 'stage': key[2], 'accepted': self._entries.get(key) is not None, **report}
+                for key, report in self._reports.items()
+            ]
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self.stats, 'cached_tables': len(self._entries), 'max_delta_e': self.max_delta_e}
+
+
+# Shared by all effect instances (tables depend only on effect version and params)
+color_lut_cache = ColorLUTCache()
@@ -9,6 +9,7 @@ import numpy as np
 import cv2
 from typing import Dict, Any
 from .base_effect import BaseEffect
+from .effect_frame import EffectFrame, INPUT_RGB, INPUT_ALPHA
 import logging
 from scipy import ndimage
 
@@ -17,6 +18,10 @@ logger = logging.getLogger(__name__)
 class DitheringEffect(BaseEffect):
     """Floyd-Steinberg dithering with spaced dots - optimized Canvas algorithm port"""
     
+    INPUTS = (INPUT_RGB, INPUT_ALPHA)
+    # Error diffusion carries error across the whole frame - no halo makes tiles seam-free
+    TILE_HALO = None
+    
     def __init__(self, gpu_enabled: bool = True):
         super().__init__(gpu_enabled)
         
@@ -36,27 +41,23 @@ class DitheringEffect(BaseEffect):
         Apply Floyd-Steinberg dithering with spaced dots
         OPTIMIZED version of Canvas algorithm from test.html:596
         """
+        return self.apply_frame(EffectFrame(image), quality=quality, **kwargs)
+    
+    def apply_frame(self, frame: EffectFrame, quality: str = 'standard', **kwargs) -> np.ndarray:
+        """Apply effect using the request's shared intermediates"""
         logger.info(f"Applying OPTIMIZED Floyd-Steinberg dithering effect")
         
         # Merge default parameters with user parameters
         params = {**self.DEFAULT_PARAMS, **kwargs}
         
-        # Extract alpha channel if present
-        rgb_image, alpha_channel = self.extract_alpha_channel(image)
-        
-        # Convert to RGB for processing
-        if len(rgb_image.shape) == 3 and rgb_image.shape[2] == 3:
-            # Assume input is BGR, convert to RGB
-            rgb_image = cv2.cvtColor(rgb_image, cv2.COLOR_BGR2RGB)
+        # Alpha and RGB come from the shared frame - converted once per request
+        rgb_image, alpha_channel = frame.rgb, frame.alpha
         
         # Apply optimized spaced dithering processing
         result = self.apply_spaced_dithering_optimized(rgb_image, alpha_channel, params)
         
-        # Convert back to BGR for consistency
-        result_bgr = cv2.cvtColor(result, cv2.COLOR_RGB2BGR)
-        
-        # Restore alpha channel
-        final_result = self.postprocess_image(result_bgr, alpha_channel)
+        # Restore alpha channel in the frame's channel order (BGR only for the legacy API)
+        final_result = self.finish_frame(frame, result, alpha_channel)
         
         logger.info("OPTIMIZED Floyd-Steinberg dithering effect applied successfully")
         return final_result
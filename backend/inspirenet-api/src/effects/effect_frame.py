@@ -0,0 +1,225 @@
+"""
+Effect Frame
+Per-request image intermediates shared by all effects, each computed at most once
+"""
+
+import hashlib
+import numpy as np
+import cv2
+import logging
+from PIL import Image
+from typing import Dict, Any, Optional, Tuple, Iterable, Callable
+
+logger = logging.getLogger(__name__)
+
+# Intermediates an effect can declare as inputs
+INPUT_BGR = 'bgr'
+INPUT_ALPHA = 'alpha'
+INPUT_RGB = 'rgb'
+INPUT_GRAY = 'gray'
+INPUT_EDGE = 'edge'
+
+# Pixel layout of the frame image. The pipeline's canonical in-memory image is
+# contiguous RGBA uint8 (PIL order); BGR/BGRA is kept for the legacy apply() API
+CHANNEL_ORDER_BGR = 'bgr'
+CHANNEL_ORDER_RGB = 'rgb'
+
+# Subject crop - EffectPlan crops once per request for every requested effect, so these are
+# global: context kept around the alpha bounding box, grid the crop origin snaps to (a
+# multiple of retro8bit's default 8px blocks), alpha counted as background, and the frame
+# fraction above which cropping is skipped
+SUBJECT_CROP_MARGIN = 16
+SUBJECT_CROP_ALIGNMENT = 16
+SUBJECT_ALPHA_THRESHOLD = 8
+SUBJECT_CROP_MAX_AREA = 0.9
+
+
+def alpha_bbox(alpha: np.ndarray, threshold: int = SUBJECT_ALPHA_THRESHOLD) -> Optional[Tuple[int, int, int, int]]:
+    """
+    Tight bounding box of the visible subject
+
+    Returns:
+        (top, bottom, left, right) with exclusive bottom/right, or None if fully transparent
+    """
+    visible = alpha > threshold
+    rows = np.flatnonzero(visible.any(axis=1))
+    if rows.size == 0:
+        return None
+    cols = np.flatnonzero(visible[rows[0]:rows[-1] + 1].any(axis=0))
+    return rows[0], rows[-1] + 1, cols[0], cols[-1] + 1
+
+
+def subject_crop_box(
+    alpha: np.ndarray,
+    margin: int = SUBJECT_CROP_MARGIN,
+    alignment: int = SUBJECT_CROP_ALIGNMENT,
+    threshold: int = SUBJECT_ALPHA_THRESHOLD,
+    max_area: float = SUBJECT_CROP_MAX_AREA
+) -> Optional[Tuple[int, int, int, int]]:
+    """
+    Padded, grid-aligned crop around the subject
+
+    Returns:
+        (top, bottom, left, right), or None when cropping would not save work
+    """
+    height, width = alpha.shape[:2]
+    bbox = alpha_bbox(alpha, threshold)
+    if bbox is None:
+        return None
+
+    top, bottom, left, right = bbox
+    top = max(0, top - margin) // alignment * alignment
+    left = max(0, left - margin) // alignment * alignment
+    bottom = min(height, bottom + margin)
+    right = min(width, right + margin)
+
+    if (bottom - top) * (right - left) >= max_area * height * width:
+        return None
+    return top, bottom, left, right
+
+
+def pil_to_array(image: Image.Image) -> np.ndarray:
+    """
+    Decode boundary: PIL image to the canonical RGBA (or RGB) uint8 array
+    
+    np.asarray wraps PIL's single exported buffer without a second copy; the
+    result is read-only, so effects must never write into their input.
+    """
+    if image.mode not in ('RGBA', 'RGB'):
+        image = image.convert('RGBA')
+    return np.asarray(image)
+
+
+def array_to_pil(array: np.ndarray) -> Image.Image:
+    """Encode boundary: canonical RGBA/RGB array to PIL (contiguous RGBA is shared, not copied)"""
+    mode = 'RGBA' if array.ndim == 3 and array.shape[2] == 4 else 'RGB'
+    return Image.fromarray(np.ascontiguousarray(array), mode=mode)
+
+
+def rgba_digest(array: np.ndarray) -> str:
+    """
+    Content hash of a decoded (background-removed) image buffer
+    
+    Keys on pixels rather than upload bytes, so re-encoded or EXIF-rotated uploads
+    that produce the same cutout share cached effect results.
+    """
+    hasher = hashlib.sha256(f"{array.shape}|{array.dtype}".encode())
+    hasher.update(memoryview(np.ascontiguousarray(array)).cast('B'))
+    return hasher.hexdigest()
+
+
+def _color_channels(frame: 'EffectFrame', order: str) -> np.ndarray:
+    """Color planes of the frame in the requested order - a plain slice when the order already matches"""
+    color = frame.image[:, :, :3] if frame.has_alpha else frame.image
+    if order == frame.channel_order:
+        # One contiguous copy at most; cv2 would otherwise copy the strided view on every call
+        return np.ascontiguousarray(color)
+    code = cv2.COLOR_BGR2RGB if order == CHANNEL_ORDER_RGB else cv2.COLOR_RGB2BGR
+    return cv2.cvtColor(color, code)
+
+
+def _edge_magnitude(frame: 'EffectFrame') -> np.ndarray:
+    """Sobel gradient magnitude of the grayscale frame"""
+    gray = frame.get(INPUT_GRAY)
+    grad_x = cv2.Sobel(gray, cv2.CV_64F, 1, 0, ksize=3)
+    grad_y = cv2.Sobel(gray, cv2.CV_64F, 0, 1, ksize=3)
+    return np.sqrt(grad_x**2 + grad_y**2)
+
+
+class EffectFrame:
+    """Lazily computed, cached intermediates for one BGR/BGRA or RGB/RGBA image"""
+
+    PRODUCERS: Dict[str, Callable[['EffectFrame'], Any]] = {
+        INPUT_BGR: lambda f: _color_channels(f, CHANNEL_ORDER_BGR),
+        INPUT_ALPHA: lambda f: f.image[:, :, 3] if f.has_alpha else None,
+        INPUT_RGB: lambda f: _color_channels(f, CHANNEL_ORDER_RGB),
+        INPUT_GRAY: lambda f: cv2.cvtColor(f.get(INPUT_RGB), cv2.COLOR_RGB2GRAY),
+        INPUT_EDGE: _edge_magnitude,
+    }
+
+    def __init__(self, image: np.ndarray, channel_order: str = CHANNEL_ORDER_BGR):
+        self.image = image
+        self.channel_order = channel_order
+        self.has_alpha = len(image.shape) == 3 and image.shape[2] == 4
+        self._cache: Dict[str, Any] = {}
+
+    def get(self, name: str) -> Any:
+        """Return an intermediate, computing it on first use"""
+        if name not in self._cache:
+            producer = self.PRODUCERS.get(name)
+            if producer is None:
+                raise ValueError(f"Unknown effect input: {name}")
+            self._cache[name] = producer(self)
+        return self._cache[name]
+
+    def prepare(self, names: Iterable[str]) -> None:
+        """Compute the given intermediates up front"""
+        for name in names:
+            self.get(name)
+
+    def computed_inputs(self) -> Tuple[str, ...]:
+        """Names of the intermediates computed so far"""
+        return tuple(self._cache.keys())
+
+    @property
+    def rgb(self) -> np.ndarray:
+        return self.get(INPUT_RGB)
+
+    @property
+    def alpha(self) -> Optional[np.ndarray]:
+        return self.get(INPUT_ALPHA)
+
+    @property
+    def gray(self) -> np.ndarray:
+        return self.get(INPUT_GRAY)
+
+    @property
+    def edge(self) -> np.ndarray:
+        return self.get(INPUT_EDGE)
+
+
+class EffectPlan:
+    """
+    Per-request effect plan: one (optionally subject-cropped) frame whose
+    intermediates are shared by every requested effect
+    """
+
+    def __init__(
+        self,
+        image: np.ndarray,
+        inputs: Iterable[str] = (),
+        crop_to_subject: bool = True,
+        channel_order: str = CHANNEL_ORDER_BGR
+    ):
+        # Uncropped input, kept by reference for identity effects
+        self.source = image
+        self.full_shape = image.shape
+        self.box = None
+
+        if crop_to_subject and len(image.shape) == 3 and image.shape[2] == 4:
+            self.box = subject_crop_box(image[:, :, 3])
+
+        if self.box is not None:
+            top, bottom, left, right = self.box
+            image = np.ascontiguousarray(image[top:bottom, left:right])
+            logger.debug(f"Effect plan cropped to subject {right - left}x{bottom - top} "
+                        f"of {self.full_shape[1]}x{self.full_shape[0]}")
+
+        self.frame = EffectFrame(image, channel_order)
+        self.inputs = tuple(dict.fromkeys(inputs))
+        self.frame.prepare(self.inputs)
+
+    @property
+    def image(self) -> np.ndarray:
+        """Image the effects run on (the crop when cropped)"""
+        return self.frame.image
+
+    def expand(self, result: Optional[np.ndarray]) -> Optional[np.ndarray]:
+        """Paste an effect result computed on the frame back into a full-size transparent canvas"""
+        if result is None or self.box is None:
+            return result
+
+        top, bottom, left, right = self.box
+        canvas = np.zeros(self.full_shape[:2] + result.shape[2:], dtype=result.dtype)
+        canvas[top:bottom, left:right] = result
+        return canvas
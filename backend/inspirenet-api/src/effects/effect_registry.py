@@ -0,0 +1,76 @@
+"""
+Effect Registry
+Single source of truth for available effects - lazy construction and per-request planning
+
+Specs and lookups come from the shared effect_specs module (same file as the BiRefNet service)
+"""
+
+import numpy as np
+from typing import Iterable
+
+from .effect_frame import EffectPlan, INPUT_RGB, INPUT_ALPHA, INPUT_EDGE, CHANNEL_ORDER_BGR
+from .effect_specs import EffectSpec, EffectRegistry as SharedEffectRegistry
+
+
+class EffectRegistry(SharedEffectRegistry):
+    """Shared effect registry with plans over numpy RGBA frames"""
+
+    def plan(
+        self,
+        image: np.ndarray,
+        effect_names: Iterable[str],
+        crop_to_subject: bool = True,
+        channel_order: str = CHANNEL_ORDER_BGR
+    ) -> EffectPlan:
+        """
+        Build the per-request plan: crop once, then compute the union of the
+        requested effects' declared inputs once for all of them
+        """
+        return EffectPlan(image, self.declared_inputs(effect_names), crop_to_subject, channel_order)
+
+
+def _enhanced_blackwhite(gpu_enabled: bool):
+    from .enhanced_blackwhite_effect import EnhancedBlackWhiteEffect
+    return EnhancedBlackWhiteEffect(gpu_enabled)
+
+
+def _dithering(gpu_enabled: bool):
+    from .dithering_effect import DitheringEffect
+    return DitheringEffect(gpu_enabled)
+
+
+def _popart(gpu_enabled: bool):
+    from .optimized_popart_effect import OptimizedPopArtEffect
+    return OptimizedPopArtEffect(gpu_enabled)
+
+
+def _retro8bit(gpu_enabled: bool):
+    from .pet_optimized_eightbit_effect import PetOptimizedEightBitEffect
+    return PetOptimizedEightBitEffect(gpu_enabled)
+
+
+EFFECT_REGISTRY = EffectRegistry()
+
+EFFECT_REGISTRY.register(EffectSpec(
+    'color', 'Original color with background removed',
+    # v2: served from the background-removal object, so the v1 copies are swept
+    version=2
+))
+EFFECT_REGISTRY.register(EffectSpec(
+    'enhancedblackwhite', 'Enhanced B&W with 60% visual improvement and research-informed processing',
+    # v2: grayscale + film curve run through a 33^3 color LUT - output differs slightly from v1
+    factory=_enhanced_blackwhite, inputs=(INPUT_RGB, INPUT_ALPHA), version=2
+))
+EFFECT_REGISTRY.register(EffectSpec(
+    'dithering', 'Floyd-Steinberg dithering with spaced dots - Canvas algorithm port',
+    # v2: always whole-frame - v1 entries of large images were tiled and differ at tile seams
+    factory=_dithering, inputs=(INPUT_RGB, INPUT_ALPHA), version=2
+))
+EFFECT_REGISTRY.register(EffectSpec(
+    'popart', 'Optimized pop art with 10x+ performance improvement and ITU-R BT.709 processing',
+    factory=_popart, inputs=(INPUT_RGB, INPUT_ALPHA)
+))
+EFFECT_REGISTRY.register(EffectSpec(
+    'retro8bit', 'Pet-optimized 8-bit with enhanced color science, 8x8 chunky blocks, and 7x speedup',
+    factory=_retro8bit, inputs=(INPUT_RGB, INPUT_ALPHA, INPUT_EDGE)
+))
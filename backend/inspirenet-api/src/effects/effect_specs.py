@@ -0,0 +1,170 @@
+"""
+Effect Specs
+Shared effect registry: names, aliases, versions, declared inputs and lazily built effects
+
+The same file ships in inspirenet-api and birefnet-bg-removal-api (src/effects/effect_specs.py)
+- each image only copies its own src/, so change both copies together. It imports nothing
+from either service; each service subclasses EffectRegistry to add plan() over its own
+image type and intermediates.
+"""
+
+import json
+import hashlib
+import threading
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Any, Tuple, Callable, Iterable
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class EffectSpec:
+    """Registered effect: how to build it, which shared intermediates it reads and how it is listed"""
+    name: str
+    description: str
+    # Called with gpu_enabled on first use (imports the implementation then); returns the
+    # effect instance or apply function. None marks an identity effect (returns its input unchanged)
+    factory: Optional[Callable[[bool], Any]] = None
+    # Intermediates the service's plan computes once per request for all effects declaring them
+    inputs: Tuple[str, ...] = ()
+    aliases: Tuple[str, ...] = ()
+    # Part of every cache key - bump whenever the effect's output changes so stale results stop matching
+    version: int = 1
+    display_name: str = ""
+    parameters: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+
+    @property
+    def identity(self) -> bool:
+        return self.factory is None
+
+
+class EffectRegistry:
+    """Registry of effect specs with lazily constructed, shared effects"""
+
+    def __init__(self):
+        self._specs: Dict[str, EffectSpec] = {}
+        self._aliases: Dict[str, str] = {}
+        self._instances: Dict[Tuple[str, bool], Any] = {}
+        self._lock = threading.Lock()
+
+    def register(self, spec: EffectSpec) -> EffectSpec:
+        """Register an effect spec (replaces any spec with the same name)"""
+        self._specs[spec.name] = spec
+        for alias in spec.aliases:
+            self._aliases[alias] = spec.name
+        return spec
+
+    def resolve(self, effect_name: str) -> str:
+        """Canonical effect name for a name or alias, case-insensitive (unknown names pass through)"""
+        name = effect_name.lower().strip()
+        return self._aliases.get(name, name)
+
+    def is_known(self, effect_name: str) -> bool:
+        """Whether effect_name is a registered name or alias"""
+        return self.resolve(effect_name) in self._specs
+
+    def get_spec(self, effect_name: str) -> EffectSpec:
+        """Spec for an effect name or alias"""
+        spec = self._specs.get(self.resolve(effect_name))
+        if spec is None:
+            raise ValueError(f"Unknown effect: {effect_name}")
+        return spec
+
+    def supported_effects(self) -> Dict[str, str]:
+        """All registered effects with descriptions"""
+        return {name: spec.description for name, spec in self._specs.items()}
+
+    def available_effects(self) -> List[str]:
+        """Canonical names of all registered effects"""
+        return list(self._specs.keys())
+
+    def catalog(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Effect listing for effect-catalog endpoints
+
+        Aliases are listed as their own entries with "alias_of" for frontend compatibility.
+        """
+        catalog = {}
+        for spec in self._specs.values():
+            display_name = spec.display_name or spec.name
+            catalog[spec.name] = {
+                "name": display_name,
+                "description": spec.description,
+                "parameters": spec.parameters
+            }
+            for alias in spec.aliases:
+                catalog[alias] = {
+                    "name": display_name,
+                    "description": f"Alias for '{spec.name}' - {spec.description}",
+                    "parameters": spec.parameters,
+                    "alias_of": spec.name
+                }
+        return catalog
+
+    def is_identity(self, effect_name: str) -> bool:
+        """Identity effects return the background-removal result unchanged - no instance, no cache object of their own"""
+        spec = self._specs.get(self.resolve(effect_name))
+        return spec is not None and spec.identity
+
+    def get_instance(self, effect_name: str, gpu_enabled: bool = True) -> Any:
+        """
+        Effect instance (or apply function), constructed on first request and shared afterwards
+
+        Returns:
+            The effect, or None for identity effects
+
+        Raises:
+            ValueError: Unknown effect
+        """
+        spec = self.get_spec(effect_name)
+        if spec.identity:
+            return None
+
+        key = (spec.name, gpu_enabled)
+        instance = self._instances.get(key)
+        if instance is None:
+            with self._lock:
+                instance = self._instances.get(key)
+                if instance is None:
+                    logger.info(f"Constructing effect '{spec.name}' on first use")
+                    instance = spec.factory(gpu_enabled)
+                    self._instances[key] = instance
+        return instance
+
+    def initialized_effects(self) -> List[str]:
+        """Effects constructed so far"""
+        return sorted({name for name, _ in self._instances.keys()})
+
+    def declared_inputs(self, effect_names: Iterable[str]) -> List[str]:
+        """Union of the intermediates declared by the requested effects (identity effects need none)"""
+        inputs = []
+        for effect_name in effect_names:
+            spec = self._specs.get(self.resolve(effect_name))
+            if spec is not None and not spec.identity:
+                inputs.extend(name for name in spec.inputs if name not in inputs)
+        return inputs
+
+    def cache_namespace(self, effect_name: str) -> str:
+        """Storage namespace for an effect's cached results - changes with the effect version"""
+        name = self.resolve(effect_name)
+        spec = self._specs.get(name)
+        version = spec.version if spec is not None else 1
+        return f"effects/{name}/v{version}"
+
+    def cache_key(self, image_digest: str, effect_name: str, params: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Cache key for an effect result
+
+        Args:
+            image_digest: Digest of the background-removed pixels the effect ran on
+            effect_name: Effect name or alias
+            params: Effect parameters (order-insensitive)
+        """
+        name = self.resolve(effect_name)
+        spec = self._specs.get(name)
+        # Unknown effects still get a key - they fail at processing, not at the cache lookup
+        version = spec.version if spec is not None else 1
+        params_str = json.dumps(params or {}, sort_keys=True, default=str)
+        params_hash = hashlib.md5(params_str.encode()).hexdigest()
+        return f"effect_{name}_v{version}_{image_digest}_{params_hash}"
@@ -3,6 +3,7 @@ Effects Processor
 Main coordinator for optimized effects processing - 1 version per effect
 """
 
+import os
 import numpy as np
 import cv2
 from typing import Dict, List, Optional, Any
@@ -12,75 +13,34 @@ import time
 import logging
 
 from .base_effect import BaseEffect
-from .enhanced_blackwhite_effect import EnhancedBlackWhiteEffect
-from .dithering_effect import DitheringEffect
-from .optimized_popart_effect import OptimizedPopArtEffect
-from .pet_optimized_eightbit_effect import PetOptimizedEightBitEffect
+from .effect_frame import EffectPlan, CHANNEL_ORDER_BGR
+from .effect_registry import EFFECT_REGISTRY, EffectRegistry
+from .tile_engine import tile_engine
+from .latency_histogram import latency_stats
 
 logger = logging.getLogger(__name__)
 
 class EffectsProcessor:
     """Process optimized effects on server-side - 1 version per effect type"""
     
-    SUPPORTED_EFFECTS = {
-        'color': 'Original color with background removed',
-        'enhancedblackwhite': 'Enhanced B&W with 60% visual improvement and research-informed processing',
-        'dithering': 'Floyd-Steinberg dithering with spaced dots - Canvas algorithm port',
-        'popart': 'Optimized pop art with 10x+ performance improvement and ITU-R BT.709 processing',
-        'retro8bit': 'Pet-optimized 8-bit with enhanced color science, 8x8 chunky blocks, and 7x speedup',
-        'watercolor': '4-stage watercolor with bleeding and texture (TODO)',
-        'mosaic': 'Adaptive mosaic with variable tile sizes (TODO)'
-    }
+    # Descriptions come from the shared registry - effects are registered once, built on first use
+    SUPPORTED_EFFECTS = EFFECT_REGISTRY.supported_effects()
     
-    def __init__(self, gpu_enabled: bool = True):
+    def __init__(self, gpu_enabled: bool = True, registry: Optional[EffectRegistry] = None):
         """Initialize effects processor with GPU capability"""
         self.gpu_enabled = gpu_enabled
-        self.effects = {}
-        self._initialize_effects()
+        # Run effects on the alpha bounding box only - backgrounds are transparent after removal
+        self.crop_to_subject = os.getenv("EFFECTS_CROP_TO_SUBJECT", "true").lower() == "true"
+        self.registry = registry or EFFECT_REGISTRY
+        # Large subject crops are processed as halo-padded tiles in parallel
+        self.tile_engine = tile_engine
         
-        logger.info(f"EffectsProcessor initialized with {len(self.effects)} optimized effects")
-    
-    def _initialize_effects(self):
-        """Initialize optimized effect instances - 1 version per type"""
-        try:
-            # Color effect (no processing needed)
-            self.effects['color'] = None
-            
-            # Enhanced Black & White effect (research-informed improvements)
-            self.effects['enhancedblackwhite'] = EnhancedBlackWhiteEffect(self.gpu_enabled)
-            
-            # Floyd-Steinberg Dithering effect (Canvas algorithm port)
-            self.effects['dithering'] = DitheringEffect(self.gpu_enabled)
-            
-            # Optimized Pop Art effect (10x+ performance improvement)
-            self.effects['popart'] = OptimizedPopArtEffect(self.gpu_enabled)
-            
-            # Pet-Optimized 8-bit Retro effect (7x speedup + enhanced color science)
-            self.effects['retro8bit'] = PetOptimizedEightBitEffect(self.gpu_enabled)
-            
-            # TODO: Initialize remaining effects as they're implemented
-            # self.effects['watercolor'] = WatercolorEffect(self.gpu_enabled)
-            # self.effects['mosaic'] = MosaicEffect(self.gpu_enabled)
-            
-            logger.info("Optimized effects initialized successfully")
-        except Exception as e:
-            logger.error(f"Failed to initialize effects: {e}")
-            raise
+        logger.info(f"EffectsProcessor initialized with {len(self.registry.available_effects())} "
+                   f"optimized effects (constructed on first use)")
     
     def get_available_effects(self) -> List[str]:
-        """Get list of actually implemented and available effects"""
-        available = []
-        
-        for effect_name in self.SUPPORTED_EFFECTS.keys():
-            if effect_name == 'color':
-                # Color effect is always available (no processing needed)
-                available.append(effect_name)
-            elif effect_name in self.effects and self.effects[effect_name] is not None:
-                # Effect is implemented and initialized
-                available.append(effect_name)
-            # Skip effects that are not yet implemented (None values)
-                
-        return available
+        """Get list of available effects"""
+        return self.registry.available_effects()
     
     def get_effect_info(self, effect_name: str) -> Dict[str, Any]:
         """Get information about a specific effect"""
@@ -96,25 +56,31 @@ class EffectsProcessor:
                 'version': 'optimized'
             }
         
-        effect_instance = self.effects.get(effect_name)
-        if effect_instance:
-            info = effect_instance.get_effect_info()
-            info['implemented'] = True
-            info['version'] = 'optimized'
-            return info
-        else:
-            return {
-                'name': effect_name,
-                'description': self.SUPPORTED_EFFECTS[effect_name],
-                'implemented': False,
-                'status': 'TODO: Implementation pending',
-                'version': 'planned'
-            }
+        info = self.registry.get_instance(effect_name, self.gpu_enabled).get_effect_info()
+        info['implemented'] = True
+        info['version'] = 'optimized'
+        return info
     
     def get_all_effects_info(self) -> Dict[str, Dict[str, Any]]:
         """Get information about all effects"""
         return {name: self.get_effect_info(name) for name in self.SUPPORTED_EFFECTS.keys()}
     
+    def plan_effects(
+        self,
+        image: np.ndarray,
+        effect_names: List[str],
+        channel_order: str = CHANNEL_ORDER_BGR
+    ) -> EffectPlan:
+        """
+        Build the per-request effect plan
+        
+        The subject crop and the shared intermediates (RGB, alpha, edge map) the
+        requested effects declare are computed once here instead of once per effect.
+        Pass channel_order='rgb' for the pipeline's canonical RGBA arrays; planned
+        results are then returned as RGBA too.
+        """
+        return self.registry.plan(image, effect_names, self.crop_to_subject, channel_order)
+    
     def process_single_effect(self, image: np.ndarray, effect_name: str, **kwargs) -> np.ndarray:
         """
         Process single effect on image
@@ -136,6 +102,29 @@ class EffectsProcessor:
             logger.error(f"Invalid input image for effect '{effect_name}': shape={getattr(image, 'shape', 'no shape')}, dtype={getattr(image, 'dtype', 'no dtype')}")
             return None
         
+        if effect_name == 'color':
+            # Color effect - return original (no processing)
+            logger.debug(f"Color effect completed - returned copy of original image")
+            return image.copy()
+        
+        return self.process_planned_effect(self.plan_effects(image, [effect_name]), effect_name, **kwargs)
+    
+    def process_planned_effect(self, plan: EffectPlan, effect_name: str, **kwargs) -> np.ndarray:
+        """
+        Process single effect against a per-request plan
+        
+        Args:
+            plan: Plan from plan_effects() shared by all effects of the request
+            effect_name: Name of effect to apply
+            **kwargs: Effect-specific parameters
+            
+        Returns:
+            Processed image with the original dimensions or None if failed
+        """
+        if effect_name not in self.SUPPORTED_EFFECTS:
+            logger.error(f"Unknown effect requested: {effect_name}. Supported: {list(self.SUPPORTED_EFFECTS.keys())}")
+            raise ValueError(f"Unknown effect: {effect_name}")
+        
         start_time = time.time()
         
         try:
@@ -143,16 +132,13 @@ class EffectsProcessor:
             
             if effect_name == 'color':
                 # Color effect - return original (no processing)
-                result = image.copy()
+                result = plan.source.copy()
                 logger.debug(f"Color effect completed - returned copy of original image")
             else:
-                effect_instance = self.effects.get(effect_name)
-                if not effect_instance:
-                    logger.error(f"Effect '{effect_name}' instance not found or not initialized")
-                    raise NotImplementedError(f"Effect '{effect_name}' not yet implemented")
+                effect_instance = self.registry.get_instance(effect_name, self.gpu_enabled)
                 
                 logger.debug(f"Applying effect '{effect_name}' using instance: {type(effect_instance).__name__}")
-                result = effect_instance.apply(image, **kwargs)
+                result = plan.expand(self.tile_engine.run(effect_instance, effect_name, plan.frame, **kwargs))
                 
                 # Validate the result
                 if result is None:
@@ -168,6 +154,7 @@ class EffectsProcessor:
                     return None
             
             processing_time = time.time() - start_time
+            latency_stats.record("effect", processing_time, effect=effect_name, shape=plan.source.shape)
             result_info = f"shape={result.shape}, dtype={result.dtype}" if hasattr(result, 'shape') else "no shape info"
             logger.info(f"Effect '{effect_name}' processed successfully in {processing_time:.3f}s ({result_info})")
             
@@ -176,7 +163,7 @@ class EffectsProcessor:
         except Exception as e:
             processing_time = time.time() - start_time
             logger.error(f"Failed to process effect '{effect_name}' after {processing_time:.3f}s: {type(e).__name__}: {e}")
-            logger.debug(f"Effect '{effect_name}' failure details - Input: shape={getattr(image, 'shape', 'no shape')}, kwargs={kwargs}")
+            logger.debug(f"Effect '{effect_name}' failure details - Input: shape={getattr(plan.image, 'shape', 'no shape')}, kwargs={kwargs}")
             return None  # Return None instead of raising to allow other effects to continue
     
     def process_multiple_effects(self, image: np.ndarray, effect_names: List[str], **kwargs) -> Dict[str, np.ndarray]:
@@ -196,9 +183,14 @@ class EffectsProcessor:
         
         logger.info(f"Processing {len(effect_names)} optimized effects: {effect_names}")
         
+        if not self.validate_image_input(image):
+            logger.error(f"Invalid input image: shape={getattr(image, 'shape', 'no shape')}")
+            return {effect_name: None for effect_name in effect_names}
+        plan = self.plan_effects(image, effect_names)
+        
         for effect_name in effect_names:
             try:
-                results[effect_name] = self.process_single_effect(image, effect_name, **kwargs)
+                results[effect_name] = self.process_planned_effect(plan, effect_name, **kwargs)
             except Exception as e:
                 logger.error(f"Failed to process effect '{effect_name}': {e}")
                 # Continue with other effects, but log the failure
@@ -230,13 +222,15 @@ class EffectsProcessor:
         if progress_callback:
             await progress_callback("effects_start", 0, f"Starting processing of {len(all_effects)} optimized effects...")
         
+        plan = self.plan_effects(image, all_effects)
+        
         for i, effect_name in enumerate(all_effects):
             try:
                 if progress_callback:
                     progress = int((i / len(all_effects)) * 100)
                     await progress_callback("effects_processing", progress, f"Processing {effect_name}...")
                 
-                results[effect_name] = self.process_single_effect(image, effect_name, quality=quality)
+                results[effect_name] = self.process_planned_effect(plan, effect_name, quality=quality)
                 
             except Exception as e:
                 logger.error(f"Failed to process effect '{effect_name}': {e}")
@@ -309,8 +303,8 @@ class EffectsProcessor:
         return {
             'supported_effects': list(self.SUPPORTED_EFFECTS.keys()),
             'gpu_enabled': self.gpu_enabled,
-            'initialized_effects': list(self.effects.keys()),
-            'effects_count': len(self.effects)
+            'initialized_effects': self.registry.initialized_effects(),
+            'effects_count': len(self.registry.available_effects())
         }
     
     def apply_effect(self, image, effect_name, **kwargs):
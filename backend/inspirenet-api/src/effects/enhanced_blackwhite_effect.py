@@ -6,8 +6,10 @@ Based on professional 35mm cinema processing with modern optimization
 
 import numpy as np
 import cv2
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from .base_effect import BaseEffect
+from .effect_frame import EffectFrame, INPUT_RGB, INPUT_ALPHA
+from .color_lut import ColorLUT, color_lut_cache
 import logging
 from scipy import ndimage
 from skimage import filters
@@ -17,6 +19,10 @@ logger = logging.getLogger(__name__)
 class EnhancedBlackWhiteEffect(BaseEffect):
     """Enhanced B&W with Phase 1 Basic optimization: Best performance + quality balance"""
     
+    INPUTS = (INPUT_RGB, INPUT_ALPHA)
+    # Edge unsharp (5x5) + halation (21x21) + grain blur radii, rounded up
+    TILE_HALO = 16
+    
     def __init__(self, gpu_enabled: bool = True):
         super().__init__(gpu_enabled)
         
@@ -41,27 +47,23 @@ class EnhancedBlackWhiteEffect(BaseEffect):
         Apply Phase 1 Basic optimized B&W with best performance/quality balance
         Performance improvement: -9% processing time + enhanced visual quality
         """
+        return self.apply_frame(EffectFrame(image), quality=quality, **kwargs)
+    
+    def apply_frame(self, frame: EffectFrame, quality: str = 'enhanced', **kwargs) -> np.ndarray:
+        """Apply effect using the request's shared intermediates"""
         logger.info(f"Applying Phase 1 Basic Enhanced BlackWhite effect")
         
         # Use Phase 1 Basic optimized defaults merged with user parameters
         params = {**self.IMPROVED_DEFAULTS, **kwargs}
         
-        # Extract alpha channel if present
-        rgb_image, alpha_channel = self.extract_alpha_channel(image)
-        
-        # Convert to RGB for processing
-        if len(rgb_image.shape) == 3 and rgb_image.shape[2] == 3:
-            # Assume input is BGR, convert to RGB
-            rgb_image = cv2.cvtColor(rgb_image, cv2.COLOR_BGR2RGB)
+        # Alpha and RGB come from the shared frame - converted once per request
+        rgb_image, alpha_channel = frame.rgb, frame.alpha
         
         # Apply streamlined Phase 1 Basic processing
         result = self.apply_enhanced_blackwhite_processing(rgb_image, params)
         
-        # Convert back to BGR for consistency
-        result_bgr = cv2.cvtColor(result, cv2.COLOR_RGB2BGR)
-        
-        # Restore alpha channel
-        final_result = self.postprocess_image(result_bgr, alpha_channel)
+        # Restore alpha channel in the frame's channel order (BGR only for the legacy API)
+        final_result = self.finish_frame(frame, result, alpha_channel)
         
         logger.info("Phase 1 Basic Enhanced BlackWhite effect applied successfully")
         return final_result
@@ -70,16 +72,13 @@ class EnhancedBlackWhiteEffect(BaseEffect):
         """
         Streamlined Phase 1 Basic B&W processing - optimized for best performance/quality balance
         """
-        # Normalize to float32 for processing
-        image_float = image.astype(np.float32) / 255.0
-        
-        # 1. Better grayscale conversion with Tri-X spectral response
-        logger.debug("🔄 Converting to grayscale with Tri-X spectral response...")
-        gray = np.dot(image_float, params['gray_weights'])
-        
-        # 2. Improved film curve (with optimized contrast)
-        logger.debug("🔄 Applying authentic film characteristic curve...")
-        gray = self.improved_film_curve(gray, params['contrast_boost'])
+        # 1-2. Tri-X spectral grayscale + film curve - one LUT lookup per pixel when within tolerance
+        logger.debug("🔄 Applying Tri-X grayscale and film characteristic curve...")
+        tone_lut = self.film_tone_lut(params)
+        if tone_lut is not None:
+            gray = tone_lut.apply(image)[:, :, 0]
+        else:
+            gray = self.film_tone(image, params)
         
         # 3. Enhanced edge processing (with optimized strength)
         logger.debug("🔄 Applying enhanced edge processing...")
@@ -110,6 +109,22 @@ class EnhancedBlackWhiteEffect(BaseEffect):
         
         return result_rgb
     
+    def film_tone(self, image: np.ndarray, params: Dict[str, Any]) -> np.ndarray:
+        """Tri-X spectral grayscale followed by the film curve (RGB 0-255 in, gray 0-1 out)"""
+        # Normalize to float32 for processing
+        image_float = image.astype(np.float32) / 255.0
+        gray = np.dot(image_float, params['gray_weights'])
+        return self.improved_film_curve(gray, params['contrast_boost'])
+    
+    def film_tone_lut(self, params: Dict[str, Any]) -> Optional[ColorLUT]:
+        """film_tone compiled into a 3D LUT for these weights and contrast"""
+        return color_lut_cache.get(
+            'enhancedblackwhite', 'film_tone',
+            lambda rgb: self.film_tone(rgb, params)[..., np.newaxis],
+            params={'gray_weights': params['gray_weights'], 'contrast_boost': params['contrast_boost']},
+            output_max=1.0
+        )
+    
     def improved_film_curve(self, image: np.ndarray, contrast: float = 1.08) -> np.ndarray:
         """
         Authentic film response curve based on Tri-X research
@@ -0,0 +1,180 @@
+"""
+Streaming Latency Histograms
+Fixed-memory log-bucketed histograms per stage, effect and image-size bucket
+"""
+
+import os
+import math
+import threading
+import logging
+from typing import Dict, Any, Callable, List, Optional, Tuple, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Bucket width - every quantile is within this fraction of a recorded value
+HISTOGRAM_RELATIVE_ERROR = 0.01
+# Tracked range in seconds - values outside are clamped into the edge buckets
+HISTOGRAM_MIN_SECONDS = 1e-5
+HISTOGRAM_MAX_SECONDS = 3600.0
+# Cap on (stage, effect, size) series - labels are bounded, this guards against a bad caller
+LATENCY_MAX_SERIES = int(os.getenv("LATENCY_MAX_SERIES", "512"))
+
+# Long-edge bounds in pixels (processing sizes are 1280 mobile / 1536 desktop)
+SIZE_BUCKETS = (512, 1024, 1536, 2048)
+
+REPORTED_QUANTILES = (0.5, 0.9, 0.99)
+
+
+def size_bucket(shape: Sequence[int]) -> str:
+    """Label for an image's long edge (array shape or PIL size - only the first two are used)"""
+    long_edge = max(shape[0], shape[1])
+    for bound in SIZE_BUCKETS:
+        if long_edge <= bound:
+            return f"<={bound}px"
+    return f">{SIZE_BUCKETS[-1]}px"
+
+
+class LatencyHistogram:
+    """
+    Log-bucketed histogram with a fixed bucket array (DDSketch-style)
+
+    Bucket i holds values in (gamma^(i-1), gamma^i]; reporting the bucket midpoint keeps
+    every quantile within HISTOGRAM_RELATIVE_ERROR of a recorded value. Memory and
+    quantile cost depend only on the tracked range, not on the number of recordings.
+    """
+
+    def __init__(
+        self,
+        relative_error: float = HISTOGRAM_RELATIVE_ERROR,
+        min_seconds: float = HISTOGRAM_MIN_SECONDS,
+        max_seconds: float = HISTOGRAM_MAX_SECONDS
+    ):
+        self.gamma = (1 + relative_error) / (1 - relative_error)
+        self._log_gamma = math.log(self.gamma)
+        self.min_seconds = min_seconds
+        self.max_seconds = max_seconds
+        self._offset = math.ceil(math.log(min_seconds) / self._log_gamma)
+        self.counts = np.zeros(math.ceil(math.log(max_seconds) / self._log_gamma) - self._offset + 1, dtype=np.int64)
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def record(self, seconds: float):
+        value = min(max(seconds, self.min_seconds), self.max_seconds)
+        self.counts[math.ceil(math.log(value) / self._log_gamma) - self._offset] += 1
+        self.count += 1
+        self.total += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def quantile(self, q: float) -> float:
+        """Value at quantile q in seconds (0.0 when empty)"""
+        if not self.count:
+            return 0.0
+        rank = q * (self.count - 1)
+        if rank <= 0:
+            return self.min
+        if rank >= self.count - 1:
+            return self.max
+        index = int(np.searchsorted(np.cumsum(self.counts), rank, side='right'))
+        value = 2 * self.gamma ** (index + self._offset) / (self.gamma + 1)
+        # The exact extremes are known - never report outside them
+        return min(max(value, self.min), self.max)
+
+    def summary(self) -> Dict[str, Any]:
+        """Count plus mean/min/max and the reported quantiles in milliseconds"""
+        summary = {
+            'count': self.count,
+            'mean_ms': round(self.mean * 1000, 2),
+            'min_ms': round(self.min * 1000, 2) if self.count else 0.0,
+            'max_ms': round(self.max * 1000, 2)
+        }
+        for q in REPORTED_QUANTILES:
+            summary[f"p{round(q * 100)}_ms"] = round(self.quantile(q) * 1000, 2)
+        return summary
+
+
+class LatencyStats:
+    """
+    Latency histograms keyed by (stage, effect, size bucket)
+
+    Every recording also feeds the per-stage, per-size and per-effect rollups, so a
+    summary reads existing histograms instead of merging them.
+    """
+
+    def __init__(self, max_series: int = LATENCY_MAX_SERIES):
+        self.max_series = max_series
+        self._series: Dict[Tuple[str, Optional[str], Optional[str]], LatencyHistogram] = {}
+        self._dropped = 0
+        self._lock = threading.Lock()
+        self._listeners: List[Callable[[str, float, Optional[str], Optional[str]], None]] = []
+
+    def add_listener(self, listener: Callable[[str, float, Optional[str], Optional[str]], None]):
+        """Also pass every recording as (stage, seconds, effect, size bucket) - e.g. to /metrics"""
+        self._listeners.append(listener)
+
+    def record(self, stage: str, seconds: float, effect: Optional[str] = None, shape: Optional[Sequence[int]] = None):
+        """Record one duration; shape is the image's (height, width, ...) or PIL (width, height)"""
+        size = size_bucket(shape) if shape is not None else None
+        # Rollups first, so the stage totals survive the series cap; duplicates collapse when unlabeled
+        keys = dict.fromkeys([(stage, None, None), (stage, None, size), (stage, effect, None), (stage, effect, size)])
+        with self._lock:
+            for key in keys:
+                histogram = self._series.get(key)
+                if histogram is None:
+                    if len(self._series) >= self.max_series:
+                        if not self._dropped:
+                            logger.warning(f"Latency series limit ({self.max_series}) reached - dropping new series")
+                        self._dropped += 1
+                        continue
+                    histogram = self._series[key] = LatencyHistogram()
+                histogram.record(seconds)
+        for listener in self._listeners:
+            listener(stage, seconds, effect, size)
+
+    def get(self, stage: str, effect: Optional[str] = None, size: Optional[str] = None) -> Optional[LatencyHistogram]:
+        return self._series.get((stage, effect, size))
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Nested per-stage summaries
+
+        {stage: {"all": {...}, "by_size": {size: {...}}, "by_effect": {effect: {"all": {...}, "by_size": {...}}}}}
+        """
+        with self._lock:
+            series = sorted(self._series.items(), key=lambda item: tuple(part or "" for part in item[0]))
+            stages: Dict[str, Any] = {}
+            for (stage, effect, size), histogram in series:
+                node = stages.setdefault(stage, {})
+                if effect is not None:
+                    node = node.setdefault('by_effect', {}).setdefault(effect, {})
+                if size is None:
+                    node['all'] = histogram.summary()
+                else:
+                    node.setdefault('by_size', {})[size] = histogram.summary()
+            return stages
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'series': len(self._series),
+            'max_series': self.max_series,
+            'dropped_recordings': self._dropped,
+            'relative_error': HISTOGRAM_RELATIVE_ERROR,
+            'stages': self.summary()
+        }
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+            self._dropped = 0
+
+
+# Process-wide histograms shared by both processors and the effects processors
+latency_stats = LatencyStats()
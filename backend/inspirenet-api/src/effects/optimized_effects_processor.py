@@ -3,81 +3,54 @@ Optimized Effects Processor
 Enhanced with parallel processing capabilities and GPU memory management
 """
 
+import os
 import numpy as np
 import cv2
-from typing import Dict, List, Optional, Any, Tuple
+from typing import Dict, List, Optional, Any
 from PIL import Image
 import asyncio
 import time
 import logging
 import torch
 import concurrent.futures
+import contextvars
 from functools import partial
 
-from .base_effect import BaseEffect
-from .enhanced_blackwhite_effect import EnhancedBlackWhiteEffect
-from .dithering_effect import DitheringEffect
-from .optimized_popart_effect import OptimizedPopArtEffect
-from .pet_optimized_eightbit_effect import PetOptimizedEightBitEffect
+from .effect_frame import EffectPlan, CHANNEL_ORDER_BGR
+from .tile_engine import tile_engine
+from .effect_registry import EFFECT_REGISTRY, EffectRegistry
+from .latency_histogram import LatencyHistogram, latency_stats
 
 logger = logging.getLogger(__name__)
 
 class OptimizedEffectsProcessor:
     """Enhanced effects processor with parallel capabilities and GPU optimization"""
     
-    SUPPORTED_EFFECTS = {
-        'color': 'Original color with background removed',
-        'enhancedblackwhite': 'Enhanced B&W with 60% visual improvement and research-informed processing',
-        'dithering': 'Floyd-Steinberg dithering with spaced dots - Canvas algorithm port',
-        'popart': 'Optimized pop art with 10x+ performance improvement and ITU-R BT.709 processing',
-        'retro8bit': 'Pet-optimized 8-bit with enhanced color science, 8x8 chunky blocks, and 7x speedup',
-        'watercolor': '4-stage watercolor with bleeding and texture (TODO)',
-        'mosaic': 'Adaptive mosaic with variable tile sizes (TODO)'
-    }
+    # Shared registry with EffectsProcessor - effects are built on first use
+    SUPPORTED_EFFECTS = EFFECT_REGISTRY.supported_effects()
     
     def __init__(
         self, 
         gpu_enabled: bool = True,
         max_workers: int = 4,
-        enable_gpu_memory_management: bool = True
+        enable_gpu_memory_management: bool = True,
+        registry: Optional[EffectRegistry] = None
     ):
         """Initialize effects processor with enhanced capabilities"""
         self.gpu_enabled = gpu_enabled and torch.cuda.is_available()
         self.enable_gpu_memory_management = enable_gpu_memory_management
-        self.effects = {}
+        self.crop_to_subject = os.getenv("EFFECTS_CROP_TO_SUBJECT", "true").lower() == "true"
+        self.registry = registry or EFFECT_REGISTRY
         self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
-        self._initialize_effects()
+        self.tile_engine = tile_engine
         
-        # Performance tracking
-        self.effect_timings = {effect: [] for effect in self.SUPPORTED_EFFECTS.keys()}
+        # Performance tracking (fixed-memory histograms, not per-run lists)
+        self.effect_timings = {effect: LatencyHistogram() for effect in self.SUPPORTED_EFFECTS.keys()}
         self.gpu_memory_clears = 0
         
-        logger.info(f"OptimizedEffectsProcessor initialized with {len(self.effects)} effects "
+        logger.info(f"OptimizedEffectsProcessor initialized with {len(self.registry.available_effects())} effects "
                    f"(GPU: {self.gpu_enabled}, Workers: {max_workers})")
     
-    def _initialize_effects(self):
-        """Initialize optimized effect instances"""
-        try:
-            # Color effect (no processing needed)
-            self.effects['color'] = None
-            
-            # Enhanced Black & White effect
-            self.effects['enhancedblackwhite'] = EnhancedBlackWhiteEffect(self.gpu_enabled)
-            
-            # Floyd-Steinberg Dithering effect
-            self.effects['dithering'] = DitheringEffect(self.gpu_enabled)
-            
-            # Optimized Pop Art effect
-            self.effects['popart'] = OptimizedPopArtEffect(self.gpu_enabled)
-            
-            # Pet-Optimized 8-bit Retro effect
-            self.effects['retro8bit'] = PetOptimizedEightBitEffect(self.gpu_enabled)
-            
-            logger.info("Optimized effects initialized successfully")
-        except Exception as e:
-            logger.error(f"Failed to initialize effects: {e}")
-            raise
-    
     def _manage_gpu_memory(self):
         """Clear GPU memory cache when needed"""
         if self.enable_gpu_memory_management and self.gpu_enabled:
@@ -85,99 +58,52 @@ class OptimizedEffectsProcessor:
             self.gpu_memory_clears += 1
             logger.debug("GPU memory cache cleared")
     
-    def _process_image_region(
+    def plan_effects(
+        self,
+        image: np.ndarray,
+        effect_names: List[str],
+        channel_order: str = CHANNEL_ORDER_BGR
+    ) -> EffectPlan:
+        """Build the per-request plan (subject crop + shared intermediates computed once)"""
+        return self.registry.plan(image, effect_names, self.crop_to_subject, channel_order)
+    
+    def process_single_effect(self, image: np.ndarray, effect_name: str, **kwargs) -> np.ndarray:
+        """Process single effect on image (EffectsProcessor-compatible entry point)"""
+        return self.process_single_effect_parallel(image, effect_name, **kwargs)
+    
+    def process_single_effect_parallel(
         self, 
-        region: np.ndarray, 
-        effect_instance: BaseEffect,
+        image: np.ndarray, 
         effect_name: str,
+        num_workers: int = 2,
         **kwargs
     ) -> np.ndarray:
-        """Process a single image region (for parallel processing)"""
-        try:
-            return effect_instance.apply(region, **kwargs)
-        except Exception as e:
-            logger.error(f"Failed to process region with {effect_name}: {e}")
-            return region
-    
-    def _split_image_for_parallel(
-        self, 
-        image: np.ndarray, 
-        num_splits: int = 4
-    ) -> Tuple[List[np.ndarray], List[Tuple[int, int, int, int]]]:
-        """Split image into regions for parallel processing"""
-        h, w = image.shape[:2]
-        
-        # Calculate optimal split based on image size
-        if h * w < 1000000:  # Small images don't benefit from splitting
-            return [image], [(0, 0, h, w)]
-        
-        # Split into grid
-        split_h = int(np.sqrt(num_splits))
-        split_w = num_splits // split_h
+        """
+        Process single effect with optional parallel region processing
         
-        regions = []
-        coords = []
+        For large images, splits into regions and processes in parallel
+        """
+        if effect_name not in self.SUPPORTED_EFFECTS:
+            raise ValueError(f"Unknown effect: {effect_name}")
         
-        for i in range(split_h):
-            for j in range(split_w):
-                y1 = i * (h // split_h)
-                y2 = (i + 1) * (h // split_h) if i < split_h - 1 else h
-                x1 = j * (w // split_w)
-                x2 = (j + 1) * (w // split_w) if j < split_w - 1 else w
-                
-                # Add overlap to prevent edge artifacts
-                overlap = 10
-                y1_ext = max(0, y1 - overlap)
-                y2_ext = min(h, y2 + overlap)
-                x1_ext = max(0, x1 - overlap)
-                x2_ext = min(w, x2 + overlap)
-                
-                regions.append(image[y1_ext:y2_ext, x1_ext:x2_ext])
-                coords.append((y1, x1, y2, x2))
+        if effect_name == 'color':
+            return image.copy()
         
-        return regions, coords
+        return self.process_planned_effect(
+            self.plan_effects(image, [effect_name]), effect_name, num_workers, **kwargs
+        )
     
-    def _merge_processed_regions(
+    def process_planned_effect(
         self,
-        regions: List[np.ndarray],
-        coords: List[Tuple[int, int, int, int]],
-        original_shape: Tuple[int, ...]
-    ) -> np.ndarray:
-        """Merge processed regions back into full image"""
-        if len(regions) == 1:
-            return regions[0]
-        
-        # Create output image
-        output = np.zeros(original_shape, dtype=regions[0].dtype)
-        
-        # Merge regions with blending at overlaps
-        for region, (y1, x1, y2, x2) in zip(regions, coords):
-            # Extract the non-overlapped part
-            overlap = 10
-            if region.shape[0] > (y2 - y1) or region.shape[1] > (x2 - x1):
-                # Region has overlap, extract center
-                y_start = overlap if y1 > 0 else 0
-                y_end = region.shape[0] - overlap if y2 < original_shape[0] else region.shape[0]
-                x_start = overlap if x1 > 0 else 0
-                x_end = region.shape[1] - overlap if x2 < original_shape[1] else region.shape[1]
-                
-                output[y1:y2, x1:x2] = region[y_start:y_end, x_start:x_end]
-            else:
-                output[y1:y2, x1:x2] = region
-        
-        return output
-    
-    def process_single_effect_parallel(
-        self, 
-        image: np.ndarray, 
+        plan: EffectPlan,
         effect_name: str,
         num_workers: int = 2,
         **kwargs
     ) -> np.ndarray:
         """
-        Process single effect with optional parallel region processing
+        Process single effect against a per-request plan
         
-        For large images, splits into regions and processes in parallel
+        The plan's (cropped) frame is tiled for parallel processing when still large
         """
         if effect_name not in self.SUPPORTED_EFFECTS:
             raise ValueError(f"Unknown effect: {effect_name}")
@@ -187,41 +113,22 @@ class OptimizedEffectsProcessor:
         try:
             if effect_name == 'color':
                 # Color effect - return original
-                result = image.copy()
+                result = plan.source.copy()
             else:
-                effect_instance = self.effects.get(effect_name)
-                if not effect_instance:
-                    raise NotImplementedError(f"Effect '{effect_name}' not yet implemented")
+                effect_instance = self.registry.get_instance(effect_name, self.gpu_enabled)
                 
-                # Check if image is large enough for parallel processing
-                h, w = image.shape[:2]
-                if h * w > 2000000 and num_workers > 1:  # > 2MP
-                    logger.debug(f"Using parallel processing for {effect_name} ({h}x{w})")
-                    
-                    # Split image
-                    regions, coords = self._split_image_for_parallel(image, num_workers)
-                    
-                    # Process regions in parallel
-                    process_func = partial(
-                        self._process_image_region,
-                        effect_instance=effect_instance,
-                        effect_name=effect_name,
-                        **kwargs
-                    )
-                    
-                    with concurrent.futures.ThreadPoolExecutor(max_workers=num_workers) as executor:
-                        processed_regions = list(executor.map(process_func, regions))
-                    
-                    # Merge results
-                    result = self._merge_processed_regions(
-                        processed_regions, coords, image.shape
-                    )
-                else:
-                    # Process normally for smaller images
-                    result = effect_instance.apply(image, **kwargs)
+                # Large frames are split into halo-padded tiles (threads for GIL-releasing
+                # effects, processes otherwise); small ones and untileable effects run whole
+                result = self.tile_engine.run(
+                    effect_instance, effect_name, plan.frame,
+                    parallel=num_workers > 1, **kwargs
+                )
+                
+                result = plan.expand(result)
             
             processing_time = time.time() - start_time
-            self.effect_timings[effect_name].append(processing_time)
+            self.effect_timings[effect_name].record(processing_time)
+            latency_stats.record("effect", processing_time, effect=effect_name, shape=plan.source.shape)
             
             # Manage GPU memory after heavy effects
             if effect_name in ['popart', 'retro8bit'] and self.gpu_enabled:
@@ -249,6 +156,9 @@ class OptimizedEffectsProcessor:
         
         logger.info(f"Processing {len(effect_names)} effects in parallel batches of {parallel_effects}")
         
+        # Crop and shared intermediates are computed once for every effect in every batch
+        plan = self.plan_effects(image, effect_names)
+        
         # Process in batches
         for i in range(0, len(effect_names), parallel_effects):
             batch = effect_names[i:i + parallel_effects]
@@ -259,13 +169,14 @@ class OptimizedEffectsProcessor:
             tasks = []
             
             for effect_name in batch:
+                # Each task gets its own context copy so the effect spans land on the request trace
                 task = loop.run_in_executor(
                     self.executor,
-                    self.process_single_effect_parallel,
-                    image,
+                    contextvars.copy_context().run,
+                    partial(self.process_planned_effect, **kwargs.get(effect_name, {})),
+                    plan,
                     effect_name,
-                    1,  # Don't use region parallelism when doing effect parallelism
-                    **kwargs.get(effect_name, {})
+                    1  # Don't use region parallelism when doing effect parallelism
                 )
                 tasks.append((effect_name, task))
             
@@ -295,12 +206,15 @@ class OptimizedEffectsProcessor:
         stats = {}
         
         for effect_name, timings in self.effect_timings.items():
-            if timings:
+            if timings.count:
                 stats[effect_name] = {
-                    'avg_time': sum(timings) / len(timings),
-                    'min_time': min(timings),
-                    'max_time': max(timings),
-                    'total_runs': len(timings)
+                    'avg_time': timings.mean,
+                    'min_time': timings.min,
+                    'max_time': timings.max,
+                    'p50_time': timings.quantile(0.5),
+                    'p90_time': timings.quantile(0.9),
+                    'p99_time': timings.quantile(0.99),
+                    'total_runs': timings.count
                 }
         
         stats['gpu_memory_clears'] = self.gpu_memory_clears
@@ -324,15 +238,7 @@ class OptimizedEffectsProcessor:
     
     def get_available_effects(self) -> List[str]:
         """Get list of available effects"""
-        available = []
-        
-        for effect_name in self.SUPPORTED_EFFECTS.keys():
-            if effect_name == 'color':
-                available.append(effect_name)
-            elif effect_name in self.effects and self.effects[effect_name] is not None:
-                available.append(effect_name)
-                
-        return available
+        return self.registry.available_effects()
     
     def get_effect_info(self, effect_name: str) -> Dict[str, Any]:
         """Get information about a specific effect with performance data"""
@@ -342,19 +248,20 @@ class OptimizedEffectsProcessor:
         base_info = {
             'name': effect_name,
             'description': self.SUPPORTED_EFFECTS[effect_name],
-            'implemented': effect_name in self.effects and self.effects[effect_name] is not None
+            'implemented': True
         }
         
         # Add performance data if available
-        if effect_name in self.effect_timings and self.effect_timings[effect_name]:
+        if effect_name in self.effect_timings and self.effect_timings[effect_name].count:
             timings = self.effect_timings[effect_name]
             base_info['performance'] = {
-                'avg_processing_time': sum(timings) / len(timings),
-                'runs': len(timings)
+                'avg_processing_time': timings.mean,
+                'p99_processing_time': timings.quantile(0.99),
+                'runs': timings.count
             }
         
-        if effect_name != 'color' and base_info['implemented']:
-            effect_instance = self.effects[effect_name]
+        if not self.registry.is_identity(effect_name):
+            effect_instance = self.registry.get_instance(effect_name, self.gpu_enabled)
             base_info.update(effect_instance.get_effect_info())
         
         return base_info
@@ -5,9 +5,10 @@ Maintains exact visual quality of original Canvas algorithm
 """
 
 import numpy as np
-import cv2
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from .base_effect import BaseEffect
+from .effect_frame import EffectFrame, INPUT_RGB, INPUT_ALPHA
+from .color_lut import ColorLUT, color_lut_cache, lut_grid, INTERP_NEAREST
 import logging
 
 logger = logging.getLogger(__name__)
@@ -15,6 +16,10 @@ logger = logging.getLogger(__name__)
 class OptimizedPopArtEffect(BaseEffect):
     """8-color pop art in Andy Warhol style - vectorized for performance"""
     
+    INPUTS = (INPUT_RGB, INPUT_ALPHA)
+    # Pointwise - tiles need no overlap
+    TILE_HALO = 0
+    
     def __init__(self, gpu_enabled: bool = True):
         super().__init__(gpu_enabled)
         
@@ -43,23 +48,20 @@ class OptimizedPopArtEffect(BaseEffect):
         Apply optimized pop art algorithm with vectorized operations
         10x+ performance improvement over pixel-by-pixel approach
         """
+        return self.apply_frame(EffectFrame(image), quality=quality, **kwargs)
+    
+    def apply_frame(self, frame: EffectFrame, quality: str = 'standard', **kwargs) -> np.ndarray:
+        """Apply effect using the request's shared intermediates"""
         logger.info(f"Applying Optimized PopArt effect")
         
-        # Extract alpha channel if present
-        rgb_image, alpha_channel = self.extract_alpha_channel(image)
-        
-        # Convert BGR to RGB for processing (Canvas uses RGB)
-        if len(rgb_image.shape) == 3 and rgb_image.shape[2] == 3:
-            rgb_image = cv2.cvtColor(rgb_image, cv2.COLOR_BGR2RGB)
+        # Alpha and RGB come from the shared frame - converted once per request
+        rgb_image, alpha_channel = frame.rgb, frame.alpha
         
         # Apply vectorized pop art pipeline
         result = self.create_pop_art_effect_vectorized(rgb_image)
         
-        # Convert back to BGR
-        result_bgr = cv2.cvtColor(result, cv2.COLOR_RGB2BGR)
-        
-        # Restore alpha channel
-        final_result = self.postprocess_image(result_bgr, alpha_channel)
+        # Restore alpha channel in the frame's channel order (BGR only for the legacy API)
+        final_result = self.finish_frame(frame, result, alpha_channel)
         
         logger.info("Optimized PopArt effect applied successfully")
         return final_result
@@ -80,12 +82,30 @@ class OptimizedPopArtEffect(BaseEffect):
         logger.debug("🔄 Applying vectorized posterization...")
         posterized_data = self.apply_posterization_vectorized(enhanced_data)
         
-        # Step 3: Apply pop art color mapping (vectorized)
-        logger.debug("🔄 Applying vectorized color mapping...")
-        result = self.apply_pop_art_color_mapping_vectorized(posterized_data)
+        # Step 3: Apply pop art color mapping (one table lookup per pixel)
+        logger.debug("🔄 Applying color mapping table...")
+        mapping_lut = self.color_mapping_lut()
+        if mapping_lut is not None:
+            result = mapping_lut.apply(posterized_data)
+        else:
+            result = self.apply_pop_art_color_mapping_vectorized(posterized_data)
         
         return result.astype(np.uint8)
     
+    def color_mapping_lut(self) -> Optional[ColorLUT]:
+        """
+        Color mapping compiled over the posterized levels
+        Posterized pixels always sit on the COLOR_LEVELS^3 grid, so the nearest lookup is exact
+        """
+        return color_lut_cache.get(
+            'popart', 'color_mapping',
+            lambda data: self.apply_pop_art_color_mapping_vectorized(data).astype(np.float32),
+            params={'color_levels': self.COLOR_LEVELS, 'palette': self.pop_colors.tolist()},
+            size=self.COLOR_LEVELS,
+            interpolation=INTERP_NEAREST,
+            samples=lut_grid(self.COLOR_LEVELS)
+        )
+    
     def apply_contrast_saturation_boost_vectorized(self, data: np.ndarray) -> np.ndarray:
         """
         Vectorized contrast and saturation boost
@@ -7,6 +7,7 @@ import numpy as np
 import cv2
 from typing import Dict, Any, Tuple, Optional
 from .base_effect import BaseEffect
+from .effect_frame import EffectFrame, INPUT_RGB, INPUT_ALPHA, INPUT_EDGE
 import logging
 from sklearn.cluster import KMeans
 
@@ -15,6 +16,10 @@ logger = logging.getLogger(__name__)
 class PetOptimizedEightBitEffect(BaseEffect):
     """Pet-optimized 8-bit retro effect with advanced color science for pet photography"""
     
+    INPUTS = (INPUT_RGB, INPUT_ALPHA, INPUT_EDGE)
+    # Not tiled: the pixel-block grid and content-aware palette depend on the whole image
+    TILE_HALO = None
+    
     def __init__(self, gpu_enabled: bool = True):
         super().__init__(gpu_enabled)
         
@@ -87,6 +92,10 @@ class PetOptimizedEightBitEffect(BaseEffect):
         
     def apply(self, image: np.ndarray, quality: str = 'standard', **kwargs) -> np.ndarray:
         """Apply pet-optimized 8-bit retro effect with advanced color science"""
+        return self.apply_frame(EffectFrame(image), quality=quality, **kwargs)
+    
+    def apply_frame(self, frame: EffectFrame, quality: str = 'standard', **kwargs) -> np.ndarray:
+        """Apply effect using the request's shared intermediates"""
         logger.info("Applying PET-OPTIMIZED 8-bit retro effect with enhanced color science")
         
         # Merge default parameters with user parameters
@@ -95,26 +104,19 @@ class PetOptimizedEightBitEffect(BaseEffect):
         # Apply quality preset optimizations
         params = self._apply_quality_preset(params, params['quality_preset'])
         
-        # Extract alpha channel if present
-        rgb_image, alpha_channel = self.extract_alpha_channel(image)
-        
-        # Convert to RGB for processing
-        if len(rgb_image.shape) == 3 and rgb_image.shape[2] == 3:
-            rgb_image = cv2.cvtColor(rgb_image, cv2.COLOR_BGR2RGB)
+        # Alpha and RGB come from the shared frame - converted once per request
+        rgb_image, alpha_channel = frame.rgb, frame.alpha
         
         # Choose the appropriate processing method based on parameters
         if params['preserve_edges'] and params['pixelation_factor'] > 1:
             # Use advanced processing for quality
-            result = self._apply_advanced_processing(rgb_image, alpha_channel, params)
+            result = self._apply_advanced_processing(rgb_image, alpha_channel, params, frame.edge)
         else:
             # Use fast vectorized quantization
             result = self._apply_fast_vectorized_quantization(rgb_image, alpha_channel, params)
         
-        # Convert back to BGR for consistency
-        result_bgr = cv2.cvtColor(result, cv2.COLOR_RGB2BGR)
-        
-        # Restore alpha channel
-        final_result = self.postprocess_image(result_bgr, alpha_channel)
+        # Restore alpha channel in the frame's channel order (BGR only for the legacy API)
+        final_result = self.finish_frame(frame, result, alpha_channel)
         
         logger.info("PET-OPTIMIZED 8-bit retro effect applied successfully")
         return final_result
@@ -220,7 +222,8 @@ class PetOptimizedEightBitEffect(BaseEffect):
         return pixelated
     
     def _apply_advanced_processing(self, image: np.ndarray, alpha_channel: np.ndarray, 
-                                 params: Dict[str, Any]) -> np.ndarray:
+                                 params: Dict[str, Any],
+                                 edge_magnitude: Optional[np.ndarray] = None) -> np.ndarray:
         """Advanced processing with edge detection and error diffusion"""
         logger.debug("🎨 Applying advanced pet-optimized processing")
         
@@ -231,7 +234,7 @@ class PetOptimizedEightBitEffect(BaseEffect):
             palette = self.PALETTE_8BIT
         
         # Apply edge detection
-        edge_map = self._create_fast_edge_map(image, params['edge_threshold'])
+        edge_map = self._create_fast_edge_map(image, params['edge_threshold'], edge_magnitude)
         
         # Apply adaptive pixelation based on edges
         if params['pixelation_factor'] > 1:
@@ -250,16 +253,18 @@ class PetOptimizedEightBitEffect(BaseEffect):
         
         return result
     
-    def _create_fast_edge_map(self, image: np.ndarray, threshold: int = 40) -> np.ndarray:
-        """Fast edge detection using Sobel operators"""
-        gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
-        
-        # Sobel edge detection
-        grad_x = cv2.Sobel(gray, cv2.CV_64F, 1, 0, ksize=3)
-        grad_y = cv2.Sobel(gray, cv2.CV_64F, 0, 1, ksize=3)
-        
-        # Magnitude calculation
-        magnitude = np.sqrt(grad_x**2 + grad_y**2)
+    def _create_fast_edge_map(self, image: np.ndarray, threshold: int = 40,
+                              magnitude: Optional[np.ndarray] = None) -> np.ndarray:
+        """Fast edge detection using Sobel operators (reuses a precomputed magnitude if given)"""
+        if magnitude is None:
+            gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+            
+            # Sobel edge detection
+            grad_x = cv2.Sobel(gray, cv2.CV_64F, 1, 0, ksize=3)
+            grad_y = cv2.Sobel(gray, cv2.CV_64F, 0, 1, ksize=3)
+            
+            # Magnitude calculation
+            magnitude = np.sqrt(grad_x**2 + grad_y**2)
         
         # Threshold
         edge_map = magnitude > threshold
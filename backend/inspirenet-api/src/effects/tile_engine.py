@@ -0,0 +1,206 @@
+"""
+Tile Engine
+Parallel tiled effect processing with per-effect halo overlap and seam-free merging
+"""
+
+import os
+import math
+import logging
+import multiprocessing
+import concurrent.futures
+import numpy as np
+from dataclasses import dataclass
+from typing import Dict, Any, List, Optional, Tuple
+
+from .effect_frame import EffectFrame
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class TileSpec:
+    """How an effect may be tiled"""
+    # Context (pixels) each output pixel depends on - blur/Sobel/halation radii summed
+    halo: int
+    # Tile origins snap to this grid so dot/block patterns line up with whole-image output
+    alignment: int = 1
+    # Hot path is GIL-releasing native code (cv2/numpy) - run tiles in threads, else processes
+    releases_gil: bool = True
+
+
+@dataclass(frozen=True)
+class Tile:
+    """Tile core (written to the output) and its halo-padded source box, as (top, bottom, left, right)"""
+    core: Tuple[int, int, int, int]
+    padded: Tuple[int, int, int, int]
+
+
+def plan_tiles(height: int, width: int, tile_size: int, spec: TileSpec) -> List[Tile]:
+    """
+    Cover the image with aligned tile cores and halo-padded source boxes
+
+    Core origins are multiples of the (alignment-rounded) tile size and the halo is
+    rounded up to the alignment, so every padded origin stays on the effect's grid.
+    """
+    alignment = max(1, spec.alignment)
+    tile = max(alignment, tile_size // alignment * alignment)
+    halo = int(math.ceil(spec.halo / alignment)) * alignment
+
+    tiles = []
+    for top in range(0, height, tile):
+        bottom = min(height, top + tile)
+        for left in range(0, width, tile):
+            right = min(width, left + tile)
+            padded = (
+                max(0, top - halo), min(height, bottom + halo),
+                max(0, left - halo), min(width, right + halo)
+            )
+            tiles.append(Tile((top, bottom, left, right), padded))
+    return tiles
+
+
+def merge_tiles(results: List[np.ndarray], tiles: List[Tile], height: int, width: int) -> np.ndarray:
+    """Crop each tile's halo and write its core into one output buffer"""
+    first = results[0]
+    output = np.empty((height, width) + first.shape[2:], dtype=first.dtype)
+    for result, tile in zip(results, tiles):
+        top, bottom, left, right = tile.core
+        pad_top, _, pad_left, _ = tile.padded
+        output[top:bottom, left:right] = result[
+            top - pad_top:bottom - pad_top,
+            left - pad_left:right - pad_left
+        ]
+    return output
+
+
+def _warm_worker() -> None:
+    """Import the effect modules (and torch) so the first tiled request does not pay for it"""
+    from . import effect_registry  # noqa: F401
+
+
+def _apply_tile_in_worker(effect_name: str, channel_order: str, tile: np.ndarray,
+                          kwargs: Dict[str, Any]) -> np.ndarray:
+    """Process-pool entry point - effects are built once per worker from the registry"""
+    from .effect_registry import EFFECT_REGISTRY
+    effect = EFFECT_REGISTRY.get_instance(effect_name, gpu_enabled=False)
+    return effect.apply_frame(EffectFrame(tile, channel_order), **kwargs)
+
+
+class TileEngine:
+    """Runs an effect over halo-padded tiles in threads or processes and merges the cores"""
+
+    def __init__(
+        self,
+        tile_size: Optional[int] = None,
+        min_pixels: Optional[int] = None,
+        max_workers: Optional[int] = None,
+        use_processes: Optional[bool] = None
+    ):
+        self.tile_size = tile_size or int(os.getenv("EFFECTS_TILE_SIZE", "512"))
+        # Below this the effect runs whole - tiling overhead outweighs the parallelism
+        self.min_pixels = min_pixels if min_pixels is not None else int(os.getenv("EFFECTS_TILE_MIN_PIXELS", "1000000"))
+        self.max_workers = max_workers or int(os.getenv("EFFECTS_TILE_WORKERS", str(min(4, os.cpu_count() or 2))))
+        # Opt-in: every spawned worker imports torch (~seconds cold, hundreds of MB each)
+        if use_processes is None:
+            use_processes = os.getenv("EFFECTS_TILE_PROCESSES", "false").lower() == "true"
+        self.use_processes = use_processes
+        self.max_process_workers = min(self.max_workers, int(os.getenv("EFFECTS_TILE_PROCESS_WORKERS", "2")))
+
+        self._thread_pool: Optional[concurrent.futures.ThreadPoolExecutor] = None
+        self._process_pool: Optional[concurrent.futures.ProcessPoolExecutor] = None
+
+    def _threads(self) -> concurrent.futures.ThreadPoolExecutor:
+        if self._thread_pool is None:
+            self._thread_pool = concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix="effect-tile"
+            )
+        return self._thread_pool
+
+    def _processes(self) -> concurrent.futures.ProcessPoolExecutor:
+        if self._process_pool is None:
+            # spawn: never fork a process holding CUDA/torch state
+            self._process_pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.max_process_workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._process_pool
+
+    def prewarm(self) -> None:
+        """Start the process workers in the background (no-op unless processes are enabled)"""
+        if not self.use_processes:
+            return
+        pool = self._processes()
+        for _ in range(self.max_process_workers):
+            pool.submit(_warm_worker)
+        logger.info(f"Pre-warming {self.max_process_workers} effect tile worker processes")
+
+    def run(
+        self,
+        effect: Any,
+        effect_name: str,
+        frame: EffectFrame,
+        parallel: bool = True,
+        spec: Optional[TileSpec] = None,
+        **kwargs
+    ) -> np.ndarray:
+        """
+        Apply an effect to a frame, tiled when the effect and image size allow
+
+        Args:
+            effect: Effect instance (BaseEffect)
+            effect_name: Registry name, used to rebuild the effect in worker processes
+            frame: Frame to process
+            parallel: False runs the effect whole (callers already parallel across effects)
+            spec: Tile spec override (defaults to effect.tile_spec(**kwargs))
+            **kwargs: Effect-specific parameters
+
+        Returns:
+            Effect output for the whole frame
+        """
+        spec = spec or effect.tile_spec(**kwargs)
+        image = frame.image
+        height, width = image.shape[:2]
+
+        if not parallel or spec is None or self.max_workers < 2 or height * width < self.min_pixels:
+            return effect.apply_frame(frame, **kwargs)
+
+        tiles = plan_tiles(height, width, self.tile_size, spec)
+        if len(tiles) < 2:
+            return effect.apply_frame(frame, **kwargs)
+
+        def source(tile: Tile) -> np.ndarray:
+            top, bottom, left, right = tile.padded
+            return image[top:bottom, left:right]
+
+        if spec.releases_gil or not self.use_processes:
+            results = list(self._threads().map(
+                lambda tile: effect.apply_frame(EffectFrame(source(tile), frame.channel_order), **kwargs),
+                tiles
+            ))
+            mode = "threads"
+        else:
+            futures = [
+                self._processes().submit(
+                    _apply_tile_in_worker, effect_name, frame.channel_order,
+                    np.ascontiguousarray(source(tile)), kwargs
+                )
+                for tile in tiles
+            ]
+            results = [future.result() for future in futures]
+            mode = "processes"
+
+        logger.debug(f"{effect_name} processed as {len(tiles)} tiles in {mode} "
+                     f"(tile={self.tile_size}, halo={spec.halo}, {width}x{height})")
+        return merge_tiles(results, tiles, height, width)
+
+    def shutdown(self) -> None:
+        """Stop worker pools"""
+        if self._thread_pool is not None:
+            self._thread_pool.shutdown(wait=False)
+            self._thread_pool = None
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=False)
+            self._process_pool = None
+
+
+# Shared engine - pools are created on first tiled effect
+tile_engine = TileEngine()
@@ -327,6 +327,22 @@ def create_progress_callback(progress_manager: EnhancedProgressManager, session_
                 eta_seconds=kwargs.get('eta_seconds', 8)
             )
             
+        elif stage == "coarse_mask":
+            # Low-res alpha mask for immediate display; the refined result follows
+            await progress_manager.send_stage_progress(
+                session_id, "coarse_mask", progress, message,
+                stage_details={
+                    "type": "coarse_mask",
+                    "format": "png",
+                    "mask": kwargs.get('mask'),
+                    "mask_width": kwargs.get('mask_width'),
+                    "mask_height": kwargs.get('mask_height'),
+                    "image_width": kwargs.get('image_width'),
+                    "image_height": kwargs.get('image_height')
+                },
+                eta_seconds=kwargs.get('eta_seconds', 6)
+            )
+            
         elif stage == "effects_start":
             await progress_manager.send_stage_progress(
                 session_id, "effects_processing", progress, message,
@@ -8,7 +8,7 @@ import torch.nn.functional as F
 import numpy as np
 from PIL import Image
 import logging
-from typing import Tuple, Optional
+from typing import Any, Tuple, Optional
 import time
 import cv2
 import os
@@ -17,8 +17,56 @@ import threading
 import psutil
 from transparent_background import Remover
 
+from metrics import model_load_seconds
+
 logger = logging.getLogger(__name__)
 
+# ImageNet normalization used by the transparent-background transforms
+INPUT_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+INPUT_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+# Copied (float-mask variant) in birefnet-bg-removal-api/src/birefnet_processor.py - the
+# service images don't share code, so change both copies together
+def find_subject_bbox(
+    mask: Image.Image,
+    image_size: Tuple[int, int],
+    threshold: int = 32,
+    padding: float = 0.1
+) -> Optional[Tuple[int, int, int, int]]:
+    """
+    Padded subject bounding box from a (possibly low-res) alpha mask.
+    
+    Args:
+        mask: Grayscale mask, any resolution with the image's aspect ratio
+        image_size: (width, height) of the full-resolution image
+        threshold: Mask values above this count as subject
+        padding: Padding added on each side, as a fraction of the box size
+        
+    Returns:
+        (left, top, right, bottom) in full-resolution pixels, or None if no subject found
+    """
+    mask_array = np.asarray(mask)
+    rows = np.flatnonzero((mask_array > threshold).any(axis=1))
+    if rows.size == 0:
+        return None
+    cols = np.flatnonzero((mask_array[rows[0]:rows[-1] + 1] > threshold).any(axis=0))
+    
+    scale_x = image_size[0] / mask_array.shape[1]
+    scale_y = image_size[1] / mask_array.shape[0]
+    left, right = cols[0] * scale_x, (cols[-1] + 1) * scale_x
+    top, bottom = rows[0] * scale_y, (rows[-1] + 1) * scale_y
+    
+    # Pad generously - the coarse pass tends to clip thin fur, ears and tails
+    pad_x = max(16.0, (right - left) * padding)
+    pad_y = max(16.0, (bottom - top) * padding)
+    return (
+        max(0, int(left - pad_x)),
+        max(0, int(top - pad_y)),
+        min(image_size[0], int(np.ceil(right + pad_x))),
+        min(image_size[1], int(np.ceil(bottom + pad_y)))
+    )
+
+
 class InSPyReNetProcessor:
     """Official InSPyReNet implementation using transparent-background package"""
     
@@ -34,6 +82,13 @@ class InSPyReNetProcessor:
         self.target_size = target_size
         self.mode = mode  # 'base', 'fast', or 'base-nightly'
         self.resize_mode = resize_mode  # 'static' or 'dynamic'
+        self.coarse_size = int(os.getenv("PROGRESSIVE_COARSE_SIZE", "384"))  # Fast preview pass size
+        self._coarse_network_warned = False
+        
+        # Two-stage ROI mode: coarse mask finds the subject, full pass runs on the padded crop
+        self.roi_crop = os.getenv("INSPIRENET_ROI_CROP", "false").lower() == "true"
+        self.roi_padding = float(os.getenv("INSPIRENET_ROI_PADDING", "0.1"))
+        self.roi_max_area = float(os.getenv("INSPIRENET_ROI_MAX_AREA", "0.6"))  # Skip crop above this frame fraction
         self.model = None
         self.model_loaded = False
         self.load_start_time = None
@@ -128,6 +183,7 @@ class InSPyReNetProcessor:
                         self.device = torch.device(device_str)
                         load_time = time.time() - self.load_start_time
                         logger.info(f"✅ InSPyReNet model loaded successfully on {device_str} in {load_time:.2f}s!")
+                        model_load_seconds.labels(model="inspirenet").set(load_time)
                         self.load_start_time = None
                         self.load_attempts = 0  # Reset attempts on success
                         
@@ -182,8 +238,15 @@ class InSPyReNetProcessor:
                 logger.error(f"Model loading failed after {self.max_load_attempts} attempts")
                 raise RuntimeError("Failed to load InSPyReNet model after multiple attempts")
 
-    def remove_background(self, image: Image.Image) -> Image.Image:
-        """Main function to remove background from image using InSPyReNet"""
+    def remove_background(self, image: Image.Image, coarse_mask: Optional[Image.Image] = None) -> Image.Image:
+        """
+        Main function to remove background from image using InSPyReNet
+        
+        Args:
+            image: Input PIL image
+            coarse_mask: Optional low-res mask (e.g. from the progressive pass) used to
+                locate the subject when ROI cropping is enabled
+        """
         # Verify model state before processing
         if not self.model_loaded or self.model is None:
             logger.info("Model not loaded, loading now...")
@@ -207,19 +270,17 @@ class InSPyReNetProcessor:
         start_time = time.time()
         
         try:
-            # Use the official InSPyReNet model to remove background
-            try:
-                result_image = self.model.process(image, type='rgba')
-            except Exception as e:
-                if "No matching definition for argument type" in str(e):
-                    logger.warning("NumPy type error detected, attempting workaround...")
-                    # Workaround: Convert to numpy array and back to reset image data type
-                    img_array = np.array(image, dtype=np.uint8)
-                    image_fixed = Image.fromarray(img_array)
-                    result_image = self.model.process(image_fixed, type='rgba')
-                    logger.info("Workaround successful - processed with type conversion")
-                else:
-                    raise
+            roi = self._find_roi(image, coarse_mask) if self.roi_crop else None
+            
+            if roi is not None:
+                # Full model resolution on the subject only, pasted back into a transparent frame
+                crop_result = self._process_rgba(image.crop(roi))
+                result_image = image.convert('RGBA')
+                result_image.putalpha(0)
+                result_image.paste(crop_result, roi[:2])
+                crop_result.close()
+            else:
+                result_image = self._process_rgba(image)
             
             # Clean up converted image
             if original_image is not None:
@@ -248,6 +309,134 @@ class InSPyReNetProcessor:
             logger.error(f"Processing failed but keeping model loaded for retry: {e}")
             raise
 
+    def _process_rgba(self, image: Image.Image) -> Image.Image:
+        """Run the official InSPyReNet model, returning an RGBA image"""
+        try:
+            return self.model.process(image, type='rgba')
+        except Exception as e:
+            if "No matching definition for argument type" in str(e):
+                logger.warning("NumPy type error detected, attempting workaround...")
+                # Workaround: Convert to numpy array and back to reset image data type
+                img_array = np.array(image, dtype=np.uint8)
+                image_fixed = Image.fromarray(img_array)
+                result_image = self.model.process(image_fixed, type='rgba')
+                logger.info("Workaround successful - processed with type conversion")
+                return result_image
+            raise
+    
+    def _find_roi(
+        self,
+        image: Image.Image,
+        coarse_mask: Optional[Image.Image] = None
+    ) -> Optional[Tuple[int, int, int, int]]:
+        """Subject crop box for the refine pass, or None when cropping would not help"""
+        try:
+            if coarse_mask is None:
+                coarse_mask = self.predict_coarse_mask(image)
+            
+            roi = find_subject_bbox(coarse_mask, image.size, padding=self.roi_padding)
+            if roi is None:
+                logger.info("ROI crop: no subject in coarse mask, processing full frame")
+                return None
+            
+            roi_area = (roi[2] - roi[0]) * (roi[3] - roi[1])
+            area_ratio = roi_area / float(image.size[0] * image.size[1])
+            if area_ratio > self.roi_max_area:
+                logger.info(f"ROI crop: subject covers {area_ratio:.0%} of frame, processing full frame")
+                return None
+            
+            logger.info(f"ROI crop: {roi} ({area_ratio:.0%} of frame)")
+            return roi
+            
+        except Exception as e:
+            logger.warning(f"ROI detection failed, processing full frame: {e}")
+            return None
+    
+    def _coarse_input_size(self, width: int, height: int, coarse_size: int) -> Tuple[int, int]:
+        """Network input size for the coarse pass, following the configured resize mode"""
+        if self.resize_mode == 'dynamic':
+            # Keep aspect ratio like transparent-background's dynamic_resize, on a multiple of 32
+            scale = coarse_size / max(width, height)
+            return (
+                max(32, int(round(width * scale / 32)) * 32),
+                max(32, int(round(height * scale / 32)) * 32)
+            )
+        
+        # Static mode feeds a square input, just smaller than the full pass
+        side = max(32, int(round(coarse_size / 32)) * 32)
+        return (side, side)
+    
+    def predict_coarse_mask(self, image: Image.Image, coarse_size: Optional[int] = None) -> Image.Image:
+        """
+        Fast low-resolution alpha mask for progressive display.
+        
+        Remover.process always resizes to the full model size in static mode, so the
+        coarse pass calls the network directly at a reduced input size and skips matting.
+        
+        Args:
+            image: Input PIL image
+            coarse_size: Longest side of the coarse pass (defaults to PROGRESSIVE_COARSE_SIZE)
+            
+        Returns:
+            Grayscale ('L') mask whose longest side is coarse_size, aspect ratio preserved
+        """
+        if not self.model_loaded or self.model is None:
+            logger.info("Model not loaded, loading now...")
+            self.load_model()
+        
+        if not self.model_loaded or self.model is None:
+            raise RuntimeError("InSPyReNet model failed to load")
+        
+        coarse_size = coarse_size or self.coarse_size
+        start_time = time.time()
+        
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        
+        width, height = image.size
+        scale = min(1.0, coarse_size / max(width, height))
+        output_size = (max(1, int(round(width * scale))), max(1, int(round(height * scale))))
+        
+        network = self._coarse_network()
+        if network is None:
+            # Full-size saliency map through the public API - slower, same mask
+            mask = self.model.process(image, type='map').convert('L').resize(output_size, Image.BILINEAR)
+            logger.info(f"Coarse mask {output_size} via Remover.process in {time.time() - start_time:.2f}s")
+            return mask
+        
+        net, device = network
+        input_size = self._coarse_input_size(width, height, coarse_size)
+        resized = image.resize(input_size, Image.BILINEAR)
+        x = (np.asarray(resized, dtype=np.float32) / 255.0 - INPUT_MEAN) / INPUT_STD
+        tensor = torch.from_numpy(np.ascontiguousarray(x.transpose(2, 0, 1))).unsqueeze(0)
+        tensor = tensor.to(device)
+        
+        with torch.no_grad():
+            pred = net(tensor)
+        
+        pred = F.interpolate(pred, (output_size[1], output_size[0]), mode="bilinear", align_corners=True)
+        mask = (pred.squeeze().clamp(0, 1) * 255).byte().cpu().numpy()
+        
+        logger.info(f"Coarse mask {output_size} from {input_size} input in {time.time() - start_time:.2f}s")
+        
+        return Image.fromarray(mask, mode='L')
+    
+    def _coarse_network(self) -> Optional[Tuple[torch.nn.Module, Any]]:
+        """
+        The Remover's network and device for a direct reduced-size forward pass
+        
+        These are transparent-background internals, not API - None (and a one-time warning)
+        when the installed version doesn't expose them, so callers use Remover.process instead.
+        """
+        net = getattr(self.model, 'model', None)
+        device = getattr(self.model, 'device', None)
+        if isinstance(net, torch.nn.Module) and device is not None:
+            return net, device
+        if not self._coarse_network_warned:
+            logger.warning("Remover does not expose model/device - coarse masks fall back to Remover.process")
+            self._coarse_network_warned = True
+        return None
+
     def get_model_info(self) -> dict:
         """Get model information and statistics"""
         base_info = {
@@ -257,6 +446,8 @@ class InSPyReNetProcessor:
             "target_size": self.target_size,
             "mode": self.mode,
             "resize_mode": self.resize_mode,
+            "coarse_size": self.coarse_size,
+            "roi_crop": self.roi_crop,
             "package": "transparent-background",
             "official": True
         }
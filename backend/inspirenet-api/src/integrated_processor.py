@@ -9,18 +9,27 @@ import hashlib
 import json
 import logging
 import gc
-from typing import Dict, List, Optional, Any, Callable
+import contextvars
+from typing import Dict, List, Optional, Any, Callable, Union, Tuple, Set
 from io import BytesIO
 from PIL import Image, ImageOps
 import numpy as np
-import cv2
 
 from inspirenet_model import InSPyReNetProcessor
 from effects.effects_processor import EffectsProcessor
+from effects.effect_frame import CHANNEL_ORDER_RGB, pil_to_array, array_to_pil, rgba_digest
+from effects.latency_histogram import latency_stats
+from metrics import record_cache_lookup
 from storage import CloudStorageManager
+from progressive_mask import PROGRESSIVE_MASK_ENABLED, send_coarse_mask, keep_coarse_mask, replace_coarse_mask
+from session_working_set import session_working_set, SessionImage, PROXY_MAX_SIZE
+from mask_cache import OriginalSource, load_background, store_background, identity_png, is_mask_record
 
 logger = logging.getLogger(__name__)
 
+# Session renders (switch/download): requested format -> PIL format; both keep the alpha channel
+SESSION_OUTPUT_FORMATS = {'png': 'PNG', 'webp': 'WEBP'}
+
 class IntegratedProcessor:
     """Integrated pipeline for background removal + effects processing with caching"""
     
@@ -33,12 +42,12 @@ class IntegratedProcessor:
         self.model_processor = self.inspirenet_processor  # Add alias for memory-efficient processor
         self.effects_processor = EffectsProcessor(gpu_enabled=gpu_enabled)
         self.storage_manager = storage_manager
+        # Fire-and-forget cache writes - referenced here until done so they aren't garbage collected
+        self._background_tasks: Set[asyncio.Task] = set()
         
-        # Performance tracking
+        # Performance tracking - stage timings go to the shared latency histograms
         self.processing_stats = {
             'total_requests': 0,
-            'bg_removal_time': [],
-            'effects_time': [],
             'cache_hits': 0,
             'cache_misses': 0
         }
@@ -75,36 +84,50 @@ class IntegratedProcessor:
             return hashlib.sha256(image_data).hexdigest()
     
     def generate_cache_key(self, image_data: bytes, effect_name: str, params: Dict[str, Any]) -> str:
-        """Generate cache key for background-removed image + specific effect"""
+        """Generate upload-keyed cache key (legacy - effect results now use generate_effect_cache_key)"""
         # Use deterministic content hash by normalizing image data first
         content_hash = self._get_normalized_image_hash(image_data)
         params_str = json.dumps(params, sort_keys=True)
         cache_key = f"integrated_{effect_name}_{content_hash}_{hashlib.md5(params_str.encode()).hexdigest()}"
         return cache_key
     
-    def generate_bg_cache_key(self, image_data: bytes) -> str:
+    def generate_effect_cache_key(self, image_digest: str, effect_name: str, params: Dict[str, Any]) -> str:
+        """Generate cache key for an effect result from the background-removed pixels, params and effect version"""
+        return self.effects_processor.registry.cache_key(image_digest, effect_name, params)
+    
+    def generate_bg_cache_key(self, image_data: Union[bytes, Image.Image]) -> str:
         """Generate cache key for background removal only"""
+        if isinstance(image_data, Image.Image):
+            # Already decoded (upload decode stage) - hash the pixels directly
+            return f"bg_removal_{rgba_digest(np.asarray(image_data))}"
         # Use deterministic content hash by normalizing image data first
         content_hash = self._get_normalized_image_hash(image_data)
         return f"bg_removal_{content_hash}"
     
     async def process_with_effects(
         self,
-        image_data: bytes,
+        image_data: Union[bytes, Image.Image],
         effects: List[str],
         effect_params: Optional[Dict[str, Dict[str, Any]]] = None,
         use_cache: bool = True,
-        progress_callback: Optional[Callable] = None
+        progress_callback: Optional[Callable] = None,
+        progressive: bool = False,
+        session_id: Optional[str] = None,
+        original: Optional[OriginalSource] = None
     ) -> Dict[str, Any]:
         """
         Process image with background removal and multiple effects
         
         Args:
-            image_data: Raw image bytes
+            image_data: Raw image bytes, or an image already decoded and oriented for processing
             effects: List of effect names to apply
             effect_params: Optional parameters for each effect
             use_cache: Whether to use caching
             progress_callback: Optional progress callback function
+            progressive: Send a coarse mask over the progress channel before the full pass
+            session_id: Keep the cutout in the session working set for effect switching
+            original: Upload bytes and decode recipe behind a decoded image_data - lets the
+                cutout be cached as a compact mask record (raw bytes input needs none)
             
         Returns:
             Dictionary with results for each effect
@@ -120,18 +143,26 @@ class IntegratedProcessor:
             effect_params = {}
         
         # Check if we have cached background-removed image
+        hash_start_time = time.time()
         bg_cache_key = self.generate_bg_cache_key(image_data)
+        latency_stats.record("hash", time.time() - hash_start_time)
         bg_removed_image = None
         bg_cache_hit = False
+        # Encoded cutout - also the result of identity effects (color)
+        bg_bytes = None
         
         if use_cache and self.storage_manager:
             try:
                 if progress_callback:
                     await progress_callback("cache_check", 10, "Checking background removal cache...")
                 
-                cached_bg = await self.storage_manager.get_cached_result(bg_cache_key)
-                if cached_bg:
-                    bg_removed_image = Image.open(BytesIO(cached_bg))
+                lookup_start_time = time.time()
+                cached_image, cached_png = await load_background(self.storage_manager, bg_cache_key)
+                latency_stats.record("cache_lookup", time.time() - lookup_start_time)
+                record_cache_lookup("bg_removal", cached_image is not None)
+                if cached_image is not None:
+                    bg_removed_image = cached_image
+                    bg_bytes = cached_png
                     bg_cache_hit = True
                     self.processing_stats['cache_hits'] += 1
                     
@@ -152,23 +183,42 @@ class IntegratedProcessor:
             
             bg_start_time = time.time()
             
-            # Load and process image
-            input_image = Image.open(BytesIO(image_data))
+            if isinstance(image_data, Image.Image):
+                # Decoded and oriented by the upload decode stage
+                input_image = image_data
+                logger.info(f"Decoded input image: {input_image.size}, mode: {input_image.mode}")
+            else:
+                # Load and process image
+                input_image = Image.open(BytesIO(image_data))
+                
+                # Log original dimensions
+                logger.info(f"Original image dimensions: {input_image.size}, mode: {input_image.mode}")
+                
+                # Fix orientation based on EXIF data
+                rotated_image = ImageOps.exif_transpose(input_image)
+                if rotated_image:
+                    logger.info(f"After EXIF transpose: {rotated_image.size}, mode: {rotated_image.mode}")
+                    input_image = rotated_image
+                else:
+                    logger.warning("ImageOps.exif_transpose returned None - using original image")
             
-            # Log original dimensions
-            logger.info(f"Original image dimensions: {input_image.size}, mode: {input_image.mode}")
+            # Two-stage mode: fast low-res mask to the client, then the full-resolution refine
+            coarse_mask, coarse_cached = None, False
+            if progressive and PROGRESSIVE_MASK_ENABLED:
+                coarse_mask, coarse_cached = await send_coarse_mask(
+                    self.inspirenet_processor, input_image, bg_cache_key,
+                    self.storage_manager, use_cache, progress_callback
+                )
             
-            # Fix orientation based on EXIF data
-            rotated_image = ImageOps.exif_transpose(input_image)
-            if rotated_image:
-                logger.info(f"After EXIF transpose: {rotated_image.size}, mode: {rotated_image.mode}")
-                input_image = rotated_image
-            else:
-                logger.warning("ImageOps.exif_transpose returned None - using original image")
-            bg_removed_image = await self._remove_background_async(input_image, progress_callback)
+            try:
+                bg_removed_image = await self._remove_background_async(input_image, progress_callback, coarse_mask)
+            except Exception:
+                if use_cache and not coarse_cached:
+                    await keep_coarse_mask(self.storage_manager, bg_cache_key, coarse_mask)
+                raise
             
             bg_processing_time = time.time() - bg_start_time
-            self.processing_stats['bg_removal_time'].append(bg_processing_time)
+            latency_stats.record("bg_removal", bg_processing_time, shape=input_image.size)
             
             # Cache background-removed image
             if use_cache and self.storage_manager:
@@ -184,16 +234,20 @@ class IntegratedProcessor:
                     elif any(ord(c) < 32 or ord(c) > 126 for c in bg_cache_key):  # Check for non-printable chars
                         logger.warning("Background cache key contains invalid characters, skipping cache")
                     else:
-                        bg_buffer = BytesIO()
-                        bg_removed_image.save(bg_buffer, format='PNG')
-                        bg_data = bg_buffer.getvalue()
-                        
-                        if not isinstance(bg_data, bytes):
-                            logger.error(f"Invalid bg data type: {type(bg_data)}")
-                            raise TypeError(f"Background data must be bytes, got {type(bg_data)}")
-                        
-                        await self.storage_manager.cache_result(bg_cache_key, bg_data)
+                        if original is None and isinstance(image_data, bytes):
+                            original = OriginalSource(image_data)
+                        # Mask + original reference when the upload is known, PNG otherwise
+                        upload_start_time = time.time()
+                        bg_bytes = await store_background(
+                            self.storage_manager, bg_cache_key, bg_removed_image, original,
+                            keep_png=any(self.effects_processor.registry.is_identity(name) for name in effects)
+                        )
+                        latency_stats.record("upload", time.time() - upload_start_time)
                         logger.info(f"Background removal result cached with key: {bg_cache_key[:32]}...")
+                        
+                        # Refined result supersedes the coarse preview mask
+                        if coarse_cached:
+                            await replace_coarse_mask(self.storage_manager, bg_cache_key)
                 except Exception as e:
                     logger.warning(f"Failed to cache background removal: {e}")
         
@@ -205,16 +259,23 @@ class IntegratedProcessor:
         results = {}
         effect_cache_hits = {}
         
-        # Convert PIL to numpy array for effects processing
-        bg_removed_array = np.array(bg_removed_image)
-        if bg_removed_array.shape[2] == 4:  # RGBA
-            # Convert to BGR + alpha for OpenCV compatibility
-            bgr_image = cv2.cvtColor(bg_removed_array[:, :, :3], cv2.COLOR_RGB2BGR)
-            alpha_channel = bg_removed_array[:, :, 3]
-            # Reconstruct BGRA
-            bg_removed_cv = np.dstack([bgr_image, alpha_channel])
-        else:  # RGB
-            bg_removed_cv = cv2.cvtColor(bg_removed_array, cv2.COLOR_RGB2BGR)
+        # Canonical in-memory image: contiguous RGBA uint8 in PIL channel order, used as-is
+        # by the effects - no BGR round trip between decode and encode
+        bg_removed_rgba = pil_to_array(bg_removed_image)
+        
+        # Effect results are keyed on the cutout pixels, so different uploads of the same
+        # photo (re-encoded, EXIF-rotated) that yield the same cutout share them
+        image_digest = rgba_digest(bg_removed_rgba)
+        
+        # Later effect switches for this session render from the decoded cutout
+        if session_id:
+            await session_working_set.remember(
+                session_id, bg_removed_rgba, image_digest, bg_cache_key if use_cache else None
+            )
+        
+        # Per-request effect plan - built on the first cache miss so the subject crop and
+        # shared intermediates are computed once, and only for effects that actually run
+        effect_plan = None
         
         # Process each effect
         for i, effect_name in enumerate(effects):
@@ -223,15 +284,34 @@ class IntegratedProcessor:
             if progress_callback:
                 await progress_callback("effects_processing", effect_progress, f"Applying {effect_name}...")
             
+            # Identity effects are the background-removal PNG itself - same bytes object, no
+            # encode and no second cache object (the bg_removal_ entry serves both)
+            if self.effects_processor.registry.is_identity(effect_name):
+                if bg_bytes is None:
+                    # Cutout rebuilt from a mask record - the PNG replaces the record once
+                    bg_bytes = await identity_png(
+                        self.storage_manager if use_cache else None, bg_cache_key, bg_removed_image
+                    )
+                results[effect_name] = bg_bytes
+                effect_cache_hits[effect_name] = bg_cache_hit
+                continue
+            
             # Check effect cache
-            effect_cache_key = self.generate_cache_key(
-                image_data, effect_name, effect_params.get(effect_name, {})
+            effect_cache_key = self.generate_effect_cache_key(
+                image_digest, effect_name, effect_params.get(effect_name, {})
             )
+            # Versioned per-effect namespace - a version bump leaves old results to the sweeper
+            effect_namespace = self.effects_processor.registry.cache_namespace(effect_name)
             
             cached_effect = None
             if use_cache and self.storage_manager:
                 try:
-                    cached_effect = await self.storage_manager.get_cached_result(effect_cache_key)
+                    lookup_start_time = time.time()
+                    cached_effect = await self.storage_manager.get_cached_result(
+                        effect_cache_key, namespace=effect_namespace
+                    )
+                    latency_stats.record("cache_lookup", time.time() - lookup_start_time, effect=effect_name)
+                    record_cache_lookup("effect", bool(cached_effect))
                     if cached_effect:
                         effect_cache_hits[effect_name] = True
                         results[effect_name] = cached_effect
@@ -247,8 +327,12 @@ class IntegratedProcessor:
                 effect_params_for_effect = effect_params.get(effect_name, {})
                 logger.info(f"Processing effect '{effect_name}' with params: {effect_params_for_effect}")
                 
-                effect_result = self.effects_processor.process_single_effect(
-                    bg_removed_cv, effect_name, **effect_params_for_effect
+                if effect_plan is None:
+                    effect_plan = self.effects_processor.plan_effects(
+                        bg_removed_rgba, effects[i:], channel_order=CHANNEL_ORDER_RGB
+                    )
+                effect_result = self.effects_processor.process_planned_effect(
+                    effect_plan, effect_name, **effect_params_for_effect
                 )
                 
                 # Validate effect result
@@ -262,19 +346,14 @@ class IntegratedProcessor:
                     results[effect_name] = None
                     continue
                 
-                # Convert result to bytes - PRESERVE ALPHA CHANNEL
-                if effect_result.shape[2] == 4:  # BGRA format
-                    # Convert BGRA to RGBA for PIL
-                    result_rgba = cv2.cvtColor(effect_result, cv2.COLOR_BGRA2RGBA)
-                    result_image = Image.fromarray(result_rgba, mode='RGBA')
-                else:  # BGR format
-                    # Convert BGR to RGB for PIL
-                    result_rgb = cv2.cvtColor(effect_result, cv2.COLOR_BGR2RGB)
-                    result_image = Image.fromarray(result_rgb, mode='RGB')
+                # Convert result to bytes - PRESERVE ALPHA CHANNEL (RGBA results are wrapped, not copied)
+                result_image = array_to_pil(effect_result)
                 
+                encode_start_time = time.time()
                 result_buffer = BytesIO()
                 result_image.save(result_buffer, format='PNG')
                 result_bytes = result_buffer.getvalue()
+                latency_stats.record("encode", time.time() - encode_start_time, effect=effect_name, shape=effect_result.shape)
                 
                 # Validate the result bytes
                 if not result_bytes or len(result_bytes) < 100:  # Too small for valid PNG
@@ -302,7 +381,11 @@ class IntegratedProcessor:
                         elif any(ord(c) < 32 or ord(c) > 126 for c in effect_cache_key):  # Check for non-printable chars
                             logger.warning(f"Cache key contains invalid characters for {effect_name}, skipping cache")
                         else:
-                            await self.storage_manager.cache_result(effect_cache_key, result_bytes)
+                            upload_start_time = time.time()
+                            await self.storage_manager.cache_result(
+                                effect_cache_key, result_bytes, namespace=effect_namespace
+                            )
+                            latency_stats.record("upload", time.time() - upload_start_time, effect=effect_name)
                             logger.info(f"Effect result cached for {effect_name} with key: {effect_cache_key[:32]}...")
                     except Exception as e:
                         logger.warning(f"Failed to cache effect {effect_name}: {e}")
@@ -320,7 +403,7 @@ class IntegratedProcessor:
                 results[effect_name] = None
         
         effects_processing_time = time.time() - effects_start_time
-        self.processing_stats['effects_time'].append(effects_processing_time)
+        latency_stats.record("effects", effects_processing_time, shape=bg_removed_rgba.shape)
         
         # Analyze processing results
         successful_effects = [name for name, result in results.items() if result is not None]
@@ -370,7 +453,116 @@ class IntegratedProcessor:
         
         return response
     
-    async def _remove_background_async(self, image: Image.Image, progress_callback: Optional[Callable] = None) -> Image.Image:
+    async def render_session_effect(
+        self,
+        session_image: SessionImage,
+        effect_name: str,
+        params: Optional[Dict[str, Any]] = None,
+        use_cache: bool = True,
+        output_format: str = "png",
+        quality: int = 95
+    ) -> Tuple[Optional[bytes], bool]:
+        """
+        Effect result for a working-set image - no decode, hashing or inference
+        
+        Args:
+            output_format: Key of SESSION_OUTPUT_FORMATS
+            quality: WebP quality (PNG is lossless and ignores it)
+        
+        Returns:
+            (result bytes or None on failure, effect cache hit)
+        """
+        params = params or {}
+        image_format = SESSION_OUTPUT_FORMATS[output_format]
+        # Only the PNG identity result is the background-removal object itself
+        identity = self.effects_processor.registry.is_identity(effect_name) and image_format == 'PNG'
+        if identity:
+            # The background-removal object is the identity effect's result
+            effect_cache_key, effect_namespace = session_image.bg_cache_key, None
+        else:
+            # PNG keys are shared with process-with-effects; other formats are cached per format and quality
+            cache_params = params if image_format == 'PNG' else {**params, 'output': [output_format, quality]}
+            effect_cache_key = self.generate_effect_cache_key(session_image.image_digest, effect_name, cache_params)
+            effect_namespace = self.effects_processor.registry.cache_namespace(effect_name)
+        
+        if use_cache and self.storage_manager and effect_cache_key:
+            try:
+                cached_effect = await self.storage_manager.get_cached_result(
+                    effect_cache_key, namespace=effect_namespace
+                )
+                # A compact background entry is not a PNG - the identity result is rendered below
+                if cached_effect and not is_mask_record(cached_effect):
+                    return cached_effect, True
+            except Exception as e:
+                logger.warning(f"Effect cache lookup failed for {effect_name}: {e}")
+        
+        def render() -> Optional[bytes]:
+            plan = self.effects_processor.plan_effects(
+                session_image.rgba, [effect_name], channel_order=CHANNEL_ORDER_RGB
+            )
+            effect_result = self.effects_processor.process_planned_effect(plan, effect_name, **params)
+            if effect_result is None:
+                return None
+            encode_start_time = time.time()
+            buffer = BytesIO()
+            if image_format == 'PNG':
+                # Fast PNG level - the switch is interactive
+                array_to_pil(effect_result).save(buffer, format='PNG', compress_level=1)
+            else:
+                array_to_pil(effect_result).save(buffer, format=image_format, quality=quality)
+            latency_stats.record("encode", time.time() - encode_start_time, effect=effect_name, shape=effect_result.shape)
+            return buffer.getvalue()
+        
+        loop = asyncio.get_event_loop()
+        # Copied context - the effect span lands on this request's trace
+        result_bytes = await loop.run_in_executor(None, contextvars.copy_context().run, render)
+        
+        if result_bytes and use_cache and self.storage_manager and not identity:
+            # Cache write off the response path
+            task = asyncio.create_task(
+                self.storage_manager.cache_result(effect_cache_key, result_bytes, namespace=effect_namespace)
+            )
+            self._background_tasks.add(task)
+            task.add_done_callback(self._background_tasks.discard)
+        return result_bytes, False
+    
+    async def render_session_preview(
+        self,
+        session_image: SessionImage,
+        effect_name: str,
+        params: Optional[Dict[str, Any]] = None,
+        max_size: int = PROXY_MAX_SIZE,
+        quality: int = 75
+    ) -> Optional[bytes]:
+        """
+        Effect WebP rendered on the session's low-resolution proxy for live parameter tuning
+        
+        Previews are never cached - each slider position is throwaway. Size-dependent params
+        (block, dot and grain sizes) apply in proxy pixels.
+        """
+        params = params or {}
+        
+        def render() -> Optional[bytes]:
+            plan = self.effects_processor.plan_effects(
+                session_image.proxy(max_size), [effect_name], channel_order=CHANNEL_ORDER_RGB
+            )
+            effect_result = self.effects_processor.process_planned_effect(plan, effect_name, **params)
+            if effect_result is None:
+                return None
+            buffer = BytesIO()
+            # method=0 is libwebp's fastest encoder setting
+            array_to_pil(effect_result).save(buffer, format='WEBP', quality=quality, method=0)
+            return buffer.getvalue()
+        
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, contextvars.copy_context().run, render)
+    
+    async def _remove_background_async(
+        self,
+        image: Image.Image,
+        progress_callback: Optional[Callable] = None,
+        coarse_mask: Optional[Image.Image] = None
+    ) -> Image.Image:
         """Remove background asynchronously with progress updates"""
         loop = asyncio.get_event_loop()
         
@@ -393,7 +585,7 @@ class IntegratedProcessor:
                 progress_thread.daemon = True
                 progress_thread.start()
             
-            return self.inspirenet_processor.remove_background(image)
+            return self.inspirenet_processor.remove_background(image, coarse_mask=coarse_mask)
         
         return await loop.run_in_executor(None, remove_bg_sync)
     
@@ -411,29 +603,19 @@ class IntegratedProcessor:
         if effect_params is None:
             effect_params = {}
         
-        # Convert to OpenCV format
-        bg_removed_array = np.array(bg_removed_image)
-        if bg_removed_array.shape[2] == 4:  # RGBA
-            bgr_image = cv2.cvtColor(bg_removed_array[:, :, :3], cv2.COLOR_RGB2BGR)
-            alpha_channel = bg_removed_array[:, :, 3]
-            bg_removed_cv = np.dstack([bgr_image, alpha_channel])
-        else:  # RGB
-            bg_removed_cv = cv2.cvtColor(bg_removed_array, cv2.COLOR_RGB2BGR)
+        # Canonical RGBA array - effects run in PIL channel order
+        bg_removed_rgba = pil_to_array(bg_removed_image)
         
         # Apply effect
-        effect_result = self.effects_processor.process_single_effect(
-            bg_removed_cv, effect_name, **effect_params
+        effect_plan = self.effects_processor.plan_effects(
+            bg_removed_rgba, [effect_name], channel_order=CHANNEL_ORDER_RGB
+        )
+        effect_result = self.effects_processor.process_planned_effect(
+            effect_plan, effect_name, **effect_params
         )
         
         # Convert result to bytes - PRESERVE ALPHA CHANNEL
-        if effect_result.shape[2] == 4:  # BGRA format
-            # Convert BGRA to RGBA for PIL
-            result_rgba = cv2.cvtColor(effect_result, cv2.COLOR_BGRA2RGBA)
-            result_image = Image.fromarray(result_rgba, mode='RGBA')
-        else:  # BGR format
-            # Convert BGR to RGB for PIL
-            result_rgb = cv2.cvtColor(effect_result, cv2.COLOR_BGR2RGB)
-            result_image = Image.fromarray(result_rgb, mode='RGB')
+        result_image = array_to_pil(effect_result)
         
         result_buffer = BytesIO()
         result_image.save(result_buffer, format='PNG')
@@ -450,8 +632,10 @@ class IntegratedProcessor:
     
     def get_processing_stats(self) -> Dict[str, Any]:
         """Get processing statistics"""
-        avg_bg_time = sum(self.processing_stats['bg_removal_time']) / len(self.processing_stats['bg_removal_time']) if self.processing_stats['bg_removal_time'] else 0
-        avg_effects_time = sum(self.processing_stats['effects_time']) / len(self.processing_stats['effects_time']) if self.processing_stats['effects_time'] else 0
+        bg_times = latency_stats.get("bg_removal")
+        effects_times = latency_stats.get("effects")
+        avg_bg_time = bg_times.mean if bg_times else 0
+        avg_effects_time = effects_times.mean if effects_times else 0
         
         return {
             'total_requests': self.processing_stats['total_requests'],
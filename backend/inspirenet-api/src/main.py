@@ -24,7 +24,15 @@ from api_v2_endpoints import router as api_v2_router, initialize_v2_api
 from inspirenet_model import InSPyReNetProcessor
 from customer_image_endpoints import router as customer_router, initialize_customer_storage
 from memory_monitor import memory_monitor
+from cache_namespaces import start_cache_sweeper
+from effects.effect_registry import EFFECT_REGISTRY
+from effects.tile_engine import tile_engine
 from simple_storage_api import register_storage_endpoints
+from metrics import install_metrics, observe_stage, register_cache_source
+from effects.latency_histogram import latency_stats
+from effects.color_lut import color_lut_cache
+from session_working_set import session_working_set
+from upload_reader import UploadLimitMiddleware
 
 # Configure logging
 logging.basicConfig(
@@ -117,7 +125,7 @@ app.add_middleware(
 async def memory_check_middleware(request, call_next):
     """Check memory before processing requests"""
     # Skip memory check for health endpoints, warmup, and OPTIONS
-    if request.url.path in ["/health", "/warmup", "/", "/api/v2/"] or request.method == "OPTIONS":
+    if request.url.path in ["/health", "/warmup", "/", "/api/v2/", "/metrics"] or request.method == "OPTIONS":
         return await call_next(request)
     
     # Check memory pressure
@@ -149,6 +157,24 @@ async def memory_check_middleware(request, call_next):
     
     return response
 
+# Refuse oversized bodies as they arrive - Starlette spools the whole multipart body
+# before a handler sees it, so the endpoint's own checks come too late for this
+app.add_middleware(UploadLimitMiddleware)
+
+# Request counters/latency and GET /metrics - added last so it is outermost and also
+# counts requests the memory check rejects
+install_metrics(app)
+
+# Stage timings recorded for /api/v2/stats also feed the /metrics histograms; in-memory
+# cache tiers are read from their own counters at scrape time
+latency_stats.add_listener(observe_stage)
+register_cache_source("session", lambda: (
+    session_working_set.stats['memory_hits'] + session_working_set.stats['spill_hits']
+    + session_working_set.stats['storage_hits'],
+    session_working_set.stats['misses']
+))
+register_cache_source("color_lut", lambda: (color_lut_cache.stats['hits'], color_lut_cache.stats['compiles']))
+
 # IMPORTANT: Register routers AFTER all middleware is configured
 # This ensures middleware (CORS, GZip, memory checks) wraps all endpoints
 
@@ -172,6 +198,9 @@ async def startup_event():
         # Initialize storage manager
         bucket_name = os.getenv("STORAGE_BUCKET", "perkieprints-processing-cache")
         storage_manager = CloudStorageManager(bucket_name)
+        if storage_manager.maintenance:
+            # Cache usage counters are reconciled in the background, not per stats call
+            storage_manager.maintenance.start()
         
         # Initialize processor
         target_size = int(os.getenv("TARGET_SIZE", "1024"))
@@ -190,6 +219,12 @@ async def startup_event():
         initialize_v2_api(storage_manager)
         logger.info("API v2 initialized with JSON response support")
         
+        # Delete cache namespaces left behind by model/effect version bumps
+        start_cache_sweeper(storage_manager, EFFECT_REGISTRY)
+        
+        # Spawn tile worker processes now rather than on the first large request (if enabled)
+        tile_engine.prewarm()
+        
         # Initialize customer image storage
         customer_bucket = os.getenv("CUSTOMER_STORAGE_BUCKET", "perkieprints-customer-images")
         initialize_customer_storage(customer_bucket)
@@ -0,0 +1,205 @@
+"""
+Compact Background-Removal Cache
+Cutouts stored as a compressed alpha mask plus a reference to the content-addressed upload
+"""
+
+import os
+import json
+import zlib
+import struct
+import asyncio
+import hashlib
+import logging
+from io import BytesIO
+from dataclasses import dataclass
+from typing import Dict, Any, Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from memory_optimized_processor import MemoryOptimizedProcessor
+from effects.effect_frame import pil_to_array, array_to_pil, rgba_digest
+
+logger = logging.getLogger(__name__)
+
+# "mask" stores mask + original reference; "png" keeps full RGBA PNGs (both are always readable)
+BG_CACHE_FORMAT = os.getenv("BG_CACHE_FORMAT", "mask").lower()
+# Upload bytes by content hash - shared by every cutout (model version, decode size) made from them
+ORIGINALS_NAMESPACE = "originals/v1"
+
+MASK_RECORD_MAGIC = b"PKBGMASK"
+MASK_RECORD_VERSION = 1
+# Re-decoding a large upload (draft + resize) costs more than the bytes it saves over a PNG -
+# cutouts whose original exceeds this fraction of the raw RGBA size stay PNG
+MASK_CACHE_MAX_ORIGINAL_RATIO = float(os.getenv("MASK_CACHE_MAX_ORIGINAL_RATIO", "0.15"))
+# zlib level 1: real masks are long 0/255 runs, higher levels buy little for several times the CPU
+MASK_ZLIB_LEVEL = 1
+
+
+def compact_cache_enabled() -> bool:
+    return BG_CACHE_FORMAT == "mask"
+
+
+@dataclass
+class OriginalSource:
+    """Upload bytes plus the decode recipe that turned them into the model input"""
+    data: bytes
+    # None: full-size decode with EXIF orientation only (the processors' raw-bytes path)
+    max_size: Optional[int] = None
+    flatten_alpha: bool = False
+
+    @property
+    def key(self) -> str:
+        return f"original_{hashlib.sha256(self.data).hexdigest()}"
+
+    def recipe(self) -> Dict[str, Any]:
+        return {'max_size': self.max_size, 'flatten_alpha': self.flatten_alpha}
+
+    def decode_rgb(self) -> np.ndarray:
+        """The RGB pixels the model saw (remove_background converts its input to RGB)"""
+        image = Image.open(BytesIO(self.data))
+        if self.max_size:
+            image = MemoryOptimizedProcessor.decode_for_processing(image, self.max_size, self.flatten_alpha)
+        else:
+            image = ImageOps.exif_transpose(image) or image
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        return pil_to_array(image)
+
+
+def prefers_mask_record(rgba: np.ndarray, source: OriginalSource) -> bool:
+    """Whether a mask record beats a PNG for this cutout (see MASK_CACHE_MAX_ORIGINAL_RATIO)"""
+    return len(source.data) <= MASK_CACHE_MAX_ORIGINAL_RATIO * rgba.nbytes
+
+
+def composite(rgb: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """Canonical contiguous RGBA from RGB planes and an alpha mask in one pass"""
+    return np.concatenate([rgb, mask[:, :, np.newaxis]], axis=2)
+
+
+def encode_png(image: Image.Image) -> bytes:
+    """PNG bytes of a cutout - the format of PNG cache entries and of identity-effect results"""
+    buffer = BytesIO()
+    image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def is_mask_record(data: Optional[bytes]) -> bool:
+    return bool(data) and data[:len(MASK_RECORD_MAGIC)] == MASK_RECORD_MAGIC
+
+
+def encode_mask_record(rgba: np.ndarray, source: OriginalSource) -> bytes:
+    """magic | header length | JSON header | zlib(8-bit alpha)"""
+    height, width = rgba.shape[:2]
+    header = json.dumps({
+        'version': MASK_RECORD_VERSION,
+        'width': width,
+        'height': height,
+        'original_key': source.key,
+        'decode': source.recipe(),
+        # Checked on reconstruction - a decoder change that shifts pixels becomes a cache miss
+        'rgba_digest': rgba_digest(rgba),
+        'codec': 'zlib'
+    }).encode()
+    mask = zlib.compress(np.ascontiguousarray(rgba[:, :, 3]), MASK_ZLIB_LEVEL)
+    return MASK_RECORD_MAGIC + struct.pack('>I', len(header)) + header + mask
+
+
+def decode_mask_record(record: bytes) -> Tuple[Dict[str, Any], np.ndarray]:
+    """(header, alpha mask) of a record"""
+    offset = len(MASK_RECORD_MAGIC)
+    (header_length,) = struct.unpack('>I', record[offset:offset + 4])
+    offset += 4
+    header = json.loads(record[offset:offset + header_length])
+    if header.get('version') != MASK_RECORD_VERSION:
+        raise ValueError(f"Unsupported mask record version: {header.get('version')}")
+    mask = np.frombuffer(zlib.decompress(record[offset + header_length:]), dtype=np.uint8)
+    return header, mask.reshape(header['height'], header['width'])
+
+
+def reconstruct_rgba(record: bytes, original: bytes) -> Optional[np.ndarray]:
+    """Cutout from a record and its original (None when they no longer match)"""
+    header, mask = decode_mask_record(record)
+    decode = header['decode']
+    rgb = OriginalSource(original, decode['max_size'], decode['flatten_alpha']).decode_rgb()
+    if rgb.shape[:2] != mask.shape:
+        logger.warning(f"Original decodes to {rgb.shape[1]}x{rgb.shape[0]}, mask is {mask.shape[1]}x{mask.shape[0]}")
+        return None
+    rgba = composite(rgb, mask)
+    if rgba_digest(rgba) != header['rgba_digest']:
+        logger.warning("Reconstructed cutout does not match the cached digest - treating as a miss")
+        return None
+    return rgba
+
+
+async def load_background(storage_manager: Any, bg_cache_key: str) -> Tuple[Optional[Image.Image], Optional[bytes]]:
+    """
+    Cached cutout in either format
+
+    Returns:
+        (image, png_bytes) - png_bytes only for entries stored as PNG (identity effects
+        reuse them); (None, None) on a miss or when the original is gone
+    """
+    data = await storage_manager.get_cached_result(bg_cache_key)
+    if not data:
+        return None, None
+    if not is_mask_record(data):
+        return Image.open(BytesIO(data)), data
+
+    header, _ = decode_mask_record(data)
+    original = await storage_manager.get_cached_result(header['original_key'], namespace=ORIGINALS_NAMESPACE)
+    if not original:
+        logger.info("Mask record found but its original expired - treating as a miss")
+        return None, None
+
+    loop = asyncio.get_event_loop()
+    rgba = await loop.run_in_executor(None, reconstruct_rgba, data, original)
+    return (array_to_pil(rgba), None) if rgba is not None else (None, None)
+
+
+async def store_background(
+    storage_manager: Any,
+    bg_cache_key: str,
+    image: Image.Image,
+    source: Optional[OriginalSource] = None,
+    keep_png: bool = False
+) -> Optional[bytes]:
+    """
+    Cache a cutout - as a mask record when the original is known, otherwise as PNG
+
+    Args:
+        keep_png: Store the PNG even when a mask record would be smaller (an identity
+            effect of the request needs the PNG bytes anyway)
+
+    Returns:
+        The PNG bytes when a PNG was written (identity effects reuse them), else None
+    """
+    rgba = None
+    if compact_cache_enabled() and source is not None and image.mode == 'RGBA' and not keep_png:
+        rgba = pil_to_array(image)
+    if rgba is not None and prefers_mask_record(rgba, source):
+        record = encode_mask_record(rgba, source)
+        # Original first (rewritten so its TTL never runs out before the record's), then the record
+        if await storage_manager.cache_result(source.key, source.data, namespace=ORIGINALS_NAMESPACE):
+            if await storage_manager.cache_result(bg_cache_key, record):
+                return None
+        logger.warning("Compact background cache write failed - falling back to PNG")
+
+    loop = asyncio.get_event_loop()
+    png_bytes = await loop.run_in_executor(None, encode_png, image)
+    await storage_manager.cache_result(bg_cache_key, png_bytes)
+    return png_bytes
+
+
+async def identity_png(storage_manager: Optional[Any], bg_cache_key: str, image: Image.Image) -> bytes:
+    """
+    PNG for an identity effect when the cutout came from a mask record
+
+    Encoded off the event loop and written back over the record, so later hits on this
+    cutout return the PNG bytes directly instead of rebuilding and re-encoding it.
+    """
+    if storage_manager is not None:
+        # No original given - always stored as PNG
+        return await store_background(storage_manager, bg_cache_key, image)
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(None, encode_png, image)
@@ -4,7 +4,6 @@ Processes effects sequentially with immediate cleanup to prevent OOM errors
 """
 
 import os
-import cv2
 import time
 import hashlib
 import gc
@@ -13,12 +12,19 @@ import numpy as np
 from PIL import Image, ImageOps
 from io import BytesIO
 import logging
-from typing import Dict, List, Optional, Tuple, Any, Callable
+from typing import Dict, List, Optional, Tuple, Any, Callable, Union
 import asyncio
 
 from effects.optimized_effects_processor import OptimizedEffectsProcessor
+from effects.effect_frame import EffectPlan, CHANNEL_ORDER_RGB, pil_to_array, array_to_pil, rgba_digest
+from effects.effect_registry import EFFECT_REGISTRY
+from effects.latency_histogram import latency_stats
+from metrics import record_cache_lookup
 from storage import CloudStorageManager
 from memory_monitor import memory_monitor
+from progressive_mask import PROGRESSIVE_MASK_ENABLED, send_coarse_mask, keep_coarse_mask, replace_coarse_mask
+from session_working_set import session_working_set
+from mask_cache import OriginalSource, load_background, store_background
 
 logger = logging.getLogger(__name__)
 
@@ -43,10 +49,14 @@ class MemoryEfficientIntegratedProcessor:
         
         logger.info(f"Memory-efficient processor initialized with batch_size={self.effects_batch_size}")
     
-    def generate_cache_key(self, image_data: bytes, effect_name: str = None, effect_params: dict = None) -> str:
+    def generate_cache_key(self, image_data: Union[bytes, Image.Image], effect_name: str = None, effect_params: dict = None) -> str:
         """Generate cache key for processed images"""
         hasher = hashlib.sha256()
-        hasher.update(image_data)
+        if isinstance(image_data, Image.Image):
+            # Already decoded (upload decode stage) - hash the pixels directly
+            hasher.update(rgba_digest(np.asarray(image_data)).encode())
+        else:
+            hasher.update(image_data)
         
         if effect_name:
             hasher.update(effect_name.encode())
@@ -55,9 +65,13 @@ class MemoryEfficientIntegratedProcessor:
         
         return hasher.hexdigest()
     
+    def generate_effect_cache_key(self, image_digest: str, effect_name: str, effect_params: dict = None) -> str:
+        """Generate cache key for an effect result from the background-removed pixels, params and effect version"""
+        return EFFECT_REGISTRY.cache_key(image_digest, effect_name, effect_params)
+    
     async def _process_single_effect_with_cleanup(
         self,
-        bg_removed_cv: np.ndarray,
+        effect_plan: EffectPlan,
         effect_name: str,
         effect_params: dict,
         session_id: str,
@@ -76,19 +90,15 @@ class MemoryEfficientIntegratedProcessor:
                 await asyncio.sleep(0.1)  # Give system time to recover
             
             # Process effect
-            effect_result = self.effects_processor.process_single_effect(
-                bg_removed_cv, effect_name, **effect_params
+            effect_result = self.effects_processor.process_planned_effect(
+                effect_plan, effect_name, **effect_params
             )
             
-            # Convert result to bytes
-            if effect_result.shape[2] == 4:  # BGRA format
-                result_rgba = cv2.cvtColor(effect_result, cv2.COLOR_BGRA2RGBA)
-                result_image = Image.fromarray(result_rgba, mode='RGBA')
-            else:  # BGR format
-                result_rgb = cv2.cvtColor(effect_result, cv2.COLOR_BGR2RGB)
-                result_image = Image.fromarray(result_rgb, mode='RGB')
+            # Convert result to bytes (RGBA results are wrapped, not copied)
+            result_image = array_to_pil(effect_result)
             
             # Save to buffer with compression
+            encode_start_time = time.time()
             result_buffer = BytesIO()
             if result_image.mode == 'RGBA':
                 result_image.save(result_buffer, format='PNG', compress_level=6, optimize=True)
@@ -96,6 +106,7 @@ class MemoryEfficientIntegratedProcessor:
                 result_image.save(result_buffer, format='JPEG', quality=90, optimize=True)
             
             result_bytes = result_buffer.getvalue()
+            latency_stats.record("encode", time.time() - encode_start_time, effect=effect_name, shape=effect_result.shape)
             
             # If storage manager available, upload immediately and return URL
             if self.storage_manager and self.enable_streaming:
@@ -104,9 +115,11 @@ class MemoryEfficientIntegratedProcessor:
                     storage_key = f"effects/{session_id}/{effect_name}_{int(time.time())}.png"
                     
                     # Upload to storage - returns bool, not URL
+                    upload_start_time = time.time()
                     upload_success = await self.storage_manager.upload_processed_image(
                         storage_key, result_bytes, effect_name
                     )
+                    latency_stats.record("upload", time.time() - upload_start_time, effect=effect_name)
                     
                     if upload_success:
                         logger.info(f"Effect {effect_name} uploaded successfully")
@@ -158,17 +171,21 @@ class MemoryEfficientIntegratedProcessor:
     
     async def process_image_with_effects(
         self,
-        image_data: bytes,
+        image_data: Union[bytes, Image.Image],
         effects: List[str],
         effect_params: Dict[str, dict] = None,
         use_cache: bool = True,
         session_id: str = None,
-        progress_callback: Optional[Callable] = None
+        progress_callback: Optional[Callable] = None,
+        progressive: bool = False,
+        original: Optional[OriginalSource] = None
     ) -> Dict[str, Any]:
         """Process image with multiple effects using memory-efficient approach"""
         
         start_time = time.time()
         effect_params = effect_params or {}
+        # Only caller-supplied sessions are kept for effect switching
+        remember_session = session_id is not None
         session_id = session_id or f"session_{int(time.time())}"
         
         # Initialize response structure
@@ -182,16 +199,24 @@ class MemoryEfficientIntegratedProcessor:
         if progress_callback:
             await progress_callback("background_removal", 10, "Removing background...")
         
+        hash_start_time = time.time()
         bg_cache_key = self.generate_cache_key(image_data)
+        latency_stats.record("hash", time.time() - hash_start_time)
         bg_removed_image = None
         bg_cache_hit = False
+        # Encoded cutout - also the result of identity effects (color)
+        bg_bytes = None
         
         # Check cache for background removal
         if use_cache and self.storage_manager:
             try:
-                cached_bg = await self.storage_manager.get_cached_result(bg_cache_key)
-                if cached_bg:
-                    bg_removed_image = Image.open(BytesIO(cached_bg))
+                lookup_start_time = time.time()
+                cached_image, cached_png = await load_background(self.storage_manager, bg_cache_key)
+                latency_stats.record("cache_lookup", time.time() - lookup_start_time)
+                record_cache_lookup("bg_removal", cached_image is not None)
+                if cached_image is not None:
+                    bg_removed_image = cached_image
+                    bg_bytes = cached_png
                     bg_cache_hit = True
                     logger.info("Background removal cache hit")
             except Exception as e:
@@ -199,42 +224,75 @@ class MemoryEfficientIntegratedProcessor:
         
         # Remove background if not cached
         if bg_removed_image is None:
-            image = Image.open(BytesIO(image_data))
-            # Fix orientation based on EXIF data
-            image = ImageOps.exif_transpose(image)
-            bg_removed_image = self.model_processor.remove_background(image)
+            if isinstance(image_data, Image.Image):
+                # Decoded and oriented by the upload decode stage
+                image = image_data
+            else:
+                image = Image.open(BytesIO(image_data))
+                # Fix orientation based on EXIF data
+                image = ImageOps.exif_transpose(image)
+            
+            # Two-stage mode: fast low-res mask to the client, then the full-resolution refine
+            coarse_mask, coarse_cached = None, False
+            if progressive and PROGRESSIVE_MASK_ENABLED:
+                coarse_mask, coarse_cached = await send_coarse_mask(
+                    self.model_processor, image, bg_cache_key,
+                    self.storage_manager, use_cache, progress_callback
+                )
+            
+            bg_start_time = time.time()
+            try:
+                bg_removed_image = self.model_processor.remove_background(image, coarse_mask=coarse_mask)
+            except Exception:
+                if use_cache and not coarse_cached:
+                    await keep_coarse_mask(self.storage_manager, bg_cache_key, coarse_mask)
+                raise
+            latency_stats.record("bg_removal", time.time() - bg_start_time, shape=image.size)
             image.close()
             del image
             
             # Cache the result
             if use_cache and self.storage_manager:
                 try:
-                    buffer = BytesIO()
-                    bg_removed_image.save(buffer, format='PNG')
-                    await self.storage_manager.cache_result(bg_cache_key, buffer.getvalue())
-                    buffer.close()
+                    if original is None and isinstance(image_data, bytes):
+                        original = OriginalSource(image_data)
+                    # Mask + original reference when the upload is known, PNG otherwise
+                    upload_start_time = time.time()
+                    bg_bytes = await store_background(
+                        self.storage_manager, bg_cache_key, bg_removed_image, original
+                    )
+                    latency_stats.record("upload", time.time() - upload_start_time)
+                    
+                    # Refined result supersedes the coarse preview mask
+                    if coarse_cached:
+                        await replace_coarse_mask(self.storage_manager, bg_cache_key)
                 except Exception as e:
                     logger.warning(f"Failed to cache background removal: {e}")
         
-        # Convert to OpenCV format
-        bg_removed_array = np.array(bg_removed_image)
-        if bg_removed_array.shape[2] == 4:  # RGBA
-            bgr_image = cv2.cvtColor(bg_removed_array[:, :, :3], cv2.COLOR_RGB2BGR)
-            alpha_channel = bg_removed_array[:, :, 3]
-            bg_removed_cv = np.dstack([bgr_image, alpha_channel])
-        else:  # RGB
-            bg_removed_cv = cv2.cvtColor(bg_removed_array, cv2.COLOR_RGB2BGR)
+        # Canonical RGBA array in PIL channel order - effects run on it without a BGR round trip
+        bg_removed_rgba = pil_to_array(bg_removed_image)
+        # Effect cache keys come from the cutout pixels, not the upload bytes
+        image_digest = rgba_digest(bg_removed_rgba)
+        
+        # Later effect switches for this session render from the decoded cutout
+        if remember_session:
+            await session_working_set.remember(
+                session_id, bg_removed_rgba, image_digest, bg_cache_key if use_cache else None
+            )
         
         # Clean up PIL image
         bg_removed_image.close()
-        del bg_removed_image, bg_removed_array
+        del bg_removed_image
         gc.collect()
         
         if progress_callback:
             await progress_callback("effects_processing", 30, "Processing effects...")
         
         # Step 2: Process effects in batches
+        effects_start_time = time.time()
         processed_count = 0
+        # Shared crop/intermediates for all effects - built on the first cache miss
+        effect_plan = None
         
         for i in range(0, len(effects), self.effects_batch_size):
             batch_effects = effects[i:i + self.effects_batch_size]
@@ -248,15 +306,33 @@ class MemoryEfficientIntegratedProcessor:
                 if progress_callback:
                     await progress_callback("effects_processing", effect_progress, f"Applying {effect_name}...")
                 
+                # Identity effects are the background-removal PNG itself - no encode, cache
+                # object or processed-image upload of their own
+                if EFFECT_REGISTRY.is_identity(effect_name):
+                    if bg_bytes is None:
+                        buffer = BytesIO()
+                        array_to_pil(bg_removed_rgba).save(buffer, format='PNG')
+                        bg_bytes = buffer.getvalue()
+                    results[effect_name] = bg_bytes
+                    effect_cache_hits[effect_name] = bg_cache_hit
+                    processed_count += 1
+                    continue
+                
                 # Check effect cache
-                effect_cache_key = self.generate_cache_key(
-                    image_data, effect_name, effect_params.get(effect_name, {})
+                effect_cache_key = self.generate_effect_cache_key(
+                    image_digest, effect_name, effect_params.get(effect_name, {})
                 )
+                effect_namespace = EFFECT_REGISTRY.cache_namespace(effect_name)
                 
                 cached_effect = None
                 if use_cache and self.storage_manager:
                     try:
-                        cached_effect = await self.storage_manager.get_cached_result(effect_cache_key)
+                        lookup_start_time = time.time()
+                        cached_effect = await self.storage_manager.get_cached_result(
+                            effect_cache_key, namespace=effect_namespace
+                        )
+                        latency_stats.record("cache_lookup", time.time() - lookup_start_time, effect=effect_name)
+                        record_cache_lookup("effect", bool(cached_effect))
                         if cached_effect:
                             effect_cache_hits[effect_name] = True
                             results[effect_name] = cached_effect
@@ -269,8 +345,12 @@ class MemoryEfficientIntegratedProcessor:
                 effect_cache_hits[effect_name] = False
                 
                 # Process effect with cleanup
+                if effect_plan is None:
+                    effect_plan = self.effects_processor.plan_effects(
+                        bg_removed_rgba, effects[processed_count:], channel_order=CHANNEL_ORDER_RGB
+                    )
                 effect_url, effect_data = await self._process_single_effect_with_cleanup(
-                    bg_removed_cv,
+                    effect_plan,
                     effect_name,
                     effect_params.get(effect_name, {}),
                     session_id,
@@ -294,7 +374,11 @@ class MemoryEfficientIntegratedProcessor:
                                 logger.error(f"Invalid effect data type for {effect_name}: {type(effect_data)}")
                                 raise TypeError(f"Effect data must be bytes, got {type(effect_data)}")
                             
-                            await self.storage_manager.cache_result(effect_cache_key, effect_data)
+                            upload_start_time = time.time()
+                            await self.storage_manager.cache_result(
+                                effect_cache_key, effect_data, namespace=effect_namespace
+                            )
+                            latency_stats.record("upload", time.time() - upload_start_time, effect=effect_name)
                             logger.info(f"Effect result cached for {effect_name} with key: {effect_cache_key[:32]}...")
                         except Exception as e:
                             logger.warning(f"Failed to cache effect {effect_name}: {e}")
@@ -309,8 +393,10 @@ class MemoryEfficientIntegratedProcessor:
                 memory_monitor.force_cleanup()
                 await asyncio.sleep(0.2)  # Give system time to recover
         
+        latency_stats.record("effects", time.time() - effects_start_time, shape=bg_removed_rgba.shape)
+        
         # Final cleanup
-        del bg_removed_cv
+        del bg_removed_rgba, effect_plan
         gc.collect()
         if torch.cuda.is_available():
             torch.cuda.empty_cache()
@@ -4,8 +4,9 @@ Handles large images with multiple effects without running out of memory
 """
 
 import gc
+import math
 import torch
-from PIL import Image
+from PIL import Image, ImageOps
 import numpy as np
 from io import BytesIO
 import logging
@@ -37,6 +38,38 @@ class MemoryOptimizedProcessor:
             
         return image
     
+    @staticmethod
+    def decode_for_processing(image: Image.Image, max_size: int = 2048, flatten_alpha: bool = False) -> Image.Image:
+        """
+        Decode an opened (not yet loaded) image straight to processing size
+        
+        JPEGs use Image.draft() to decode in the DCT domain at the smallest 1/2, 1/4 or 1/8
+        reduction still covering max_size, so a 12MP phone photo is never decoded at full
+        resolution. EXIF orientation is applied to the reduced image, LANCZOS brings it to
+        max_size and the decoded image is handed on as-is - no re-encode.
+        """
+        width, height = image.size
+        if image.format == 'JPEG' and max(width, height) > max_size:
+            scale = max_size / max(width, height)
+            image.draft('RGB', (math.ceil(width * scale), math.ceil(height * scale)))
+            logger.info(f"Draft decode {width}x{height} -> {image.size}")
+        image.load()
+        
+        # Fix orientation based on EXIF data
+        image = ImageOps.exif_transpose(image) or image
+        image = MemoryOptimizedProcessor.optimize_image_for_processing(image, max_size=max_size)
+        
+        if image.mode == 'RGBA':
+            if flatten_alpha:
+                # Composite on white (mobile doesn't need transparency for processing)
+                rgb_image = Image.new('RGB', image.size, (255, 255, 255))
+                rgb_image.paste(image, mask=image.split()[3])
+                return rgb_image
+            return image
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        return image
+    
     @staticmethod
     def clear_gpu_memory():
         """Clear GPU memory cache"""
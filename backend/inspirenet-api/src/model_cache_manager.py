@@ -14,9 +14,10 @@ from typing import Optional, Dict, Any
 from pathlib import Path
 import json
 from concurrent.futures import ThreadPoolExecutor
-from google.cloud import storage
 import torch
 
+from storage_backend import create_client
+
 logger = logging.getLogger(__name__)
 
 
@@ -179,7 +180,7 @@ class ModelCacheManager:
         
         try:
             if not self.gcs_client:
-                self.gcs_client = storage.Client()
+                self.gcs_client = create_client()
             
             bucket = self.gcs_client.bucket(self.gcs_bucket_name)
             blob = bucket.blob(f"models/{self.version}/{filename}")
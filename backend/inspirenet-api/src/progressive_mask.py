@@ -0,0 +1,113 @@
+"""
+Progressive Background Removal
+Sends a fast low-resolution mask to the client before the full-resolution pass
+"""
+
+import os
+import asyncio
+import base64
+import logging
+from io import BytesIO
+from typing import Optional, Callable, Any, Tuple
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Progressive mode is opt-in per request; this switch allows disabling it service-wide
+PROGRESSIVE_MASK_ENABLED = os.getenv("PROGRESSIVE_MASK_ENABLED", "true").lower() == "true"
+
+
+def coarse_cache_key(bg_cache_key: str) -> str:
+    """Cache key for a coarse mask kept after its refine pass failed"""
+    return f"coarse_{bg_cache_key}"
+
+
+def encode_mask(mask: Image.Image) -> bytes:
+    buffer = BytesIO()
+    mask.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+async def send_coarse_mask(
+    model_processor: Any,
+    image: Image.Image,
+    bg_cache_key: str,
+    storage_manager: Optional[Any] = None,
+    use_cache: bool = True,
+    progress_callback: Optional[Callable] = None
+) -> Tuple[Optional[Image.Image], bool]:
+    """
+    Run (or reuse) the coarse mask pass and push it over the progress channel
+
+    Args:
+        model_processor: InSPyReNetProcessor providing predict_coarse_mask
+        image: EXIF-corrected input image
+        bg_cache_key: Cache key the refined background removal will be stored under
+        storage_manager: Optional cache backend
+        use_cache: Whether to look for a coarse mask left by an earlier failed refine
+        progress_callback: Progress callback receiving the "coarse_mask" stage
+
+    Returns:
+        (coarse_mask, cached) - the mask for ROI detection in the refine pass (None on
+        failure), and whether a coarse entry in the cache must be replaced once the
+        refined result is cached. New masks stay in memory; only keep_coarse_mask writes them.
+    """
+    if not progress_callback or not hasattr(model_processor, 'predict_coarse_mask'):
+        return None, False
+
+    coarse_key = coarse_cache_key(bg_cache_key)
+    mask_bytes = None
+    mask = None
+    cached = False
+
+    try:
+        if use_cache and storage_manager:
+            mask_bytes = await storage_manager.get_cached_result(coarse_key)
+            cached = mask_bytes is not None
+
+        if mask_bytes is None:
+            loop = asyncio.get_event_loop()
+            mask = await loop.run_in_executor(None, model_processor.predict_coarse_mask, image)
+            mask_bytes = encode_mask(mask)
+
+        if mask is None:
+            mask = Image.open(BytesIO(mask_bytes))
+            mask.load()
+        mask_width, mask_height = mask.size
+
+        await progress_callback(
+            "coarse_mask", 20, "Preview mask ready, refining edges...",
+            mask=base64.b64encode(mask_bytes).decode('ascii'),
+            mask_width=mask_width,
+            mask_height=mask_height,
+            image_width=image.size[0],
+            image_height=image.size[1]
+        )
+
+    except Exception as e:
+        # The coarse pass is only a preview - never fail the request over it
+        logger.warning(f"Coarse mask pass failed: {e}")
+
+    return mask, cached
+
+
+async def keep_coarse_mask(storage_manager: Optional[Any], bg_cache_key: str, mask: Optional[Image.Image]) -> None:
+    """Cache the coarse mask when its refine pass failed, so a retry can show it straight away"""
+    if mask is None or not storage_manager:
+        return
+
+    try:
+        await storage_manager.cache_result(coarse_cache_key(bg_cache_key), encode_mask(mask))
+    except Exception as e:
+        logger.warning(f"Failed to cache coarse mask: {e}")
+
+
+async def replace_coarse_mask(storage_manager: Optional[Any], bg_cache_key: str) -> None:
+    """Drop the coarse mask once the refined result is cached under bg_cache_key"""
+    if not storage_manager or not hasattr(storage_manager, 'delete_cached_result'):
+        return
+
+    try:
+        await storage_manager.delete_cached_result(coarse_cache_key(bg_cache_key))
+    except Exception as e:
+        logger.warning(f"Failed to remove coarse mask from cache: {e}")
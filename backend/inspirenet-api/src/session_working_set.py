@@ -0,0 +1,331 @@
+"""
+Session Working Set
+Decoded background-removed images per session for instant effect switching, spilled to local disk and the GCS cache
+"""
+
+import os
+import json
+import time
+import asyncio
+import hashlib
+import functools
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Any, List, Optional, Set, Tuple
+
+import numpy as np
+from PIL import Image
+
+from effects.effect_frame import pil_to_array, array_to_pil, rgba_digest
+from mask_cache import load_background
+
+logger = logging.getLogger(__name__)
+
+# Decoded RGBA arrays kept in memory (LRU by bytes)
+SESSION_WORKING_SET_MB = int(os.getenv("SESSION_WORKING_SET_MB", "512"))
+# Evicted sessions spill to local disk as raw arrays - reloaded without a PNG decode
+SESSION_SPILL_DIR = os.getenv("SESSION_SPILL_DIR", "/tmp/session-working-set")
+SESSION_SPILL_MB = int(os.getenv("SESSION_SPILL_MB", "1024"))
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", "3600"))
+# Session -> background-removal cache key pointers, so any instance can rehydrate a session
+SESSION_NAMESPACE = "sessions/v1"
+# Long side of the downscaled copy that live-parameter previews render on
+PROXY_MAX_SIZE = int(os.getenv("PROXY_MAX_SIZE", "512"))
+# Requested preview sizes round up to one of these, so a session holds at most a few proxies
+PROXY_SIZES = tuple(size for size in (128, 256) if size < PROXY_MAX_SIZE) + (PROXY_MAX_SIZE,)
+
+
+def proxy_size(max_size: int) -> int:
+    """Smallest fixed proxy size covering max_size (PROXY_MAX_SIZE at most)"""
+    return next((size for size in PROXY_SIZES if size >= max_size), PROXY_MAX_SIZE)
+
+
+# Effects too slow to preview at PROXY_MAX_SIZE within ~100ms on one CPU get a smaller proxy.
+# Effect + WebP encode at 512x384 vs 256x192: dithering ~115 vs ~27ms, retro8bit ~250 vs ~90ms
+PREVIEW_MAX_SIZES = {'dithering': 256, 'retro8bit': 256}
+
+
+def preview_size(effect_name: str, max_size: Optional[int] = None) -> int:
+    """Proxy size for previewing an effect - the effect's cap when not requested, and never above it"""
+    cap = min(PREVIEW_MAX_SIZES.get(effect_name, PROXY_MAX_SIZE), PROXY_MAX_SIZE)
+    return proxy_size(min(max(max_size or cap, 128), cap))
+
+
+@dataclass
+class SessionImage:
+    """A session's background-removed image, ready for effects"""
+    rgba: np.ndarray  # canonical contiguous RGBA uint8
+    image_digest: str  # rgba_digest of the cutout - keys effect results
+    bg_cache_key: Optional[str] = None
+    last_access: float = field(default_factory=time.time)
+    # Preview proxies by fixed long side (PROXY_SIZES), counted in nbytes
+    proxies: Dict[int, np.ndarray] = field(default_factory=dict, repr=False)
+    # Set by the working set holding this entry - charges new proxy bytes to its budget
+    on_grow: Optional[Callable[['SessionImage', int], None]] = field(default=None, repr=False, compare=False)
+
+    @property
+    def mask(self) -> np.ndarray:
+        """Alpha mask (view, no copy)"""
+        return self.rgba[:, :, 3]
+
+    def proxy(self, max_size: int = PROXY_MAX_SIZE) -> np.ndarray:
+        """Downscaled RGBA (long side <= proxy_size(max_size)), built on first use and kept with the session"""
+        max_size = proxy_size(max_size)
+        cached = self.proxies.get(max_size)
+        if cached is not None:
+            return cached
+        height, width = self.rgba.shape[:2]
+        scale = max_size / max(width, height)
+        if scale >= 1:
+            proxy = self.rgba
+        else:
+            size = (max(1, round(width * scale)), max(1, round(height * scale)))
+            # PIL resamples RGBA premultiplied, so transparent pixels don't bleed into the edge
+            image = array_to_pil(self.rgba).resize(
+                size, Image.Resampling.BILINEAR, reducing_gap=2.0
+            )
+            proxy = pil_to_array(image)
+        self.proxies[max_size] = proxy
+        if proxy is not self.rgba and self.on_grow is not None:
+            self.on_grow(self, proxy.nbytes)
+        return proxy
+
+    @property
+    def nbytes(self) -> int:
+        """Image plus its proxies (a proxy that is the image itself adds nothing)"""
+        return self.rgba.nbytes + sum(
+            proxy.nbytes for proxy in self.proxies.values() if proxy is not self.rgba
+        )
+
+
+def session_key(session_id: str) -> str:
+    """Fixed-length, path-safe key for a client-supplied session ID"""
+    return hashlib.sha256(session_id.encode('utf-8')).hexdigest()
+
+
+class SessionWorkingSet:
+    """Memory LRU of session images with local-disk spill and GCS-cache rehydration"""
+
+    def __init__(
+        self,
+        max_bytes: int = SESSION_WORKING_SET_MB * 1024 * 1024,
+        spill_dir: Optional[str] = SESSION_SPILL_DIR,
+        spill_max_bytes: int = SESSION_SPILL_MB * 1024 * 1024,
+        ttl: int = SESSION_TTL_SECONDS
+    ):
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.spill_max_bytes = spill_max_bytes
+        self.ttl = ttl
+        self.storage_manager = None
+        self._entries: 'OrderedDict[str, SessionImage]' = OrderedDict()
+        self._spilled: 'OrderedDict[str, int]' = OrderedDict()
+        self._bytes = 0
+        self._spill_bytes = 0
+        self._lock = threading.Lock()
+        # Pointer writes and spills in flight - referenced until done so they aren't garbage collected
+        self._background: Set[asyncio.Future] = set()
+        self.stats = {
+            'memory_hits': 0,
+            'spill_hits': 0,
+            'storage_hits': 0,
+            'misses': 0,
+            'evictions': 0
+        }
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    def attach_storage(self, storage_manager: Any) -> None:
+        """Storage cache used for session pointers and cross-instance rehydration"""
+        self.storage_manager = storage_manager
+
+    # Memory tier
+
+    def _grow(self, key: str, entry: SessionImage, delta: int) -> None:
+        """Charge a proxy built after insert - ignored once the entry has been evicted or replaced"""
+        with self._lock:
+            if self._entries.get(key) is entry:
+                self._bytes += delta
+
+    def _track(self, future: asyncio.Future) -> None:
+        self._background.add(future)
+        future.add_done_callback(self._background.discard)
+
+    def _insert(self, key: str, entry: SessionImage) -> None:
+        """Hold entry in memory; evicted entries spill in the executor (inline without a running loop)"""
+        evicted = []
+        # Bound to the key, not the entry, so the entry holds no reference cycle
+        entry.on_grow = functools.partial(self._grow, key)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous.nbytes
+            self._entries[key] = entry
+            self._bytes += entry.nbytes
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                old_key, old_entry = self._entries.popitem(last=False)
+                self._bytes -= old_entry.nbytes
+                self.stats['evictions'] += 1
+                evicted.append((old_key, old_entry))
+        if not evicted or not self.spill_dir:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._spill_all(evicted)
+            return
+        # np.savez of a full-resolution array is too slow to run on the event loop
+        self._track(loop.run_in_executor(None, self._spill_all, evicted))
+
+    def put(self, session_id: str, rgba: np.ndarray, image_digest: str, bg_cache_key: Optional[str] = None) -> None:
+        """Hold a session's image in memory (no copy - the array must not be mutated afterwards)"""
+        self._insert(session_key(session_id), SessionImage(rgba, image_digest, bg_cache_key))
+
+    async def remember(
+        self,
+        session_id: str,
+        rgba: np.ndarray,
+        image_digest: str,
+        bg_cache_key: Optional[str] = None
+    ) -> None:
+        """put() plus a storage pointer so other instances can rehydrate the session"""
+        self.put(session_id, rgba, image_digest, bg_cache_key)
+        if bg_cache_key and self.storage_manager and getattr(self.storage_manager, 'enabled', True):
+            pointer = json.dumps({'bg_cache_key': bg_cache_key, 'created_at': int(time.time())}).encode()
+            self._track(asyncio.create_task(self._write_pointer(session_key(session_id), pointer)))
+
+    async def _write_pointer(self, key: str, pointer: bytes) -> None:
+        try:
+            await self.storage_manager.cache_result(key, pointer, namespace=SESSION_NAMESPACE)
+        except Exception as e:
+            logger.warning(f"Failed to store session pointer: {e}")
+
+    # Disk tier
+
+    def _spill_path(self, key: str) -> str:
+        return os.path.join(self.spill_dir, f"{key}.npz")
+
+    def _spill_all(self, evicted: List[Tuple[str, SessionImage]]) -> None:
+        for key, entry in evicted:
+            self._spill(key, entry)
+
+    def _spill(self, key: str, entry: SessionImage) -> None:
+        if not self.spill_dir or time.time() - entry.last_access > self.ttl:
+            return
+        try:
+            path = self._spill_path(key)
+            np.savez(path, rgba=entry.rgba, meta=np.array(json.dumps({
+                'image_digest': entry.image_digest,
+                'bg_cache_key': entry.bg_cache_key,
+                'last_access': entry.last_access
+            })))
+            size = os.path.getsize(path)
+            stale = []
+            with self._lock:
+                self._spill_bytes += size - self._spilled.pop(key, 0)
+                self._spilled[key] = size
+                while self._spill_bytes > self.spill_max_bytes and len(self._spilled) > 1:
+                    old_key, old_size = self._spilled.popitem(last=False)
+                    self._spill_bytes -= old_size
+                    stale.append(old_key)
+            for old_key in stale:
+                self._remove_spill(old_key)
+        except Exception as e:
+            logger.warning(f"Failed to spill session image: {e}")
+
+    def _remove_spill(self, key: str) -> None:
+        try:
+            os.remove(self._spill_path(key))
+        except FileNotFoundError:
+            pass
+
+    def _load_spill(self, key: str) -> Optional[SessionImage]:
+        with self._lock:
+            size = self._spilled.pop(key, None)
+            if size is None:
+                return None
+            self._spill_bytes -= size
+        try:
+            with np.load(self._spill_path(key)) as data:
+                meta = json.loads(str(data['meta']))
+                if time.time() - meta['last_access'] > self.ttl:
+                    return None
+                return SessionImage(np.ascontiguousarray(data['rgba']), meta['image_digest'], meta['bg_cache_key'])
+        except Exception as e:
+            logger.warning(f"Failed to load spilled session image: {e}")
+            return None
+        finally:
+            self._remove_spill(key)
+
+    # Storage tier
+
+    async def _load_from_storage(self, key: str) -> Optional[SessionImage]:
+        if not self.storage_manager or not getattr(self.storage_manager, 'enabled', True):
+            return None
+        pointer = await self.storage_manager.get_cached_result(key, namespace=SESSION_NAMESPACE)
+        if not pointer:
+            return None
+        bg_cache_key = json.loads(pointer.decode())['bg_cache_key']
+        # PNG or compact mask record (reconstructed from its original)
+        cached_image, _ = await load_background(self.storage_manager, bg_cache_key)
+        if cached_image is None:
+            return None
+
+        def decode() -> SessionImage:
+            rgba = pil_to_array(cached_image)
+            return SessionImage(rgba, rgba_digest(rgba), bg_cache_key)
+
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, decode)
+
+    async def get(self, session_id: str) -> Optional[SessionImage]:
+        """Session image from memory, local spill or the storage cache (None when unknown/expired)"""
+        key = session_key(session_id)
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if now - entry.last_access <= self.ttl:
+                    entry.last_access = now
+                    self._entries.move_to_end(key)
+                    self.stats['memory_hits'] += 1
+                    return entry
+                del self._entries[key]
+                self._bytes -= entry.nbytes
+
+        loop = asyncio.get_event_loop()
+        entry = await loop.run_in_executor(None, self._load_spill, key) if self.spill_dir else None
+        if entry is not None:
+            self.stats['spill_hits'] += 1
+        else:
+            try:
+                entry = await self._load_from_storage(key)
+            except Exception as e:
+                logger.warning(f"Failed to rehydrate session from storage: {e}")
+                entry = None
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+            self.stats['storage_hits'] += 1
+
+        entry.last_access = now
+        self._insert(key, entry)
+        return entry
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self.stats,
+                'sessions_in_memory': len(self._entries),
+                'memory_mb': round(self._bytes / (1024 * 1024), 1),
+                'max_memory_mb': round(self.max_bytes / (1024 * 1024), 1),
+                'sessions_spilled': len(self._spilled),
+                'spill_mb': round(self._spill_bytes / (1024 * 1024), 1)
+            }
+
+
+# Shared by both integrated processors and the effect-switching endpoints
+session_working_set = SessionWorkingSet()
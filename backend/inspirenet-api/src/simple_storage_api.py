@@ -4,22 +4,210 @@ Just uploads original + processed image and returns URLs
 No dashboard needed - URLs go directly into Shopify order properties
 """
 
+import os
+import time
+import asyncio
 import logging
 import base64
-from typing import Dict, Any
-from datetime import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Dict, Any, Optional, Tuple
+from datetime import datetime, timedelta
+import re
 import uuid
 import hashlib
-from google.cloud import storage
 from fastapi import HTTPException
 from pydantic import BaseModel
 
+from storage_backend import create_client
+from storage_maintenance import StorageMaintenanceEngine
+
 logger = logging.getLogger(__name__)
 
 # Security constraints
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB max
 ALLOWED_CONTENT_TYPES = ['image/jpeg', 'image/png', 'image/webp']
 
+UPLOAD_BUCKET_NAME = os.getenv("CUSTOMER_STORAGE_BUCKET", "perkieprints-customer-images")
+# Keep-alive connections (and upload threads) shared by all checkout uploads in the process
+STORAGE_HTTP_POOL_SIZE = int(os.getenv("STORAGE_HTTP_POOL_SIZE", "32"))
+
+# Direct-to-GCS uploads: signed PUT URLs expire after this long
+SIGNED_UPLOAD_EXPIRY_SECONDS = int(os.getenv("SIGNED_UPLOAD_EXPIRY_SECONDS", "900"))
+# Account that signs upload URLs through IAM signBlob (default: the runtime service account)
+SIGNED_UPLOAD_SERVICE_ACCOUNT = os.getenv("SIGNED_UPLOAD_SERVICE_ACCOUNT")
+
+# Signed uploads land private with this metadata key; confirm makes them public, and
+# the sweep deletes marked objects never confirmed within expiry + grace
+SIGNED_UPLOAD_MARKER = 'signed-upload'
+SIGNED_UPLOAD_SWEEP_GRACE_SECONDS = int(os.getenv("SIGNED_UPLOAD_SWEEP_GRACE_SECONDS", "3600"))
+SIGNED_UPLOAD_SWEEP_INTERVAL_SECONDS = int(os.getenv("SIGNED_UPLOAD_SWEEP_INTERVAL_SECONDS", "21600"))
+ORDERS_PREFIX = "orders/"
+
+FILE_EXTENSIONS = {'image/jpeg': 'jpg', 'image/png': 'png', 'image/webp': 'webp'}
+# Bytes read from an uploaded object to confirm its type
+IMAGE_SIGNATURE_BYTES = 16
+
+
+class UploadBucket:
+    """Process-wide storage client and validated bucket for checkout uploads"""
+
+    def __init__(self, bucket_name: str, pool_size: int = STORAGE_HTTP_POOL_SIZE):
+        self.bucket_name = bucket_name
+        self.pool_size = pool_size
+        self.client = None
+        self.bucket = None
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="storage-upload")
+        self._sweep_task: Optional[asyncio.Task] = None
+
+    def _create_client(self):
+        client = create_client()
+        # GCS clients send requests through a google-auth AuthorizedSession; size its
+        # keep-alive pool so concurrent uploads reuse connections instead of reconnecting
+        http = getattr(client, '_http', None)
+        if http is not None and hasattr(http, 'mount'):
+            from requests.adapters import HTTPAdapter
+            adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+            http.mount("https://", adapter)
+        return client
+
+    def _validate(self):
+        """Create the client and check the bucket once - failures are retried on the next call"""
+        with self._lock:
+            if self.bucket is not None:
+                return self.bucket
+            if self.client is None:
+                self.client = self._create_client()
+            bucket = self.client.bucket(self.bucket_name)
+            # Verify bucket exists (only checks metadata, doesn't load objects)
+            if not bucket.exists():
+                logger.error(f"GCS bucket '{self.bucket_name}' does not exist")
+                raise HTTPException(
+                    status_code=503,
+                    detail="Storage service unavailable"
+                )
+            self.bucket = bucket
+            logger.info(f"Upload bucket validated: {self.bucket_name}")
+            return bucket
+
+    async def run(self, func, *args, **kwargs):
+        """Run a blocking storage call on the upload pool"""
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self._executor, partial(func, *args, **kwargs))
+
+    async def get_bucket(self):
+        if self.bucket is not None:
+            return self.bucket
+        return await self.run(self._validate)
+
+    def public_url(self, filename: str) -> str:
+        return f"https://storage.googleapis.com/{self.bucket_name}/{filename}"
+
+    def _upload_public_sync(self, bucket, filename: str, image_bytes: bytes, mime_type: str) -> str:
+        blob = bucket.blob(filename)
+        # publicRead is applied with the upload - no separate make_public round trip
+        blob.upload_from_string(image_bytes, content_type=mime_type, predefined_acl='publicRead')
+        return self.public_url(filename)
+
+    async def upload_public(self, bucket, filename: str, image_bytes: bytes, mime_type: str) -> str:
+        """Upload a publicly readable object and return its URL"""
+        return await self.run(self._upload_public_sync, bucket, filename, image_bytes, mime_type)
+
+    def _signing_kwargs(self) -> Dict[str, str]:
+        """
+        Signing arguments for generate_signed_url
+
+        Key-file credentials sign locally. Cloud Run's metadata-server credentials hold
+        no private key, so signing goes through IAM signBlob with the access token.
+        """
+        credentials = getattr(self.client, '_credentials', None)
+        if credentials is None:
+            return {}
+        from google.auth import credentials as auth_credentials
+        if isinstance(credentials, auth_credentials.Signing):
+            return {}
+        if not credentials.valid:
+            from google.auth.transport.requests import Request
+            credentials.refresh(Request())
+        return {
+            'service_account_email': SIGNED_UPLOAD_SERVICE_ACCOUNT or credentials.service_account_email,
+            'access_token': credentials.token
+        }
+
+    def sign_upload(self, blob_path: str, content_type: str) -> Tuple[str, Dict[str, str]]:
+        """
+        Signed PUT URL for a private image upload - public only once confirmed
+
+        Returns:
+            (signed_url, headers the client must send with the PUT)
+        """
+        blob = self._validate().blob(blob_path)
+        # Signed headers are enforced by GCS: private ACL, the sweep marker and the size cap apply at upload time
+        signed_headers = {
+            'x-goog-acl': 'private',
+            f'x-goog-meta-{SIGNED_UPLOAD_MARKER}': 'pending',
+            'x-goog-content-length-range': f"1,{MAX_FILE_SIZE}"
+        }
+        signed_url = blob.generate_signed_url(
+            version="v4",
+            expiration=timedelta(seconds=SIGNED_UPLOAD_EXPIRY_SECONDS),
+            method="PUT",
+            content_type=content_type,
+            headers=signed_headers,
+            **self._signing_kwargs()
+        )
+        return signed_url, {'Content-Type': content_type, **signed_headers}
+
+    def inspect_upload(self, blob_path: str) -> Tuple[Any, bytes]:
+        """Object metadata plus its leading bytes - never the full image"""
+        blob = self._validate().get_blob(blob_path)
+        if blob is None:
+            return None, b''
+        header = blob.download_as_bytes(start=0, end=IMAGE_SIGNATURE_BYTES - 1) if blob.size else b''
+        return blob, header
+
+    async def sweep_unconfirmed(self) -> Dict[str, int]:
+        """Delete signed uploads that were never confirmed (private, so never served)"""
+        bucket = await self.get_bucket()
+        cutoff = time.time() - SIGNED_UPLOAD_EXPIRY_SECONDS - SIGNED_UPLOAD_SWEEP_GRACE_SECONDS
+
+        def unconfirmed(blob) -> bool:
+            metadata = blob.metadata or {}
+            return (SIGNED_UPLOAD_MARKER in metadata and 'confirmed_at' not in metadata
+                    and bool(blob.time_created) and blob.time_created.timestamp() < cutoff)
+
+        engine = StorageMaintenanceEngine(self.client, bucket, ())
+        result = await engine.delete_where(ORDERS_PREFIX, unconfirmed)
+        if result['blobs']:
+            logger.info(f"Deleted {result['blobs']} unconfirmed signed uploads "
+                        f"({result['bytes'] // 1024}KB of {result['scanned']} scanned)")
+        return result
+
+    async def _sweep_forever(self, interval: int):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.sweep_unconfirmed()
+            except Exception as e:
+                logger.error(f"Unconfirmed upload sweep failed: {e}")
+
+    def start_sweeper(self, interval: int = SIGNED_UPLOAD_SWEEP_INTERVAL_SECONDS) -> None:
+        """Schedule the periodic unconfirmed-upload sweep on the running event loop (0 disables)"""
+        if self._sweep_task is None and interval > 0:
+            self._sweep_task = asyncio.create_task(self._sweep_forever(interval))
+
+    async def warm(self) -> None:
+        """Create the client and validate the bucket before the first checkout"""
+        try:
+            await self.get_bucket()
+        except Exception as e:
+            logger.warning(f"Upload bucket validation deferred to first request: {e}")
+
+
+upload_bucket = UploadBucket(UPLOAD_BUCKET_NAME)
+
 
 def validate_and_parse_data_url(data_url: str, image_type: str = "image") -> tuple:
     """
@@ -157,6 +345,33 @@ class ImageUploadResponse(BaseModel):
     urls: Dict[str, str]  # original and processed URLs
     session_id: str
 
+class SignedUploadRequest(BaseModel):
+    session_id: str
+    kind: str = 'original'  # original or processed
+    content_type: str = 'image/jpeg'
+    effect: Optional[str] = None  # effect name for processed uploads
+
+class SignedUploadResponse(BaseModel):
+    signed_url: str
+    public_url: str
+    upload_id: str
+    blob_path: str
+    expires_in: int
+    method: str = 'PUT'
+    headers: Dict[str, str]  # must be sent with the PUT exactly as given
+
+class ConfirmUploadRequest(BaseModel):
+    session_id: str
+    upload_id: str
+    blob_path: str
+
+class ConfirmUploadResponse(BaseModel):
+    success: bool
+    upload_id: str
+    url: str
+    size: int
+    content_type: str
+
 
 async def upload_customer_images(request: ImageUploadRequest) -> ImageUploadResponse:
     """
@@ -183,19 +398,9 @@ async def upload_customer_images(request: ImageUploadRequest) -> ImageUploadResp
             detail="Invalid session_id: must be 1-200 characters"
         )
 
-    # Initialize GCS client with error handling
+    # Process-wide client; the bucket check ran at startup and is cached
     try:
-        client = storage.Client()
-        bucket = client.bucket('perkieprints-customer-images')
-
-        # Verify bucket exists (only checks metadata, doesn't load objects)
-        if not bucket.exists():
-            logger.error("GCS bucket 'perkieprints-customer-images' does not exist")
-            raise HTTPException(
-                status_code=503,
-                detail="Storage service unavailable"
-            )
-
+        bucket = await upload_bucket.get_bucket()
     except HTTPException:
         raise
     except Exception as e:
@@ -205,92 +410,49 @@ async def upload_customer_images(request: ImageUploadRequest) -> ImageUploadResp
             detail="Storage service initialization failed"
         )
 
-    urls = {}
-
-    # Upload original image
-    if 'original' in request.images:
-        try:
-            # Parse and validate data URL
-            image_bytes, mime_type = validate_and_parse_data_url(
-                request.images['original'],
-                "original image"
-            )
-
-            # Security validation: size limit
-            if len(image_bytes) > MAX_FILE_SIZE:
-                raise HTTPException(
-                    status_code=413,
-                    detail=f"Original image too large ({len(image_bytes) // 1024 // 1024}MB, max {MAX_FILE_SIZE // 1024 // 1024}MB)"
-                )
-
-            # Generate filename with timestamp and random UUID for security
-            timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
-            random_id = uuid.uuid4().hex[:8]
-            filename = f"orders/{request.session_id}/{timestamp}_{random_id}_original.jpg"
-
-            # Upload to GCS
-            blob = bucket.blob(filename)
-            blob.upload_from_string(image_bytes, content_type=mime_type)
-            blob.make_public()
-
-            # Get public URL
-            urls['original'] = f"https://storage.googleapis.com/perkieprints-customer-images/{filename}"
-
-            logger.info(f"✓ Uploaded original image: {urls['original']} ({len(image_bytes) // 1024}KB)")
+    # Validate both images before uploading either
+    timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
+    uploads = []
+    for kind in ('original', 'processed'):
+        if kind not in request.images:
+            continue
+
+        # Parse and validate data URL
+        image_bytes, mime_type = validate_and_parse_data_url(
+            request.images[kind],
+            f"{kind} image"
+        )
 
-        except HTTPException:
-            # Re-raise client/server errors
-            raise
-        except Exception as e:
-            # GCS or other infrastructure errors
-            logger.error(f"Failed to upload original image to GCS: {e}", exc_info=True)
+        # Security validation: size limit
+        if len(image_bytes) > MAX_FILE_SIZE:
             raise HTTPException(
-                status_code=503,
-                detail="Storage service temporarily unavailable"
-            )
-
-    # Upload processed image
-    if 'processed' in request.images:
-        try:
-            # Parse and validate data URL
-            image_bytes, mime_type = validate_and_parse_data_url(
-                request.images['processed'],
-                "processed image"
+                status_code=413,
+                detail=f"{kind.capitalize()} image too large ({len(image_bytes) // 1024 // 1024}MB, max {MAX_FILE_SIZE // 1024 // 1024}MB)"
             )
 
-            # Security validation: size limit
-            if len(image_bytes) > MAX_FILE_SIZE:
-                raise HTTPException(
-                    status_code=413,
-                    detail=f"Processed image too large ({len(image_bytes) // 1024 // 1024}MB, max {MAX_FILE_SIZE // 1024 // 1024}MB)"
-                )
-
-            # Generate filename with effect name and random UUID
-            effect = request.metadata.get('effect', 'processed')
-            timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
-            random_id = uuid.uuid4().hex[:8]
-            filename = f"orders/{request.session_id}/{timestamp}_{random_id}_{effect}.jpg"
-
-            # Upload to GCS
-            blob = bucket.blob(filename)
-            blob.upload_from_string(image_bytes, content_type=mime_type)
-            blob.make_public()
-
-            # Get public URL
-            urls['processed'] = f"https://storage.googleapis.com/perkieprints-customer-images/{filename}"
-
-            logger.info(f"✓ Uploaded processed image: {urls['processed']} ({len(image_bytes) // 1024}KB)")
+        # Generate filename with timestamp and random UUID for security
+        suffix = 'original' if kind == 'original' else request.metadata.get('effect', 'processed')
+        random_id = uuid.uuid4().hex[:8]
+        filename = f"orders/{request.session_id}/{timestamp}_{random_id}_{suffix}.jpg"
+        uploads.append((kind, filename, image_bytes, mime_type))
 
-        except HTTPException:
-            # Re-raise client/server errors
-            raise
-        except Exception as e:
+    # Upload both images concurrently off the event loop
+    urls = {}
+    results = await asyncio.gather(
+        *(upload_bucket.upload_public(bucket, filename, image_bytes, mime_type)
+          for _, filename, image_bytes, mime_type in uploads),
+        return_exceptions=True
+    )
+    for (kind, _, image_bytes, _), result in zip(uploads, results):
+        if isinstance(result, Exception):
             # GCS or other infrastructure errors
-            logger.error(f"Failed to upload processed image to GCS: {e}", exc_info=True)
+            logger.error(f"Failed to upload {kind} image to GCS: {result}", exc_info=result)
             raise HTTPException(
                 status_code=503,
                 detail="Storage service temporarily unavailable"
             )
+        urls[kind] = result
+        logger.info(f"✓ Uploaded {kind} image: {urls[kind]} ({len(image_bytes) // 1024}KB)")
 
     # Add metadata as a JSON file (optional, for tracking)
     try:
@@ -317,7 +479,8 @@ async def upload_customer_images(request: ImageUploadRequest) -> ImageUploadResp
                 'uploaded_at': datetime.utcnow().isoformat()
             }
             
-            metadata_blob.upload_from_string(
+            await upload_bucket.run(
+                metadata_blob.upload_from_string,
                 json.dumps(metadata_content, indent=2),
                 content_type='application/json'
             )
@@ -339,14 +502,180 @@ async def upload_customer_images(request: ImageUploadRequest) -> ImageUploadResp
         )
 
 
+def validate_session_id(session_id: str) -> None:
+    """Session IDs become a path segment of the upload"""
+    if not session_id or len(session_id) > 200 or '/' in session_id or '\\' in session_id or session_id in ('.', '..'):
+        raise HTTPException(
+            status_code=400,
+            detail="Invalid session_id: must be 1-200 characters with no path separators"
+        )
+
+
+def matches_content_type(header: bytes, content_type: str) -> bool:
+    """Whether an object's leading bytes are the image format its Content-Type claims"""
+    if content_type == 'image/jpeg':
+        return header[:3] == b'\xff\xd8\xff'
+    if content_type == 'image/png':
+        return header[:8] == b'\x89PNG\r\n\x1a\n'
+    if content_type == 'image/webp':
+        return header[:4] == b'RIFF' and header[8:12] == b'WEBP'
+    return False
+
+
+async def create_signed_upload(request: SignedUploadRequest) -> SignedUploadResponse:
+    """
+    Signed URL for uploading one image straight to Cloud Storage
+    The image bytes never pass through this API - clients PUT them to GCS and then confirm
+    """
+    validate_session_id(request.session_id)
+
+    if request.kind not in ('original', 'processed'):
+        raise HTTPException(
+            status_code=400,
+            detail="Invalid kind: must be 'original' or 'processed'"
+        )
+
+    if request.content_type not in ALLOWED_CONTENT_TYPES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid file type: {request.content_type}. Allowed: {', '.join(ALLOWED_CONTENT_TYPES)}"
+        )
+
+    if request.kind == 'original':
+        suffix = 'original'
+    else:
+        suffix = re.sub(r'[^a-z0-9_-]', '', (request.effect or 'processed').lower())[:40] or 'processed'
+
+    upload_id = uuid.uuid4().hex
+    timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
+    blob_path = (f"orders/{request.session_id}/{timestamp}_{upload_id}_{suffix}."
+                 f"{FILE_EXTENSIONS[request.content_type]}")
+
+    try:
+        signed_url, headers = await upload_bucket.run(upload_bucket.sign_upload, blob_path, request.content_type)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to sign upload URL: {e}", exc_info=True)
+        raise HTTPException(
+            status_code=503,
+            detail="Storage service temporarily unavailable"
+        )
+
+    logger.info(f"Signed {request.kind} upload: {blob_path}")
+    return SignedUploadResponse(
+        signed_url=signed_url,
+        public_url=upload_bucket.public_url(blob_path),
+        upload_id=upload_id,
+        blob_path=blob_path,
+        expires_in=SIGNED_UPLOAD_EXPIRY_SECONDS,
+        headers=headers
+    )
+
+
+async def confirm_signed_upload(request: ConfirmUploadRequest) -> ConfirmUploadResponse:
+    """
+    Verify a direct upload from object metadata and its first bytes, then make it public
+
+    Objects that are too large or not the image type they claim are deleted.
+    """
+    validate_session_id(request.session_id)
+
+    # Only objects this session was signed for can be confirmed
+    filename = request.blob_path.rsplit('/', 1)[-1]
+    if (not request.blob_path.startswith(f"orders/{request.session_id}/")
+            or '..' in request.blob_path or f"_{request.upload_id}_" not in filename):
+        raise HTTPException(
+            status_code=400,
+            detail="blob_path does not match this session's upload"
+        )
+
+    try:
+        blob, header = await upload_bucket.run(upload_bucket.inspect_upload, request.blob_path)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to inspect upload {request.blob_path}: {e}", exc_info=True)
+        raise HTTPException(
+            status_code=503,
+            detail="Storage service temporarily unavailable"
+        )
+
+    if blob is None:
+        raise HTTPException(
+            status_code=404,
+            detail="Upload not found. File may not have been uploaded successfully."
+        )
+
+    rejection = None
+    if not blob.size:
+        rejection = (400, "Invalid image: file is empty")
+    elif blob.size > MAX_FILE_SIZE:
+        rejection = (413, f"Image too large ({blob.size // 1024 // 1024}MB, max {MAX_FILE_SIZE // 1024 // 1024}MB)")
+    elif blob.content_type not in ALLOWED_CONTENT_TYPES or not matches_content_type(header, blob.content_type):
+        rejection = (400, f"Invalid file type: content does not match {blob.content_type}")
+
+    if rejection:
+        logger.warning(f"Rejected direct upload {request.blob_path}: {rejection[1]}")
+        try:
+            await upload_bucket.run(blob.delete)
+        except Exception as e:
+            logger.error(f"Failed to delete rejected upload {request.blob_path}: {e}")
+        raise HTTPException(status_code=rejection[0], detail=rejection[1])
+
+    # confirmed_at exempts the object from the sweep; it is made public only after that lands
+    blob.metadata = {
+        **(blob.metadata or {}),
+        'upload_id': request.upload_id,
+        'session_id': request.session_id[:100],
+        'confirmed_at': datetime.utcnow().isoformat()
+    }
+    try:
+        await upload_bucket.run(blob.patch)
+        await upload_bucket.run(blob.make_public)
+    except Exception as e:
+        logger.error(f"Failed to publish confirmed upload {request.blob_path}: {e}")
+        raise HTTPException(
+            status_code=503,
+            detail="Storage service temporarily unavailable"
+        )
+
+    logger.info(f"✓ Confirmed direct upload: {request.blob_path} ({blob.size // 1024}KB)")
+    return ConfirmUploadResponse(
+        success=True,
+        upload_id=request.upload_id,
+        url=upload_bucket.public_url(request.blob_path),
+        size=blob.size,
+        content_type=blob.content_type
+    )
+
+
 # Add to main API
 def register_storage_endpoints(app):
     """Register the storage endpoints with the main FastAPI app"""
     
+    @app.on_event("startup")
+    async def warm_upload_bucket():
+        await upload_bucket.warm()
+        upload_bucket.start_sweeper()
+    
     @app.post("/api/storage/upload", response_model=ImageUploadResponse)
     async def upload_images(request: ImageUploadRequest):
         """
         Simple endpoint to upload original + processed images
         Returns URLs that go directly into Shopify order properties
         """
-        return await upload_customer_images(request)
\ No newline at end of file
+        return await upload_customer_images(request)
+    
+    @app.post("/api/storage/upload/signed-url", response_model=SignedUploadResponse)
+    async def signed_upload_url(request: SignedUploadRequest):
+        """
+        Signed URL for a direct-to-GCS upload (PUT with the returned headers),
+        followed by /api/storage/upload/confirm
+        """
+        return await create_signed_upload(request)
+    
+    @app.post("/api/storage/upload/confirm", response_model=ConfirmUploadResponse)
+    async def confirm_upload(request: ConfirmUploadRequest):
+        """Verify a direct upload's size and type without downloading it, then make it public"""
+        return await confirm_signed_upload(request)
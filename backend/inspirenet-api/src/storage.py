@@ -5,38 +5,39 @@ Cloud Storage Manager for caching processed images
 import asyncio
 import logging
 import time
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 import os
 from io import BytesIO
 
-try:
-    from google.cloud import storage
-    from google.api_core import exceptions as gcs_exceptions
-    GOOGLE_CLOUD_AVAILABLE = True
-except ImportError:
-    GOOGLE_CLOUD_AVAILABLE = False
-    storage = None
-    gcs_exceptions = None
+from cache_namespaces import model_namespace
+from storage_maintenance import StorageMaintenanceEngine
+from storage_backend import create_client, backend_available, NotFound
 
 logger = logging.getLogger(__name__)
 
+CACHE_PREFIX = "inspirenet-cache"
+# Namespace kinds laid out as {kind}/{name}/v{version}
+NAMESPACE_KINDS = ("models", "effects")
+
 
 class CloudStorageManager:
     """Manages caching of processed images in Google Cloud Storage"""
     
-    def __init__(self, bucket_name: str, cache_ttl: int = 86400):
+    def __init__(self, bucket_name: str, cache_ttl: int = 86400, client: Optional[Any] = None):
         """
         Initialize storage manager
         
         Args:
             bucket_name: GCS bucket name for caching
             cache_ttl: Cache TTL in seconds (default 24 hours)
+            client: Storage client (default: STORAGE_BACKEND via storage_backend.create_client)
         """
         self.bucket_name = bucket_name
         self.cache_ttl = cache_ttl
-        self.client = None
+        self.client = client
         self.bucket = None
-        self.enabled = GOOGLE_CLOUD_AVAILABLE
+        self.maintenance: Optional[StorageMaintenanceEngine] = None
+        self.enabled = client is not None or backend_available()
         
         if not self.enabled:
             logger.warning("Google Cloud Storage not available. Caching disabled.")
@@ -49,12 +50,10 @@ class CloudStorageManager:
             self.enabled = False
     
     def _initialize_client(self):
-        """Initialize Google Cloud Storage client"""
-        if not GOOGLE_CLOUD_AVAILABLE:
-            return
-            
+        """Initialize the storage client (GCS, or a local backend for offline runs)"""
         try:
-            self.client = storage.Client()
+            if self.client is None:
+                self.client = create_client()
             self.bucket = self.client.bucket(self.bucket_name)
             
             # Test bucket access
@@ -63,26 +62,33 @@ class CloudStorageManager:
                 self.enabled = False
             else:
                 logger.info(f"Connected to GCS bucket: {self.bucket_name}")
+                # Usage counters per cache area, kept current on every write/delete
+                self.maintenance = StorageMaintenanceEngine(
+                    self.client, self.bucket,
+                    [f"{CACHE_PREFIX}/", f"{CACHE_PREFIX}/models/", f"{CACHE_PREFIX}/effects/"]
+                )
                 
         except Exception as e:
             logger.error(f"Failed to initialize GCS client: {e}")
             self.enabled = False
     
-    def _get_blob_name(self, cache_key: str) -> str:
-        """Generate blob name from cache key"""
+    def _get_blob_name(self, cache_key: str, namespace: Optional[str] = None) -> str:
+        """Generate blob name from cache key within a versioned namespace (default: current model)"""
         # Validate cache key is a proper string hash
         if not isinstance(cache_key, str):
             raise TypeError(f"cache_key must be a string, not {type(cache_key).__name__}")
         if len(cache_key) < 2:
             raise ValueError(f"cache_key too short: {cache_key}")
-        return f"inspirenet-cache/{cache_key[:2]}/{cache_key}.png"
+        namespace = namespace or model_namespace()
+        return f"{CACHE_PREFIX}/{namespace}/{cache_key[:2]}/{cache_key}.png"
     
-    async def get_cached_result(self, cache_key: str) -> Optional[bytes]:
+    async def get_cached_result(self, cache_key: str, namespace: Optional[str] = None) -> Optional[bytes]:
         """
         Get cached result from storage
         
         Args:
             cache_key: Cache key for the image
+            namespace: Versioned cache namespace (default: current background-removal model)
             
         Returns:
             Cached image bytes or None if not found
@@ -91,7 +97,7 @@ class CloudStorageManager:
             return None
             
         try:
-            blob_name = self._get_blob_name(cache_key)
+            blob_name = self._get_blob_name(cache_key, namespace)
             blob = self.bucket.blob(blob_name)
             
             # Check if blob exists and is not expired
@@ -113,19 +119,20 @@ class CloudStorageManager:
             logger.debug(f"Cache hit for key: {cache_key}")
             return content
             
-        except gcs_exceptions.NotFound:
+        except NotFound:
             return None
         except Exception as e:
             logger.error(f"Error retrieving cached result: {e}")
             return None
     
-    async def cache_result(self, cache_key: str, image_data: bytes) -> bool:
+    async def cache_result(self, cache_key: str, image_data: bytes, namespace: Optional[str] = None) -> bool:
         """
         Cache processed image result
         
         Args:
             cache_key: Cache key for the image
             image_data: Processed image bytes
+            namespace: Versioned cache namespace (default: current background-removal model)
             
         Returns:
             True if successfully cached, False otherwise
@@ -148,12 +155,14 @@ class CloudStorageManager:
             return False
             
         try:
-            blob_name = self._get_blob_name(cache_key)
+            namespace = namespace or model_namespace()
+            blob_name = self._get_blob_name(cache_key, namespace)
             blob = self.bucket.blob(blob_name)
             
             # Set metadata
             blob.metadata = {
                 "cache_key": cache_key,
+                "namespace": namespace,
                 "model": "inspirenet",
                 "created_at": str(int(time.time()))
             }
@@ -168,6 +177,7 @@ class CloudStorageManager:
                 lambda: blob.upload_from_string(image_data, content_type="image/png")
             )
             
+            self.maintenance.record_write(blob_name, len(image_data))
             logger.debug(f"Cached result for key: {cache_key}")
             return True
             
@@ -201,7 +211,7 @@ class CloudStorageManager:
             return False
             
         try:
-            blob_name = f"inspirenet-cache/{effect}/{cache_key[:2]}/{cache_key}.png"
+            blob_name = f"{CACHE_PREFIX}/{effect}/{cache_key[:2]}/{cache_key}.png"
             blob = self.bucket.blob(blob_name)
             
             # Set metadata
@@ -222,6 +232,7 @@ class CloudStorageManager:
                 lambda: blob.upload_from_string(image_data, content_type="image/png")
             )
             
+            self.maintenance.record_write(blob_name, len(image_data))
             logger.debug(f"Uploaded processed image for key: {cache_key}, effect: {effect}")
             return True
             
@@ -229,16 +240,78 @@ class CloudStorageManager:
             logger.error(f"Error uploading processed image: {e}")
             return False
     
+    async def delete_cached_result(self, cache_key: str, namespace: Optional[str] = None) -> bool:
+        """Remove a cached result, e.g. a coarse mask superseded by the refined one"""
+        if not self.enabled:
+            return False
+        
+        try:
+            await self._delete_blob_async(self._get_blob_name(cache_key, namespace))
+            return True
+        except Exception as e:
+            logger.error(f"Error deleting cached result: {e}")
+            return False
+    
     async def _delete_blob_async(self, blob_name: str):
         """Delete blob asynchronously"""
         try:
             blob = self.bucket.blob(blob_name)
             loop = asyncio.get_event_loop()
             await loop.run_in_executor(None, blob.delete)
+            self.maintenance.record_delete(blob_name)
             logger.debug(f"Deleted expired blob: {blob_name}")
         except Exception as e:
             logger.error(f"Error deleting blob {blob_name}: {e}")
     
+    def _list_prefixes(self, prefix: str) -> List[str]:
+        """Immediate "subdirectory" prefixes under a prefix"""
+        iterator = self.client.list_blobs(self.bucket_name, prefix=prefix, delimiter="/")
+        prefixes = set()
+        for page in iterator.pages:
+            prefixes.update(page.prefixes)
+        return sorted(prefixes)
+    
+    def _collect_cache_namespaces(self) -> List[str]:
+        root = f"{CACHE_PREFIX}/"
+        namespaces = []
+        for top in self._list_prefixes(root):
+            kind = top[len(root):-1]
+            if kind in NAMESPACE_KINDS:
+                for owner in self._list_prefixes(top):
+                    for version in self._list_prefixes(owner):
+                        namespaces.append(version[len(root):-1])
+            elif len(kind) == 2:
+                # Pre-versioning flat layout: inspirenet-cache/{key[:2]}/{key}.png
+                namespaces.append(kind)
+        return namespaces
+    
+    async def list_cache_namespaces(self) -> List[str]:
+        """
+        Cache namespaces present in the bucket
+        
+        Versioned namespaces ({kind}/{name}/v{n}) plus the two-character shard
+        directories of the old unversioned layout. Per-effect upload folders
+        written by upload_processed_image are not cache namespaces and are skipped.
+        """
+        if not self.enabled:
+            return []
+        
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, self._collect_cache_namespaces)
+    
+    async def delete_cache_namespace(self, namespace: str) -> Dict[str, int]:
+        """
+        Delete every blob in a cache namespace using parallel batch requests
+        
+        Returns:
+            {'blobs': deleted blob count, 'bytes': bytes reclaimed}
+        """
+        if not self.enabled:
+            return {'blobs': 0, 'bytes': 0}
+        
+        deleted = await self.maintenance.delete_where(f"{CACHE_PREFIX}/{namespace}/")
+        return {'blobs': deleted['blobs'], 'bytes': deleted['bytes']}
+    
     async def cleanup_expired_cache(self) -> int:
         """
         Clean up expired cache entries
@@ -250,25 +323,18 @@ class CloudStorageManager:
             return 0
             
         try:
-            deleted_count = 0
             current_time = time.time()
             
-            # List all blobs in cache directory
-            blobs = self.client.list_blobs(
-                self.bucket_name,
-                prefix="inspirenet-cache/",
-                max_results=1000
-            )
+            def expired(blob) -> bool:
+                return bool(blob.time_created) and current_time - blob.time_created.timestamp() > self.cache_ttl
             
-            for blob in blobs:
-                if blob.time_created:
-                    age = current_time - blob.time_created.timestamp()
-                    if age > self.cache_ttl:
-                        await self._delete_blob_async(blob.name)
-                        deleted_count += 1
+            # Pages through the whole cache; expired blobs go out in parallel batch deletes
+            result = await self.maintenance.delete_where(f"{CACHE_PREFIX}/", expired)
+            deleted_count = result['blobs']
             
             if deleted_count > 0:
-                logger.info(f"Cleaned up {deleted_count} expired cache entries")
+                logger.info(f"Cleaned up {deleted_count} expired cache entries "
+                            f"({result['bytes'] / (1024 * 1024):.1f}MB of {result['scanned']} scanned)")
             
             return deleted_count
             
@@ -291,33 +357,18 @@ class CloudStorageManager:
             }
         
         try:
-            total_entries = 0
-            total_size = 0
-            expired_entries = 0
-            current_time = time.time()
-            
-            # List all blobs in cache directory
-            blobs = self.client.list_blobs(
-                self.bucket_name,
-                prefix="inspirenet-cache/"
-            )
-            
-            for blob in blobs:
-                total_entries += 1
-                if blob.size:
-                    total_size += blob.size
-                
-                if blob.time_created:
-                    age = current_time - blob.time_created.timestamp()
-                    if age > self.cache_ttl:
-                        expired_entries += 1
+            # Counters are maintained on write/delete and reconciled in the background,
+            # so this never lists the bucket
+            maintenance_stats = self.maintenance.get_stats()
+            areas = maintenance_stats["prefixes"]
             
             return {
                 "enabled": True,
                 "bucket_name": self.bucket_name,
-                "total_entries": total_entries,
-                "total_size_mb": total_size / (1024 * 1024),
-                "expired_entries": expired_entries,
+                "total_entries": sum(area["count"] for area in areas.values()),
+                "total_size_mb": round(sum(area["size_mb"] for area in areas.values()), 2),
+                "areas": areas,
+                "counters_reconciled_at": maintenance_stats["reconciled_at"],
                 "cache_ttl_hours": self.cache_ttl / 3600
             }
             
@@ -340,14 +391,16 @@ class LocalCacheManager:
         os.makedirs(cache_dir, exist_ok=True)
         logger.info(f"Using local cache directory: {cache_dir}")
     
-    def _get_cache_path(self, cache_key: str) -> str:
-        """Get local cache file path"""
-        return os.path.join(self.cache_dir, f"{cache_key}.png")
+    def _get_cache_path(self, cache_key: str, namespace: Optional[str] = None) -> str:
+        """Get local cache file path within a versioned namespace directory"""
+        namespace_dir = os.path.join(self.cache_dir, namespace or model_namespace())
+        os.makedirs(namespace_dir, exist_ok=True)
+        return os.path.join(namespace_dir, f"{cache_key}.png")
     
-    async def get_cached_result(self, cache_key: str) -> Optional[bytes]:
+    async def get_cached_result(self, cache_key: str, namespace: Optional[str] = None) -> Optional[bytes]:
         """Get cached result from local storage"""
         try:
-            cache_path = self._get_cache_path(cache_key)
+            cache_path = self._get_cache_path(cache_key, namespace)
             
             if not os.path.exists(cache_path):
                 return None
@@ -365,7 +418,7 @@ class LocalCacheManager:
             logger.error(f"Error retrieving cached result: {e}")
             return None
     
-    async def cache_result(self, cache_key: str, image_data: bytes) -> bool:
+    async def cache_result(self, cache_key: str, image_data: bytes, namespace: Optional[str] = None) -> bool:
         """Cache result to local storage"""
         # Type validation to prevent critical parameter type errors
         if not isinstance(cache_key, str):
@@ -377,7 +430,7 @@ class LocalCacheManager:
             raise TypeError(f"image_data must be bytes, got {type(image_data)}")
         
         try:
-            cache_path = self._get_cache_path(cache_key)
+            cache_path = self._get_cache_path(cache_key, namespace)
             
             with open(cache_path, 'wb') as f:
                 f.write(image_data)
@@ -388,20 +441,32 @@ class LocalCacheManager:
             logger.error(f"Error caching result: {e}")
             return False
     
+    async def delete_cached_result(self, cache_key: str, namespace: Optional[str] = None) -> bool:
+        """Remove a cached result from local storage"""
+        try:
+            cache_path = self._get_cache_path(cache_key, namespace)
+            if os.path.exists(cache_path):
+                os.remove(cache_path)
+            return True
+        except Exception as e:
+            logger.error(f"Error deleting cached result: {e}")
+            return False
+    
     async def cleanup_expired_cache(self) -> int:
         """Clean up expired local cache entries"""
         try:
             deleted_count = 0
             current_time = time.time()
             
-            for filename in os.listdir(self.cache_dir):
-                if filename.endswith('.png'):
-                    filepath = os.path.join(self.cache_dir, filename)
-                    age = current_time - os.path.getmtime(filepath)
-                    
-                    if age > self.cache_ttl:
-                        os.remove(filepath)
-                        deleted_count += 1
+            for dirpath, _, filenames in os.walk(self.cache_dir):
+                for filename in filenames:
+                    if filename.endswith('.png'):
+                        filepath = os.path.join(dirpath, filename)
+                        age = current_time - os.path.getmtime(filepath)
+                        
+                        if age > self.cache_ttl:
+                            os.remove(filepath)
+                            deleted_count += 1
             
             if deleted_count > 0:
                 logger.info(f"Cleaned up {deleted_count} expired local cache entries")
@@ -0,0 +1,501 @@
+"""
+Storage Backend
+Pluggable object-storage client: Google Cloud Storage, or a local in-memory/filesystem stand-in with injectable latency
+"""
+
+import os
+import json
+import time
+import random
+import logging
+import threading
+import contextlib
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional, Tuple, Iterator
+
+try:
+    from google.cloud import storage as gcs
+    from google.api_core.exceptions import NotFound
+    GOOGLE_CLOUD_AVAILABLE = True
+except ImportError:
+    GOOGLE_CLOUD_AVAILABLE = False
+    gcs = None
+
+    class NotFound(Exception):
+        """Object or bucket does not exist (stand-in for google.api_core.exceptions.NotFound)"""
+
+logger = logging.getLogger(__name__)
+
+# gcs (production), memory (process-local) or filesystem (shared across processes via STORAGE_BACKEND_ROOT)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "gcs").lower()
+STORAGE_BACKEND_ROOT = os.getenv("STORAGE_BACKEND_ROOT", "/tmp/storage-backend")
+# Simulated per-call round trip for the local backends, e.g. 20 (ms) to approximate GCS from Cloud Run
+STORAGE_BACKEND_LATENCY_MS = float(os.getenv("STORAGE_BACKEND_LATENCY_MS", "0"))
+STORAGE_BACKEND_JITTER_MS = float(os.getenv("STORAGE_BACKEND_JITTER_MS", "0"))
+# Simulated transfer time per MB uploaded/downloaded
+STORAGE_BACKEND_MS_PER_MB = float(os.getenv("STORAGE_BACKEND_MS_PER_MB", "0"))
+
+LOCAL_BACKENDS = ("memory", "filesystem")
+LIST_PAGE_SIZE = 1000
+
+
+def backend_available(backend: Optional[str] = None) -> bool:
+    """Whether the configured backend can be used in this environment"""
+    backend = backend or STORAGE_BACKEND
+    return backend in LOCAL_BACKENDS or GOOGLE_CLOUD_AVAILABLE
+
+
+def create_client(project: Optional[str] = None, backend: Optional[str] = None, **kwargs) -> Any:
+    """
+    Storage client for the configured backend
+
+    The local backends implement the subset of the google.cloud.storage API the
+    services use (buckets, blobs, paged listing, batches), so storage managers
+    work unchanged against them.
+
+    Args:
+        project: GCP project (GCS backend only)
+        backend: Override STORAGE_BACKEND
+        **kwargs: LocalStorageClient options (root, latency_ms, jitter_ms, ms_per_mb)
+    """
+    backend = backend or STORAGE_BACKEND
+    if backend in LOCAL_BACKENDS:
+        if backend == "filesystem":
+            kwargs.setdefault("root", STORAGE_BACKEND_ROOT)
+        return LocalStorageClient(**kwargs)
+    if not GOOGLE_CLOUD_AVAILABLE:
+        raise RuntimeError("google-cloud-storage is not installed; set STORAGE_BACKEND=memory or filesystem")
+    return gcs.Client(project=project) if project else gcs.Client()
+
+
+class LatencyModel:
+    """Sleeps to emulate a network round trip plus transfer time"""
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, ms_per_mb: float = 0.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.ms_per_mb = ms_per_mb
+
+    def wait(self, nbytes: int = 0) -> None:
+        delay_ms = self.latency_ms + nbytes / (1024 * 1024) * self.ms_per_mb
+        if self.jitter_ms:
+            delay_ms += random.uniform(0, self.jitter_ms)
+        if delay_ms > 0:
+            time.sleep(delay_ms / 1000.0)
+
+
+class _MemoryObjects:
+    """Objects of one bucket held in process memory"""
+
+    def __init__(self):
+        self._objects: Dict[str, Tuple[bytes, Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> Optional[Tuple[bytes, Dict[str, Any]]]:
+        with self._lock:
+            return self._objects.get(name)
+
+    def info(self, name: str) -> Optional[Dict[str, Any]]:
+        entry = self.get(name)
+        return dict(entry[1]) if entry else None
+
+    def put(self, name: str, data: bytes, info: Dict[str, Any]) -> None:
+        with self._lock:
+            self._objects[name] = (data, info)
+
+    def update_info(self, name: str, info: Dict[str, Any]) -> bool:
+        with self._lock:
+            if name not in self._objects:
+                return False
+            self._objects[name] = (self._objects[name][0], info)
+            return True
+
+    def delete(self, name: str) -> bool:
+        with self._lock:
+            return self._objects.pop(name, None) is not None
+
+    def names(self, prefix: str = "") -> List[str]:
+        with self._lock:
+            return sorted(name for name in self._objects if name.startswith(prefix))
+
+
+class _FilesystemObjects:
+    """Objects of one bucket as files, with JSON sidecars for metadata"""
+
+    def __init__(self, root: str):
+        self.data_root = os.path.join(root, "objects")
+        self.info_root = os.path.join(root, "info")
+        os.makedirs(self.data_root, exist_ok=True)
+        os.makedirs(self.info_root, exist_ok=True)
+
+    def _paths(self, name: str) -> Tuple[str, str]:
+        return os.path.join(self.data_root, name), os.path.join(self.info_root, name + ".json")
+
+    def info(self, name: str) -> Optional[Dict[str, Any]]:
+        _, info_path = self._paths(name)
+        try:
+            with open(info_path) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def get(self, name: str) -> Optional[Tuple[bytes, Dict[str, Any]]]:
+        data_path, _ = self._paths(name)
+        info = self.info(name)
+        if info is None:
+            return None
+        try:
+            with open(data_path, "rb") as f:
+                return f.read(), info
+        except FileNotFoundError:
+            return None
+
+    def _write(self, path: str, payload: bytes) -> None:
+        # Write-then-rename so concurrent readers never see partial objects
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
+
+    def put(self, name: str, data: bytes, info: Dict[str, Any]) -> None:
+        data_path, info_path = self._paths(name)
+        self._write(data_path, data)
+        self._write(info_path, json.dumps(info).encode())
+
+    def update_info(self, name: str, info: Dict[str, Any]) -> bool:
+        if self.info(name) is None:
+            return False
+        self._write(self._paths(name)[1], json.dumps(info).encode())
+        return True
+
+    def delete(self, name: str) -> bool:
+        data_path, info_path = self._paths(name)
+        existed = False
+        for path in (info_path, data_path):
+            try:
+                os.remove(path)
+                existed = True
+            except FileNotFoundError:
+                pass
+        return existed
+
+    def names(self, prefix: str = "") -> List[str]:
+        names = []
+        for dirpath, _, filenames in os.walk(self.info_root):
+            for filename in filenames:
+                if filename.endswith(".json"):
+                    path = os.path.join(dirpath, filename[:-len(".json")])
+                    name = os.path.relpath(path, self.info_root).replace(os.sep, "/")
+                    if name.startswith(prefix):
+                        names.append(name)
+        return sorted(names)
+
+
+# Memory buckets are shared by every client in the process, like a real bucket
+_MEMORY_BUCKETS: Dict[str, _MemoryObjects] = {}
+_MEMORY_BUCKETS_LOCK = threading.Lock()
+
+
+def reset_memory_backend() -> None:
+    """Drop all in-memory buckets (tests and benchmarks)"""
+    with _MEMORY_BUCKETS_LOCK:
+        _MEMORY_BUCKETS.clear()
+
+
+class LocalBlob:
+    """google.cloud.storage.Blob subset - properties load on reload/listing/upload, as with GCS"""
+
+    def __init__(self, bucket: 'LocalBucket', name: str, info: Optional[Dict[str, Any]] = None):
+        self.bucket = bucket
+        self.name = name
+        self.metadata: Optional[Dict[str, str]] = None
+        self.content_type: Optional[str] = None
+        self.cache_control: Optional[str] = None
+        self.size: Optional[int] = None
+        self.time_created: Optional[datetime] = None
+        self.updated: Optional[datetime] = None
+        if info is not None:
+            self._load(info)
+
+    def _load(self, info: Dict[str, Any]) -> None:
+        self.metadata = dict(info["metadata"]) if info.get("metadata") else None
+        self.content_type = info.get("content_type")
+        self.cache_control = info.get("cache_control")
+        self.size = info.get("size")
+        self.time_created = datetime.fromtimestamp(info["time_created"], tz=timezone.utc)
+        self.updated = datetime.fromtimestamp(info.get("updated", info["time_created"]), tz=timezone.utc)
+
+    @property
+    def _objects(self):
+        return self.bucket._objects
+
+    @property
+    def public_url(self) -> str:
+        return f"https://storage.googleapis.com/{self.bucket.name}/{self.name}"
+
+    def exists(self, **kwargs) -> bool:
+        self.bucket.client._round_trip()
+        return self._objects.info(self.name) is not None
+
+    def reload(self, **kwargs) -> None:
+        self.bucket.client._round_trip()
+        info = self._objects.info(self.name)
+        if info is None:
+            raise NotFound(f"No such object: {self.bucket.name}/{self.name}")
+        self._load(info)
+
+    def upload_from_string(self, data, content_type: Optional[str] = None, **kwargs) -> None:
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self.bucket.client._round_trip(len(data))
+        now = time.time()
+        info = {
+            "size": len(data),
+            "time_created": now,
+            "updated": now,
+            "content_type": content_type or self.content_type or "application/octet-stream",
+            "cache_control": self.cache_control,
+            "metadata": self.metadata or {},
+            "public": kwargs.get("predefined_acl") == "publicRead"
+        }
+        self._objects.put(self.name, bytes(data), info)
+        self._load(info)
+
+    def upload_from_file(self, file_obj, content_type: Optional[str] = None, **kwargs) -> None:
+        self.upload_from_string(file_obj.read(), content_type=content_type)
+
+    def download_as_bytes(self, start: Optional[int] = None, end: Optional[int] = None, **kwargs) -> bytes:
+        """Object bytes, or the inclusive [start, end] range like a GCS ranged read"""
+        entry = self._objects.get(self.name)
+        if entry is None:
+            self.bucket.client._round_trip()
+            raise NotFound(f"No such object: {self.bucket.name}/{self.name}")
+        data = entry[0]
+        if start is not None or end is not None:
+            data = data[start or 0:None if end is None else end + 1]
+        self.bucket.client._round_trip(len(data))
+        return data
+
+    def download_as_text(self, encoding: str = "utf-8", **kwargs) -> str:
+        return self.download_as_bytes().decode(encoding)
+
+    def download_to_file(self, file_obj, **kwargs) -> None:
+        file_obj.write(self.download_as_bytes())
+
+    def generate_signed_url(self, expiration: Any = None, method: str = "GET", **kwargs) -> str:
+        """Unsigned local URL - the local backends have no HTTP endpoint to upload to"""
+        return f"local://{self.bucket.name}/{self.name}?method={method}"
+
+    def delete(self, **kwargs) -> None:
+        self.bucket.delete_blob(self.name)
+
+    def patch(self, **kwargs) -> None:
+        self.bucket.client._round_trip()
+        info = self._objects.info(self.name)
+        if info is None:
+            raise NotFound(f"No such object: {self.bucket.name}/{self.name}")
+        info.update({
+            "metadata": self.metadata or {},
+            "content_type": self.content_type or info.get("content_type"),
+            "cache_control": self.cache_control,
+            "updated": time.time()
+        })
+        self._objects.update_info(self.name, info)
+
+    def make_public(self, **kwargs) -> None:
+        self.bucket.client._round_trip()
+        info = self._objects.info(self.name)
+        if info is None:
+            raise NotFound(f"No such object: {self.bucket.name}/{self.name}")
+        info["public"] = True
+        self._objects.update_info(self.name, info)
+
+
+class LocalBucket:
+    """google.cloud.storage.Bucket subset - local buckets always exist"""
+
+    def __init__(self, client: 'LocalStorageClient', name: str):
+        self.client = client
+        self.name = name
+        self.lifecycle_rules: List[Dict[str, Any]] = []
+        self._objects = client._objects_for(name)
+
+    def exists(self, **kwargs) -> bool:
+        self.client._round_trip()
+        return True
+
+    def reload(self, **kwargs) -> None:
+        self.client._round_trip()
+
+    def patch(self, **kwargs) -> None:
+        self.client._round_trip()
+
+    def blob(self, blob_name: str, **kwargs) -> LocalBlob:
+        return LocalBlob(self, blob_name)
+
+    def get_blob(self, blob_name: str, **kwargs) -> Optional[LocalBlob]:
+        self.client._round_trip()
+        info = self._objects.info(blob_name)
+        return LocalBlob(self, blob_name, info) if info is not None else None
+
+    def delete_blob(self, blob_name: str, **kwargs) -> None:
+        self.client._round_trip()
+        if not self._objects.delete(blob_name):
+            self.client._fail(NotFound(f"No such object: {self.name}/{blob_name}"))
+
+    def copy_blob(self, blob: LocalBlob, destination_bucket: 'LocalBucket', new_name: Optional[str] = None,
+                  **kwargs) -> LocalBlob:
+        self.client._round_trip()
+        entry = self._objects.get(blob.name)
+        if entry is None:
+            raise NotFound(f"No such object: {self.name}/{blob.name}")
+        data, info = entry
+        info = {**info, "time_created": time.time(), "updated": time.time()}
+        name = new_name or blob.name
+        destination_bucket._objects.put(name, data, info)
+        return LocalBlob(destination_bucket, name, info)
+
+
+class _Page(list):
+    def __init__(self, items: List[LocalBlob], prefixes: set):
+        super().__init__(items)
+        self.prefixes = prefixes
+
+
+class _BlobIterator:
+    """HTTPIterator subset - iterate blobs directly or page by page; .prefixes fills as pages are read"""
+
+    def __init__(self, client: 'LocalStorageClient', bucket: LocalBucket, prefix: str,
+                 delimiter: Optional[str], max_results: Optional[int], page_size: Optional[int]):
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix or ""
+        self.delimiter = delimiter
+        self.max_results = max_results
+        self.page_size = page_size or LIST_PAGE_SIZE
+        self.prefixes: set = set()
+
+    @property
+    def pages(self) -> Iterator[_Page]:
+        names = self.bucket._objects.names(self.prefix)
+        items, prefixes = [], set()
+        for name in names:
+            rest = name[len(self.prefix):]
+            if self.delimiter and self.delimiter in rest:
+                prefixes.add(self.prefix + rest.split(self.delimiter, 1)[0] + self.delimiter)
+            else:
+                items.append(name)
+        if self.max_results is not None:
+            items = items[:self.max_results]
+
+        start = 0
+        while True:
+            self.client._round_trip()
+            chunk = items[start:start + self.page_size]
+            blobs = []
+            for name in chunk:
+                info = self.bucket._objects.info(name)
+                if info is not None:
+                    blobs.append(LocalBlob(self.bucket, name, info))
+            # Prefixes are reported with the first page
+            page = _Page(blobs, prefixes if start == 0 else set())
+            self.prefixes.update(page.prefixes)
+            yield page
+            start += self.page_size
+            if start >= len(items):
+                return
+
+    def __iter__(self) -> Iterator[LocalBlob]:
+        for page in self.pages:
+            yield from page
+
+
+class _BatchResponse:
+    """Per-call result inside a local batch (status code like a GCS batch sub-response)"""
+
+    def __init__(self, status_code: int = 200):
+        self.status_code = status_code
+
+
+class LocalBatch:
+    """Calls grouped into one round trip - one response per call in _responses, like google.cloud.storage.Batch"""
+
+    def __init__(self):
+        self._responses: List[_BatchResponse] = []
+        self.errors: List[Exception] = []
+
+
+class LocalStorageClient:
+    """google.cloud.storage.Client subset backed by memory or a directory tree"""
+
+    def __init__(
+        self,
+        root: Optional[str] = None,
+        latency_ms: float = STORAGE_BACKEND_LATENCY_MS,
+        jitter_ms: float = STORAGE_BACKEND_JITTER_MS,
+        ms_per_mb: float = STORAGE_BACKEND_MS_PER_MB,
+        project: Optional[str] = None
+    ):
+        self.root = root
+        self.project = project or "local"
+        self.latency = LatencyModel(latency_ms, jitter_ms, ms_per_mb)
+        self._batch = threading.local()
+        self.calls = 0
+
+    def _objects_for(self, bucket_name: str):
+        if self.root:
+            return _FilesystemObjects(os.path.join(self.root, bucket_name))
+        with _MEMORY_BUCKETS_LOCK:
+            return _MEMORY_BUCKETS.setdefault(bucket_name, _MemoryObjects())
+
+    def _round_trip(self, nbytes: int = 0) -> None:
+        # Calls inside a batch share the batch's single round trip
+        batch = getattr(self._batch, "current", None)
+        if batch is None:
+            self.calls += 1
+            self.latency.wait(nbytes)
+        else:
+            batch._responses.append(_BatchResponse())
+
+    def _fail(self, error: Exception) -> None:
+        batch = getattr(self._batch, "current", None)
+        if batch is None:
+            raise error
+        batch.errors.append(error)
+        batch._responses[-1].status_code = 404 if isinstance(error, NotFound) else 500
+
+    def bucket(self, bucket_name: str, **kwargs) -> LocalBucket:
+        return LocalBucket(self, bucket_name)
+
+    def get_bucket(self, bucket_name: str, **kwargs) -> LocalBucket:
+        self._round_trip()
+        return LocalBucket(self, bucket_name)
+
+    def create_bucket(self, bucket_name: str, **kwargs) -> LocalBucket:
+        self._round_trip()
+        return LocalBucket(self, bucket_name)
+
+    def list_blobs(
+        self,
+        bucket_or_name: Any,
+        prefix: Optional[str] = None,
+        delimiter: Optional[str] = None,
+        max_results: Optional[int] = None,
+        page_size: Optional[int] = None,
+        **kwargs
+    ) -> _BlobIterator:
+        bucket = bucket_or_name if isinstance(bucket_or_name, LocalBucket) else self.bucket(bucket_or_name)
+        return _BlobIterator(self, bucket, prefix, delimiter, max_results, page_size)
+
+    @contextlib.contextmanager
+    def batch(self, raise_exception: bool = True):
+        """Group calls into one round trip; failures raise on exit unless raise_exception=False"""
+        batch = self._batch.current = LocalBatch()
+        try:
+            yield batch
+        finally:
+            self._batch.current = None
+            self._round_trip()
+        if batch.errors and raise_exception:
+            raise batch.errors[0]
@@ -0,0 +1,256 @@
+"""
+Storage Maintenance Engine
+Concurrent GCS paging, batched deletes and incrementally maintained per-prefix counters
+"""
+
+import os
+import time
+import asyncio
+import logging
+import threading
+from typing import Dict, Any, List, Optional, Callable, Iterable, AsyncIterator
+
+logger = logging.getLogger(__name__)
+
+STORAGE_PAGE_SIZE = int(os.getenv("STORAGE_PAGE_SIZE", "1000"))
+STORAGE_LIST_CONCURRENCY = int(os.getenv("STORAGE_LIST_CONCURRENCY", "4"))
+STORAGE_DELETE_CONCURRENCY = int(os.getenv("STORAGE_DELETE_CONCURRENCY", "4"))
+# GCS batch requests are capped at 100 calls
+STORAGE_DELETE_BATCH_SIZE = 100
+# Full rescans correct counter drift from lifecycle rules and other instances (0 disables)
+STORAGE_RECONCILE_INTERVAL_SECONDS = int(os.getenv("STORAGE_RECONCILE_INTERVAL_SECONDS", "21600"))
+
+
+class PrefixCounters:
+    """Blob count and total bytes per tracked prefix, attributed to the longest matching prefix"""
+
+    def __init__(self, prefixes: Iterable[str]):
+        self._lock = threading.Lock()
+        # Longest first so nested prefixes win over their parents
+        self.prefixes = sorted(set(prefixes), key=len, reverse=True)
+        self._counts = {prefix: {'count': 0, 'bytes': 0} for prefix in self.prefixes}
+        self.reconciled_at: Optional[float] = None
+
+    def prefix_for(self, blob_name: str) -> Optional[str]:
+        for prefix in self.prefixes:
+            if blob_name.startswith(prefix):
+                return prefix
+        return None
+
+    def roots(self) -> List[str]:
+        """Tracked prefixes not nested in another - scanning these covers every counter once"""
+        return [
+            prefix for prefix in self.prefixes
+            if not any(prefix != other and prefix.startswith(other) for other in self.prefixes)
+        ]
+
+    def add(self, blob_name: str, count: int, size: int) -> None:
+        prefix = self.prefix_for(blob_name)
+        if prefix is None:
+            return
+        with self._lock:
+            counts = self._counts[prefix]
+            counts['count'] = max(0, counts['count'] + count)
+            counts['bytes'] = max(0, counts['bytes'] + size)
+
+    def replace(self, totals: Dict[str, Dict[str, int]]) -> None:
+        with self._lock:
+            for prefix, counts in totals.items():
+                self._counts[prefix] = dict(counts)
+            self.reconciled_at = time.time()
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {prefix: dict(counts) for prefix, counts in self._counts.items()}
+
+
+class StorageMaintenanceEngine:
+    """Paged listing, parallel batch deletes and O(1) usage counters for one bucket"""
+
+    def __init__(
+        self,
+        client: Any,
+        bucket: Any,
+        tracked_prefixes: Iterable[str],
+        page_size: int = STORAGE_PAGE_SIZE,
+        list_concurrency: int = STORAGE_LIST_CONCURRENCY,
+        delete_batch_size: int = STORAGE_DELETE_BATCH_SIZE,
+        delete_concurrency: int = STORAGE_DELETE_CONCURRENCY
+    ):
+        self.client = client
+        self.bucket = bucket
+        self.bucket_name = bucket.name
+        self.page_size = page_size
+        self.list_concurrency = list_concurrency
+        self.delete_batch_size = delete_batch_size
+        self.delete_concurrency = delete_concurrency
+        self.counters = PrefixCounters(tracked_prefixes)
+        self._delete_semaphore: Optional[asyncio.Semaphore] = None
+        self._reconcile_task: Optional[asyncio.Task] = None
+        self._reconciling = False
+
+    # Counters
+
+    def record_write(self, blob_name: str, size: int) -> None:
+        self.counters.add(blob_name, 1, size)
+
+    def record_delete(self, blob_name: str, size: int = 0) -> None:
+        """Size is unknown for deletes by name - the next reconcile corrects the byte total"""
+        self.counters.add(blob_name, -1, -size)
+
+    # Listing
+
+    async def pages(self, prefix: str) -> AsyncIterator[List[Any]]:
+        """Yield blob pages under a prefix, fetching the next page while the caller works"""
+        loop = asyncio.get_event_loop()
+        pages = self.client.list_blobs(self.bucket_name, prefix=prefix, page_size=self.page_size).pages
+        next_page = loop.run_in_executor(None, next, pages, None)
+        while True:
+            page = await next_page
+            if page is None:
+                return
+            blobs = list(page)
+            next_page = loop.run_in_executor(None, next, pages, None)
+            yield blobs
+
+    async def reconcile(self) -> Dict[str, Dict[str, int]]:
+        """Rescan tracked prefixes (roots concurrently) and reset the counters"""
+        totals = {prefix: {'count': 0, 'bytes': 0} for prefix in self.counters.prefixes}
+        semaphore = asyncio.Semaphore(self.list_concurrency)
+
+        async def scan(root: str):
+            async with semaphore:
+                async for blobs in self.pages(root):
+                    for blob in blobs:
+                        prefix = self.counters.prefix_for(blob.name)
+                        if prefix is not None:
+                            totals[prefix]['count'] += 1
+                            totals[prefix]['bytes'] += blob.size or 0
+
+        self._reconciling = True
+        try:
+            start_time = time.time()
+            await asyncio.gather(*(scan(root) for root in self.counters.roots()))
+            self.counters.replace(totals)
+            logger.info(f"Reconciled storage counters for gs://{self.bucket_name} "
+                        f"in {time.time() - start_time:.1f}s")
+            return totals
+        finally:
+            self._reconciling = False
+
+    # Deletion
+
+    def _delete_batch(self, blob_names: List[str]) -> List[str]:
+        """
+        One GCS batch request
+
+        Returns:
+            Names whose delete failed (403, 429, 5xx...) - a 404 means already gone and counts as deleted
+        """
+        with self.client.batch(raise_exception=False) as batch:
+            for blob_name in blob_names:
+                self.bucket.delete_blob(blob_name)
+        # raise_exception=False (google-cloud-storage>=2.10) leaves one sub-response per call, in call order
+        return [
+            blob_name for blob_name, response in zip(blob_names, batch._responses)
+            if not (200 <= response.status_code < 300 or response.status_code == 404)
+        ]
+
+    async def _delete_chunk(self, blobs: List[Any]) -> List[Any]:
+        """Delete one batch and update counters for the blobs that are gone; returns the blobs that failed"""
+        if self._delete_semaphore is None:
+            self._delete_semaphore = asyncio.Semaphore(self.delete_concurrency)
+        loop = asyncio.get_event_loop()
+        async with self._delete_semaphore:
+            failed_names = set(await loop.run_in_executor(None, self._delete_batch, [blob.name for blob in blobs]))
+        failed = []
+        for blob in blobs:
+            if blob.name in failed_names:
+                failed.append(blob)
+            else:
+                self.record_delete(blob.name, blob.size or 0)
+        return failed
+
+    async def delete_where(
+        self,
+        prefix: str,
+        predicate: Optional[Callable[[Any], bool]] = None,
+        dry_run: bool = False
+    ) -> Dict[str, int]:
+        """
+        Delete blobs under a prefix that match a predicate (all when None)
+
+        Listing continues while earlier batches are deleted in parallel, pausing once
+        twice delete_concurrency batches are pending. Blobs count as deleted only when
+        their own call in the batch succeeded (or found them already gone).
+
+        Returns:
+            {'scanned': blobs listed, 'blobs': blobs matched (dry run) or deleted,
+             'bytes': their size, 'failed': blobs whose delete or whole batch failed}
+        """
+        stats = {'scanned': 0, 'blobs': 0, 'bytes': 0, 'failed': 0}
+        pending = {}
+        max_pending = 2 * self.delete_concurrency
+
+        def settle(done) -> None:
+            for task in done:
+                chunk = pending.pop(task)
+                if task.exception() is not None:
+                    stats['failed'] += len(chunk)
+                    logger.error(f"Batch delete failed under {prefix}: {task.exception()}")
+                    continue
+                failed = task.result()
+                if failed:
+                    stats['failed'] += len(failed)
+                    logger.warning(f"{len(failed)} of {len(chunk)} deletes failed under {prefix}")
+                deleted = [blob for blob in chunk if blob not in failed]
+                stats['blobs'] += len(deleted)
+                stats['bytes'] += sum(blob.size or 0 for blob in deleted)
+
+        async for blobs in self.pages(prefix):
+            stats['scanned'] += len(blobs)
+            matched = [blob for blob in blobs if predicate is None or predicate(blob)]
+            if dry_run:
+                stats['blobs'] += len(matched)
+                stats['bytes'] += sum(blob.size or 0 for blob in matched)
+                continue
+            for start in range(0, len(matched), self.delete_batch_size):
+                chunk = matched[start:start + self.delete_batch_size]
+                pending[asyncio.create_task(self._delete_chunk(chunk))] = chunk
+                if len(pending) >= max_pending:
+                    done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    settle(done)
+
+        if pending:
+            done, _ = await asyncio.wait(pending)
+            settle(done)
+        return stats
+
+    # Background reconciliation
+
+    async def _reconcile_forever(self, interval: int):
+        while True:
+            try:
+                await self.reconcile()
+            except Exception as e:
+                logger.error(f"Storage counter reconcile failed for gs://{self.bucket_name}: {e}")
+            await asyncio.sleep(interval)
+
+    def start(self, interval: int = STORAGE_RECONCILE_INTERVAL_SECONDS) -> None:
+        """Schedule the initial and periodic counter reconcile on the running event loop"""
+        if self._reconcile_task is None and interval > 0:
+            self._reconcile_task = asyncio.create_task(self._reconcile_forever(interval))
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Counter snapshot - no bucket listing"""
+        return {
+            'prefixes': {
+                prefix: {
+                    'count': counts['count'],
+                    'size_mb': round(counts['bytes'] / (1024 * 1024), 2)
+                }
+                for prefix, counts in self.counters.snapshot().items()
+            },
+            'reconciled_at': self.counters.reconciled_at,
+            'reconciling': self._reconciling
+        }
@@ -0,0 +1,220 @@
+"""
+Upload Reader
+Caps request bodies as they arrive and checks spooled image uploads from their header bytes in place
+"""
+
+import os
+import struct
+import logging
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from PIL import Image
+from starlette.exceptions import HTTPException
+
+logger = logging.getLogger(__name__)
+
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(50 * 1024 * 1024)))
+MAX_UPLOAD_PIXELS = int(os.getenv("MAX_UPLOAD_PIXELS", str(4096 * 4096)))
+# Multipart framing and form fields on top of the file part
+UPLOAD_FORM_OVERHEAD = 1024 * 1024
+# JPEG SOF can sit behind large EXIF/ICC segments - stop probing after this many bytes
+HEADER_PROBE_LIMIT = 256 * 1024
+
+# SOF0-SOF15 except DHT (C4), JPG (C8) and DAC (CC)
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+# Markers without a length field
+JPEG_STANDALONE_MARKERS = {0x01, 0xD0, 0xD1, 0xD2, 0xD3, 0xD4, 0xD5, 0xD6, 0xD7, 0xD8, 0xD9}
+
+
+@dataclass
+class ImageHeader:
+    """Format and pixel dimensions read from the first bytes of an image"""
+    format: str  # PIL format name: JPEG, PNG, WEBP
+    width: int
+    height: int
+
+
+class UploadRejected(Exception):
+    """Upload refused while reading - carries the HTTP status and the user-facing message"""
+
+    def __init__(self, status_code: int, detail: str, message: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.message = message
+
+
+def _probe_jpeg(data: bytes) -> Optional[ImageHeader]:
+    i = 2
+    while i + 4 <= len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:
+            # Fill byte before a marker
+            i += 1
+            continue
+        if marker in JPEG_STANDALONE_MARKERS:
+            i += 2
+            continue
+        if marker in JPEG_SOF_MARKERS:
+            if i + 9 > len(data):
+                return None
+            height, width = struct.unpack('>HH', data[i + 5:i + 9])
+            return ImageHeader('JPEG', width, height)
+        segment_length = struct.unpack('>H', data[i + 2:i + 4])[0]
+        i += 2 + segment_length
+    return None
+
+
+def _probe_webp(data: bytes) -> Optional[ImageHeader]:
+    chunk = data[12:16]
+    if chunk == b'VP8 ' and len(data) >= 30 and data[23:26] == b'\x9d\x01\x2a':
+        width, height = struct.unpack('<HH', data[26:30])
+        return ImageHeader('WEBP', width & 0x3FFF, height & 0x3FFF)
+    if chunk == b'VP8L' and len(data) >= 25 and data[20] == 0x2F:
+        bits = struct.unpack('<I', data[21:25])[0]
+        return ImageHeader('WEBP', (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1)
+    if chunk == b'VP8X' and len(data) >= 30:
+        width = int.from_bytes(data[24:27], 'little') + 1
+        height = int.from_bytes(data[27:30], 'little') + 1
+        return ImageHeader('WEBP', width, height)
+    return None
+
+
+def probe_image_header(data: bytes) -> Optional[ImageHeader]:
+    """
+    Parse dimensions from JPEG SOF, PNG IHDR or WebP VP8/VP8L/VP8X headers
+
+    Returns None when the format is unknown or the header is not within data yet.
+    """
+    if data[:3] == b'\xff\xd8\xff':
+        return _probe_jpeg(data)
+    if data[:8] == b'\x89PNG\r\n\x1a\n':
+        if len(data) >= 24 and data[12:16] == b'IHDR':
+            width, height = struct.unpack('>II', data[16:24])
+            return ImageHeader('PNG', width, height)
+        return None
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return _probe_webp(data)
+    return None
+
+
+def check_dimensions(header: ImageHeader, max_pixels: int = MAX_UPLOAD_PIXELS) -> None:
+    if header.width * header.height > max_pixels:
+        max_side = int(max_pixels ** 0.5)
+        logger.warning(f"Image too large: {header.width}x{header.height} = "
+                       f"{header.width * header.height / 1e6:.1f} megapixels")
+        raise UploadRejected(
+            413,
+            f"Image dimensions too large. Maximum {max_side}x{max_side}.",
+            f"Image dimensions too large ({header.width}x{header.height}). "
+            f"Maximum supported is {max_side}x{max_side}."
+        )
+
+
+class SpooledUpload:
+    """The framework's spooled upload file with its probed header - no copy of the bytes"""
+
+    def __init__(self, spool: Any, size: int, header: Optional[ImageHeader]):
+        self.file = spool
+        self.size = size
+        self.header = header
+
+    @property
+    def format(self) -> Optional[str]:
+        return self.header.format if self.header else None
+
+    def read_bytes(self) -> bytes:
+        self.file.seek(0)
+        return self.file.read()
+
+    def open_image(self) -> Image.Image:
+        """Lazy PIL image over the spool - decoding happens on first pixel access"""
+        self.file.seek(0)
+        return Image.open(self.file)
+
+    def close(self) -> None:
+        self.file.close()
+
+
+async def read_image_upload(
+    upload: Any,
+    max_bytes: int = MAX_UPLOAD_BYTES,
+    max_pixels: int = MAX_UPLOAD_PIXELS
+) -> SpooledUpload:
+    """
+    Check an UploadFile in place - size from the framework's spool, dimensions from its first bytes
+
+    Starlette has already spooled the multipart body before the handler runs, so this is
+    no early rejection: the body cap is UploadLimitMiddleware's job. No second copy is
+    made; headers beyond the probe window fall back to PIL's header-only open.
+
+    Raises:
+        UploadRejected: 413 for too many bytes or pixels
+    """
+    max_mb = max_bytes // (1024 * 1024)
+    file = upload.file
+    size = getattr(upload, 'size', None)
+    if size is None:
+        file.seek(0, os.SEEK_END)
+        size = file.tell()
+    if size > max_bytes:
+        raise UploadRejected(413, f"File too large (max {max_mb}MB)",
+                             f"File too large. Maximum size is {max_mb}MB.")
+
+    await upload.seek(0)
+    header = probe_image_header(await upload.read(HEADER_PROBE_LIMIT))
+    if header is None:
+        try:
+            file.seek(0)
+            with Image.open(file) as img:
+                header = ImageHeader(img.format, *img.size)
+        except Exception as e:
+            logger.warning(f"Failed to check image dimensions: {e}")
+    if header is not None:
+        check_dimensions(header, max_pixels)
+
+    await upload.seek(0)
+    return SpooledUpload(file, size, header)
+
+
+class UploadLimitMiddleware:
+    """
+    Refuse request bodies over max_body_bytes while they arrive
+
+    A larger Content-Length gets 413 before any body is read; bodies without one
+    (chunked) are counted and fail with 413 at the first message past the cap.
+    FastAPI re-raises HTTPException from body parsing, so the form parse stops there.
+    """
+
+    def __init__(self, app: Any, max_body_bytes: int = MAX_UPLOAD_BYTES + UPLOAD_FORM_OVERHEAD):
+        self.app = app
+        self.max_body_bytes = max_body_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        max_mb = self.max_body_bytes // (1024 * 1024)
+        detail = f"Request body too large (max {max_mb}MB)"
+        content_length = dict(scope["headers"]).get(b"content-length", b"")
+        if content_length.isdigit() and int(content_length) > self.max_body_bytes:
+            from starlette.responses import JSONResponse
+            logger.warning(f"Rejected {int(content_length) // (1024 * 1024)}MB body for {scope['path']}")
+            response = JSONResponse({"detail": detail}, status_code=413, headers={"Connection": "close"})
+            return await response(scope, receive, send)
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_bytes:
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
@@ -0,0 +1,100 @@
+"""
+Test Subject Cropping (EffectPlan)
+Verifies effects run on the alpha bounding box and match full-frame output
+"""
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../src'))
+
+import numpy as np
+import logging
+
+from effects.effect_frame import alpha_bbox, subject_crop_box, SUBJECT_CROP_MARGIN, SUBJECT_CROP_ALIGNMENT
+from effects.optimized_effects_processor import OptimizedEffectsProcessor
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def make_subject_image(height: int = 600, width: int = 800) -> np.ndarray:
+    """Synthetic BGRA image: textured frame with an opaque ellipse subject"""
+    rng = np.random.default_rng(42)
+    image = np.zeros((height, width, 4), dtype=np.uint8)
+    image[:, :, :3] = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+
+    yy, xx = np.mgrid[0:height, 0:width]
+    subject = ((yy - 300) / 150.0) ** 2 + ((xx - 420) / 120.0) ** 2 <= 1.0
+    image[:, :, 3] = np.where(subject, 255, 0).astype(np.uint8)
+    return image
+
+
+def test_alpha_bbox_and_crop_box():
+    """Bounding box covers exactly the visible pixels; the crop pads it and aligns its origin"""
+    image = make_subject_image()
+
+    top, bottom, left, right = alpha_bbox(image[:, :, 3])
+    ys, xs = np.nonzero(image[:, :, 3])
+    assert (top, bottom, left, right) == (ys.min(), ys.max() + 1, xs.min(), xs.max() + 1)
+    assert alpha_bbox(np.zeros((10, 10), dtype=np.uint8)) is None
+
+    crop_top, crop_bottom, crop_left, crop_right = subject_crop_box(image[:, :, 3])
+    assert crop_top % SUBJECT_CROP_ALIGNMENT == 0 and crop_left % SUBJECT_CROP_ALIGNMENT == 0
+    assert crop_top <= top - SUBJECT_CROP_MARGIN and crop_left <= left - SUBJECT_CROP_MARGIN
+    assert (crop_bottom, crop_right) == (bottom + SUBJECT_CROP_MARGIN, right + SUBJECT_CROP_MARGIN)
+    print("✅ Alpha bounding box and crop box correct")
+
+
+def test_pointwise_effect_matches_full_frame():
+    """Pointwise effects produce identical subject pixels through the cropped plan"""
+    processor = OptimizedEffectsProcessor(gpu_enabled=False)
+    image = make_subject_image()
+
+    plan = processor.plan_effects(image, ['popart'])
+    assert plan.box is not None
+    cropped = processor.process_planned_effect(plan, 'popart', num_workers=1)
+    full = processor.registry.get_instance('popart', False).apply(image)
+
+    assert cropped.shape == full.shape
+    visible = image[:, :, 3] > 0
+    assert np.array_equal(cropped[visible], full[visible])
+
+    # Everything outside the crop is transparent
+    top, bottom, left, right = plan.box
+    assert not cropped[:top, :, 3].any() and not cropped[:, :left, 3].any()
+    print("✅ Pop Art subject crop matches full-frame output")
+
+
+def test_neighbourhood_effect_shape_and_alpha():
+    """Neighbourhood effects keep frame size and alpha when cropped"""
+    processor = OptimizedEffectsProcessor(gpu_enabled=False)
+    image = make_subject_image()
+
+    cropped = processor.process_planned_effect(processor.plan_effects(image, ['enhancedblackwhite']),
+                                               'enhancedblackwhite', num_workers=1)
+
+    assert cropped.shape == image.shape
+    assert np.array_equal(cropped[:, :, 3], image[:, :, 3])
+    print("✅ Enhanced B&W subject crop preserves frame and alpha")
+
+
+def test_opaque_image_not_cropped():
+    """Images without transparency fall back to full-frame processing"""
+    processor = OptimizedEffectsProcessor(gpu_enabled=False)
+    image = make_subject_image()
+    image[:, :, 3] = 255
+
+    plan = processor.plan_effects(image, ['popart'])
+    assert plan.box is None
+    full = processor.registry.get_instance('popart', False).apply(image)
+    assert np.array_equal(processor.process_planned_effect(plan, 'popart', num_workers=1), full)
+    print("✅ Opaque image processed full-frame")
+
+
+if __name__ == "__main__":
+    test_alpha_bbox_and_crop_box()
+    test_pointwise_effect_matches_full_frame()
+    test_neighbourhood_effect_shape_and_alpha()
+    test_opaque_image_not_cropped()
+    print("\n🎉 All subject crop tests passed")
@@ -0,0 +1,81 @@
+"""
+Test Color LUT Compiler
+Compiled pointwise stages match direct evaluation and are cached per effect version and params
+"""
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../src'))
+
+import numpy as np
+
+from effects.color_lut import ColorLUTCache, accuracy_report, compile_color_lut, color_lut_cache
+from effects.effect_registry import EFFECT_REGISTRY
+from effects.enhanced_blackwhite_effect import EnhancedBlackWhiteEffect
+from effects.optimized_popart_effect import OptimizedPopArtEffect
+
+
+def random_rgb(seed: int, size=(96, 128)) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 256, (*size, 3), dtype=np.uint8)
+
+
+def test_popart_mapping_table_is_exact():
+    """Pop art through the posterized-level table equals the per-mask color mapping"""
+    effect = OptimizedPopArtEffect(gpu_enabled=False)
+    image = random_rgb(1)
+
+    data = image.astype(np.float32)
+    posterized = effect.apply_posterization_vectorized(effect.apply_contrast_saturation_boost_vectorized(data))
+    direct = effect.apply_pop_art_color_mapping_vectorized(posterized)
+
+    assert effect.color_mapping_lut() is not None
+    assert np.array_equal(effect.create_pop_art_effect_vectorized(image), direct)
+
+
+def test_blackwhite_tone_lut_within_tolerance():
+    """Film tone LUT stays under the delta-E limit; a discontinuous effect is reported, not hidden"""
+    effect = OptimizedPopArtEffect(gpu_enabled=False)
+    bw = EnhancedBlackWhiteEffect(gpu_enabled=False)
+    params = dict(bw.IMPROVED_DEFAULTS)
+
+    tone_lut = bw.film_tone_lut(params)
+    assert tone_lut is not None
+    image = random_rgb(2)
+    assert np.abs(tone_lut.apply(image)[:, :, 0] - bw.film_tone(image, params)).max() < 0.02
+
+    # Whole pop art (posterize steps) through trilinear interpolation is far off
+    popart = lambda data: effect.create_pop_art_effect_vectorized(data).astype(np.float32)
+    report = accuracy_report(popart, compile_color_lut(popart, size=17))
+    assert report['max_delta_e'] > color_lut_cache.max_delta_e
+
+
+def test_cache_keys_on_params_and_version():
+    """Same params hit the cache; new params or a bumped effect version recompile"""
+    cache = ColorLUTCache(max_delta_e=1.0)
+    calls = []
+
+    def invert(rgb):
+        calls.append(rgb.shape)
+        return 255.0 - rgb
+
+    spec = EFFECT_REGISTRY.get_spec('popart')
+    original_version = spec.version
+    try:
+        first = cache.get('popart', 'invert', invert, params={'a': 1}, size=5)
+        assert cache.get('popart', 'invert', invert, params={'a': 1}, size=5) is first
+        assert cache.get('popart', 'invert', invert, params={'a': 2}, size=5) is not first
+        spec.version += 1
+        assert cache.get('popart', 'invert', invert, params={'a': 1}, size=5) is not first
+    finally:
+        spec.version = original_version
+
+    stats = cache.get_stats()
+    assert (stats['hits'], stats['compiles'], stats['rejected']) == (1, 3, 0)
+    assert all(report['max_delta_e'] < 0.01 for report in cache.reports())
+
+    # A table over the limit is remembered as rejected and not recompiled
+    step = lambda rgb: np.where(rgb > 100, 255.0, 0.0)
+    assert cache.get('popart', 'step', step, size=5) is None
+    assert cache.get('popart', 'step', step, size=5) is None
+    assert cache.get_stats()['rejected'] == 1
@@ -0,0 +1,154 @@
+"""
+Test Effect Registry and Per-Request Planning
+Verifies lazy effect construction and shared intermediates across effects
+"""
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../src'))
+
+import numpy as np
+import logging
+from io import BytesIO
+from PIL import Image
+
+from effects.effect_registry import EffectRegistry, EffectSpec, EFFECT_REGISTRY
+from effects.effect_frame import EffectFrame, INPUT_RGB, INPUT_ALPHA, INPUT_EDGE, pil_to_array, rgba_digest
+from effects.effects_processor import EffectsProcessor
+from test_alpha_crop import make_subject_image
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def test_effects_constructed_on_first_use():
+    """Effects are only built when first requested, then reused"""
+    built = []
+    registry = EffectRegistry()
+    registry.register(EffectSpec('color', 'Original'))
+    registry.register(EffectSpec('fake', 'Fake effect', factory=lambda gpu: built.append(gpu) or object(),
+                                 aliases=('fakeeffect',)))
+
+    assert built == []
+    assert registry.available_effects() == ['color', 'fake']
+
+    first = registry.get_instance('fake', gpu_enabled=False)
+    assert registry.get_instance(' FakeEffect ', gpu_enabled=False) is first
+    assert built == [False]
+    assert registry.get_instance('color') is None
+    assert registry.initialized_effects() == ['fake']
+
+    try:
+        registry.get_instance('planned')
+        assert False, "Expected ValueError"
+    except ValueError:
+        pass
+    print("✅ Effects constructed lazily")
+
+
+def test_shared_specs_match_birefnet_copy():
+    """The spec module ships unchanged in the BiRefNet service"""
+    here = os.path.join(os.path.dirname(__file__), '../../src/effects/effect_specs.py')
+    birefnet = os.path.join(os.path.dirname(__file__), '../../../birefnet-bg-removal-api/src/effects/effect_specs.py')
+    if not os.path.exists(birefnet):
+        return
+    with open(here, 'rb') as ours, open(birefnet, 'rb') as theirs:
+        assert ours.read() == theirs.read()
+    print("✅ Shared effect specs identical in both services")
+
+
+def test_plan_computes_union_of_inputs_once():
+    """The plan prepares exactly the inputs the requested effects declare"""
+    image = make_subject_image()
+
+    plan = EFFECT_REGISTRY.plan(image, ['color', 'popart'])
+    assert set(plan.frame.computed_inputs()) >= {INPUT_RGB, INPUT_ALPHA}
+    assert INPUT_EDGE not in plan.frame.computed_inputs()
+
+    plan = EFFECT_REGISTRY.plan(image, ['popart', 'retro8bit'])
+    edge = plan.frame.edge
+    assert plan.frame.get(INPUT_EDGE) is edge
+    print("✅ Shared intermediates computed once per plan")
+
+
+def test_planned_effects_match_single_effects():
+    """Effects run against a shared plan match one-off processing and leave the frame intact"""
+    processor = EffectsProcessor(gpu_enabled=False)
+    image = make_subject_image()
+    names = ['color', 'popart', 'retro8bit', 'dithering']
+
+    plan = processor.plan_effects(image, names)
+    rgb_before = plan.frame.rgb.copy()
+
+    for name in names:
+        planned = processor.process_planned_effect(plan, name)
+        single = processor.process_single_effect(image, name)
+        assert planned.shape == image.shape
+        assert np.array_equal(planned, single), name
+
+    assert np.array_equal(plan.frame.rgb, rgb_before)
+    print("✅ Planned effects match single-effect output")
+
+
+def test_frame_matches_manual_conversion():
+    """Frame intermediates equal the per-effect conversions they replace"""
+    image = make_subject_image()
+    frame = EffectFrame(image)
+
+    assert np.array_equal(frame.alpha, image[:, :, 3])
+    assert np.array_equal(frame.rgb, image[:, :, 2::-1])
+    print("✅ Frame intermediates match manual conversion")
+
+
+def test_cache_key_follows_pixels_and_version():
+    """Effect cache keys depend on cutout pixels, params and effect version - not encoding"""
+    image = Image.fromarray(make_subject_image(), mode='RGBA')
+    encodings = []
+    for compress_level in (1, 9):
+        buffer = BytesIO()
+        image.save(buffer, format='PNG', compress_level=compress_level)
+        encodings.append(buffer.getvalue())
+    assert encodings[0] != encodings[1]
+
+    digests = [rgba_digest(pil_to_array(Image.open(BytesIO(data)))) for data in encodings]
+    assert digests[0] == digests[1]
+
+    key = EFFECT_REGISTRY.cache_key(digests[0], 'popart', {'a': 1, 'b': 2})
+    assert key == EFFECT_REGISTRY.cache_key(digests[1], 'popart', {'b': 2, 'a': 1})
+    assert key != EFFECT_REGISTRY.cache_key(digests[0], 'popart', {'a': 1, 'b': 3})
+    assert key != EFFECT_REGISTRY.cache_key(digests[0], 'dithering', {'a': 1, 'b': 2})
+
+    registry = EffectRegistry()
+    registry.register(EffectSpec('popart', 'Pop art', version=1))
+    old_key = registry.cache_key(digests[0], 'popart')
+    registry.register(EffectSpec('popart', 'Pop art', version=2))
+    assert registry.cache_key(digests[0], 'popart') != old_key
+    print("✅ Cache keys follow pixels, params and effect version")
+
+
+def test_identity_effects_share_cutout_bytes():
+    """Identity effects are flagged so processors hand back the background-removal PNG"""
+    assert EFFECT_REGISTRY.is_identity('color')
+    assert not EFFECT_REGISTRY.is_identity('popart')
+    assert not EFFECT_REGISTRY.is_identity('unknown')
+
+    # The cutout PNG decodes to exactly what the color effect would have encoded
+    rgba = make_subject_image()
+    buffer = BytesIO()
+    Image.fromarray(rgba, mode='RGBA').save(buffer, format='PNG')
+    processor = EffectsProcessor(gpu_enabled=False)
+    color = processor.process_planned_effect(processor.plan_effects(rgba, ['color']), 'color')
+    assert np.array_equal(pil_to_array(Image.open(BytesIO(buffer.getvalue()))), color)
+    print("✅ Identity effects share the cutout bytes")
+
+
+if __name__ == "__main__":
+    test_effects_constructed_on_first_use()
+    test_shared_specs_match_birefnet_copy()
+    test_plan_computes_union_of_inputs_once()
+    test_planned_effects_match_single_effects()
+    test_frame_matches_manual_conversion()
+    test_cache_key_follows_pixels_and_version()
+    test_identity_effects_share_cutout_bytes()
+    print("\n🎉 All effect registry tests passed")
@@ -0,0 +1,54 @@
+"""
+Test Streaming Latency Histograms
+Quantiles stay within the relative error in fixed memory; series roll up per stage, effect and size
+"""
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '../../src'))
+
+import numpy as np
+
+from effects.latency_histogram import LatencyHistogram, LatencyStats, size_bucket, HISTOGRAM_RELATIVE_ERROR
+
+
+def test_quantiles_within_relative_error():
+    """p50/p90/p99 of a skewed sample match numpy within the bucket error; memory does not grow"""
+    rng = np.random.default_rng(0)
+    samples = rng.lognormal(mean=np.log(0.2), sigma=0.8, size=50000)
+
+    histogram = LatencyHistogram()
+    buckets = histogram.counts.size
+    for value in samples:
+        histogram.record(float(value))
+
+    assert histogram.counts.size == buckets and histogram.count == samples.size
+    assert abs(histogram.mean - samples.mean()) < 1e-9
+    for q in (0.5, 0.9, 0.99):
+        expected = np.quantile(samples, q, method='lower')
+        assert abs(histogram.quantile(q) - expected) <= expected * HISTOGRAM_RELATIVE_ERROR * 1.01
+
+    assert histogram.quantile(0.0) == samples.min() and histogram.quantile(1.0) == samples.max()
+    assert LatencyHistogram().summary()['p99_ms'] == 0.0
+
+
+def test_stats_rollups_and_series_limit():
+    """One recording feeds stage, size and effect rollups; new series beyond the cap are dropped"""
+    stats = LatencyStats()
+    stats.record("effect", 0.050, effect="popart", shape=(1536, 1152, 4))
+    stats.record("effect", 0.150, effect="popart", shape=(640, 480, 4))
+    stats.record("effect", 0.020, effect="enhancedblackwhite", shape=(1536, 1152, 4))
+    stats.record("bg_removal", 1.2, shape=(3024, 4032))
+
+    assert size_bucket((1152, 1536)) == "<=1536px" and size_bucket((4032, 3024)) == ">2048px"
+    summary = stats.summary()
+    assert summary["effect"]["all"]["count"] == 3
+    assert summary["effect"]["by_size"]["<=1536px"]["count"] == 2
+    popart = summary["effect"]["by_effect"]["popart"]
+    assert popart["all"]["count"] == 2 and set(popart["by_size"]) == {"<=1024px", "<=1536px"}
+    assert summary["bg_removal"]["by_size"][">2048px"]["max_ms"] == 1200.0
+
+    limited = LatencyStats(max_series=2)
+    limited.record("effect", 0.1, effect="popart", shape=(100, 100))
+    assert limited.get_stats()['series'] == 2 and limited.get_stats()['dropped_recordings'] == 2
+    assert limited.get("effect").count == 1
@@ -0,0 +1,51 @@
+"""
+Test draft-mode decode stage
+JPEGs decode at a DCT reduction, keep EXIF orientation and are handed on without re-encoding
+"""
+
+from io import BytesIO
+
+from PIL import Image
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from memory_optimized_processor import MemoryOptimizedProcessor
+
+
+def encode_jpeg(size, orientation=None) -> bytes:
+    buffer = BytesIO()
+    exif = Image.Exif()
+    if orientation:
+        exif[0x0112] = orientation
+    Image.new('RGB', size, (200, 100, 50)).save(buffer, format='JPEG', exif=exif.tobytes())
+    return buffer.getvalue()
+
+
+def test_jpeg_draft_decode_to_target_size():
+    """Large JPEG decodes via draft and lands exactly on max_size"""
+    image = Image.open(BytesIO(encode_jpeg((4000, 3000))))
+    decoded = MemoryOptimizedProcessor.decode_for_processing(image, max_size=1280)
+
+    # draft picked the 1/2 reduction (2000x1500 still covers 1280x960) before the final resize
+    assert image.size == (2000, 1500)
+    assert decoded.size == (1280, 960)
+    assert decoded.mode == 'RGB'
+
+
+def test_orientation_and_alpha_handling():
+    """EXIF rotation applies after the draft; RGBA is kept or flattened on request"""
+    rotated = MemoryOptimizedProcessor.decode_for_processing(
+        Image.open(BytesIO(encode_jpeg((2400, 1200), orientation=6))), max_size=600
+    )
+    assert rotated.size == (300, 600)
+
+    buffer = BytesIO()
+    Image.new('RGBA', (100, 80), (0, 0, 0, 0)).save(buffer, format='PNG')
+    kept = MemoryOptimizedProcessor.decode_for_processing(Image.open(BytesIO(buffer.getvalue())), max_size=600)
+    flattened = MemoryOptimizedProcessor.decode_for_processing(
+        Image.open(BytesIO(buffer.getvalue())), max_size=600, flatten_alpha=True
+    )
+    assert kept.mode == 'RGBA'
+    assert flattened.mode == 'RGB' and flattened.getpixel((0, 0)) == (255, 255, 255)
@@ -0,0 +1,114 @@
+"""
+Test compact background-removal cache
+Mask records reconstruct the exact cutout from the referenced original
+"""
+
+import asyncio
+from io import BytesIO
+
+import cv2
+import numpy as np
+from PIL import Image
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from mask_cache import (
+    OriginalSource, composite, is_mask_record, load_background, store_background, identity_png, ORIGINALS_NAMESPACE
+)
+from effects.effect_frame import pil_to_array, array_to_pil
+from storage import CloudStorageManager
+from storage_backend import create_client, reset_memory_backend
+
+
+def encode_photo(size=(1600, 1200), orientation=6) -> bytes:
+    """Smooth JPEG with an EXIF rotation, like a phone upload"""
+    yy, xx = np.mgrid[0:size[1], 0:size[0]]
+    rgb = np.dstack([xx * 255 // size[0], yy * 255 // size[1], (xx + yy) % 256]).astype(np.uint8)
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    buffer = BytesIO()
+    Image.fromarray(rgb).save(buffer, format='JPEG', quality=90, exif=exif.tobytes())
+    return buffer.getvalue()
+
+
+def fake_cutout(rgb: np.ndarray) -> Image.Image:
+    """Model-style output: the input RGB plus a soft-edged subject mask"""
+    height, width = rgb.shape[:2]
+    mask = np.zeros((height, width), dtype=np.uint8)
+    cv2.ellipse(mask, (width // 2, height // 2), (width // 3, height // 3), 0, 0, 360, 255, -1)
+    return array_to_pil(composite(rgb, cv2.GaussianBlur(mask, (0, 0), 2)))
+
+
+def make_storage() -> CloudStorageManager:
+    reset_memory_backend()
+    return CloudStorageManager("test-cache", client=create_client(backend="memory"))
+
+
+def test_mask_record_round_trip():
+    """A decoded upload's cutout is stored as mask + original and rebuilt pixel-exact"""
+    storage = make_storage()
+    source = OriginalSource(encode_photo(), max_size=1024, flatten_alpha=True)
+    cutout = fake_cutout(source.decode_rgb())
+    assert cutout.size == (768, 1024)  # EXIF rotation applied before the resize
+
+    async def run():
+        png_bytes = await store_background(storage, "bg_removal_" + "a" * 64, cutout, source)
+        record = await storage.get_cached_result("bg_removal_" + "a" * 64)
+        original = await storage.get_cached_result(source.key, namespace=ORIGINALS_NAMESPACE)
+        loaded, loaded_png = await load_background(storage, "bg_removal_" + "a" * 64)
+        return png_bytes, record, original, loaded, loaded_png
+
+    png_bytes, record, original, loaded, loaded_png = asyncio.run(run())
+    assert png_bytes is None and loaded_png is None
+    assert is_mask_record(record) and original == source.data
+
+    buffer = BytesIO()
+    cutout.save(buffer, format='PNG')
+    assert len(record) < len(buffer.getvalue()) // 20
+    assert np.array_equal(pil_to_array(loaded), pil_to_array(cutout))
+
+
+def test_png_fallback_and_stale_original():
+    """Without an original the PNG format is used; a record whose original changed is a miss"""
+    storage = make_storage()
+    data = encode_photo((320, 240), orientation=1)
+    raw_cutout = fake_cutout(OriginalSource(data).decode_rgb())
+
+    async def run():
+        png_bytes = await store_background(storage, "bg_removal_" + "b" * 64, raw_cutout)
+        png_loaded = await load_background(storage, "bg_removal_" + "b" * 64)
+
+        source = OriginalSource(data)
+        await store_background(storage, "bg_removal_" + "c" * 64, raw_cutout, source)
+        # Same key, different pixels - as if the decoder changed under a stored record
+        await storage.cache_result(source.key, encode_photo((320, 240), orientation=3), namespace=ORIGINALS_NAMESPACE)
+        stale = await load_background(storage, "bg_removal_" + "c" * 64)
+        return png_bytes, png_loaded, stale
+
+    png_bytes, (png_image, png_data), stale = asyncio.run(run())
+    assert png_data == png_bytes
+    assert np.array_equal(pil_to_array(png_image), pil_to_array(raw_cutout))
+    assert stale == (None, None)
+
+
+def test_identity_effect_replaces_record_with_png_once():
+    """A color request on a mask-record hit writes the PNG back; later hits get its bytes directly"""
+    storage = make_storage()
+    source = OriginalSource(encode_photo((320, 240), orientation=1))
+    cutout = fake_cutout(source.decode_rgb())
+    key = "bg_removal_" + "d" * 64
+
+    async def run():
+        await store_background(storage, key, cutout, source)
+        loaded, loaded_png = await load_background(storage, key)
+        assert loaded_png is None
+        png_bytes = await identity_png(storage, key, loaded)
+        return png_bytes, await load_background(storage, key), await store_background(
+            storage, "bg_removal_" + "e" * 64, cutout, source, keep_png=True
+        )
+
+    png_bytes, (image, stored_png), kept_png = asyncio.run(run())
+    assert stored_png == png_bytes and kept_png is not None
+    assert np.array_equal(pil_to_array(image), pil_to_array(cutout))
@@ -0,0 +1,167 @@
+"""
+Test service metrics
+/metrics serves the prometheus_client registry as OpenMetrics with route-template request counters, stage histograms and cache tiers
+"""
+
+import asyncio
+import contextvars
+import json
+import time
+
+from fastapi import FastAPI
+from prometheus_client.openmetrics.parser import text_string_to_metric_families
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import metrics
+from metrics import (
+    install_metrics, observe_stage, record_cache_lookup, register_cache_source,
+    render_metrics, time_stage, current_trace, OPENMETRICS_CONTENT_TYPE
+)
+from effects.latency_histogram import LatencyStats
+
+
+async def asgi_get(app, path: str, query: str = ""):
+    """(status, headers, body) of a GET through the full middleware stack"""
+    scope = {
+        "type": "http", "method": "GET", "path": path, "raw_path": path.encode(), "query_string": query.encode(),
+        "headers": [], "http_version": "1.1", "scheme": "http", "server": ("test", 80),
+        "client": ("client", 1), "root_path": "", "asgi": {"version": "3.0"}
+    }
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    await app(scope, receive, send)
+    headers = dict(messages[0]["headers"])
+    body = b"".join(message.get("body", b"") for message in messages[1:])
+    return messages[0]["status"], headers, body.decode()
+
+
+def samples(text: str):
+    """{(sample name, labels): value} of an OpenMetrics exposition (parsing also validates it)"""
+    return {
+        (sample.name, frozenset(sample.labels.items())): sample.value
+        for family in text_string_to_metric_families(text) for sample in family.samples
+    }
+
+
+def test_cache_tiers_are_read_at_scrape_time():
+    """Mirrored tiers are read from their own stats on every scrape, not copied per lookup"""
+    stats = {'hits': 3, 'misses': 1}
+    register_cache_source("test_mirrored", lambda: (stats['hits'], stats['misses']))
+
+    first = samples(render_metrics().decode())
+    stats['hits'] = 7
+    second = samples(render_metrics().decode())
+
+    hit = ("cache_lookups_total", frozenset({"tier": "test_mirrored", "result": "hit"}.items()))
+    assert first[hit] == 3 and second[hit] == 7
+    assert second[("cache_hit_ratio", frozenset({"tier": "test_mirrored"}.items()))] == 0.875
+
+
+def test_metrics_endpoint_and_sources():
+    """Requests are labeled by route template; stage timings and cache tiers show up on /metrics"""
+    app = FastAPI()
+    install_metrics(app)
+
+    @app.get("/items/{item_id}")
+    async def get_item(item_id: int):
+        return {"id": item_id}
+
+    stats = LatencyStats()
+    stats.add_listener(observe_stage)
+    stats.record("test_stage", 0.02, effect="popart", shape=(1536, 1152, 4))
+    record_cache_lookup("test_tier", True)
+    record_cache_lookup("test_tier", False)
+    record_cache_lookup("test_tier", True)
+    register_cache_source("test_source", lambda: (9, 1))
+
+    async def run():
+        for item_id in (1, 2):
+            await asgi_get(app, f"/items/{item_id}")
+        await asgi_get(app, "/missing")
+        return await asgi_get(app, "/metrics")
+
+    status, headers, text = asyncio.run(run())
+    assert status == 200 and headers[b"content-type"].decode() == OPENMETRICS_CONTENT_TYPE
+    assert text.endswith("# EOF\n")
+    values = samples(text)
+
+    def value(name, **labels):
+        return values[(name, frozenset(labels.items()))]
+
+    assert value("http_requests_total", method="GET", route="/items/{item_id}", status="200") == 2
+    assert value("http_requests_total", method="GET", route="unmatched", status="404") == 1
+    assert value("stage_duration_seconds_count", stage="test_stage", effect="popart", size="<=1536px") == 1
+    assert value("cache_lookups_total", tier="test_tier", result="hit") == 2
+    assert value("cache_hit_ratio", tier="test_source") == 0.9
+    assert value("process_resident_memory_bytes") > 0
+    # The scrape itself is still in flight while rendering
+    assert value("http_requests_in_flight") == 1
+
+
+def test_request_trace_server_timing_and_log(tmp_path, monkeypatch):
+    """Stages recorded during a request - including from executor threads - become Server-Timing spans and a JSONL record"""
+    log_path = tmp_path / "traces.jsonl"
+    monkeypatch.setattr(metrics, "TRACE_LOG_PATH", str(log_path))
+    monkeypatch.setattr(metrics, "TIMING_ALLOW_ORIGIN", "*")
+    app = FastAPI()
+    install_metrics(app)
+
+    def render():
+        observe_stage("effect", 0.0125, effect="popart", size="<=1536px")
+
+    @app.get("/render/{name}")
+    async def render_route(name: str):
+        with time_stage("decode", size="<=1024px"):
+            pass
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, contextvars.copy_context().run, render)
+        return {"name": name}
+
+    status, headers, _ = asyncio.run(asgi_get(app, "/render/popart"))
+    timing = headers[b"server-timing"].decode()
+    assert status == 200 and headers[b"timing-allow-origin"] == b"*"
+    assert timing.startswith('decode;desc="<=1024px";dur=')
+    assert 'effect;desc="popart <=1536px";dur=12.5' in timing and ", total;dur=" in timing
+    # Outside a request nothing is traced
+    assert current_trace() is None
+
+    record = json.loads(log_path.read_text().splitlines()[-1])
+    assert record["route"] == "/render/{name}" and record["status"] == 200
+    assert [span["stage"] for span in record["spans"]] == ["decode", "effect"]
+
+
+def test_profile_on_request(tmp_path, monkeypatch):
+    """A request carrying the admin token is sampled; the folded stacks are served back by id"""
+    monkeypatch.setattr(metrics, "PROFILE_ADMIN_TOKEN", "secret")
+    monkeypatch.setattr(metrics, "PROFILE_DIR", str(tmp_path))
+    monkeypatch.setattr(metrics, "PROFILE_INTERVAL_MS", 1)
+    app = FastAPI()
+    install_metrics(app)
+
+    @app.get("/busy")
+    def busy_route():
+        deadline = time.perf_counter() + 0.2
+        while time.perf_counter() < deadline:
+            sum(range(1000))
+        return {}
+
+    async def run():
+        plain = await asgi_get(app, "/busy")
+        profiled = await asgi_get(app, "/busy", "profile=secret")
+        url = profiled[1][b"x-profile-url"].decode()
+        return plain, url, await asgi_get(app, url), await asgi_get(app, url, "profile=secret")
+
+    (_, plain_headers, _), url, forbidden, (status, _, folded) = asyncio.run(run())
+    assert b"x-profile-id" not in plain_headers and len(list(tmp_path.iterdir())) == 1
+    assert forbidden[0] == 403 and status == 200
+    assert folded.startswith("# GET /busy samples=")
+    assert any("busy_route (test_metrics.py" in line for line in folded.splitlines()[1:])
@@ -0,0 +1,56 @@
+"""
+Test progressive coarse mask
+The coarse mask stays in memory unless its refine pass fails
+"""
+
+import asyncio
+
+from PIL import Image
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from progressive_mask import send_coarse_mask, keep_coarse_mask, replace_coarse_mask, coarse_cache_key
+from storage import CloudStorageManager
+from storage_backend import create_client, reset_memory_backend
+
+
+class CoarseModel:
+    """Model stand-in counting coarse passes"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def predict_coarse_mask(self, image: Image.Image) -> Image.Image:
+        self.calls += 1
+        return Image.new('L', (image.width // 4, image.height // 4), 200)
+
+
+def test_coarse_mask_is_only_cached_after_failed_refine():
+    """A first pass writes nothing; a failed refine leaves the mask for the retry to reuse and drop"""
+    reset_memory_backend()
+    storage = CloudStorageManager("test-cache", client=create_client(backend="memory"))
+    model = CoarseModel()
+    image = Image.new('RGB', (64, 48))
+    stages = []
+
+    async def progress(stage, progress, message, **data):
+        stages.append((stage, data['mask_width'], data['mask_height']))
+
+    async def run():
+        mask, cached = await send_coarse_mask(model, image, "bg_key", storage, True, progress)
+        assert mask.size == (16, 12) and not cached
+        assert await storage.get_cached_result(coarse_cache_key("bg_key")) is None
+
+        # Refine failed - the retry sends the kept mask without another coarse pass
+        await keep_coarse_mask(storage, "bg_key", mask)
+        mask, cached = await send_coarse_mask(model, image, "bg_key", storage, True, progress)
+        assert mask.size == (16, 12) and cached
+        assert model.calls == 1
+
+        await replace_coarse_mask(storage, "bg_key")
+        assert await storage.get_cached_result(coarse_cache_key("bg_key")) is None
+
+    asyncio.run(run())
+    assert stages == [("coarse_mask", 16, 12)] * 2
@@ -0,0 +1,126 @@
+"""
+Test session working set
+Memory LRU with disk spill and rehydration from the storage cache
+"""
+
+import asyncio
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from session_working_set import SessionWorkingSet, session_key, preview_size
+from effects.effect_frame import rgba_digest
+from storage import CloudStorageManager
+from storage_backend import create_client, reset_memory_backend
+
+
+def make_rgba(seed: int, size=(48, 64)) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 256, (*size, 4), dtype=np.uint8)
+
+
+def test_lru_spills_to_disk_and_reloads(tmp_path):
+    """Evicted sessions come back from the spill file unchanged"""
+    one = make_rgba(1)
+    working_set = SessionWorkingSet(max_bytes=one.nbytes * 2, spill_dir=str(tmp_path))
+
+    for i in range(3):
+        rgba = make_rgba(i + 1)
+        working_set.put(f"session-{i}", rgba, rgba_digest(rgba))
+
+    stats = working_set.get_stats()
+    assert (stats['sessions_in_memory'], stats['sessions_spilled']) == (2, 1)
+
+    async def run():
+        return await working_set.get("session-0"), await working_set.get("unknown")
+
+    entry, missing = asyncio.run(run())
+    assert missing is None
+    assert np.array_equal(entry.rgba, one)
+    assert entry.image_digest == rgba_digest(one)
+    assert np.shares_memory(entry.mask, entry.rgba)
+    assert working_set.stats['spill_hits'] == 1
+    # Reloading session-0 pushed the least recently used one out to disk
+    assert working_set.get_stats()['sessions_spilled'] == 1
+
+
+def test_spill_runs_in_executor_under_event_loop(tmp_path):
+    """Evictions inside a running loop spill off the loop, tracked until written"""
+    one = make_rgba(1)
+    working_set = SessionWorkingSet(max_bytes=one.nbytes, spill_dir=str(tmp_path))
+
+    async def run():
+        working_set.put("session-a", one, rgba_digest(one))
+        working_set.put("session-b", make_rgba(2), "b")
+        assert len(working_set._background) == 1
+        await asyncio.gather(*working_set._background)
+        assert not working_set._background
+
+    asyncio.run(run())
+    assert working_set.get_stats()['sessions_spilled'] == 1
+    assert os.listdir(tmp_path) == [f"{session_key('session-a')}.npz"]
+
+
+def test_rehydrates_from_storage_pointer(tmp_path):
+    """A different instance (empty working set) rebuilds the session from the bg cache"""
+    reset_memory_backend()
+    storage = CloudStorageManager("test-cache", client=create_client(backend="memory"))
+    rgba = make_rgba(7)
+    bg_cache_key = "bg_removal_" + "a" * 64
+    buffer = BytesIO()
+    Image.fromarray(rgba, mode='RGBA').save(buffer, format='PNG')
+
+    writer = SessionWorkingSet(spill_dir=None)
+    writer.attach_storage(storage)
+    reader = SessionWorkingSet(spill_dir=str(tmp_path))
+    reader.attach_storage(storage)
+
+    async def run():
+        await storage.cache_result(bg_cache_key, buffer.getvalue())
+        await writer.remember("session-x", rgba, rgba_digest(rgba), bg_cache_key)
+        await asyncio.sleep(0.05)  # pointer write is scheduled in the background
+        return await reader.get("session-x")
+
+    entry = asyncio.run(run())
+    assert entry is not None
+    assert np.array_equal(entry.rgba, rgba)
+    assert entry.image_digest == rgba_digest(rgba)
+    assert reader.stats['storage_hits'] == 1
+
+
+def test_proxy_is_downscaled_and_cached():
+    """Preview proxy keeps the aspect ratio, is built once per fixed size, and small images are used as-is"""
+    rgba = make_rgba(3, size=(960, 1280))
+    working_set = SessionWorkingSet(spill_dir=None)
+    working_set.put("session-p", rgba, rgba_digest(rgba))
+
+    entry = asyncio.run(working_set.get("session-p"))
+    proxy = entry.proxy(512)
+    assert proxy.shape == (384, 512, 4)
+    assert entry.proxy(512) is proxy
+    # Requested sizes round up to PROXY_SIZES and never exceed PROXY_MAX_SIZE
+    assert entry.proxy(300) is proxy and entry.proxy(2048) is proxy
+    assert entry.proxy(200).shape == (192, 256, 4)
+    assert set(entry.proxies) == {256, 512}
+
+    # Proxy bytes count against the working-set budget
+    assert entry.nbytes == rgba.nbytes + sum(p.nbytes for p in entry.proxies.values())
+    assert working_set._bytes == entry.nbytes
+
+    small = make_rgba(4)
+    working_set.put("session-s", small, rgba_digest(small))
+    assert asyncio.run(working_set.get("session-s")).proxy(512) is small
+
+
+def test_preview_size_caps_slow_effects():
+    """Slow effects default to a smaller proxy and can't be asked for a larger one"""
+    assert preview_size('popart') == 512
+    assert preview_size('popart', 200) == 256
+    assert preview_size('dithering') == 256
+    assert preview_size('retro8bit', 512) == 256
+    assert preview_size('retro8bit', 64) == 128
@@ -0,0 +1,70 @@
+"""
+Test local storage backend
+CloudStorageManager running unchanged against the in-memory and filesystem GCS stand-ins
+"""
+
+import asyncio
+
+import pytest
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from storage import CloudStorageManager
+from storage_backend import create_client, reset_memory_backend, NotFound
+from cache_namespaces import model_namespace
+
+
+def test_cache_round_trip_and_namespace_sweep():
+    """Hit/miss, namespace listing and batched namespace deletes on the memory backend"""
+    reset_memory_backend()
+    storage = CloudStorageManager("test-cache", client=create_client(backend="memory"))
+    assert storage.enabled
+
+    async def run():
+        key = "ab" + "0" * 30
+        assert await storage.get_cached_result(key) is None
+        assert await storage.cache_result(key, b"png-bytes")
+        assert await storage.get_cached_result(key) == b"png-bytes"
+
+        await storage.cache_result(key, b"old-effect", namespace="effects/popart/v1")
+        await storage.cache_result(key, b"new-effect", namespace="effects/popart/v2")
+        namespaces = await storage.list_cache_namespaces()
+        deleted = await storage.delete_cache_namespace("effects/popart/v1")
+        return namespaces, deleted
+
+    namespaces, deleted = asyncio.run(run())
+    assert set(namespaces) == {model_namespace(), "effects/popart/v1", "effects/popart/v2"}
+    assert deleted == {'blobs': 1, 'bytes': len(b"old-effect")}
+    assert [b.name for b in storage.client.list_blobs("test-cache", prefix="inspirenet-cache/effects/")] == [
+        f"inspirenet-cache/effects/popart/v2/ab/{'ab' + '0' * 30}.png"
+    ]
+
+
+def test_filesystem_backend_listing_and_latency(tmp_path):
+    """Delimited listing, NotFound semantics and one injected round trip per call"""
+    client = create_client(backend="filesystem", root=str(tmp_path), latency_ms=0)
+    bucket = client.bucket("images")
+    for name in ("a/1.png", "a/2.png", "b/x/3.png", "top.png"):
+        bucket.blob(name).upload_from_string(b"x" * 10, content_type="image/png")
+
+    iterator = client.list_blobs("images", delimiter="/")
+    pages = list(iterator.pages)
+    assert [blob.name for blob in pages[0]] == ["top.png"]
+    assert pages[0].prefixes == {"a/", "b/"}
+
+    blob = client.bucket("images").blob("a/1.png")
+    assert blob.size is None
+    blob.reload()
+    assert blob.size == 10 and blob.content_type == "image/png"
+
+    calls = client.calls
+    with client.batch(raise_exception=False) as batch:
+        bucket.delete_blob("a/1.png")
+        bucket.delete_blob("missing.png")
+    assert client.calls == calls + 1
+    assert [response.status_code for response in batch._responses] == [200, 404]
+
+    with pytest.raises(NotFound):
+        bucket.blob("a/1.png").download_as_bytes()
@@ -0,0 +1,157 @@
+"""
+Test storage maintenance engine
+Paged batch deletes and incrementally maintained per-prefix counters
+"""
+
+import asyncio
+import contextlib
+from datetime import datetime, timedelta, timezone
+from unittest.mock import Mock
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from storage_maintenance import StorageMaintenanceEngine, PrefixCounters
+
+
+class FakeClient:
+    """Minimal in-memory stand-in for the GCS client's list/batch API"""
+
+    def __init__(self, blobs, page_size=3):
+        self.blobs = blobs
+        self.page_size = page_size
+        self.batches = 0
+        # Blob name -> status code its delete call answers with
+        self.statuses = {}
+        self.current = None
+
+    def list_blobs(self, bucket_name, prefix='', page_size=None, **kwargs):
+        items = [self.blobs[name] for name in sorted(self.blobs) if name.startswith(prefix)]
+        pages = [items[i:i + self.page_size] for i in range(0, len(items), self.page_size)]
+        return Mock(pages=iter(pages))
+
+    @contextlib.contextmanager
+    def batch(self, raise_exception=True):
+        self.batches += 1
+        self.current = Mock(_responses=[])
+        yield self.current
+        self.current = None
+
+
+class FakeBucket:
+    name = 'test-bucket'
+
+    def __init__(self, client):
+        self.client = client
+
+    def delete_blob(self, blob_name):
+        status = self.client.statuses.get(blob_name, 204)
+        if status in (204, 404):
+            self.client.blobs.pop(blob_name, None)
+        self.client.current._responses.append(Mock(status_code=status))
+
+
+def make_blob(size, age_days=0):
+    return Mock(size=size, time_created=datetime.now(timezone.utc) - timedelta(days=age_days))
+
+
+def make_engine(blobs, **kwargs):
+    # Mock reserves name= in its constructor, so blob names are assigned afterwards
+    for name, blob in blobs.items():
+        blob.name = name
+    client = FakeClient(blobs)
+    prefixes = ["cache/", "cache/effects/", "tiers/temporary/"]
+    return client, StorageMaintenanceEngine(client, FakeBucket(client), prefixes, **kwargs)
+
+
+def test_counters_attribute_to_longest_prefix():
+    """Nested prefixes get their own counters; roots cover everything once"""
+    counters = PrefixCounters(["cache/", "cache/effects/"])
+    counters.add("cache/effects/popart/v1/ab/key.png", 1, 100)
+    counters.add("cache/models/v1/ab/key.png", 1, 40)
+    counters.add("elsewhere/key.png", 1, 999)
+
+    snapshot = counters.snapshot()
+    assert snapshot["cache/effects/"] == {'count': 1, 'bytes': 100}
+    assert snapshot["cache/"] == {'count': 1, 'bytes': 40}
+    assert counters.roots() == ["cache/"]
+
+
+def test_reconcile_and_delete_keep_counters_current():
+    """Reconcile sets counters from a scan; batched deletes update them incrementally"""
+    blobs = {
+        **{f"cache/effects/popart/k{i}.png": make_blob(100, age_days=i) for i in range(7)},
+        **{f"cache/models/k{i}.png": make_blob(10) for i in range(2)},
+        "tiers/temporary/s1/a.png": make_blob(5),
+    }
+    client, engine = make_engine(blobs, delete_batch_size=2)
+
+    async def run():
+        await engine.reconcile()
+        assert engine.counters.snapshot()["cache/effects/"] == {'count': 7, 'bytes': 700}
+        assert engine.counters.reconciled_at is not None
+
+        dry = await engine.delete_where("cache/effects/", lambda blob: blob.time_created < cutoff, dry_run=True)
+        assert dry == {'scanned': 7, 'blobs': 4, 'bytes': 400, 'failed': 0}
+        assert len(client.blobs) == 10
+
+        deleted = await engine.delete_where("cache/effects/", lambda blob: blob.time_created < cutoff)
+        assert deleted['blobs'] == 4
+        return engine.get_stats()
+
+    cutoff = datetime.now(timezone.utc) - timedelta(days=2, hours=12)
+    stats = asyncio.run(run())
+
+    # 4 matches in batches of at most 2 across 3 pages
+    assert client.batches >= 2
+    assert sorted(name for name in client.blobs if name.startswith("cache/effects/")) == [
+        "cache/effects/popart/k0.png", "cache/effects/popart/k1.png", "cache/effects/popart/k2.png"
+    ]
+    assert stats['prefixes']["cache/effects/"]['count'] == 3
+    assert engine.counters.snapshot()["cache/effects/"]['bytes'] == 300
+    assert stats['prefixes']["tiers/temporary/"]['count'] == 1
+
+
+def test_delete_checks_each_call_in_the_batch():
+    """Rejected calls stay counted and are reported as failed; blobs already gone count as deleted"""
+    blobs = {f"cache/effects/k{i}.png": make_blob(100) for i in range(4)}
+    client, engine = make_engine(blobs, delete_batch_size=4)
+    client.statuses = {"cache/effects/k1.png": 429, "cache/effects/k2.png": 403, "cache/effects/k3.png": 404}
+
+    async def run():
+        await engine.reconcile()
+        return await engine.delete_where("cache/effects/")
+
+    deleted = asyncio.run(run())
+    assert deleted == {'scanned': 4, 'blobs': 2, 'bytes': 200, 'failed': 2}
+    assert engine.counters.snapshot()["cache/effects/"] == {'count': 2, 'bytes': 200}
+    assert sorted(client.blobs) == ["cache/effects/k1.png", "cache/effects/k2.png"]
+
+
+def test_delete_counts_only_successful_batches_and_bounds_pending():
+    """Failed batches are reported as failed, and listing waits while too many batches are pending"""
+    blobs = {f"cache/effects/k{i:02d}.png": make_blob(10) for i in range(20)}
+    client, engine = make_engine(blobs, delete_batch_size=1, delete_concurrency=1)
+    live = [0, 0]  # in flight, peak
+
+    async def finish(chunk):
+        await asyncio.sleep(0.001)
+        live[0] -= 1
+        if chunk[0].name.endswith("7.png"):
+            raise RuntimeError("batch rejected")
+        for blob in chunk:
+            client.blobs.pop(blob.name)
+        return []
+
+    def tracked_chunk(chunk):
+        live[0] += 1
+        live[1] = max(live[1], live[0])
+        return finish(chunk)
+
+    engine._delete_chunk = tracked_chunk
+    deleted = asyncio.run(engine.delete_where("cache/effects/"))
+
+    assert deleted == {'scanned': 20, 'blobs': 18, 'bytes': 180, 'failed': 2}
+    assert sorted(client.blobs) == ["cache/effects/k07.png", "cache/effects/k17.png"]
+    assert live[1] <= 2 * engine.delete_concurrency
@@ -12,7 +12,13 @@ import os
 # Add src to path for imports
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
 
-from simple_storage_api import validate_and_parse_data_url
+import asyncio
+
+from simple_storage_api import (
+    validate_and_parse_data_url, upload_bucket, create_signed_upload, confirm_signed_upload,
+    SignedUploadRequest, ConfirmUploadRequest
+)
+from storage_backend import create_client, reset_memory_backend
 
 
 def create_valid_jpeg_base64():
@@ -204,6 +210,84 @@ def test_data_url_no_semicolon():
     assert len(image_bytes) > 0
 
 
+
+def signed_put(signed, data: bytes):
+    """What a client PUT with the signed headers leaves in the bucket"""
+    blob = upload_bucket.bucket.blob(signed.blob_path)
+    blob.metadata = {
+        name[len('x-goog-meta-'):]: value for name, value in signed.headers.items() if name.startswith('x-goog-meta-')
+    }
+    blob.upload_from_string(data, content_type=signed.headers['Content-Type'])
+
+
+def test_signed_upload_confirm_flow():
+    """Signed upload + confirm against the local backend; mismatched content is deleted"""
+    reset_memory_backend()
+    upload_bucket.client = create_client(backend="memory")
+    upload_bucket.bucket = None
+
+    async def run():
+        signed = await create_signed_upload(SignedUploadRequest(session_id="sess-1", content_type="image/jpeg"))
+        assert signed.headers['x-goog-content-length-range'].startswith("1,")
+        assert signed.headers['x-goog-acl'] == 'private'
+        signed_put(signed, base64.b64decode(create_valid_jpeg_base64()))
+        objects = upload_bucket.bucket._objects
+        assert not objects.info(signed.blob_path)['public']
+        confirmed = await confirm_signed_upload(ConfirmUploadRequest(
+            session_id="sess-1", upload_id=signed.upload_id, blob_path=signed.blob_path))
+        assert confirmed.success and confirmed.url == signed.public_url
+        # Public only once confirm accepted it
+        assert objects.info(signed.blob_path)['public']
+
+        # PNG bytes uploaded as JPEG are rejected and removed
+        bad = await create_signed_upload(SignedUploadRequest(session_id="sess-1", content_type="image/jpeg"))
+        signed_put(bad, b"\x89PNG\r\n\x1a\n" + b"0" * 32)
+        with pytest.raises(HTTPException) as exc:
+            await confirm_signed_upload(ConfirmUploadRequest(
+                session_id="sess-1", upload_id=bad.upload_id, blob_path=bad.blob_path))
+        assert exc.value.status_code == 400
+        assert not upload_bucket.bucket.blob(bad.blob_path).exists()
+
+        # Another session's object cannot be confirmed
+        with pytest.raises(HTTPException) as exc:
+            await confirm_signed_upload(ConfirmUploadRequest(
+                session_id="sess-2", upload_id=signed.upload_id, blob_path=signed.blob_path))
+        assert exc.value.status_code == 400
+
+    asyncio.run(run())
+
+
+def test_sweep_deletes_unconfirmed_signed_uploads():
+    """Signed uploads never confirmed are swept after expiry; confirmed and server-side uploads stay"""
+    reset_memory_backend()
+    upload_bucket.client = create_client(backend="memory")
+    upload_bucket.bucket = None
+    jpeg = base64.b64decode(create_valid_jpeg_base64())
+
+    async def run():
+        abandoned = await create_signed_upload(SignedUploadRequest(session_id="sess-1", content_type="image/jpeg"))
+        kept = await create_signed_upload(SignedUploadRequest(session_id="sess-1", content_type="image/jpeg"))
+        recent = await create_signed_upload(SignedUploadRequest(session_id="sess-1", content_type="image/jpeg"))
+        for signed in (abandoned, kept, recent):
+            signed_put(signed, jpeg)
+        await confirm_signed_upload(ConfirmUploadRequest(
+            session_id="sess-1", upload_id=kept.upload_id, blob_path=kept.blob_path))
+        server_side = "orders/sess-1/20240101_000000_abc_original.jpg"
+        upload_bucket.bucket.blob(server_side).upload_from_string(jpeg, content_type="image/jpeg")
+
+        objects = upload_bucket.bucket._objects
+        for name in (abandoned.blob_path, kept.blob_path, server_side):
+            objects.update_info(name, {**objects.info(name), 'time_created': 0})
+
+        result = await upload_bucket.sweep_unconfirmed()
+        assert result['blobs'] == 1 and result['scanned'] == 4
+        assert not upload_bucket.bucket.blob(abandoned.blob_path).exists()
+        for name in (kept.blob_path, recent.blob_path, server_side):
+            assert upload_bucket.bucket.blob(name).exists()
+
+    asyncio.run(run())
+
+
 if __name__ == "__main__":
     # Run tests
     pytest.main([__file__, "-v"])
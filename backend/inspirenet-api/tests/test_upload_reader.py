@@ -0,0 +1,135 @@
+"""
+Test upload reader
+Header dimension probing on the spooled upload and the body cap as requests arrive
+"""
+
+import asyncio
+from io import BytesIO
+
+import pytest
+from PIL import Image
+from fastapi import FastAPI, Request
+from starlette.datastructures import UploadFile
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from upload_reader import (
+    probe_image_header, read_image_upload, UploadRejected, UploadLimitMiddleware, HEADER_PROBE_LIMIT
+)
+
+
+class CountingFile(BytesIO):
+    """Spool stand-in that counts how many bytes were read"""
+
+    def __init__(self, data: bytes):
+        super().__init__(data)
+        self.bytes_read = 0
+
+    def read(self, size: int = -1) -> bytes:
+        chunk = super().read(size)
+        self.bytes_read += len(chunk)
+        return chunk
+
+
+def spooled(data: bytes) -> UploadFile:
+    return UploadFile(CountingFile(data), size=len(data), filename='upload')
+
+
+def encode(size, fmt, mode='RGB', **kwargs) -> bytes:
+    buffer = BytesIO()
+    Image.new(mode, size, (120, 80, 40)).save(buffer, format=fmt, **kwargs)
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize("fmt,mode,kwargs", [
+    ('JPEG', 'RGB', {'exif': Image.Exif().tobytes()}),
+    ('JPEG', 'RGB', {'progressive': True}),
+    ('PNG', 'RGBA', {}),
+    ('WEBP', 'RGB', {'lossless': False}),
+    ('WEBP', 'RGB', {'lossless': True}),
+    ('WEBP', 'RGBA', {'exif': Image.Exif().tobytes()}),
+])
+def test_probe_matches_pil(fmt, mode, kwargs):
+    """Header parsing agrees with PIL for each format variant"""
+    data = encode((321, 123), fmt, mode, **kwargs)
+    header = probe_image_header(data[:4096])
+    assert header is not None
+    assert (header.format, header.width, header.height) == (fmt, 321, 123)
+
+
+def test_oversized_dimensions_rejected_from_header():
+    """A huge-dimension PNG is refused from its header bytes, not after reading the body"""
+    header = encode((8, 8), 'PNG')[:33]
+    # Patch IHDR to claim 10000x10000 and append a large body
+    data = header[:16] + (10000).to_bytes(4, 'big') * 2 + header[24:] + b'\0' * (4 * HEADER_PROBE_LIMIT)
+    upload = spooled(data)
+
+    with pytest.raises(UploadRejected) as exc:
+        asyncio.run(read_image_upload(upload))
+    assert exc.value.status_code == 413
+    assert upload.file.bytes_read <= HEADER_PROBE_LIMIT
+
+
+def test_byte_cap_and_result_reuses_spool():
+    """The byte cap uses the spooled size; accepted uploads read from the same file, not a copy"""
+    data = encode((64, 48), 'JPEG')
+    with pytest.raises(UploadRejected):
+        asyncio.run(read_image_upload(spooled(data), max_bytes=len(data) - 1))
+
+    upload_file = spooled(data)
+    upload = asyncio.run(read_image_upload(upload_file))
+    assert upload.file is upload_file.file
+    assert (upload.size, upload.format) == (len(data), 'JPEG')
+    assert upload.read_bytes() == data
+    assert upload.open_image().size == (64, 48)
+    upload.close()
+
+
+def call_with_body(chunks, content_length=None):
+    """Send a POST through UploadLimitMiddleware; returns (status, body messages the app received)"""
+    app = FastAPI()
+    seen = []
+
+    @app.post("/upload")
+    async def upload(request: Request):
+        seen.append(len(await request.body()))
+        return {"ok": True}
+
+    limited = UploadLimitMiddleware(app, max_body_bytes=100)
+    headers = [(b"content-length", str(content_length).encode())] if content_length is not None else []
+    scope = {"type": "http", "method": "POST", "path": "/upload", "raw_path": b"/upload", "root_path": "",
+             "query_string": b"", "headers": headers, "scheme": "http", "http_version": "1.1",
+             "server": ("test", 80), "client": ("test", 1)}
+    messages = [{"type": "http.request", "body": c, "more_body": i < len(chunks) - 1} for i, c in enumerate(chunks)]
+    pulled = []
+    sent = []
+
+    async def receive():
+        message = messages.pop(0) if messages else {"type": "http.disconnect"}
+        pulled.append(message)
+        return message
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(limited(scope, receive, send))
+    return sent[0]["status"], pulled, seen
+
+
+def test_body_cap_from_content_length():
+    """A declared oversized body is refused before any of it is read"""
+    status, pulled, seen = call_with_body([b"x" * 200], content_length=200)
+    assert status == 413
+    assert pulled == [] and seen == []
+
+
+def test_body_cap_while_chunked_body_arrives():
+    """Without Content-Length the body is counted and refused at the first chunk past the cap"""
+    status, pulled, seen = call_with_body([b"x" * 60, b"x" * 60, b"x" * 60])
+    assert status == 413
+    assert len(pulled) == 2 and seen == []
+
+    status, _, seen = call_with_body([b"x" * 50, b"x" * 50], content_length=100)
+    assert status == 200 and seen == [100]